@@ -0,0 +1,73 @@
+"""
+Event loop latency while dumping a snapshot.
+
+A ticker coroutine sleeps for 1ms in a loop and records how late it wakes up,
+first while the loop calls the blocking dump() and then while it awaits
+async_dump(). Run from the repository root:
+
+    python -m benchmarks.bench_async_latency --entries 200000
+"""
+
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+from src.snapshot.Snapshot import SnapshotManager
+
+TICK = 0.001
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def measure(dump) -> list:
+    lags, stop = [], asyncio.Event()
+    task = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await dump()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await task
+    return lags, elapsed
+
+
+def report(name: str, lags: list, elapsed: float):
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    p99 = lags_ms[int(len(lags_ms) * 0.99) - 1] if len(lags_ms) > 1 else lags_ms[0]
+    print(
+        f"{name:<12} dump {elapsed * 1000:8.1f}ms  ticks {len(lags):6d}  "
+        f"lag median {statistics.median(lags_ms):7.2f}ms  "
+        f"p99 {p99:7.2f}ms  max {lags_ms[-1]:8.2f}ms"
+    )
+
+
+async def main(entries: int):
+    source = {
+        f"key{i}": {"id": i, "name": f"user-{i}", "tags": ["a", "b", "c"]}
+        for i in range(entries)
+    }
+    path = tempfile.mkdtemp()
+    try:
+        manager = SnapshotManager(path=path)
+
+        async def blocking():
+            manager.dump(source)
+
+        report("dump", *await measure(blocking))
+        report("async_dump", *await measure(lambda: manager.async_dump(source)))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=100_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.entries))
@@ -0,0 +1,91 @@
+"""
+Disk use and write I/O of successive, mostly identical snapshots.
+
+Dumps `--snapshots` versions of a dict with `--entries` keys, changing
+`--changed` percent of the values between versions, once as regular
+snapshots and once with dedup=True. Changed keys are a contiguous range,
+use `--scatter` to spread them over the whole dict instead. Run from the
+repository root:
+
+    python -m benchmarks.bench_dedup --entries 200000 --changed 5
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.snapshot.ChunkStore import CHUNK_DIR
+from src.snapshot.Snapshot import SnapshotManager
+
+
+def disk_usage(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def versions(entries: int, snapshots: int, changed: float, scatter: bool):
+    rng = random.Random(0)
+    source = {
+        f"user:{i}": {"name": f"user {i}", "score": rng.randint(0, 10**6)}
+        for i in range(entries)
+    }
+    keys = list(source)
+    count = int(entries * changed / 100)
+    for _ in range(snapshots):
+        yield source
+        if scatter:
+            selected = rng.sample(keys, count)
+        else:
+            start = rng.randrange(entries - count + 1)
+            selected = keys[start : start + count]
+        for key in selected:
+            source[key]["score"] += 1
+
+
+def run(dedup: bool, args) -> tuple:
+    path = Path(tempfile.mkdtemp())
+    try:
+        manager = SnapshotManager(path=path, dedup=dedup, durability="none")
+        started = time.perf_counter()
+        for source in versions(
+            args.entries, args.snapshots, args.changed, args.scatter
+        ):
+            manager.dump(source)
+        elapsed = time.perf_counter() - started
+        written = (
+            manager._chunks.bytes_written
+            if dedup
+            else sum(entry.size for entry in manager.manifest())
+        )
+        chunks = sum(1 for f in (path / CHUNK_DIR).rglob("*") if f.is_file())
+        return disk_usage(path), written, elapsed, chunks
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main(args):
+    print(
+        f"{args.snapshots} snapshots of {args.entries} entries, "
+        f"{args.changed}% changed between them"
+        f"{' (scattered)' if args.scatter else ''}"
+    )
+    plain = run(False, args)
+    dedup = run(True, args)
+    for name, (usage, written, elapsed, chunks) in (("plain", plain), ("dedup", dedup)):
+        print(
+            f"{name:<6} disk {usage / 1e6:8.1f}MB  written {written / 1e6:8.1f}MB"
+            f"  {elapsed:6.2f}s  chunks {chunks}"
+        )
+    print(
+        f"disk use x{plain[0] / dedup[0]:.1f} smaller, writes x{plain[1] / dedup[1]:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=200_000)
+    parser.add_argument("--snapshots", type=int, default=10)
+    parser.add_argument("--changed", type=float, default=5.0)
+    parser.add_argument("--scatter", action="store_true")
+    main(parser.parse_args())
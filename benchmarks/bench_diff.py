@@ -0,0 +1,81 @@
+"""
+Diffing two near identical snapshots against decoding and comparing them.
+
+Dumps `--entries` entries holding `--value-size` characters, then the same
+with `--changes` of them modified, and times SnapshotManager.diff() (entry
+digests from the footers), diff_snapshots() on encodings without footers
+(encoded bytes hashed in one pass) and loading both and comparing the
+dicts. Run from the repository root:
+
+    python -m benchmarks.bench_diff --entries 50000 --value-size 1024
+"""
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.snapshot.Diff import diff_snapshots, diff_values
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Writer import Writer
+
+
+def timed(fn) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def encode(source: dict) -> bytes:
+    buffer = io.BytesIO()
+    Writer(source, buffer).write()
+    return buffer.getvalue()
+
+
+def main(entries: int, value_size: int, changes: int):
+    path = Path(tempfile.mkdtemp())
+    try:
+        manager = SnapshotManager(path=path)
+        source = {
+            f"key:{i}": {"value": i, "text": os.urandom(value_size // 2).hex()}
+            for i in range(entries)
+        }
+        changed = dict(source)
+        for i in range(0, entries, max(entries // changes, 1))[:changes]:
+            changed[f"key:{i}"] = dict(source[f"key:{i}"], value=-i - 1)
+        before = manager.dump(source)
+        after = manager.dump(changed)
+        plain = encode(source), encode(changed)
+
+        def decoded():
+            with open(before, "rb") as a, open(after, "rb") as b:
+                return diff_values(
+                    manager.read_from_buffer(a), manager.read_from_buffer(b)
+                )
+
+        runs = [
+            ("manager.diff", lambda: manager.diff(before.name, after.name)),
+            (
+                "diff_snapshots",
+                lambda: diff_snapshots(io.BytesIO(plain[0]), io.BytesIO(plain[1])),
+            ),
+            ("load + compare", decoded),
+        ]
+        size = before.stat().st_size / (1 << 20)
+        print(f"{entries} entries, {size:.1f} MiB each, {changes} changed")
+        for name, fn in runs:
+            elapsed, result = timed(fn)
+            print(f"{name:16} {elapsed * 1000:9.1f}ms {len(result.changed)} changed")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--value-size", type=int, default=1024)
+    parser.add_argument("--changes", type=int, default=10)
+    args = parser.parse_args()
+    main(args.entries, args.value_size, args.changes)
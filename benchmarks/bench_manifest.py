@@ -0,0 +1,117 @@
+"""
+Snapshot lookups in a directory with many snapshots.
+
+Fills a directory with `--snapshots` small snapshot files and times the old
+per-call directory scan (glob, stat every file, strptime every name) against
+the manifest: the one-off rebuild when it is missing, then list(), finding
+the latest snapshot, find(target_timestamp), a list(since=...) range of the
+newest 100 and list(target_timestamp). Run from the repository root:
+
+    python -m benchmarks.bench_manifest --snapshots 100000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Writer import Writer
+
+FORMAT = SnapshotManager._datetime_format
+
+
+def populate(path: Path, count: int) -> list:
+    buffer = BytesIO()
+    Writer(
+        {"key": "value", "n": 1}, buffer, chunk_size=1024, hash_keys=True, header=True
+    ).write()
+    data = buffer.getvalue()
+    start = datetime(2024, 1, 1)
+    names = []
+    for i in range(count):
+        name = (start + timedelta(seconds=i)).strftime(FORMAT)
+        (path / name).write_bytes(data)
+        names.append(name)
+    return names
+
+
+def scan_list(path: Path) -> list:
+    files = [f for f in path.glob("*") if not f.name.startswith(".")]
+    return sorted(files, key=lambda f: f.stat().st_mtime, reverse=True)
+
+
+def scan_latest(path: Path) -> Path:
+    files = [f for f in path.glob("*") if not f.name.startswith(".")]
+    return max(files, key=lambda f: f.stat().st_mtime)
+
+
+def scan_nearest(path: Path, target_timestamp: str) -> list:
+    files = [f for f in path.glob("*") if not f.name.startswith(".")]
+    target = datetime.strptime(target_timestamp, FORMAT)
+    return sorted(files, key=lambda f: abs(target - datetime.strptime(f.name, FORMAT)))
+
+
+def scan_find(path: Path, target_timestamp: str) -> Path:
+    files = [f for f in path.glob("*") if not f.name.startswith(".")]
+    target = datetime.strptime(target_timestamp, FORMAT)
+    return min(files, key=lambda f: abs(target - datetime.strptime(f.name, FORMAT)))
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name: str, scan: float, manifest: float):
+    print(
+        f"{name:<14} scan {scan * 1000:10.1f}ms  manifest {manifest * 1000:10.2f}ms"
+        f"  x{scan / manifest if manifest else float('inf'):8.1f}"
+    )
+
+
+def main(count: int):
+    path = Path(tempfile.mkdtemp())
+    try:
+        started = time.perf_counter()
+        names = populate(path, count)
+        print(f"created {count} snapshots in {time.perf_counter() - started:.1f}s")
+
+        manager = SnapshotManager(path=path)
+        started = time.perf_counter()
+        manager.manifest()
+        print(f"manifest rebuild {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        target = names[len(names) // 2]
+        report("list()", timed(lambda: scan_list(path)), timed(manager.list))
+        report("latest", timed(lambda: scan_latest(path)), timed(manager._latest))
+        report(
+            "find(target)",
+            timed(lambda: scan_find(path, target)),
+            timed(lambda: manager.find(target)),
+        )
+        report(
+            "list(since=)",
+            timed(lambda: scan_list(path)[:100]),
+            timed(lambda: manager.list(since=names[-100])),
+        )
+        report(
+            "list(target)",
+            timed(lambda: scan_nearest(path, target)),
+            timed(lambda: manager.list(target)),
+        )
+        manager.close()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snapshots", type=int, default=100_000)
+    main(parser.parse_args().snapshots)
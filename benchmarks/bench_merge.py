@@ -0,0 +1,74 @@
+"""
+Merging snapshots by copying encoded entries against decoding and dumping.
+
+Dumps `--snapshots` snapshots of `--entries` entries holding `--value-size`
+characters each, every one sharing `--overlap` of its keys with the others,
+then times SnapshotManager.merge() with last_wins, with a custom strategy
+(shared keys decoded), and loading every snapshot into one dict and dumping
+it. Run from the repository root:
+
+    python -m benchmarks.bench_merge --snapshots 4 --entries 20000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.snapshot.Reader import Reader
+from src.snapshot.Snapshot import SnapshotManager
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(snapshots: int, entries: int, value_size: int, overlap: float):
+    path = Path(tempfile.mkdtemp())
+    try:
+        manager = SnapshotManager(path=path)
+        shared = int(entries * overlap)
+        names = []
+        for n in range(snapshots):
+            source = {
+                f"{n}:{i}" if i >= shared else f"shared:{i}": {
+                    "value": i,
+                    "text": os.urandom(value_size // 2).hex(),
+                }
+                for i in range(entries)
+            }
+            names.append(manager.dump(source).name)
+
+        def decoded():
+            result = {}
+            for name in names:
+                with open(path / name, "rb") as f:
+                    result.update(Reader(f).read())
+            manager.dump(result)
+
+        merged = manager.merge(names)
+        size = sum((path / name).stat().st_size for name in names) / (1 << 20)
+        print(
+            f"{snapshots} snapshots, {size:.1f} MiB in, {merged.stat().st_size / (1 << 20):.1f} MiB out"
+        )
+        for label, fn in [
+            ("merge last_wins", lambda: manager.merge(names)),
+            ("merge combined", lambda: manager.merge(names, lambda k, v: v[-1])),
+            ("load + dump", decoded),
+        ]:
+            print(f"{label:16} {timed(fn) * 1000:9.1f}ms")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snapshots", type=int, default=4)
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--value-size", type=int, default=1024)
+    parser.add_argument("--overlap", type=float, default=0.1)
+    args = parser.parse_args()
+    main(args.snapshots, args.entries, args.value_size, args.overlap)
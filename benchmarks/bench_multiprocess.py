@@ -0,0 +1,106 @@
+"""
+Writer and reader processes sharing one snapshot directory.
+
+Starts `--writers` processes dumping (and pruning through a retention
+policy keeping `--keep` snapshots) and `--readers` processes loading the
+newest snapshot for `--seconds`, then reports the dumps and loads per
+second, the slowest load, any failed or torn read and whether the manifest
+still matches the directory. Run from the repository root:
+
+    python -m benchmarks.bench_multiprocess --writers 4 --readers 4
+"""
+
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.snapshot.Retention import RetentionPolicy
+from src.snapshot.Snapshot import SnapshotManager
+
+
+def write(path: Path, writer: int, seconds: float, keep: int, dedup: bool, results):
+    manager = SnapshotManager(
+        path=path, dedup=dedup, retention=RetentionPolicy(last=keep)
+    )
+    payload = {f"key:{i}": {"value": i, "tags": ["a", "b"]} for i in range(100)}
+    deadline = time.monotonic() + seconds
+    dumps = errors = 0
+    while time.monotonic() < deadline:
+        try:
+            manager.dump(dict(payload, writer=writer, seq=dumps, check=writer + dumps))
+            dumps += 1
+        except Exception:
+            errors += 1
+    results.put(("write", dumps, errors, 0.0))
+
+
+def read(path: Path, seconds: float, results):
+    manager = SnapshotManager(path=path)
+    deadline = time.monotonic() + seconds
+    loads = errors = 0
+    slowest = 0.0
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            data = manager.load()
+            if data and data["check"] != data["writer"] + data["seq"]:
+                errors += 1
+            loads += 1
+        except Exception:
+            errors += 1
+        slowest = max(slowest, time.perf_counter() - start)
+    results.put(("read", loads, errors, slowest))
+
+
+def main(writers: int, readers: int, seconds: float, keep: int, dedup: bool):
+    path = Path(tempfile.mkdtemp())
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [
+        context.Process(target=write, args=(path, w, seconds, keep, dedup, results))
+        for w in range(writers)
+    ] + [
+        context.Process(target=read, args=(path, seconds, results))
+        for _ in range(readers)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        totals = {"write": [0, 0, 0.0], "read": [0, 0, 0.0]}
+        for _ in processes:
+            kind, count, errors, slowest = results.get()
+            totals[kind][0] += count
+            totals[kind][1] += errors
+            totals[kind][2] = max(totals[kind][2], slowest)
+        for process in processes:
+            process.join()
+
+        manager = SnapshotManager(path=path)
+        consistent = sorted(e.name for e in manager.manifest()) == sorted(
+            p.name for p in manager.list()
+        )
+        dumps, write_errors, _ = totals["write"]
+        loads, read_errors, slowest = totals["read"]
+        print(
+            f"{writers} writers {dumps / seconds:8.1f} dumps/s  {write_errors} errors"
+        )
+        print(
+            f"{readers} readers {loads / seconds:8.1f} loads/s  {read_errors} errors"
+            f"  slowest {slowest * 1000:.1f}ms"
+        )
+        print(f"manifest matches directory: {consistent}")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--keep", type=int, default=5)
+    parser.add_argument("--dedup", action="store_true")
+    args = parser.parse_args()
+    main(args.writers, args.readers, args.seconds, args.keep, args.dedup)
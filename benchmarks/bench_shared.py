@@ -0,0 +1,80 @@
+"""
+Handing a snapshot to worker processes, pickled buffer against shared memory.
+
+Encodes `--entries` entries holding `--value-size` characters once, as the bytes of `write_to_buffer()` and
+with `publish_shared()`, then has `--workers` pool processes get it: the
+bytes pickled to every worker, the segment attached by name. Reports the
+time until every worker holds the snapshot and until every worker decoded
+it, and the time of one lazy key lookup. Run from the repository root:
+
+    python -m benchmarks.bench_shared --entries 20000 --value-size 4096
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.snapshot.Snapshot import SnapshotManager
+
+
+def from_bytes(data: bytes) -> int:
+    return len(SnapshotManager.read_from_buffer(None, io.BytesIO(data)))
+
+
+def from_shared(path: str, name: str) -> int:
+    return len(SnapshotManager(path=path).attach_shared(name))
+
+
+def attached_size(path: str, name: str) -> int:
+    with SnapshotManager(path=path).attach_shared(name, lazy=True) as shared:
+        return shared.size
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(entries: int, workers: int, value_size: int):
+    path = Path(tempfile.mkdtemp())
+    try:
+        manager = SnapshotManager(path=path)
+        source = {
+            f"key:{i}": {"value": i, "text": os.urandom(value_size // 2).hex()}
+            for i in range(entries)
+        }
+        context = multiprocessing.get_context("fork")
+        buffer = io.BytesIO()
+        manager.write_to_buffer(source, buffer)
+        data = buffer.getvalue()
+        with context.Pool(workers) as pool, manager.publish_shared(source) as shared:
+            args = [(str(path), shared.name)] * workers
+            sent = timed(lambda: pool.map(len, [data] * workers))
+            attached = timed(lambda: pool.starmap(attached_size, args))
+            pickled = timed(lambda: pool.map(from_bytes, [data] * workers))
+            handed = timed(lambda: pool.starmap(from_shared, args))
+            with manager.attach_shared(shared.name, lazy=True) as view:
+                lookup = timed(lambda: view.get(f"key:{entries // 2}"))
+
+        size = len(data) / (1 << 20)
+        print(f"{entries} entries, {size:.1f} MiB, {workers} workers")
+        print(f"{'':14} {'transfer':>10} {'decode':>10}")
+        print(f"pickled buffer {sent * 1000:8.1f}ms {pickled * 1000:8.1f}ms")
+        print(f"shared memory  {attached * 1000:8.1f}ms {handed * 1000:8.1f}ms")
+        print(f"lazy lookup of one key {lookup * 1000:.1f}ms")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--value-size", type=int, default=4096)
+    args = parser.parse_args()
+    main(args.entries, args.workers, args.value_size)
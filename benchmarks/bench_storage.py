@@ -0,0 +1,59 @@
+"""
+Many small snapshots on each storage backend.
+
+Dumps `--snapshots` small snapshots through a SnapshotManager on the file
+system, in memory and in SQLite, then times listing the backend, loading
+the newest snapshot and pruning half of them. Run from the repository root:
+
+    python -m benchmarks.bench_storage --snapshots 2000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Storage import FileSystemBackend, MemoryBackend, SQLiteBackend
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run(name: str, path: Path, count: int):
+    storage = {
+        "file": lambda: FileSystemBackend(path / "files"),
+        "memory": MemoryBackend,
+        "sqlite": lambda: SQLiteBackend(path / "snapshots.db"),
+    }[name]()
+    manager = SnapshotManager(path=path / "files", storage=storage, durability="none")
+    source = {f"key:{i}": {"value": i, "tags": ["a", "b"]} for i in range(50)}
+
+    dump = timed(lambda: [manager.dump(source) for _ in range(count)])
+    listing = timed(storage.list)
+    load = timed(manager.load)
+    prune = timed(lambda: manager.prune(max_prune=count // 2))
+    print(
+        f"{name:<7} dump {dump / count * 1e6:8.1f}us each  list {listing * 1000:8.2f}ms"
+        f"  load {load * 1000:7.2f}ms  prune {count // 2} {prune * 1000:9.1f}ms"
+    )
+    manager.close()
+    storage.close()
+
+
+def main(count: int):
+    for name in ("file", "memory", "sqlite"):
+        path = Path(tempfile.mkdtemp())
+        try:
+            run(name, path, count)
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snapshots", type=int, default=2000)
+    main(parser.parse_args().snapshots)
@@ -0,0 +1,201 @@
+from enum import Enum
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Hashable, List, Optional, Union
+import os
+import struct
+import threading
+from .Reader import Reader
+from .Writer import Writer
+
+
+class LogOperation(Enum):
+    SET = 1
+    DELETE = 2
+
+
+class FsyncPolicy(Enum):
+    # fsync after every append
+    ALWAYS = "always"
+    # fsync from a background thread at most once a second
+    EVERYSEC = "everysec"
+    # leave flushing to the OS
+    NO = "no"
+
+
+class AppendOnlyLog:
+    """
+    Set/delete operations appended to numbered segment files.
+
+    Records are an operation byte and a length followed by the
+    `Writer.write_key_value` (set) or `Writer.write_value` (delete) framing,
+    the length lets replay stop at a record torn by a crash. Segments are
+    hidden files in the snapshot directory; `rotate` closes the active one so
+    everything up to it can be folded into a snapshot and removed. The
+    snapshot records the last segment it includes and replay starts after
+    it, so a crash between publishing the snapshot and removing the segments
+    never applies them again. Segment numbers continue after `floor()`, the
+    last segment folded, once the folded segments are gone.
+    """
+
+    _prefix = ".aof-"
+
+    def __init__(
+        self,
+        path: Path,
+        fsync: Union[str, FsyncPolicy] = FsyncPolicy.EVERYSEC,
+        floor: Callable[[], int] = None,
+    ):
+        self._path = Path(path)
+        self._fsync = FsyncPolicy(fsync)
+        self._floor = floor
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._seq: Optional[int] = None
+        self._size = 0
+        self._unsynced = False
+        self._stop = threading.Event()
+        self._syncer: Optional[threading.Thread] = None
+
+    @property
+    def size(self) -> int:
+        "Bytes appended to the active segment"
+        return self._size
+
+    def segments(self) -> List[Path]:
+        files = self._path.glob(f"{self._prefix}*")
+        return sorted(files, key=self._sequence)
+
+    def set(self, key: Hashable, value) -> int:
+        payload = BytesIO()
+        Writer(buffer=payload).write_key_value(key, value)
+        return self._append(self._record(LogOperation.SET, payload.getvalue()))
+
+    def delete(self, key: Hashable) -> int:
+        payload = BytesIO()
+        Writer(buffer=payload).write_value(key)
+        return self._append(self._record(LogOperation.DELETE, payload.getvalue()))
+
+    def replay(self, state: dict, after: int = 0, upto: int = None) -> dict:
+        """
+        Apply the segments after sequence `after` (up to `upto`) in order onto
+        `state`. Raises FileNotFoundError for a segment removed meanwhile.
+        """
+        for segment in self.segments():
+            if self._sequence(segment) <= after:
+                continue
+            if upto is not None and self._sequence(segment) > upto:
+                break
+            with open(segment, "rb") as f:
+                self._replay_segment(Reader(f), state)
+        return state
+
+    def rotate(self) -> Optional[int]:
+        "Close the active segment and return its sequence number"
+        with self._lock:
+            if self._fd is None:
+                segments = self.segments()
+                return self._sequence(segments[-1]) if segments else None
+            seq = self._seq
+            self._close_segment()
+            return seq
+
+    def remove(self, upto: int):
+        "Delete the closed segments up to sequence `upto`"
+        for segment in self.segments():
+            if self._sequence(segment) > upto:
+                break
+            if segment.name == self._active_name():
+                break
+            segment.unlink()
+
+    def sync(self):
+        with self._lock:
+            if self._fd is not None and self._unsynced:
+                os.fsync(self._fd)
+                self._unsynced = False
+
+    def close(self):
+        self._stop.set()
+        if self._syncer is not None:
+            self._syncer.join()
+            self._syncer = None
+        with self._lock:
+            self._close_segment()
+        self._stop.clear()
+
+    def _record(self, op: LogOperation, payload: bytes) -> bytes:
+        record = BytesIO()
+        record.write(bytes([op.value]))
+        Writer(buffer=record).write_length(len(payload))
+        record.write(payload)
+        return record.getvalue()
+
+    def _append(self, record: bytes) -> int:
+        with self._lock:
+            if self._fd is None:
+                self._open_segment()
+            os.write(self._fd, record)
+            self._size += len(record)
+            if self._fsync == FsyncPolicy.ALWAYS:
+                os.fsync(self._fd)
+            else:
+                self._unsynced = True
+        return len(record)
+
+    def _open_segment(self):
+        segments = self.segments()
+        last = self._sequence(segments[-1]) if segments else 0
+        if self._floor is not None:
+            last = max(last, self._floor())
+        self._seq = last + 1
+        path = self._path / f"{self._prefix}{self._seq:08d}"
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = 0
+        if self._fsync == FsyncPolicy.EVERYSEC and self._syncer is None:
+            self._syncer = threading.Thread(target=self._sync_every_second, daemon=True)
+            self._syncer.start()
+
+    def _close_segment(self):
+        if self._fd is None:
+            return
+        if self._fsync != FsyncPolicy.NO:
+            os.fsync(self._fd)
+        os.close(self._fd)
+        self._fd = None
+        self._seq = None
+        self._size = 0
+        self._unsynced = False
+
+    def _active_name(self) -> Optional[str]:
+        if self._seq is None:
+            return None
+        return f"{self._prefix}{self._seq:08d}"
+
+    def _sync_every_second(self):
+        while not self._stop.wait(1):
+            self.sync()
+
+    def _sequence(self, segment: Path) -> int:
+        return int(segment.name[len(self._prefix) :])
+
+    def _replay_segment(self, reader: Reader, state: dict):
+        buffer = reader.buffer
+        while True:
+            op = buffer.read(1)
+            try:
+                op = LogOperation(op[0]) if op else None
+                length = reader.read_length() if op else 0
+            except (ValueError, IndexError, struct.error):
+                return
+            payload = buffer.read(length)
+            if op is None or len(payload) != length:
+                # end of the log, or a record torn by a crash
+                return
+
+            record = Reader(BytesIO(payload))
+            if op == LogOperation.SET:
+                key, value = record.read_key_value()
+                state[key] = value
+            else:
+                state.pop(record.read_value(), None)
@@ -0,0 +1,196 @@
+from pathlib import Path
+from typing import BinaryIO, Callable, ContextManager, Optional
+import asyncio
+import contextlib
+import copy
+import json
+import os
+import threading
+from .Locking import create_locked
+from .Storage import temp_path
+
+
+def _private_dirty() -> Optional[int]:
+    "Private dirty bytes of this process, only available on Linux"
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Private_Dirty:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class BackgroundDump:
+    """
+    Handle of a snapshot being written outside the caller.
+
+    With `fork` the child serialises its copy-on-write view of the source, so
+    the parent can keep mutating it right away. `cow_bytes` is the growth of
+    the child's private dirty memory while serialising, i.e. the pages it had
+    to copy (Linux only). The child only writes and syncs the temp file, a
+    thread of the parent reaps it and renames the snapshot in place.
+    `published` is called in the parent with the path and whatever `write`
+    returned once the snapshot is in place, still holding the `lock` the
+    rename was made under, `failed` with the path when the dump fails.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size: Optional[int] = None
+        self.cow_bytes: Optional[int] = None
+        self._error: Optional[str] = None
+        self._pid: Optional[int] = None
+        self._pipe: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def fork(
+        cls,
+        path: Path,
+        source: dict,
+        write: Callable[[BinaryIO, dict], object],
+        published: Callable[[Path, object], None] = None,
+        lock: Callable[[], ContextManager] = contextlib.nullcontext,
+        failed: Callable[[Path], None] = None,
+    ) -> "BackgroundDump":
+        handle = cls(path)
+        tmp = temp_path(path)
+        # reserving the name before forking so no other dump can pick it, the
+        # parent keeps it locked until the snapshot is renamed in place
+        f = os.fdopen(create_locked(tmp), "wb")
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            result, status = {}, 0
+            try:
+                before = _private_dirty()
+                result["info"] = write(f, source)
+                f.flush()
+                os.fsync(f.fileno())
+                result["size"] = f.tell()
+                f.close()
+                after = _private_dirty()
+                if before is not None and after is not None:
+                    result["cow_bytes"] = max(0, after - before)
+            except BaseException as e:
+                result["error"] = repr(e)
+                status = 1
+            finally:
+                try:
+                    os.write(write_fd, json.dumps(result).encode())
+                finally:
+                    os._exit(status)
+
+        os.close(write_fd)
+        handle._pid = pid
+        handle._pipe = read_fd
+
+        def reap():
+            # reaped whether or not the caller keeps the handle, no zombie
+            info = handle._collect()
+            os.waitpid(pid, 0)
+            with f:
+                try:
+                    if not handle._error:
+                        with lock():
+                            os.replace(tmp, path)
+                            if published is not None:
+                                published(path, info)
+                        return
+                except BaseException as e:
+                    handle._error = repr(e)
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+            if failed is not None:
+                failed(path)
+
+        handle._thread = threading.Thread(target=reap, daemon=True)
+        handle._thread.start()
+        return handle
+
+    @classmethod
+    def thread(
+        cls,
+        path: Path,
+        source: dict,
+        write: Callable[[BinaryIO, dict], object],
+        published: Callable[[Path, object], None] = None,
+        lock: Callable[[], ContextManager] = contextlib.nullcontext,
+        failed: Callable[[Path], None] = None,
+    ) -> "BackgroundDump":
+        "Fallback without fork: serialises a deep copy taken by the caller"
+        handle = cls(path)
+        tmp = temp_path(path)
+        f = os.fdopen(create_locked(tmp), "wb")
+        source = copy.deepcopy(source)
+
+        def run():
+            # closed, letting go of the temp, once it is renamed or removed
+            with f:
+                try:
+                    info = write(f, source)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    handle.size = f.tell()
+                    with lock():
+                        os.replace(tmp, path)
+                        if published is not None:
+                            published(path, info)
+                    return
+                except BaseException as e:
+                    handle._error = repr(e)
+                    try:
+                        os.unlink(tmp)
+                    except OSError:
+                        pass
+            if failed is not None:
+                failed(path)
+
+        handle._thread = threading.Thread(target=run, daemon=True)
+        handle._thread.start()
+        return handle
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._pid
+
+    def poll(self) -> bool:
+        "True once the snapshot is published or failed"
+        return not self._thread.is_alive()
+
+    def wait(self, timeout: float = None) -> Path:
+        "Blocks until done and returns the snapshot path, raising if it failed"
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise TimeoutError(f"Background dump of {self.path} still running")
+        if self._error:
+            raise RuntimeError(f"Background dump of {self.path} failed: {self._error}")
+        return self.path
+
+    def __await__(self):
+        return asyncio.get_running_loop().run_in_executor(None, self.wait).__await__()
+
+    def _collect(self):
+        "Read the report of the child until it exits, returns what `write` returned"
+        chunks = []
+        while True:
+            data = os.read(self._pipe, 4096)
+            if not data:
+                break
+            chunks.append(data)
+        os.close(self._pipe)
+        self._pipe = None
+
+        result = json.loads(b"".join(chunks) or b"{}")
+        self.size = result.get("size")
+        self.cow_bytes = result.get("cow_bytes")
+        self._error = result.get("error")
+        if not result:
+            self._error = "child exited without reporting"
+        info = result.get("info")
+        return tuple(info) if isinstance(info, list) else info
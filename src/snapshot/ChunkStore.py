@@ -0,0 +1,508 @@
+from bisect import bisect_right
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, List, Optional
+import hashlib
+import io
+import os
+import struct
+import threading
+import zlib
+from .Durability import Durability, fsync_directory
+from .Header import HEADER_SIZE
+from .Locking import FileLock, reset_after_fork
+from .Reader import CorruptSnapshotError
+
+CHUNK_DIR = ".chunks"
+# a recipe names the chunks a snapshot is made of, it stands in the snapshot
+# directory in place of the snapshot
+RECIPE_MAGIC = b"\x89PSR"
+CHUNK_DIGEST_SIZE = 16
+MIN_CHUNK_SIZE = 2 * 1024
+MAX_CHUNK_SIZE = 64 * 1024
+# Chunks end where a gear hash of the bytes before the cut has its top bits
+# clear, past MIN_CHUNK_SIZE. The hash shifts one bit per byte so only the
+# last 64 bytes are in it: a cut depends on the bytes just before it and
+# edits move the cuts around them only. The top bits are tested as the low
+# ones only mix the last few bytes.
+AVERAGE_CHUNK_SIZE = 4 * 1024
+_GEAR = [
+    int.from_bytes(hashlib.blake2b(bytes([i]), digest_size=8).digest(), "little")
+    for i in range(256)
+]
+_WINDOW = 64
+_HASH_MASK = (1 << _WINDOW) - 1
+# clear once in the bytes past MIN_CHUNK_SIZE of an average chunk
+_CUT_BITS = (AVERAGE_CHUNK_SIZE - MIN_CHUNK_SIZE).bit_length() - 1
+_CUT_MASK = ((1 << _CUT_BITS) - 1) << (_WINDOW - _CUT_BITS)
+# pending bytes that trigger looking for cuts while writing
+_SCAN_SIZE = 1024 * 1024
+
+# magic, prefix length, chunk count
+_RECIPE = struct.Struct("<4sII")
+# digest, length
+_REF = struct.Struct(f"<{CHUNK_DIGEST_SIZE}sI")
+_CRC = struct.Struct("<I")
+
+
+def chunk_digest(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=CHUNK_DIGEST_SIZE).digest()
+
+
+def _boundary(data, start: int, end: int) -> int:
+    "End of the first chunk starting at `start` cut before `end`, -1 for none"
+    gear, cut_mask, h = _GEAR, _CUT_MASK, 0
+    first = start + MIN_CHUNK_SIZE
+    for byte in data[first - _WINDOW : first]:
+        h = (h << 1) + gear[byte]
+    # carries only go up so the low 64 bits are the same without masking on
+    # every byte, masking once per window keeps the int small
+    for block in range(first, end, _WINDOW):
+        h &= _HASH_MASK
+        for position, byte in enumerate(data[block : min(block + _WINDOW, end)], block):
+            h = (h << 1) + gear[byte]
+            if not h & cut_mask:
+                return position + 1
+    return -1
+
+
+def cut(data, final: bool = False) -> List[int]:
+    """
+    End offsets of the content-defined chunks in `data`. Unless `final` the
+    bytes after the last cut are left over, more data may still move it.
+    """
+    cuts, start = [], 0
+    while start < len(data):
+        boundary = _boundary(data, start, min(start + MAX_CHUNK_SIZE, len(data)))
+        if boundary >= 0:
+            start = boundary
+        elif len(data) - start >= MAX_CHUNK_SIZE:
+            start += MAX_CHUNK_SIZE
+        elif final:
+            start = len(data)
+        else:
+            break
+        cuts.append(start)
+    return cuts
+
+
+class Recipe:
+    """
+    The list of chunks a snapshot is made of.
+
+    `prefix` holds the first bytes of the snapshot inline (its header, which
+    changes on every dump and would never be shared), `chunks` the digest and
+    length of every chunk after it in order.
+    """
+
+    __slots__ = ("prefix", "chunks")
+
+    def __init__(self, prefix: bytes = b"", chunks: list = None):
+        self.prefix = prefix
+        self.chunks: list[tuple[bytes, int]] = chunks or []
+
+    @property
+    def size(self) -> int:
+        "Size of the snapshot the recipe stands for"
+        return len(self.prefix) + sum(length for _, length in self.chunks)
+
+    def pack(self) -> bytes:
+        data = b"".join(
+            [
+                _RECIPE.pack(RECIPE_MAGIC, len(self.prefix), len(self.chunks)),
+                self.prefix,
+                *(_REF.pack(digest, length) for digest, length in self.chunks),
+            ]
+        )
+        return data + _CRC.pack(zlib.crc32(data))
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "Recipe":
+        if data[: len(RECIPE_MAGIC)] != RECIPE_MAGIC or len(data) < _RECIPE.size:
+            raise ValueError("Not a chunk recipe")
+        (crc,) = _CRC.unpack_from(data, len(data) - _CRC.size)
+        if zlib.crc32(data[: -_CRC.size]) != crc:
+            raise CorruptSnapshotError("Chunk recipe checksum mismatch")
+        _, prefix_size, count = _RECIPE.unpack_from(data)
+        start = _RECIPE.size + prefix_size
+        chunks = list(_REF.iter_unpack(data[start : start + count * _REF.size]))
+        return cls(data[_RECIPE.size : start], chunks)
+
+    @classmethod
+    def read(cls, path: Path) -> Optional["Recipe"]:
+        "None when `path` is a regular snapshot"
+        with open(path, "rb") as f:
+            if f.read(len(RECIPE_MAGIC)) != RECIPE_MAGIC:
+                return None
+            f.seek(0)
+            return cls.unpack(f.read())
+
+
+def is_recipe(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(RECIPE_MAGIC)) == RECIPE_MAGIC
+
+
+def open_snapshot(path: Path) -> BinaryIO:
+    """
+    Opens a snapshot for reading. Recipes are resolved against the chunk
+    store next to them and read like the snapshot they stand for.
+    """
+    path = Path(path)
+    f = open(path, "rb")
+    if f.read(len(RECIPE_MAGIC)) != RECIPE_MAGIC:
+        f.seek(0)
+        return f
+    with f:
+        f.seek(0)
+        recipe = Recipe.unpack(f.read())
+    return io.BufferedReader(ChunkedReader(path.parent / CHUNK_DIR, recipe))
+
+
+class ChunkedReader(io.RawIOBase):
+    "Seekable read-only view of the snapshot a recipe describes"
+
+    def __init__(self, root: Path, recipe: Recipe):
+        self._root = root
+        self._recipe = recipe
+        self._starts = []
+        position = len(recipe.prefix)
+        for _, length in recipe.chunks:
+            self._starts.append(position)
+            position += length
+        self._size = position
+        self._position = 0
+        self._cached: tuple[int, bytes] = (-1, b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def readinto(self, b) -> int:
+        position = self._position
+        if position >= self._size:
+            return 0
+        prefix = self._recipe.prefix
+        if position < len(prefix):
+            data, start = prefix, 0
+        else:
+            index = bisect_right(self._starts, position) - 1
+            data, start = self._chunk(index), self._starts[index]
+        data = memoryview(data)[position - start : position - start + len(b)]
+        b[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def _chunk(self, index: int) -> bytes:
+        if self._cached[0] != index:
+            digest, length = self._recipe.chunks[index]
+            try:
+                data = chunk_path(self._root, digest).read_bytes()
+            except FileNotFoundError:
+                raise CorruptSnapshotError(f"Chunk {digest.hex()} is missing")
+            if len(data) != length or chunk_digest(data) != digest:
+                raise CorruptSnapshotError(f"Chunk {digest.hex()} is damaged")
+            self._cached = (index, data)
+        return self._cached[1]
+
+
+def chunk_path(root: Path, digest: bytes) -> Path:
+    name = digest.hex()
+    return root / name[:2] / name
+
+
+class ChunkingBuffer:
+    """
+    Write side of the chunk store, handed to a Writer in place of a file.
+
+    The first `prefix` bytes (the header, patched once the body is written)
+    stay in memory for the recipe; the rest is cut into content-defined
+    chunks as it comes and every chunk not in the store yet is written to it.
+    Only the prefix can be written to again after seeking back.
+    """
+
+    def __init__(
+        self, store: "ChunkStore", name: str, prefix: int = HEADER_SIZE, throttle=None
+    ):
+        self._store = store
+        self._name = name
+        # IOThrottle (or meter) new chunks are paid for in
+        self._throttle = throttle
+        self._prefix = bytearray()
+        self._prefix_size = prefix
+        self._pending = bytearray()
+        self._position = 0
+        self._size = 0
+        self._chunks: list[tuple[bytes, int]] = []
+        # chunk directories written to, synced on close
+        self._directories: set = set()
+
+    def write(self, data) -> int:
+        written = len(data)
+        if self._position == self._size >= self._prefix_size:
+            # appending past the prefix, the common case
+            self._pending += data
+            self._position = self._size = self._size + written
+            if len(self._pending) >= _SCAN_SIZE:
+                self._flush(final=False)
+            return written
+        if self._position < self._prefix_size:
+            inline = min(written, self._prefix_size - self._position)
+            self._prefix[self._position : self._position + inline] = data[:inline]
+            self._position += inline
+            self._size = max(self._size, self._position)
+            data = data[inline:]
+        if len(data):
+            if self._position != self._size:
+                raise io.UnsupportedOperation("only the prefix can be rewritten")
+            self._pending += data
+            self._position += len(data)
+            if len(self._pending) >= _SCAN_SIZE:
+                self._flush(final=False)
+        self._size = max(self._size, self._position)
+        return written
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset != self._size and not 0 <= offset <= self._prefix_size:
+            raise io.UnsupportedOperation("only the prefix can be rewritten")
+        self._position = offset
+        return offset
+
+    def flush(self):
+        pass
+
+    def close(self) -> Recipe:
+        "Store what is left and return the recipe of everything written"
+        self._flush(final=True)
+        if self._store.durability == Durability.FILE_AND_DIR and self._directories:
+            for directory in self._directories:
+                fsync_directory(directory)
+            fsync_directory(self._store.root)
+        return Recipe(bytes(self._prefix), self._chunks)
+
+    def _flush(self, final: bool):
+        start = 0
+        for end in cut(self._pending, final):
+            data = bytes(self._pending[start:end])
+            self._chunks.append(
+                (
+                    self._store.put(
+                        data, self._name, self._directories, self._throttle
+                    ),
+                    len(data),
+                )
+            )
+            start = end
+        del self._pending[:start]
+
+
+class ChunkStore:
+    """
+    Content-addressed chunks shared by the snapshots of a directory.
+
+    Every chunk is stored once under `.chunks/` named by its digest, and a
+    snapshot written through a ChunkingBuffer is replaced by its recipe.
+    Reference counts are built from the recipes of the published snapshots
+    the first time they are needed and kept up to date by `track`, which
+    frees the chunks no snapshot uses anymore. Chunks written by a dump that
+    isn't published yet are pinned under its name until `release`.
+
+    A dump reuses a stored chunk without writing it, so the other processes
+    of the directory must not free it meanwhile: pinning takes a shared lock
+    on `.chunks.lock`, held while any dump of this process is unpublished,
+    and chunks are only freed under the exclusive lock. When it is busy the
+    orphaned chunks are kept and freed by a later call; under the lock the
+    snapshots `live` lists are counted again, in case another process
+    published one using them since.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        durability: Durability = Durability.FILE,
+        live: Callable[[], Iterable[str]] = None,
+    ):
+        self._directory = Path(directory)
+        self.root = self._directory / CHUNK_DIR
+        self.durability = durability
+        self._live = live
+        self._guard = FileLock(self._directory / f"{CHUNK_DIR}.lock")
+        self._lock = threading.Lock()
+        self._refs: dict[bytes, int] = {}
+        # snapshot name -> chunk digests it references, the counted snapshots
+        self._recipes: dict[str, list[bytes]] = {}
+        # unpublished snapshot name -> chunks it references
+        self._pins: dict[str, set] = {}
+        # unreferenced chunks waiting for the exclusive lock
+        self._orphans: set = set()
+        # bytes and chunks written since creation, to measure the savings
+        self.bytes_written = 0
+        self.chunks_written = 0
+        reset_after_fork(self)
+
+    def _after_fork(self):
+        # a background dump writes chunks in the child
+        self._lock = threading.Lock()
+
+    def buffer(self, name: str, throttle=None) -> ChunkingBuffer:
+        self.pin(name)
+        return ChunkingBuffer(self, name, throttle=throttle)
+
+    def pin(self, name: str):
+        "Pin the chunks of `name`, also the ones a forked child writes for it"
+        with self._lock:
+            self._pin(name)
+
+    def put(self, data, name: str, directories: set = None, throttle=None) -> bytes:
+        """
+        Store a chunk unless present, pinning it for the snapshot `name`.
+        Chunks actually written are paid for in `throttle` first.
+        """
+        digest = chunk_digest(data)
+        path = chunk_path(self.root, digest)
+        with self._lock:
+            self._pin(name)
+            self._pins[name].add(digest)
+            if path.exists():
+                return digest
+
+        if throttle is not None:
+            throttle.acquire(len(data))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+                if self.durability != Durability.NONE:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
+            raise
+        if directories is not None:
+            directories.add(path.parent)
+        with self._lock:
+            self.bytes_written += len(data)
+            self.chunks_written += 1
+        return digest
+
+    def release(self, name: str):
+        "Unpin the chunks of `name` once it is published or has failed"
+        with self._lock:
+            if self._pins.pop(name, None) is not None and not self._pins:
+                self._guard.release()
+
+    def track(self, names: Iterable[str]) -> int:
+        """
+        Count the references of the snapshots `names` (all the published
+        ones), dropping those of snapshots gone since the last call and
+        removing the chunks left without any. Returns the chunks removed.
+        """
+        if not self.root.exists():
+            return 0
+        with self._lock:
+            self._count(names)
+            return self._free()
+
+    def collect(self, names: Iterable[str]) -> int:
+        """
+        `track`, then remove every stored chunk no snapshot references, like
+        the ones left by a dump that crashed. Lists the whole store.
+        """
+        freed = self.track(names)
+        if not self.root.exists():
+            return freed
+        stored = set()
+        for directory in self.root.iterdir():
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                if path.name.startswith("."):
+                    continue
+                try:
+                    stored.add(bytes.fromhex(path.name))
+                except ValueError:
+                    continue
+        with self._lock:
+            self._orphans.update(stored.difference(self._refs))
+            return freed + self._free()
+
+    def _read_digests(self, name: str) -> list[bytes]:
+        try:
+            recipe = Recipe.read(self._directory / name)
+        except (OSError, ValueError):
+            # removed meanwhile or not readable, holds no chunk
+            return []
+        return [digest for digest, _ in recipe.chunks] if recipe else []
+
+    def _pin(self, name: str):
+        "Called holding the lock"
+        if name in self._pins:
+            return
+        if not self._pins:
+            self._guard.acquire(shared=True)
+        self._pins[name] = set()
+
+    def _count(self, names: Iterable[str]):
+        "Count the references of `names`, dropping the others; called holding the lock"
+        names = set(names)
+        for name in [name for name in self._recipes if name not in names]:
+            for digest in self._recipes.pop(name):
+                self._refs[digest] -= 1
+                if not self._refs[digest]:
+                    del self._refs[digest]
+                    self._orphans.add(digest)
+        for name in names.difference(self._recipes):
+            digests = self._read_digests(name)
+            self._recipes[name] = digests
+            for digest in digests:
+                self._refs[digest] = self._refs.get(digest, 0) + 1
+
+    def _free(self) -> int:
+        """
+        Remove the orphaned chunks unless a dump, in this process or another,
+        may be reusing them. Called holding the lock.
+        """
+        if not self._orphans or self._pins:
+            return 0
+        if not self._guard.acquire(blocking=False):
+            return 0
+        try:
+            if self._live is not None:
+                self._count(self._live())
+            freed = 0
+            for digest in self._orphans.difference(self._refs):
+                try:
+                    chunk_path(self.root, digest).unlink()
+                    freed += 1
+                except FileNotFoundError:
+                    continue
+            self._orphans.clear()
+            return freed
+        finally:
+            self._guard.release()
@@ -0,0 +1,111 @@
+from io import BytesIO
+from typing import BinaryIO, Iterable, Optional
+import zlib
+from .Writer import Writer, entry_digest, fingerprint
+from .Footer import Footer
+from .Header import FLAG_DELTA
+from .TypeHandler import EncodingTypes
+
+
+class DeltaWriter(Writer):
+    """
+    Writes only the top level entries that differ from a base snapshot.
+
+    Entries are compared by the digest of their encoded bytes against
+    `base_hashes` (the per key digests recorded in the base footers), so the
+    base never has to be decoded. The body holds the added and changed entries
+    and is readable by `Reader` as a partial dict; the footer names the base,
+    the deleted keys and the digests of the written entries.
+
+    When the changed `keys` are known (e.g. from a TrackedDict) only those are
+    encoded, present ones are written and missing ones recorded as deleted;
+    with `base_hashes` too, those the base already holds as they are are left out.
+    """
+
+    def __init__(
+        self,
+        source: dict = None,
+        buffer: BinaryIO = None,
+        base: str = None,
+        base_hashes: dict[str, bytes] = None,
+        chunk_size: int = None,
+        keys: Iterable = None,
+        header: bool = False,
+    ):
+        super().__init__(source, buffer, chunk_size, hash_keys=True, header=header)
+        self._base = base
+        self._base_hashes = base_hashes or {}
+        self._diffed = base_hashes is not None
+        self._keys = keys
+        self._deleted: list[str] = []
+
+    @property
+    def deleted(self) -> list[str]:
+        return self._deleted
+
+    def write_body(self):
+        scratch = BytesIO()
+        writer = Writer(buffer=scratch)
+        changed = []
+        self._key_hashes = {}
+        if self._keys is None:
+            items = self._source.items()
+            keys = {str(key) for key in self._source}
+            self._deleted = [key for key in self._base_hashes if key not in keys]
+        else:
+            items = [
+                (key, self._source[key]) for key in self._keys if key in self._source
+            ]
+            self._deleted = [
+                str(key)
+                for key in self._keys
+                if key not in self._source
+                and (not self._diffed or str(key) in self._base_hashes)
+            ]
+
+        for key, value in items:
+            scratch.seek(0)
+            scratch.truncate()
+            writer.write_key_value(key, value)
+            data = scratch.getvalue()
+            digest = entry_digest(data).digest()
+            if self._base_hashes.get(str(key)) != digest:
+                changed.append(data)
+                self._key_hashes[str(key)] = digest
+
+        self._entries = len(changed)
+        offset = self.write_length(len(changed))
+        self._chunks = []
+        self._crcs = []
+        chunk_size = self._chunk_size or len(changed) or 1
+        for i in range(0, len(changed), chunk_size):
+            batch = changed[i : i + chunk_size]
+            length, crc = 0, 0
+            for data in batch:
+                self._buffer.write(data)
+                length += len(data)
+                crc = zlib.crc32(data, crc)
+            self._chunks.append((offset, length, len(batch)))
+            self._crcs.append(crc)
+            offset += length
+
+        self.write_encoding(EncodingTypes.EOF)
+        footer = Footer()
+        footer.set_base(self._base)
+        footer.set_deleted(self._deleted)
+        self.write_footer(offset + 1, footer)
+
+    @property
+    def fingerprint(self) -> Optional[bytes]:
+        "Fingerprint of the state base and delta describe, None when `keys` were given"
+        if self._keys is not None:
+            # the digests of the base aren't known
+            return None
+        state = dict(self._base_hashes)
+        for key in self._deleted:
+            state.pop(key, None)
+        state.update(self._key_hashes)
+        return fingerprint(state)
+
+    def _header_flags(self) -> int:
+        return super()._header_flags() | FLAG_DELTA
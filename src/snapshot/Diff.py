@@ -0,0 +1,195 @@
+from itertools import zip_longest
+from typing import BinaryIO, Iterator, List
+from .Footer import Footer
+from .Reader import Reader, CorruptSnapshotError, _DECODE_ERRORS
+from .Shards import find_keys
+from .Writer import entry_digest
+
+# read size when hashing the encoded bytes of an entry
+BLOCK_SIZE = 1024 * 1024
+
+
+class SnapshotDiff:
+    """
+    Outcome of `diff_snapshots` and SnapshotManager.diff().
+
+    `added`, `removed` and `changed` are sorted lists of paths, tuples of
+    the keys (and list indexes) leading from the top level to what differs.
+    A value whose type changed, or a list item that moved, is `changed` as
+    a whole.
+    """
+
+    __slots__ = ("added", "removed", "changed")
+
+    def __init__(self):
+        self.added: list[tuple] = []
+        self.removed: list[tuple] = []
+        self.changed: list[tuple] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return (
+            f"SnapshotDiff(added={self.added}, removed={self.removed}, "
+            f"changed={self.changed})"
+        )
+
+    def sort(self):
+        self.added.sort()
+        self.removed.sort()
+        self.changed.sort()
+
+
+def _differ(before, after) -> bool:
+    return type(before) is not type(after) or before != after
+
+
+def diff_values(before, after, path: tuple = (), result: SnapshotDiff = None):
+    "Paths that differ between two decoded values, descending into dicts and lists"
+    if result is None:
+        result = diff_values(before, after, path, SnapshotDiff())
+        result.sort()
+        return result
+    if isinstance(before, dict) and isinstance(after, dict):
+        result.removed.extend(path + (key,) for key in before.keys() - after.keys())
+        result.added.extend(path + (key,) for key in after.keys() - before.keys())
+        for key in before.keys() & after.keys():
+            if _differ(before[key], after[key]):
+                diff_values(before[key], after[key], path + (key,), result)
+    elif isinstance(before, list) and isinstance(after, list):
+        for index in range(min(len(before), len(after))):
+            if _differ(before[index], after[index]):
+                diff_values(before[index], after[index], path + (index,), result)
+        result.removed.extend(path + (i,) for i in range(len(after), len(before)))
+        result.added.extend(path + (i,) for i in range(len(before), len(after)))
+    elif _differ(before, after):
+        result.changed.append(path)
+    return result
+
+
+def diff_digests(before: dict, after: dict) -> SnapshotDiff:
+    "Top level keys added, removed and changed between two key to entry digest maps"
+    result = SnapshotDiff()
+    result.removed = [(key,) for key in before.keys() - after.keys()]
+    result.added = [(key,) for key in after.keys() - before.keys()]
+    result.changed = [
+        (key,) for key, digest in before.items() if after.get(key, digest) != digest
+    ]
+    result.sort()
+    return result
+
+
+def entry_digests(buffer: BinaryIO) -> Iterator[tuple]:
+    """
+    (key, digest) of every top level entry from the current position, the
+    digest being the one Writer(hash_keys=True) stores for the entry. Values
+    are skipped over and their encoded bytes hashed, nothing is decoded.
+    """
+    reader = Reader(buffer)
+    try:
+        reader.read_header()
+        count = reader.read_length()
+        for index in range(count):
+            start = buffer.tell()
+            key = reader.skip_key_value()
+            if key is None:
+                raise CorruptSnapshotError(
+                    f"Snapshot ended after {index} of {count} entries"
+                )
+            remaining = buffer.tell() - start
+            buffer.seek(start)
+            digest = entry_digest()
+            while remaining:
+                data = buffer.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    raise CorruptSnapshotError(f"Entry {key!r} runs past the end")
+                digest.update(data)
+                remaining -= len(data)
+            yield key, digest.digest()
+    except _DECODE_ERRORS as e:
+        if isinstance(e, CorruptSnapshotError):
+            raise
+        raise CorruptSnapshotError(f"Corrupt snapshot: {e!r}") from e
+
+
+def state_digests(files: List[tuple]) -> dict:
+    """
+    Entry digests of the state the (open, footer) files of a delta chain
+    describe, oldest first. Files recording none are hashed.
+    """
+    digests = {}
+    for open_file, footer in files:
+        key_hashes = footer.key_hashes() if footer is not None else None
+        if key_hashes is None:
+            with open_file() as f:
+                key_hashes = dict(entry_digests(f))
+        for key in footer.deleted() if footer is not None else ():
+            digests.pop(key, None)
+        digests.update(key_hashes)
+    return digests
+
+
+def _walk(before: BinaryIO, after: BinaryIO) -> SnapshotDiff:
+    "Both bodies side by side, only entries not matched yet are held"
+    result = SnapshotDiff()
+    pending = ({}, {})
+    for pair in zip_longest(entry_digests(before), entry_digests(after)):
+        if pair[0] == pair[1]:
+            continue
+        for side, entry in enumerate(pair):
+            if entry is None:
+                continue
+            key, digest = entry
+            other = pending[1 - side].pop(key, None)
+            if other is None:
+                pending[side][key] = digest
+            elif other != digest:
+                result.changed.append((key,))
+    result.removed = [(key,) for key in pending[0]]
+    result.added = [(key,) for key in pending[1]]
+    result.sort()
+    return result
+
+
+def descend(result: SnapshotDiff, before: dict, after: dict, nested: bool = True):
+    """
+    Replaces the top level keys in `result.changed` by what differs in
+    their decoded values `before` and `after`, entries whose bytes differ
+    but decode equal are dropped.
+    """
+    changed, result.changed = result.changed, []
+    for path in changed:
+        key = path[0]
+        if nested:
+            diff_values(before[key], after[key], path, result)
+        elif _differ(before[key], after[key]):
+            result.changed.append(path)
+    result.sort()
+
+
+def diff_snapshots(
+    before: BinaryIO, after: BinaryIO, nested: bool = True
+) -> SnapshotDiff:
+    """
+    Differences going from the snapshot at the current position of `before`
+    to the one of `after`. Top level entries are compared by the digests in
+    the footers when both have them, else by hashing their encoded bytes in
+    one pass over both bodies, and only the entries that differ are decoded
+    to find the paths inside them (`nested`) or confirm they changed.
+    """
+    starts = before.tell(), after.tell()
+    footers = Footer.read(before, starts[0]), Footer.read(after, starts[1])
+    digests = [footer.key_hashes() if footer else None for footer in footers]
+    if None in digests:
+        result = _walk(before, after)
+    else:
+        result = diff_digests(*digests)
+    if result.changed:
+        keys = [path[0] for path in result.changed]
+        values = []
+        for buffer, start, footer in zip((before, after), starts, footers):
+            buffer.seek(start)
+            values.append(find_keys(buffer, keys, footer))
+        descend(result, *values, nested=nested)
+    return result
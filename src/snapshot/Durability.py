@@ -0,0 +1,98 @@
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Optional
+import os
+import threading
+import time
+
+
+class Durability(Enum):
+    # rename only, the OS flushes when it likes; a crash may lose the snapshot
+    NONE = "none"
+    # fsync the file before renaming it in place, a crash never leaves a torn
+    # snapshot but may lose the rename
+    FILE = "file"
+    # also fsync the directory (and manifest) so the snapshot survives a crash
+    FILE_AND_DIR = "file+dir"
+
+
+def fsync_directory(path: Path):
+    "Makes renames and creations in `path` durable"
+    if os.name == "nt":
+        # directories can't be opened for fsync, NTFS journals renames itself
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class GroupCommit:
+    """
+    Shares one `sync` call between callers that ask for it close together.
+
+    A caller is only released once a sync that started after its request has
+    finished. The first caller becomes the leader, optionally waits `window`
+    seconds for others to join, and syncs once for everyone who asked before
+    it started; requests arriving meanwhile are batched into the next round.
+    """
+
+    def __init__(self, sync: Callable[[], None], window: float = 0.0):
+        self._sync = sync
+        self._window = window
+        self._cond = threading.Condition()
+        self._requested = 0
+        self._synced = 0
+        self._running = False
+        # failed rounds: last ticket -> [first ticket, waiters left, error]
+        self._failures: dict[int, list] = {}
+        self.requests = 0
+        self.syncs = 0
+
+    def sync(self):
+        with self._cond:
+            self._requested += 1
+            self.requests += 1
+            ticket = self._requested
+            while self._synced < ticket:
+                if self._running:
+                    self._cond.wait()
+                else:
+                    self._lead()
+            error = self._failure(ticket)
+        if error is not None:
+            raise error
+
+    def _lead(self):
+        "Runs one sync for every request made so far, called holding the lock"
+        self._running = True
+        first = self._synced + 1
+        target, error = self._requested, None
+        self._cond.release()
+        try:
+            if self._window:
+                time.sleep(self._window)
+            with self._cond:
+                target = self._requested
+            self._sync()
+        except BaseException as e:
+            error = e
+        finally:
+            self._cond.acquire()
+            self.syncs += 1
+            self._synced = target
+            self._running = False
+            if error is not None:
+                self._failures[target] = [first, target - first + 1, error]
+            self._cond.notify_all()
+
+    def _failure(self, ticket: int) -> Optional[BaseException]:
+        for target, failure in list(self._failures.items()):
+            first, waiting, error = failure
+            if first <= ticket <= target:
+                failure[1] -= 1
+                if failure[1] == 0:
+                    del self._failures[target]
+                return error
+        return None
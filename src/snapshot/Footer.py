@@ -0,0 +1,187 @@
+from typing import BinaryIO, Optional
+import struct
+from .Header import HEADER_MAGIC, HEADER_SIZE
+
+FOOTER_MAGIC = b"PSNF"
+CHUNK_SECTION = b"CHNK"
+# digest of the encoded bytes of every top level entry
+KEY_HASH_SECTION = b"KEYH"
+# name of the snapshot a delta applies to
+BASE_SECTION = b"BASE"
+# top level keys a delta removes from its base
+DELETED_SECTION = b"DELS"
+# CRC32 of the bytes of every chunk, in chunk order
+CRC_SECTION = b"CRCS"
+# fingerprint of the whole state the snapshot describes, deltas included
+FINGERPRINT_SECTION = b"FPRT"
+# last append only log segment the state includes
+LOG_SECTION = b"AOFS"
+
+# section count, section table offset, magic
+_TRAILER = struct.Struct("<IQ4s")
+# tag, offset, length
+_SECTION = struct.Struct("<4sQQ")
+# offset, length, entry count
+_CHUNK = struct.Struct("<QQI")
+_KEY_LENGTH = struct.Struct("<I")
+_CRC = struct.Struct("<I")
+_SEQUENCE = struct.Struct("<Q")
+KEY_DIGEST_SIZE = 8
+
+
+def _pack_keys(keys) -> bytes:
+    parts = []
+    for key in keys:
+        key = key.encode("utf-8")
+        parts.append(_KEY_LENGTH.pack(len(key)))
+        parts.append(key)
+    return b"".join(parts)
+
+
+def _unpack_keys(payload: bytes, trailing: int = 0):
+    "Yields (key, `trailing` bytes stored after the key)"
+    view = memoryview(payload)
+    pos = 0
+    while pos < len(view):
+        (length,) = _KEY_LENGTH.unpack_from(view, pos)
+        pos += _KEY_LENGTH.size
+        key = bytes(view[pos : pos + length]).decode("utf-8")
+        pos += length
+        yield key, bytes(view[pos : pos + trailing])
+        pos += trailing
+
+
+class Footer:
+    """
+    Optional trailer written after the EOF marker of a snapshot.
+
+    The plain `Reader` stops at the EOF marker so anything written here is
+    invisible to it. Sections are tagged byte blobs; all offsets are relative
+    to the start of the body (after the header, if any) so snapshots embedded
+    in a larger buffer still resolve.
+    """
+
+    def __init__(self, sections: dict[bytes, bytes] = None):
+        self._sections: dict[bytes, bytes] = dict(sections or {})
+        # parsed key digests, unpacking them is the slow part of a large footer
+        self._key_hashes: Optional[dict[str, bytes]] = None
+
+    def add_section(self, tag: bytes, payload: bytes):
+        if len(tag) != 4:
+            raise ValueError("Section tag must be 4 bytes")
+        self._sections[tag] = payload
+        self._key_hashes = None
+
+    def get_section(self, tag: bytes) -> Optional[bytes]:
+        return self._sections.get(tag)
+
+    def set_chunks(self, chunks: list[tuple[int, int, int]]):
+        self.add_section(
+            CHUNK_SECTION, b"".join(_CHUNK.pack(*chunk) for chunk in chunks)
+        )
+
+    def chunks(self) -> list[tuple[int, int, int]]:
+        payload = self.get_section(CHUNK_SECTION)
+        if not payload:
+            return []
+        return [chunk for chunk in _CHUNK.iter_unpack(payload)]
+
+    def set_crcs(self, crcs: list[int]):
+        self.add_section(CRC_SECTION, b"".join(_CRC.pack(crc) for crc in crcs))
+
+    def crcs(self) -> list[int]:
+        "Empty for snapshots written before chunks were checksummed"
+        payload = self.get_section(CRC_SECTION)
+        return [crc for (crc,) in _CRC.iter_unpack(payload or b"")]
+
+    def set_key_hashes(self, key_hashes: dict[str, bytes]):
+        parts = []
+        for key, digest in key_hashes.items():
+            key = key.encode("utf-8")
+            parts.append(_KEY_LENGTH.pack(len(key)) + key + digest)
+        self.add_section(KEY_HASH_SECTION, b"".join(parts))
+
+    def key_hashes(self) -> Optional[dict[str, bytes]]:
+        "A copy the caller may change"
+        if self._key_hashes is None:
+            payload = self.get_section(KEY_HASH_SECTION)
+            if payload is None:
+                return None
+            self._key_hashes = dict(_unpack_keys(payload, KEY_DIGEST_SIZE))
+        return dict(self._key_hashes)
+
+    def set_fingerprint(self, fingerprint: bytes):
+        self.add_section(FINGERPRINT_SECTION, fingerprint)
+
+    def fingerprint(self) -> Optional[bytes]:
+        "None for snapshots written before fingerprints were recorded"
+        return self.get_section(FINGERPRINT_SECTION)
+
+    def set_log_sequence(self, sequence: int):
+        self.add_section(LOG_SECTION, _SEQUENCE.pack(sequence))
+
+    def log_sequence(self) -> Optional[int]:
+        "None for snapshots that include no log segment"
+        payload = self.get_section(LOG_SECTION)
+        return _SEQUENCE.unpack(payload)[0] if payload else None
+
+    def set_base(self, name: str):
+        self.add_section(BASE_SECTION, name.encode("utf-8"))
+
+    def base(self) -> Optional[str]:
+        payload = self.get_section(BASE_SECTION)
+        return payload.decode("utf-8") if payload else None
+
+    def set_deleted(self, keys: list[str]):
+        self.add_section(DELETED_SECTION, _pack_keys(keys))
+
+    def deleted(self) -> list[str]:
+        payload = self.get_section(DELETED_SECTION)
+        return [key for key, _ in _unpack_keys(payload or b"")]
+
+    def write(self, buffer: BinaryIO, offset: int) -> int:
+        "`offset` is the position of the footer relative to the snapshot start"
+        written = 0
+        table = []
+        for tag, payload in self._sections.items():
+            table.append(_SECTION.pack(tag, offset + written, len(payload)))
+            written += buffer.write(payload)
+
+        table_offset = offset + written
+        for entry in table:
+            written += buffer.write(entry)
+        written += buffer.write(
+            _TRAILER.pack(len(self._sections), table_offset, FOOTER_MAGIC)
+        )
+        return written
+
+    @classmethod
+    def read(cls, buffer: BinaryIO, start: int = 0) -> Optional["Footer"]:
+        "Returns None when the snapshot has no footer"
+        current_pos = buffer.tell()
+        try:
+            # offsets are relative to the body, after the header if there is one
+            # the magic is enough, a damaged header still takes its space
+            buffer.seek(start)
+            if buffer.read(len(HEADER_MAGIC)) == HEADER_MAGIC:
+                start += HEADER_SIZE
+            end = buffer.seek(0, 2)
+            if end - start < _TRAILER.size:
+                return None
+            buffer.seek(end - _TRAILER.size)
+            count, table_offset, magic = _TRAILER.unpack(buffer.read(_TRAILER.size))
+            if magic != FOOTER_MAGIC:
+                return None
+
+            buffer.seek(start + table_offset)
+            table = buffer.read(count * _SECTION.size)
+            if len(table) != count * _SECTION.size:
+                return None
+
+            sections = {}
+            for tag, offset, length in _SECTION.iter_unpack(table):
+                buffer.seek(start + offset)
+                sections[tag] = buffer.read(length)
+            return cls(sections)
+        finally:
+            buffer.seek(current_pos)
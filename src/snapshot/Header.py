@@ -0,0 +1,104 @@
+from typing import BinaryIO, Optional
+import struct
+import zlib
+
+# the high bit can't start the length prefix of a snapshot without a header
+HEADER_MAGIC = b"\x89PSN"
+HEADER_VERSION = 1
+# values are still zlib compressed one by one when that's smaller
+CODEC_NONE = 0
+# the body is followed by a Footer
+FLAG_FOOTER = 1
+# the snapshot is a delta against the base named in its footer
+FLAG_DELTA = 2
+
+# magic, version, codec, flags, body size, entry count, creation time, checksum
+_HEADER = struct.Struct("<4sHBBQQd8s")
+_CRC = struct.Struct("<I")
+HEADER_SIZE = _HEADER.size + _CRC.size
+
+
+class Header:
+    """
+    Fixed size header written before the body when a Writer is asked for one.
+
+    `size` is the encoded body (length prefix up to the EOF marker), `entries`
+    the top level entries in it, `created` the POSIX time the write started
+    and `checksum` the blake2b digest of everything after the header. The
+    header carries a CRC32 of its own fields so a damaged one is told apart
+    from a snapshot without header.
+    """
+
+    def __init__(
+        self,
+        version: int = HEADER_VERSION,
+        codec: int = CODEC_NONE,
+        flags: int = 0,
+        size: int = 0,
+        entries: int = 0,
+        created: float = 0.0,
+        checksum: bytes = bytes(8),
+    ):
+        self.version = version
+        self.codec = codec
+        self.flags = flags
+        self.size = size
+        self.entries = entries
+        self.created = created
+        self.checksum = checksum
+
+    @property
+    def has_footer(self) -> bool:
+        return bool(self.flags & FLAG_FOOTER)
+
+    @property
+    def delta(self) -> bool:
+        return bool(self.flags & FLAG_DELTA)
+
+    def pack(self) -> bytes:
+        fields = _HEADER.pack(
+            HEADER_MAGIC,
+            self.version,
+            self.codec,
+            self.flags,
+            self.size,
+            self.entries,
+            self.created,
+            self.checksum,
+        )
+        return fields + _CRC.pack(zlib.crc32(fields))
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "Header":
+        if len(data) < HEADER_SIZE or data[: len(HEADER_MAGIC)] != HEADER_MAGIC:
+            raise ValueError("Not a snapshot header")
+        fields = data[: _HEADER.size]
+        (crc,) = _CRC.unpack_from(data, _HEADER.size)
+        if zlib.crc32(fields) != crc:
+            raise ValueError("Snapshot header checksum mismatch")
+        _, version, codec, flags, size, entries, created, checksum = _HEADER.unpack(
+            fields
+        )
+        if version > HEADER_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {version}")
+        return cls(version, codec, flags, size, entries, created, checksum)
+
+    @classmethod
+    def read(cls, buffer: BinaryIO) -> Optional["Header"]:
+        """
+        Header at the current position, leaving the buffer after it. Returns
+        None and leaves the position alone for snapshots without one.
+        """
+        start = buffer.tell()
+        magic = buffer.read(len(HEADER_MAGIC))
+        if magic != HEADER_MAGIC:
+            buffer.seek(start)
+            return None
+        return cls.unpack(magic + buffer.read(HEADER_SIZE - len(HEADER_MAGIC)))
+
+    def __repr__(self):
+        return (
+            f"Header(version={self.version}, codec={self.codec}, "
+            f"flags={self.flags}, size={self.size}, entries={self.entries}, "
+            f"created={self.created}, checksum={self.checksum.hex()})"
+        )
@@ -0,0 +1,192 @@
+from io import BytesIO
+from typing import BinaryIO, Optional
+import zlib
+from .Reader import Reader, CorruptSnapshotError
+from .TypeRegistry import TypeNotFoundException
+from .Footer import Footer
+from .Header import Header, HEADER_MAGIC, HEADER_SIZE
+from .Writer import entry_digest
+
+# read size of verify(), large enough to run at disk speed
+BLOCK_SIZE = 1024 * 1024
+
+
+class Verification:
+    """
+    Outcome of `verify`.
+
+    `header` is the parsed header (None when missing or damaged), `chunks`
+    the number of chunks whose CRC was checked, `bad_chunks` the indexes of
+    those that failed and `errors` a description of every problem found.
+    """
+
+    __slots__ = ("header", "chunks", "bad_chunks", "errors")
+
+    def __init__(self):
+        self.header: Optional[Header] = None
+        self.chunks = 0
+        self.bad_chunks: list[int] = []
+        self.errors: list[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def __repr__(self):
+        return (
+            f"Verification(ok={self.ok}, chunks={self.chunks}, "
+            f"bad_chunks={self.bad_chunks}, errors={self.errors})"
+        )
+
+
+def _body_start(buffer: BinaryIO) -> int:
+    "Position of the body, a damaged header still takes its space"
+    buffer.seek(0)
+    return HEADER_SIZE if buffer.read(len(HEADER_MAGIC)) == HEADER_MAGIC else 0
+
+
+def _directory(footer: Optional[Footer], size: int) -> tuple[list, list]:
+    "Chunk directory and CRCs when they describe `size` body bytes, else empty"
+    chunks = footer.chunks() if footer else []
+    crcs = footer.crcs() if footer else []
+    if not chunks or len(crcs) != len(chunks):
+        return [], []
+    end = 0
+    for offset, length, _ in chunks:
+        if offset < end or offset + length > size:
+            return [], []
+        end = offset + length
+    return chunks, crcs
+
+
+def verify(buffer: BinaryIO, block_size: int = BLOCK_SIZE) -> Verification:
+    """
+    Checks a snapshot without decoding it: the header CRC, the checksum of
+    everything after the header and the CRC32 of every chunk, all in one
+    sequential pass over the raw bytes. Snapshots written with neither a
+    header nor a chunk directory can only be checked by decoding them.
+    """
+    result = Verification()
+    body = _body_start(buffer)
+    if body:
+        buffer.seek(0)
+        try:
+            result.header = Header.read(buffer)
+        except ValueError as e:
+            result.errors.append(f"header: {e}")
+    size = buffer.seek(0, 2) - body
+    try:
+        footer = Footer.read(buffer)
+    except (ValueError, UnicodeDecodeError):
+        footer = None
+    chunks, crcs = _directory(footer, size)
+    if footer is not None and footer.chunks() and not chunks:
+        result.errors.append("chunk directory doesn't match the body")
+
+    if result.header is None and not chunks:
+        if body:
+            return result
+        buffer.seek(0)
+        try:
+            Reader(buffer).read()
+        except (CorruptSnapshotError, TypeNotFoundException) as e:
+            result.errors.append(str(e))
+        return result
+
+    hasher = entry_digest() if result.header is not None else None
+    index, crc, position = 0, 0, 0
+    buffer.seek(body)
+    while True:
+        try:
+            block = buffer.read(block_size)
+        except CorruptSnapshotError as e:
+            # a chunk store chunk is missing or damaged, the rest is unread
+            result.errors.append(str(e))
+            hasher = None
+            break
+        if not block:
+            break
+        if hasher is not None:
+            hasher.update(block)
+        view = memoryview(block)
+        end = position + len(block)
+        # feed the part of every chunk this block covers to its CRC
+        while index < len(chunks):
+            offset, length, _ = chunks[index]
+            low, high = max(offset, position), min(offset + length, end)
+            if low < high:
+                crc = zlib.crc32(view[low - position : high - position], crc)
+            if offset + length > end:
+                break
+            if crc != crcs[index]:
+                result.bad_chunks.append(index)
+            index, crc = index + 1, 0
+        position = end
+
+    result.chunks = len(chunks)
+    result.bad_chunks.extend(range(index, len(chunks)))
+    for bad in result.bad_chunks:
+        offset, length, count = chunks[bad]
+        result.errors.append(
+            f"chunk {bad} ({count} entries at {offset}+{length}) CRC mismatch"
+        )
+    if hasher is not None and hasher.digest() != result.header.checksum:
+        result.errors.append("checksum mismatch")
+    return result
+
+
+def salvage(buffer: BinaryIO) -> tuple[dict, int]:
+    """
+    Reads what survives of a damaged snapshot, returning it with the number
+    of top level entries lost. Chunks whose CRC doesn't match are skipped
+    and decoding resumes at the next good one; without a chunk directory the
+    entries before the first damage are kept.
+    """
+    body = _body_start(buffer)
+    size = buffer.seek(0, 2) - body
+    header = None
+    if body:
+        buffer.seek(0)
+        try:
+            header = Header.read(buffer)
+        except ValueError:
+            pass
+    try:
+        footer = Footer.read(buffer)
+    except (ValueError, UnicodeDecodeError):
+        footer = None
+    chunks, crcs = _directory(footer, size)
+
+    result, lost = {}, 0
+    if not chunks:
+        buffer.seek(body)
+        reader = Reader(buffer)
+        expected = header.entries if header else None
+        # anything a damaged body makes a decoder raise ends the salvage
+        try:
+            count = reader.read_length()
+            expected = count if expected is None else expected
+            for _ in range(count):
+                key, value = reader.read_key_value()
+                if key is None:
+                    break
+                result[key] = value
+        except Exception:
+            pass
+        return result, max((expected or 0) - len(result), 0)
+
+    for (offset, length, count), crc in zip(chunks, crcs):
+        buffer.seek(body + offset)
+        try:
+            data = buffer.read(length)
+        except CorruptSnapshotError:
+            lost += count
+            continue
+        if zlib.crc32(data) != crc:
+            lost += count
+            continue
+        try:
+            result.update(Reader(BytesIO(data)).read_entries(count))
+        except Exception:
+            lost += count
+    return result, lost
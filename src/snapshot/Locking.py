@@ -0,0 +1,190 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+import os
+import threading
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, locks only exclude the threads of one process
+    fcntl = None
+
+LOCK_NAME = ".lock"
+
+# objects whose _after_fork() a forked child calls before anything else
+_forked: weakref.WeakSet = weakref.WeakSet()
+
+
+def reset_after_fork(obj):
+    """
+    Have a forked child call `obj._after_fork()`, to replace the thread locks
+    another thread of the parent may have held at the fork.
+    """
+    _forked.add(obj)
+
+
+class FileLock:
+    """
+    flock() on a lock file, coordinating the processes sharing a snapshot
+    directory.
+
+    `exclusive()` excludes the other processes and the other threads of this
+    one, and is reentrant. `acquire()` and `release()` are the bare calls on
+    the one descriptor of the lock, for callers keeping count of their own
+    holders. A forked child starts without the locks its parent held.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd: Optional[int] = None
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        reset_after_fork(self)
+
+    def acquire(self, shared: bool = False, blocking: bool = True) -> bool:
+        "Take the lock, False when `blocking` is off and another process holds it"
+        fd = self._descriptor()
+        if fcntl is None:
+            return True
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            return False
+        return True
+
+    def release(self):
+        if fcntl is not None and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._thread_lock:
+            if not self._depth:
+                self.acquire()
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if not self._depth:
+                    self.release()
+
+    def close(self):
+        with self._thread_lock:
+            if self._fd is not None and not self._depth:
+                os.close(self._fd)
+                self._fd = None
+
+    def _descriptor(self) -> int:
+        with self._thread_lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            return self._fd
+
+    def _after_fork(self):
+        # the inherited descriptor shares the parent's locks, closing our copy
+        # leaves them with the parent
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = None
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+
+
+def _reset_after_fork():
+    for obj in list(_forked):
+        obj._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextmanager
+def read_lease(path: Path) -> Iterator[bool]:
+    """
+    Shared lock on a published snapshot file while the block reads it, so
+    `claim` fails for it in every process. Yields False when the file was
+    removed before the lease was taken.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        yield False
+        return
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+        # unlinked between being opened and leased
+        yield os.fstat(fd).st_nlink > 0
+    finally:
+        os.close(fd)
+
+
+def claim(path: Path) -> Optional[int]:
+    """
+    Descriptor holding `path` exclusively until closed, None while a reader
+    leases it. Raises FileNotFoundError when it doesn't exist.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+    return fd
+
+
+def create_locked(path: Path) -> int:
+    """
+    Descriptor of the new file `path`, locked exclusively until closed.
+    FileExistsError while another descriptor holds it; a file nobody holds,
+    left by a crashed writer, is replaced.
+    """
+    if fcntl is None:
+        return os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o666)
+    while True:
+        # locked under a name of its own before it shows up as `path`
+        fresh = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}")
+        fd = os.open(fresh, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.link(fresh, path)
+            return fd
+        except FileExistsError:
+            os.close(fd)
+        except BaseException:
+            os.close(fd)
+            raise
+        finally:
+            os.unlink(fresh)
+        if not _reclaim(path):
+            raise FileExistsError(path)
+
+
+def _reclaim(path: Path) -> bool:
+    "Remove `path` unless a descriptor holds it, True when the name may be free"
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return True
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            # not replaced by a concurrent reclaim since it was opened
+            if os.path.samestat(os.fstat(fd), os.stat(path)):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return True
+    finally:
+        os.close(fd)
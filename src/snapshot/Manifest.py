@@ -0,0 +1,444 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional
+import contextlib
+import os
+import struct
+import threading
+from .Reader import Reader
+from .Storage import FileSystemBackend
+from .Shards import ShardMap
+from .Writer import entry_digest
+
+MANIFEST_NAME = ".manifest"
+_ADD = "+"
+_REMOVE = "-"
+
+
+def checksum(data=b""):
+    "Hash object used for the whole file checksum recorded in the manifest"
+    return entry_digest(data)
+
+
+class ManifestEntry:
+    __slots__ = ("name", "timestamp", "size", "entries", "checksum")
+
+    def __init__(
+        self, name: str, timestamp: float, size: int, entries: int, checksum: str
+    ):
+        self.name = name
+        # creation time (POSIX seconds) encoded in the name, mtime for foreign files
+        self.timestamp = timestamp
+        self.size = size
+        # top level entries stored in the file (changed entries only for deltas)
+        self.entries = entries
+        self.checksum = checksum
+
+    def __eq__(self, other):
+        if not isinstance(other, ManifestEntry):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"ManifestEntry({fields})"
+
+
+def entry_order(entry: ManifestEntry):
+    "Sort key of the manifest, oldest first"
+    # name_10 sorts after name_9
+    return entry.timestamp, len(entry.name), entry.name
+
+
+class Manifest:
+    """
+    Append-only index of the snapshots in a directory.
+
+    Every publish appends a `+` line (name, timestamp, size, entry count,
+    checksum) and every prune a `-` line, each with a single `O_APPEND` write
+    so processes sharing the directory (e.g. forked background dumps) can
+    append concurrently. Readers keep the parsed index in memory and only read
+    the lines appended since the last call, one `stat` per lookup instead of a
+    directory listing. A missing manifest is rebuilt by rescanning the
+    directory; once removals outnumber the live entries the file is rewritten.
+
+    The entries are kept sorted by timestamp, with a parallel list of the
+    timestamps, so nearest/floor/ceiling and range lookups are a `bisect`.
+    New snapshots are the newest ones, appending them keeps the order.
+    Observers are told of every change to the index as it is parsed, with a
+    version number that `snapshot()` also returns.
+
+    With a directory `lock` (a FileLock) appends and rewrites take it, so a
+    rewrite never drops the lines another process appends meanwhile. A
+    missing manifest is rebuilt without the lock but never replaces one
+    another process wrote first.
+    """
+
+    def __init__(self, directory: Path, datetime_format: str, storage=None, lock=None):
+        self._directory = Path(directory)
+        # where the snapshots are, the manifest itself stays in `directory`
+        self._storage = storage or FileSystemBackend(self._directory)
+        self._guard = lock
+        self._file = self._directory / MANIFEST_NAME
+        self._datetime_format = datetime_format
+        self._lock = threading.Lock()
+        self._entries: dict[str, ManifestEntry] = {}
+        # sorted view of _entries and its timestamps, rebuilt when None
+        self._sorted: Optional[List[ManifestEntry]] = None
+        self._timestamps: List[float] = []
+        self._removed = 0
+        # identity of the parsed file and how far it was parsed
+        self._inode: Optional[int] = None
+        self._offset = 0
+        # bumped on every change of the index, reported to the observers
+        self._version = 0
+        self._observers: List[Callable] = []
+
+    @property
+    def path(self) -> Path:
+        return self._file
+
+    def observe(self, observer: Callable[[int, Optional[str], ManifestEntry], None]):
+        """
+        Call `observer(version, "+" or "-", entry)` for each entry added to or
+        removed from the index, with None and no entry when it is reloaded.
+        It runs under the manifest lock and must not call back into it.
+        """
+        with self._lock:
+            self._observers.append(observer)
+            self._changed(None)
+
+    def snapshot(self) -> tuple:
+        "Version of the index and its live entries, oldest first"
+        with self._lock:
+            entries = list(self._index())
+            return self._version, entries
+
+    def refresh(self):
+        "Parse the lines appended since the last lookup"
+        with self._lock:
+            self._refresh()
+
+    def entries(self) -> List[ManifestEntry]:
+        "Live entries, oldest first"
+        with self._lock:
+            return list(self._index())
+
+    def floor(self, timestamp: float) -> Optional[ManifestEntry]:
+        "Newest entry at or before `timestamp`"
+        with self._lock:
+            entries = self._index()
+            i = bisect_right(self._timestamps, timestamp)
+            return entries[i - 1] if i else None
+
+    def ceiling(self, timestamp: float) -> Optional[ManifestEntry]:
+        "Oldest entry at or after `timestamp`"
+        with self._lock:
+            entries = self._index()
+            i = bisect_left(self._timestamps, timestamp)
+            return entries[i] if i < len(entries) else None
+
+    def nearest(self, timestamp: float) -> Optional[ManifestEntry]:
+        "Entry closest to `timestamp`, the older one on a tie"
+        before, after = self.floor(timestamp), self.ceiling(timestamp)
+        if before is None or after is None:
+            return before or after
+        if timestamp - before.timestamp <= after.timestamp - timestamp:
+            return before
+        return after
+
+    def between(self, since: float = None, until: float = None) -> List[ManifestEntry]:
+        "Entries with `since <= timestamp <= until`, oldest first"
+        with self._lock:
+            entries = self._index()
+            return entries[slice(*self._bounds(since, until))]
+
+    def around(
+        self, timestamp: float, since: float = None, until: float = None
+    ) -> Iterator[ManifestEntry]:
+        "Entries in the range by increasing distance from `timestamp`"
+        with self._lock:
+            entries = self._index()
+            lo, hi = self._bounds(since, until)
+            pivot = min(max(bisect_left(self._timestamps, timestamp), lo), hi)
+            before = entries[lo:pivot]
+            after = entries[pivot:hi]
+        # walk outwards from the insertion point, merging both sides
+        left, right = len(before) - 1, 0
+        while left >= 0 or right < len(after):
+            if right >= len(after) or (
+                left >= 0
+                and timestamp - before[left].timestamp
+                <= after[right].timestamp - timestamp
+            ):
+                yield before[left]
+                left -= 1
+            else:
+                yield after[right]
+                right += 1
+
+    def get(self, name: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            self._refresh()
+            return self._entries.get(name)
+
+    def add(self, entry: ManifestEntry):
+        self._append([self._line(entry)])
+
+    def remove(self, names: Iterable[str]):
+        self._append([f"{_REMOVE}\t{name}" for name in names])
+
+    def record(self, entry: ManifestEntry):
+        "Append without touching the in-memory index, safe in a forked child"
+        self._write_lines([self._line(entry)])
+
+    def sync(self):
+        "fsync the manifest file"
+        try:
+            fd = os.open(self._file, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def describe(
+        self, path: Path, size: int = None, entries: int = None, digest: str = None
+    ) -> ManifestEntry:
+        """
+        Build the entry of a published snapshot, reading it for what isn't
+        given. The checksum is the one in the header, files without header are
+        hashed whole and sharded snapshots combine the ones of their shards.
+        """
+        path = Path(path)
+        if size is None or entries is None or digest is None:
+            with self._storage.open(path.name) as f:
+                shards = ShardMap.parse(f, self._directory)
+                if shards is not None:
+                    size, entries, digest = shards.describe()
+                else:
+                    size = f.seek(0, 2)
+                    f.seek(0)
+                    size, entries, digest = self._inspect(f, size)
+        return ManifestEntry(path.name, self.timestamp(path), size, entries, digest)
+
+    def timestamp(self, path: Path) -> float:
+        "Creation time from a snapshot name, `name_N` duplicates share it"
+        name = path.name
+        for candidate in (name, name.rsplit("_", 1)[0]):
+            try:
+                return datetime.strptime(candidate, self._datetime_format).timestamp()
+            except ValueError:
+                continue
+        return self._storage.stat(path.name).mtime
+
+    def rebuild(self):
+        "Rescan the directory and atomically replace the manifest"
+        with self._exclusive(), self._lock:
+            self._rebuild()
+
+    def compact(self):
+        "Rewrite the manifest with only the live entries"
+        with self._exclusive(), self._lock:
+            self._refresh()
+            self._write(self._entries.values())
+
+    def _exclusive(self):
+        # taken before the thread lock, the order the manager takes them in
+        return self._guard.exclusive() if self._guard else contextlib.nullcontext()
+
+    def _append(self, lines: List[str]):
+        if not lines:
+            return
+        with self._exclusive(), self._lock:
+            self._refresh()
+            self._write_lines(lines)
+            # parsing our own lines back keeps the offset in step with appends
+            # made by other processes in between
+            self._refresh()
+            if self._removed > max(1024, len(self._entries)):
+                self._write(self._entries.values())
+
+    def _write_lines(self, lines: List[str]):
+        data = "".join(f"{line}\n" for line in lines).encode("utf-8")
+        fd = os.open(self._file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _index(self) -> List[ManifestEntry]:
+        self._refresh()
+        if self._sorted is None:
+            self._sorted = sorted(self._entries.values(), key=self._order)
+            self._timestamps = [entry.timestamp for entry in self._sorted]
+        return self._sorted
+
+    def _bounds(self, since: Optional[float], until: Optional[float]):
+        lo = 0 if since is None else bisect_left(self._timestamps, since)
+        hi = len(self._sorted)
+        if until is not None:
+            hi = bisect_right(self._timestamps, until)
+        return lo, max(lo, hi)
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self._file)
+        except FileNotFoundError:
+            self._rebuild(replace=False)
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # replaced by a rebuild or compaction
+            self._entries = {}
+            self._sorted = None
+            self._removed = 0
+            self._inode = stat.st_ino
+            self._offset = 0
+            self._changed(None)
+        if stat.st_size == self._offset:
+            return
+
+        with open(self._file, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # appends are single writes, trailing bytes are a line torn by a crash
+            self._terminate_torn_tail()
+        if not end:
+            return
+        for line in data[:end].decode("utf-8", "replace").split("\n"):
+            self._parse(line)
+        self._offset += end
+
+    def _terminate_torn_tail(self):
+        "End the torn line so it is skipped and later appends start a new line"
+        fd = os.open(self._file, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, b"\n")
+        finally:
+            os.close(fd)
+
+    def _parse(self, line: str):
+        fields = line.split("\t")
+        try:
+            if fields[0] == _ADD and len(fields) == 6:
+                name, timestamp, size, entries, digest = fields[1:]
+                entry = ManifestEntry(
+                    name, float(timestamp), int(size), int(entries), digest
+                )
+                self._insert(entry)
+            elif fields[0] == _REMOVE and len(fields) == 2:
+                self._discard(fields[1])
+                self._removed += 1
+        except ValueError:
+            # a torn line, skipped
+            pass
+
+    def _insert(self, entry: ManifestEntry):
+        replaced = self._entries.get(entry.name)
+        self._entries[entry.name] = entry
+        if replaced is None:
+            self._changed(_ADD, entry)
+        else:
+            self._changed(None)
+        if self._sorted is None:
+            return
+        if replaced is None and (
+            not self._sorted or self._order(entry) >= self._order(self._sorted[-1])
+        ):
+            self._sorted.append(entry)
+            self._timestamps.append(entry.timestamp)
+        else:
+            self._sorted = None
+
+    def _discard(self, name: str):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._changed(_REMOVE, entry)
+        if entry is None or self._sorted is None:
+            return
+        i = bisect_left(self._timestamps, entry.timestamp)
+        while i < len(self._sorted) and self._sorted[i] is not entry:
+            i += 1
+        if i < len(self._sorted):
+            del self._sorted[i]
+            del self._timestamps[i]
+        else:
+            self._sorted = None
+
+    def _inspect(self, f: BinaryIO, size: int) -> tuple:
+        reader = Reader(f)
+        try:
+            header = reader.read_header()
+            if header is not None:
+                return size, header.entries, header.checksum.hex()
+            entries = reader.read_length()
+        except (ValueError, IndexError, struct.error):
+            # damaged header or empty file
+            entries = 0
+        f.seek(0)
+        digest = checksum()
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            digest.update(block)
+        return size, entries, digest.hexdigest()
+
+    def _rebuild(self, replace: bool = True):
+        entries = []
+        for name in self._storage.list():
+            if "\t" in name or "\n" in name:
+                continue
+            try:
+                entries.append(self.describe(self._directory / name))
+            except OSError:
+                # removed while scanning
+                continue
+        self._write(entries, replace)
+
+    def _write(self, entries: Iterable[ManifestEntry], replace: bool = True):
+        entries = sorted(entries, key=self._order)
+        tmp = self._directory / f"{MANIFEST_NAME}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(f"{self._line(entry)}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if replace:
+            os.replace(tmp, self._file)
+        else:
+            # linking fails where renaming would replace a manifest another
+            # process created since it was found missing
+            try:
+                os.link(tmp, self._file)
+            except FileExistsError:
+                os.unlink(tmp)
+                self._inode = None
+                self._refresh()
+                return
+            os.unlink(tmp)
+
+        stat = os.stat(self._file)
+        self._entries = {entry.name: entry for entry in entries}
+        self._sorted = entries
+        self._timestamps = [entry.timestamp for entry in entries]
+        self._removed = 0
+        self._inode = stat.st_ino
+        self._offset = stat.st_size
+        self._changed(None)
+
+    def _changed(self, kind: Optional[str], entry: ManifestEntry = None):
+        self._version += 1
+        for observer in self._observers:
+            observer(self._version, kind, entry)
+
+    @staticmethod
+    def _line(entry: ManifestEntry) -> str:
+        fields = (entry.timestamp, entry.size, entry.entries, entry.checksum)
+        return "\t".join([_ADD, entry.name, *map(str, fields)])
+
+    _order = staticmethod(entry_order)
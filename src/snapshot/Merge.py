@@ -0,0 +1,211 @@
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional
+import zlib
+from .Footer import Footer
+from .Reader import Reader, CorruptSnapshotError
+from .Shards import chunk_spans
+from .TypeHandler import EncodingTypes
+from .Writer import Writer, _CountingBuffer, entry_digest
+
+# read size when copying encoded entries
+BLOCK_SIZE = 1024 * 1024
+
+
+def last_wins(key, values: list):
+    "Merge strategy keeping the value of the last snapshot holding the key"
+    return values[-1]
+
+
+def first_wins(key, values: list):
+    "Merge strategy keeping the value of the first snapshot holding the key"
+    return values[0]
+
+
+def assign(states: List[dict], strategy: Callable) -> tuple[dict, dict]:
+    """
+    Input and entry digest every key is copied from, out of the entry
+    digests of the inputs, and the inputs holding the keys `strategy`
+    combines, unless it is last_wins or first_wins.
+    """
+    owner, shared = {}, {}
+    for index, digests in enumerate(states):
+        for key, digest in digests.items():
+            held = owner.get(key)
+            if held is None or strategy is last_wins:
+                owner[key] = index, digest
+            if held is not None and strategy not in (last_wins, first_wins):
+                shared.setdefault(key, [held[0]]).append(index)
+    for key in shared:
+        del owner[key]
+    return owner, shared
+
+
+def combine(
+    shared: dict, strategy: Callable, finds: List[Callable], batch: int
+) -> Iterator[tuple]:
+    "(key, combined value) of the `shared` keys, decoded `batch` keys at a time"
+    keys = list(shared)
+    for start in range(0, len(keys), batch):
+        chunk = keys[start : start + batch]
+        found = [find(chunk) for find in finds]
+        for key in chunk:
+            yield key, strategy(key, [found[i][key] for i in shared[key]])
+
+
+def merge_parts(inputs: List[List[tuple]], owner: dict) -> List[tuple]:
+    """
+    (open, footer, take) of every file for a MergeWriter, `inputs` holding
+    the (open, footer) files of each snapshot oldest first. A key is taken
+    from the newest file of its input recording it.
+    """
+    wanted = [{} for _ in inputs]
+    for key, (index, digest) in owner.items():
+        wanted[index][key] = digest
+    parts = []
+    for files, remaining in zip(inputs, wanted):
+        found = []
+        for open_file, footer in reversed(files):
+            key_hashes = footer.key_hashes() if footer is not None else None
+            if key_hashes is None:
+                # written before digests were recorded, holds the rest
+                take, remaining = remaining, {}
+            else:
+                take = {
+                    key: remaining.pop(key) for key in key_hashes if key in remaining
+                }
+            found.append((open_file, footer, take))
+        # base files first, so a full snapshot is read front to back
+        parts.extend(reversed(found))
+    return parts
+
+
+class MergeWriter(Writer):
+    """
+    Writes a full snapshot out of the encoded entries of other snapshots.
+
+    `parts` are (open, footer, take) triples: a callable opening a snapshot
+    file, its footer and the entries to copy from it, key to entry digest.
+    Entries are copied verbatim, never decoded: chunks whose entries are
+    all taken as blocks checked against the CRC in the footer, the other
+    entries found by skipping over values. `extra` yields `extra_count`
+    more (key, value) pairs encoded after them.
+    """
+
+    def __init__(
+        self,
+        parts: List[tuple],
+        buffer: BinaryIO = None,
+        extra: Iterable[tuple] = (),
+        extra_count: int = 0,
+        chunk_size: int = None,
+        header: bool = False,
+    ):
+        super().__init__({}, buffer, chunk_size, hash_keys=True, header=header)
+        self._parts = parts
+        self._extra = extra
+        self._extra_count = extra_count
+        # start and entry count of the chunk being written
+        self._start = 0
+        self._count = 0
+
+    def write_body(self):
+        self._entries = self._extra_count + sum(len(take) for _, _, take in self._parts)
+        buffer = self._buffer
+        counter = self._buffer = _CountingBuffer(buffer)
+        try:
+            self.write_length(self._entries)
+            self._chunks = []
+            self._crcs = []
+            self._key_hashes = {}
+            self._start, self._count = counter.written, 0
+            counter.crc = 0
+            for open_file, footer, take in self._parts:
+                if take:
+                    with open_file() as f:
+                        self._copy(f, footer, dict(take))
+            for key, value in self._extra:
+                counter.hasher = entry_digest()
+                self.write_key_value(key, value)
+                self._key_hashes[str(key)] = counter.hasher.digest()
+                counter.hasher = None
+                self._written(1)
+            if self._count:
+                self._close_chunk()
+            counter.crc = None
+            self.write_encoding(EncodingTypes.EOF)
+        finally:
+            self._buffer = buffer
+
+        self.write_footer(counter.written)
+
+    def _copy(self, f: BinaryIO, footer: Optional[Footer], take: dict):
+        "Copy the entries named in `take` from the snapshot in `f`"
+        reader = Reader(f)
+        reader.read_header()
+        body = f.tell()
+        count = reader.read_length()
+        spans = chunk_spans(footer, count, take.keys())
+        directory = {}
+        if spans is not None:
+            crcs = footer.crcs()
+            for index, (offset, length, _) in enumerate(footer.chunks()):
+                directory[offset] = length, crcs[index] if index < len(crcs) else None
+
+        for offset, entries, keys in [(None, count, None)] if spans is None else spans:
+            if offset is not None and len(keys) == entries:
+                length, crc = directory[offset]
+                f.seek(body + offset)
+                copied = self._transfer(f, length)
+                if crc is not None and copied != crc:
+                    raise CorruptSnapshotError(f"Chunk at {offset} failed its CRC")
+                for key in keys:
+                    self._key_hashes[key] = take.pop(key)
+                self._written(entries)
+                continue
+
+            if offset is not None:
+                f.seek(body + offset)
+            wanted = take if keys is None else keys
+            for index in range(entries):
+                if not wanted:
+                    break
+                start = f.tell()
+                key = reader.skip_key_value()
+                if key is None:
+                    raise CorruptSnapshotError(
+                        f"Snapshot ended after {index} of {entries} entries"
+                    )
+                if key not in wanted:
+                    continue
+                end = f.tell()
+                f.seek(start)
+                self._transfer(f, end - start)
+                self._key_hashes[key] = take.pop(key)
+                if keys is not None:
+                    keys.discard(key)
+                self._written(1)
+        if take:
+            raise CorruptSnapshotError(f"{len(take)} entries to merge weren't found")
+
+    def _transfer(self, f: BinaryIO, length: int) -> int:
+        "Copy `length` bytes from `f`, returns their CRC32"
+        crc = 0
+        while length:
+            data = f.read(min(BLOCK_SIZE, length))
+            if not data:
+                raise CorruptSnapshotError("Entry runs past the end of the snapshot")
+            self._buffer.write(data)
+            crc = zlib.crc32(data, crc)
+            length -= len(data)
+        return crc
+
+    def _written(self, entries: int):
+        self._count += entries
+        if self._chunk_size and self._count >= self._chunk_size:
+            self._close_chunk()
+
+    def _close_chunk(self):
+        counter = self._buffer
+        self._chunks.append((self._start, counter.written - self._start, self._count))
+        self._crcs.append(counter.crc)
+        self._start, self._count = counter.written, 0
+        counter.crc = 0
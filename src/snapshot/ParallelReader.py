@@ -0,0 +1,68 @@
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Union
+import mmap
+import os
+from .Reader import Reader
+from .Footer import Footer
+from .Header import HEADER_SIZE
+from .ParallelWriter import resolve_executor
+
+
+def _decode_chunk(path: str, offset: int, count: int) -> dict:
+    # runs inside the worker so it must stay a module level function
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            view.seek(offset)
+            return Reader(view).read_entries(count)
+
+
+class ParallelReader(Reader):
+    """
+    Decodes the chunks recorded in a snapshot footer concurrently.
+
+    Every worker maps the file and seeks straight to its chunk, the decoded
+    dicts are merged back in chunk order. Snapshots without a chunk directory
+    are read sequentially.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        workers: int = None,
+        executor: Union[str, Executor] = "process",
+    ):
+        super().__init__()
+        self._path = str(path)
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = executor
+
+    def read(self) -> dict:
+        with open(self._path, "rb") as f:
+            footer = Footer.read(f)
+            chunks = footer.chunks() if footer else []
+            if not chunks or len(chunks) == 1 or self._workers == 1:
+                return Reader(f).read()
+
+            reader = Reader(f)
+            # chunk offsets are relative to the body
+            body = HEADER_SIZE if reader.read_header() else 0
+            total = reader.read_length()
+            if total != sum(count for _, _, count in chunks):
+                # directory doesn't describe the body, don't trust it
+                f.seek(0)
+                return Reader(f).read()
+
+        executor, owns_executor = resolve_executor(self._executor, self._workers)
+        try:
+            futures = [
+                executor.submit(_decode_chunk, self._path, body + offset, count)
+                for offset, _, count in chunks
+            ]
+            result = {}
+            for future in futures:
+                result.update(future.result())
+            return result
+        finally:
+            if owns_executor:
+                executor.shutdown(cancel_futures=True)
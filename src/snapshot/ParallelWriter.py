@@ -0,0 +1,151 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import deque
+from io import BytesIO
+from typing import BinaryIO, Union
+import asyncio
+import math
+import os
+import zlib
+from .Writer import Writer, entry_digest
+from .TypeHandler import EncodingTypes
+
+
+def resolve_executor(
+    executor: Union[str, Executor], workers: int
+) -> tuple[Executor, bool]:
+    "Returns the executor and whether the caller owns (and must shut) it"
+    if isinstance(executor, Executor):
+        return executor, False
+    if executor == "process":
+        return ProcessPoolExecutor(max_workers=workers), True
+    if executor == "thread":
+        return ThreadPoolExecutor(max_workers=workers), True
+    raise ValueError(f"Unknown executor {executor}")
+
+
+def _encode_chunk(items: list[tuple]) -> bytes:
+    # runs inside the worker so it must stay a module level function
+    buffer = BytesIO()
+    writer = Writer(buffer=buffer)
+    for key, value in items:
+        writer.write_key_value(key, value)
+    return buffer.getvalue()
+
+
+async def write_stream(
+    source: dict, stream, executor: Executor = None, chunk_size: int = 1024
+) -> int:
+    """
+    Encode `source` chunk by chunk on `executor` and write every chunk to
+    `stream` as soon as it is ready, awaiting `drain()` when it has one.
+    """
+    loop = asyncio.get_running_loop()
+    items = list(source.items())
+    prefix, suffix = BytesIO(), BytesIO()
+    Writer(buffer=prefix).write_length(len(items))
+    Writer(buffer=suffix).write_encoding(EncodingTypes.EOF)
+
+    written = await _send(stream, prefix.getvalue())
+    for i in range(0, len(items), chunk_size):
+        data = await loop.run_in_executor(
+            executor, _encode_chunk, items[i : i + chunk_size]
+        )
+        written += await _send(stream, data)
+    return written + await _send(stream, suffix.getvalue())
+
+
+async def _send(stream, data: bytes) -> int:
+    stream.write(data)
+    if hasattr(stream, "drain"):
+        await stream.drain()
+    else:
+        await asyncio.sleep(0)
+    return len(data)
+
+
+def _encode_hashed_chunk(items: list[tuple]) -> tuple[bytes, list[bytes]]:
+    "Like _encode_chunk, also returning the digest of every entry"
+    buffer = BytesIO()
+    writer = Writer(buffer=buffer)
+    digests = []
+    for key, value in items:
+        start = buffer.tell()
+        writer.write_key_value(key, value)
+        with buffer.getbuffer() as view:
+            digests.append(entry_digest(view[start:]).digest())
+    return buffer.getvalue(), digests
+
+
+class ParallelWriter(Writer):
+    """
+    Splits the top level items into chunks and encodes them concurrently.
+
+    Chunk outputs are written in order so the result is a regular snapshot
+    that `Reader` can read; the chunk boundaries are recorded in the footer.
+    Process workers only know the handlers registered at import time when the
+    platform spawns instead of forking, use `executor="thread"` for custom
+    handlers registered at runtime.
+    """
+
+    def __init__(
+        self,
+        source: dict = None,
+        buffer: BinaryIO = None,
+        workers: int = None,
+        chunk_size: int = None,
+        executor: Union[str, Executor] = "process",
+        hash_keys: bool = False,
+        header: bool = False,
+    ):
+        super().__init__(source, buffer, chunk_size, hash_keys, header)
+        self._workers = workers or os.cpu_count() or 1
+        self._executor = executor
+
+    def write_body(self):
+        items = list(self._source.items())
+        self._entries = len(items)
+        chunk_size = self._chunk_size or max(
+            1, math.ceil(len(items) / (self._workers * 4))
+        )
+        batches = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        offset = self.write_length(len(items))
+        self._chunks = []
+        self._crcs = []
+        self._key_hashes = {}
+        for batch, data in zip(batches, self._encode(batches)):
+            count = len(batch)
+            if self._hash_keys:
+                data, digests = data
+                for (key, _), digest in zip(batch, digests):
+                    self._key_hashes[str(key)] = digest
+            self._buffer.write(data)
+            self._chunks.append((offset, len(data), count))
+            self._crcs.append(zlib.crc32(data))
+            offset += len(data)
+
+        self.write_encoding(EncodingTypes.EOF)
+        self.write_footer(offset + 1)
+
+    def _encode(self, batches: list[list[tuple]]):
+        "Yields encoded batches in order keeping at most 2 * workers in flight"
+        if not batches:
+            return
+
+        encode = _encode_hashed_chunk if self._hash_keys else _encode_chunk
+        executor, owns_executor = resolve_executor(self._executor, self._workers)
+        try:
+            pending = deque()
+            remaining = iter(batches)
+            for batch in remaining:
+                pending.append(executor.submit(encode, batch))
+                if len(pending) >= self._workers * 2:
+                    break
+            while pending:
+                yield pending.popleft().result()
+                batch = next(remaining, None)
+                if batch is not None:
+                    pending.append(executor.submit(encode, batch))
+        finally:
+            if owns_executor:
+                executor.shutdown(cancel_futures=True)
@@ -1,4 +1,4 @@
-from typing import BinaryIO
+from typing import BinaryIO, Optional
 import struct
 from .TypeHandler import (
     TypeHandler,
@@ -7,8 +7,17 @@ from .TypeHandler import (
     ALL_SET_MARKER,
 )
 from .TypeRegistry import TypeNotFoundException
+from .Header import Header
 import zlib
 
+# what a damaged body makes the decoders raise
+_DECODE_ERRORS = (IndexError, struct.error, UnicodeDecodeError, zlib.error, ValueError)
+_EOF_MARKER = 3 << 6 | EncodingTypes.EOF.value
+
+
+class CorruptSnapshotError(ValueError):
+    "The snapshot ends early or holds bytes that don't decode"
+
 
 class Reader:
     def __init__(self, buffer: BinaryIO = None):
@@ -27,23 +36,50 @@ class Reader:
     def read(self) -> dict:
         if not self._buffer:
             return {}
-        length = self.read_length()
-        result = {}
+        if not self._buffer.read(1):
+            return {}
+        self._buffer.seek(-1, 1)
+
+        try:
+            self.read_header()
+            length = self.read_length()
+            result = self.read_entries(length)
+            encoding = self.read_encoding()
+        except CorruptSnapshotError:
+            raise
+        except _DECODE_ERRORS as e:
+            raise CorruptSnapshotError(f"Corrupt snapshot: {e!r}") from e
+        if encoding != EncodingTypes.EOF:
+            raise CorruptSnapshotError("Missing EOF marker after the entries")
 
-        for _ in range(length):
-            key, value = self.read_key_value()
-            if key is None or value is None:
-                break
-            result[key] = value
+        return result
 
-        encoding = self.read_encoding()
-        if encoding == EncodingTypes.EOF:
-            pass
+    def read_header(self) -> Optional[Header]:
+        "Skips the header at the current position and returns it, if there is one"
+        return Header.read(self._buffer)
 
+    def read_entries(self, count: int) -> dict:
+        "Read `count` top level key values from the current position"
+        result = {}
+        try:
+            for index in range(count):
+                key, value = self.read_key_value()
+                if key is None:
+                    raise CorruptSnapshotError(
+                        f"Snapshot ended after {index} of {count} entries"
+                    )
+                result[key] = value
+        except CorruptSnapshotError:
+            raise
+        except _DECODE_ERRORS as e:
+            raise CorruptSnapshotError(f"Corrupt snapshot: {e!r}") from e
         return result
 
     def read_encoding(self):
-        first_byte = self._buffer.read(1)[0]
+        current = self._buffer.read(1)
+        if not current:
+            raise CorruptSnapshotError("Unexpected end of snapshot")
+        first_byte = current[0]
         # prefix 11
         if first_byte >> 6 == 3:
             return EncodingTypes(first_byte & 0x3F)
@@ -51,18 +87,13 @@ class Reader:
         return None
 
     def read_object_id(self) -> tuple[TypeHandler, int]:
-        current_pos = self._buffer.tell()
-        encoding = self.read_encoding()
-
-        if encoding == EncodingTypes.EOF:
-            return None, 1
-
-        self._buffer.seek(current_pos)
         current = self._buffer.read(1)
         if not current:
             return None, None
 
         object_type_id = current[0]
+        if object_type_id == _EOF_MARKER:
+            return None, 1
 
         handler = self._registry.get_handler_by_id(object_type_id)
         if not handler:
@@ -73,11 +104,23 @@ class Reader:
         return handler, 1
 
     def read_value(self, encoding: EncodingTypes = None):
+        if encoding is None:
+            # strings written by write_value carry the marker when compressed
+            encoding = self.read_encoding()
         length = self.read_length()
+        data = self._buffer.read(length)
+        if len(data) != length:
+            raise CorruptSnapshotError("Value runs past the end of the snapshot")
         if encoding == EncodingTypes.COMPRESSED:
-            data = self._buffer.read(length)
             return zlib.decompress(data).decode()
-        return self._buffer.read(length).decode("utf-8")
+        return data.decode("utf-8")
+
+    def skip_value(self, encoding: EncodingTypes = None):
+        "Move past a value written by write_value without decoding it"
+        if encoding is None:
+            self.read_encoding()
+        length = self.read_length()
+        self._buffer.seek(length, 1)
 
     def read_key_value(self):
         handler, _ = self.read_object_id()
@@ -87,6 +130,15 @@ class Reader:
         value = handler.deserialise(self)
         return key, value
 
+    def skip_key_value(self) -> Optional[str]:
+        "Key of the next entry, moving past its value without decoding it, None at the end"
+        handler, _ = self.read_object_id()
+        if handler is None:
+            return None
+        key = self.read_value()
+        handler.skip(self)
+        return key
+
     def read_length(self):
         length = self._buffer.read(1)
         marker_with_first_byte = length[0]
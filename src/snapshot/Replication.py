@@ -0,0 +1,341 @@
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional, Union
+import hashlib
+import socket
+import struct
+import threading
+import time
+import zlib
+
+# kind and payload length in front of every message
+_FRAME = struct.Struct("<cI")
+# offset and CRC32 in front of the bytes of a DATA message
+_DATA = struct.Struct("<QI")
+_OFFSET = struct.Struct("<Q")
+# offset the receiver holds and whether it already published the snapshot
+_RESUME = struct.Struct("<Q?")
+
+OFFER = b"O"  # sender: snapshot size and name
+RESUME = b"R"  # receiver: where to carry on from
+DATA = b"D"  # sender: a checksummed chunk
+ACK = b"A"  # receiver: bytes held so far
+END = b"E"  # sender: digest of the whole snapshot
+DONE = b"K"  # receiver: snapshot published
+ERROR = b"X"  # receiver: why it gave up on the connection
+
+CHUNK_SIZE = 1 << 20
+DIGEST_SIZE = 32
+
+
+class ReplicationError(Exception):
+    "The receiver refused a snapshot or a message didn't follow the protocol"
+
+
+def snapshot_digest() -> "hashlib._Hash":
+    return hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+
+def connect(address, timeout: Optional[float] = None) -> socket.socket:
+    "Socket connected to `address`, (host, port) for TCP and a path for Unix sockets"
+    if isinstance(address, (str, Path)):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(address))
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+    sock = socket.create_connection(address, timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def send_frame(sock: socket.socket, kind: bytes, payload: bytes = b""):
+    sock.sendall(_FRAME.pack(kind, len(payload)) + payload)
+
+
+def read_frame(stream: BinaryIO) -> Optional[tuple]:
+    "(kind, payload) of the next message, None when the peer closed between messages"
+    head = stream.read(_FRAME.size)
+    if not head:
+        return None
+    if len(head) < _FRAME.size:
+        raise ConnectionError("Connection closed inside a message")
+    kind, length = _FRAME.unpack(head)
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ConnectionError("Connection closed inside a message")
+    return kind, payload
+
+
+class SnapshotSender:
+    """
+    Ships snapshots of `manager` to a SnapshotReceiver.
+
+    A snapshot goes as its encoded bytes (recipes of deduplicated snapshots
+    are resolved) in chunks of `chunk_size` with a CRC32 each, at most
+    `window` of them unacknowledged, then the blake2b digest of the whole.
+    Deltas go after the bases the receiver doesn't have yet. `address` is
+    a (host, port) pair, the path of a Unix socket or a callable returning
+    a connected socket. A failed connection is opened again up to `retries`
+    times, and the receiver tells where to carry on from, so only the
+    chunks it never acknowledged are sent again.
+    """
+
+    def __init__(
+        self,
+        manager,
+        address: Union[tuple, str, Path, Callable[[], socket.socket]],
+        chunk_size: int = CHUNK_SIZE,
+        window: int = 8,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: Optional[float] = 30.0,
+    ):
+        self._manager = manager
+        self._address = address
+        self._chunk_size = chunk_size
+        self._window = window
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = timeout
+        # snapshot bytes put on the wire, and the ones a resume didn't resend
+        self.bytes_sent = 0
+        self.bytes_resumed = 0
+        self.reconnects = 0
+
+    def send(self, name: str = None) -> List[str]:
+        """
+        Ship snapshot `name` (default the latest) with the bases it needs,
+        returns the names the receiver didn't have.
+        """
+        manager = self._manager
+        with manager.lease(name) as path:
+            if path is None:
+                raise FileNotFoundError(name or "No snapshot to send")
+            if manager.sharded(path):
+                raise ValueError(f"{path.name} is sharded, ship its shards instead")
+            pending = manager.chain(path)
+            sent = []
+            failures = 0
+            while pending:
+                try:
+                    with self._connect() as sock, sock.makefile("rb") as stream:
+                        while pending:
+                            if self._ship(sock, stream, pending[0]):
+                                sent.append(pending[0].name)
+                            pending.pop(0)
+                except (OSError, ReplicationError):
+                    failures += 1
+                    if failures > self._retries:
+                        raise
+                    self.reconnects += 1
+                    time.sleep(self._backoff * failures)
+            return sent
+
+    def _connect(self) -> socket.socket:
+        if callable(self._address):
+            return self._address()
+        return connect(self._address, self._timeout)
+
+    def _ship(self, sock: socket.socket, stream: BinaryIO, path: Path) -> bool:
+        "Send one snapshot, False when the receiver already had it"
+        with self._manager.open(path) as f:
+            size = f.seek(0, 2)
+            send_frame(sock, OFFER, _OFFSET.pack(size) + path.name.encode())
+            offset, published = _RESUME.unpack(self._expect(stream, RESUME))
+            if published:
+                return False
+            if offset > size:
+                raise ReplicationError(f"Receiver holds {offset} of {size} bytes")
+
+            digest = snapshot_digest()
+            f.seek(0)
+            # the receiver's bytes are hashed again from the local copy
+            for position in range(0, offset, self._chunk_size):
+                digest.update(f.read(min(self._chunk_size, offset - position)))
+            self.bytes_resumed += offset
+
+            head = _FRAME.size + _DATA.size
+            buffer = bytearray(head + self._chunk_size)
+            acked = position = offset
+            unacked = []
+            while position < size:
+                view = memoryview(buffer)[head:]
+                length = f.readinto(view[: min(self._chunk_size, size - position)])
+                if not length:
+                    raise ReplicationError(f"{path.name} shrank while being sent")
+                data = view[:length]
+                digest.update(data)
+                _FRAME.pack_into(buffer, 0, DATA, _DATA.size + length)
+                _DATA.pack_into(buffer, _FRAME.size, position, zlib.crc32(data))
+                sock.sendall(memoryview(buffer)[: head + length])
+                position += length
+                self.bytes_sent += length
+                unacked.append(position)
+                if len(unacked) >= self._window:
+                    acked = self._ack(stream, unacked.pop(0))
+            while unacked:
+                acked = self._ack(stream, unacked.pop(0))
+            if acked != size:
+                raise ReplicationError(f"Receiver acknowledged {acked} of {size} bytes")
+
+            send_frame(sock, END, digest.digest())
+            self._expect(stream, DONE)
+            return True
+
+    def _ack(self, stream: BinaryIO, expected: int) -> int:
+        (offset,) = _OFFSET.unpack(self._expect(stream, ACK))
+        if offset != expected:
+            raise ReplicationError(f"Acknowledged {offset}, expected {expected}")
+        return offset
+
+    @staticmethod
+    def _expect(stream: BinaryIO, kind: bytes) -> bytes:
+        frame = read_frame(stream)
+        if frame is None:
+            raise ConnectionError("Receiver closed the connection")
+        if frame[0] == ERROR:
+            raise ReplicationError(frame[1].decode(errors="replace"))
+        if frame[0] != kind:
+            raise ReplicationError(f"Expected {kind!r}, got {frame[0]!r}")
+        return frame[1]
+
+
+class _Partial:
+    "A snapshot being received, kept across connections until it is complete"
+
+    def __init__(self, name: str, f: BinaryIO, size: int):
+        self.name = name
+        self.file = f
+        self.size = size
+        self.offset = 0
+        self.digest = snapshot_digest()
+        self.busy = False
+
+
+class SnapshotReceiver:
+    """
+    Writes the snapshots a SnapshotSender ships into `manager`.
+
+    Chunks are written to the staging writer of the storage as they arrive
+    and acknowledged once their CRC32 matched; a snapshot whose digest
+    matches is committed and added to the manifest under the directory
+    lock, like a dump, so it appears whole or not at all. Snapshots cut
+    short by a disconnect stay staged and the sender carries on from the
+    last acknowledged chunk when it offers them again.
+    """
+
+    def __init__(self, manager, timeout: Optional[float] = 30.0):
+        self._manager = manager
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._partials: dict[str, _Partial] = {}
+        self.received: List[str] = []
+
+    def serve(self, listener: socket.socket):
+        "Handle the connections accepted on `listener` until it is closed"
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            try:
+                self.handle(sock)
+            except OSError:
+                # the sender reconnects and resumes
+                pass
+
+    def handle(self, sock: socket.socket) -> List[str]:
+        "Receive over one connection until the sender closes it, returns the names published"
+        published = []
+        partial = None
+        with sock, sock.makefile("rb") as stream:
+            sock.settimeout(self._timeout)
+            if sock.family in (socket.AF_INET, socket.AF_INET6):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                while True:
+                    frame = read_frame(stream)
+                    if frame is None:
+                        return published
+                    kind, payload = frame
+                    if kind == OFFER:
+                        self._put_back(partial)
+                        partial = self._offered(sock, payload)
+                    elif kind == DATA and partial is not None:
+                        self._data(sock, partial, payload)
+                    elif kind == END and partial is not None:
+                        published.append(self._end(sock, partial, payload))
+                        partial = None
+                    else:
+                        raise ReplicationError(f"Unexpected message {kind!r}")
+            except ReplicationError as e:
+                send_frame(sock, ERROR, str(e).encode())
+                return published
+            finally:
+                self._put_back(partial)
+
+    def close(self):
+        "Drop the snapshots left partly received"
+        with self._lock:
+            partials, self._partials = self._partials, {}
+        for partial in partials.values():
+            partial.file.abort()
+
+    def _offered(self, sock: socket.socket, payload: bytes) -> Optional[_Partial]:
+        (size,) = _OFFSET.unpack_from(payload)
+        name = payload[_OFFSET.size :].decode()
+        if not name or name.startswith(".") or Path(name).name != name:
+            raise ReplicationError(f"Invalid snapshot name {name!r}")
+
+        manager = self._manager
+        if manager.exists(name):
+            send_frame(sock, RESUME, _RESUME.pack(size, True))
+            return None
+        with self._lock:
+            partial = self._partials.get(name)
+            if partial is not None and partial.busy:
+                raise ReplicationError(f"{name} is being received")
+            if partial is None or partial.size != size:
+                if partial is not None:
+                    partial.file.abort()
+                try:
+                    f = manager.stage(name)
+                except FileExistsError:
+                    raise ReplicationError(f"{name} exists") from None
+                partial = self._partials[name] = _Partial(name, f, size)
+            partial.busy = True
+        send_frame(sock, RESUME, _RESUME.pack(partial.offset, False))
+        return partial
+
+    def _data(self, sock: socket.socket, partial: _Partial, payload: bytes):
+        offset, crc = _DATA.unpack_from(payload)
+        data = memoryview(payload)[_DATA.size :]
+        if offset != partial.offset:
+            raise ReplicationError(f"Chunk at {offset}, expected {partial.offset}")
+        if zlib.crc32(data) != crc:
+            raise ReplicationError(f"Chunk at {offset} failed its CRC")
+        if offset + len(data) > partial.size:
+            raise ReplicationError(f"Chunk at {offset} runs past the end")
+        partial.file.write(data)
+        partial.digest.update(data)
+        partial.offset += len(data)
+        send_frame(sock, ACK, _OFFSET.pack(partial.offset))
+
+    def _end(self, sock: socket.socket, partial: _Partial, payload: bytes) -> str:
+        with self._lock:
+            del self._partials[partial.name]
+        if partial.offset != partial.size or partial.digest.digest() != payload:
+            partial.file.abort()
+            raise ReplicationError(f"{partial.name} doesn't match its digest")
+        self._manager.install(partial.name, partial.file)
+        self.received.append(partial.name)
+        send_frame(sock, DONE)
+        return partial.name
+
+    def _put_back(self, partial: Optional[_Partial]):
+        if partial is not None:
+            with self._lock:
+                partial.busy = False
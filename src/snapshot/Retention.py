@@ -0,0 +1,368 @@
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import threading
+import time
+from .Manifest import ManifestEntry, entry_order
+
+
+class RetentionPolicy:
+    """
+    Which snapshots to keep, decided from manifest entries alone.
+
+    `last` keeps the newest N snapshots, `hourly` and `daily` the newest
+    snapshot of each of the last N hours and days (local time) that have
+    one. A snapshot is kept when any of them keeps it, and when none is
+    given every snapshot is. `max_age` (seconds) then drops the older ones
+    and `max_bytes` the oldest until the rest fit. The newest snapshot is
+    always kept, as are the bases the kept deltas need, which may leave the
+    limits exceeded until the chain is compacted.
+    """
+
+    __slots__ = ("last", "hourly", "daily", "max_age", "max_bytes")
+
+    def __init__(
+        self,
+        last: Optional[int] = None,
+        hourly: Optional[int] = None,
+        daily: Optional[int] = None,
+        max_age: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.last = last
+        self.hourly = hourly
+        self.daily = daily
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{f}={getattr(self, f)!r}"
+            for f in self.__slots__
+            if getattr(self, f) is not None
+        )
+        return f"RetentionPolicy({fields})"
+
+    def expired(
+        self,
+        entries: List[ManifestEntry],
+        base: Callable[[str], Optional[str]] = None,
+        now: float = None,
+    ) -> List[ManifestEntry]:
+        """
+        Entries (oldest first, as the manifest lists them) the policy drops,
+        oldest first. `base` names the snapshot a delta depends on, None for
+        full snapshots.
+        """
+        if not entries:
+            return []
+        now = time.time() if now is None else now
+        newest_first = entries[::-1]
+        keep = self._kept(newest_first)
+
+        if self.max_age is not None:
+            keep = {
+                entry.name
+                for entry in newest_first
+                if entry.name in keep and now - entry.timestamp <= self.max_age
+            }
+        keep.add(entries[-1].name)
+        if self.max_bytes is not None:
+            total = 0
+            for entry in newest_first:
+                if entry.name not in keep:
+                    continue
+                total += entry.size
+                if total > self.max_bytes and entry is not entries[-1]:
+                    # this one and everything older
+                    total = float("inf")
+                    keep.discard(entry.name)
+
+        if base is not None:
+            for name in list(keep):
+                parent = base(name)
+                while parent is not None and parent not in keep:
+                    keep.add(parent)
+                    parent = base(parent)
+        return [entry for entry in entries if entry.name not in keep]
+
+    def _kept(self, newest_first: List[ManifestEntry]) -> set:
+        if self.last is None and self.hourly is None and self.daily is None:
+            return {entry.name for entry in newest_first}
+        keep = set()
+        if self.last:
+            keep.update(entry.name for entry in newest_first[: self.last])
+        for count, period in ((self.hourly, "%Y-%m-%d %H"), (self.daily, "%Y-%m-%d")):
+            if not count:
+                continue
+            seen = set()
+            for entry in newest_first:
+                bucket = datetime.fromtimestamp(entry.timestamp).strftime(period)
+                if bucket in seen:
+                    continue
+                if len(seen) == count:
+                    break
+                seen.add(bucket)
+                keep.add(entry.name)
+        return keep
+
+
+class _Buckets:
+    "Newest entry of each of the newest `count` periods that have one"
+
+    def __init__(self, count: int, period: str):
+        self.count = count
+        self.period = period
+        # period -> entry, oldest period first
+        self.newest: "OrderedDict[str, ManifestEntry]" = OrderedDict()
+
+    def bucket(self, entry: ManifestEntry) -> str:
+        return datetime.fromtimestamp(entry.timestamp).strftime(self.period)
+
+    def keeps(self, entry: ManifestEntry) -> bool:
+        return self.newest.get(self.bucket(entry)) is entry
+
+    def add(self, entry: ManifestEntry) -> List[ManifestEntry]:
+        "Take the newest entry in, returns the entries it displaced"
+        bucket = self.bucket(entry)
+        displaced = []
+        if bucket in self.newest:
+            displaced.append(self.newest.pop(bucket))
+        self.newest[bucket] = entry
+        if len(self.newest) > self.count:
+            displaced.append(self.newest.popitem(last=False)[1])
+        return displaced
+
+
+class RetentionIndex:
+    """
+    RetentionPolicy.expired() kept up to date as manifest entries come and go.
+
+    Fed the changes of a Manifest (see `Manifest.observe`), it keeps the
+    entries `last`, `hourly` and `daily` keep, their total size and the number
+    of live deltas on each base. An evaluation then only looks at the entries
+    pushed out of a rule or left without dependent deltas since the last one,
+    and at the oldest entries `max_age` and `max_bytes` reach, instead of the
+    whole manifest. Changes it can't follow (an entry older than the newest
+    one, the manifest reloaded) make it start over from a manifest snapshot.
+    """
+
+    def __init__(self, policy: RetentionPolicy, base: Callable[[str], Optional[str]]):
+        self.policy = policy
+        self._base = base
+        self._lock = threading.Lock()
+        self._events: deque = deque()
+        self._stale = True
+        self._version = 0
+
+    def changed(self, version: int, kind: Optional[str], entry: ManifestEntry):
+        "Manifest observer, only queues the change"
+        self._events.append((version, kind, entry))
+
+    def expired(self, manifest, now: float = None) -> List[ManifestEntry]:
+        "Entries of `manifest` the policy drops, oldest first"
+        now = time.time() if now is None else now
+        with self._lock:
+            manifest.refresh()
+            self._apply()
+            if self._stale:
+                self._rebuild(*manifest.snapshot())
+                self._apply()
+            return self._evaluate(now)
+
+    def _apply(self):
+        while self._events:
+            version, kind, entry = self._events.popleft()
+            if version <= self._version:
+                continue
+            self._version = version
+            if self._stale:
+                continue
+            if kind == "+":
+                self._add(entry)
+            elif kind == "-":
+                self._remove(entry)
+            else:
+                self._stale = True
+
+    def _rebuild(self, version: int, entries: List[ManifestEntry]):
+        policy = self.policy
+        self._order: List[ManifestEntry] = []
+        self._keys: list = []
+        self._entries: Dict[str, ManifestEntry] = {}
+        self._everything = (
+            policy.last is None and policy.hourly is None and policy.daily is None
+        )
+        self._last: deque = deque()
+        self._last_names: set = set()
+        self._rules = [
+            _Buckets(count, period)
+            for count, period in (
+                (policy.hourly, "%Y-%m-%d %H"),
+                (policy.daily, "%Y-%m-%d"),
+            )
+            if count
+        ]
+        # entries a rule keeps and their total size
+        self._kept: set = set()
+        self._kept_bytes = 0
+        self._bases: Dict[str, Optional[str]] = {}
+        # base -> number of live deltas on it
+        self._deps: Dict[str, int] = {}
+        # names to look at in the next evaluation
+        self._pending: set = set()
+        self._version = version
+        self._stale = False
+        for entry in entries:
+            self._add(entry)
+
+    def _add(self, entry: ManifestEntry):
+        if entry.name in self._entries or (
+            self._order and entry_order(entry) <= self._keys[-1]
+        ):
+            self._stale = True
+            return
+        if self._order:
+            # no longer kept for being the newest
+            self._pending.add(self._order[-1].name)
+        self._order.append(entry)
+        self._keys.append(entry_order(entry))
+        self._entries[entry.name] = entry
+        base = self._base(entry.name)
+        self._bases[entry.name] = base
+        if base is not None:
+            self._deps[base] = self._deps.get(base, 0) + 1
+
+        displaced = []
+        if self.policy.last:
+            self._last.append(entry)
+            self._last_names.add(entry.name)
+            if len(self._last) > self.policy.last:
+                displaced.append(self._last.popleft())
+                self._last_names.discard(displaced[-1].name)
+        for rule in self._rules:
+            displaced.extend(rule.add(entry))
+        if self._keeps(entry):
+            self._kept.add(entry.name)
+            self._kept_bytes += entry.size
+        else:
+            self._pending.add(entry.name)
+        for old in displaced:
+            if old.name in self._kept and not self._keeps(old):
+                self._kept.discard(old.name)
+                self._kept_bytes -= old.size
+                self._pending.add(old.name)
+
+    def _remove(self, entry: ManifestEntry):
+        entry = self._entries.pop(entry.name, None)
+        if entry is None:
+            return
+        i = bisect_left(self._keys, entry_order(entry))
+        del self._order[i]
+        del self._keys[i]
+        self._pending.discard(entry.name)
+        base = self._bases.pop(entry.name)
+        if base is not None:
+            self._deps[base] -= 1
+            if not self._deps[base]:
+                del self._deps[base]
+                # may have been kept for this delta alone
+                self._pending.add(base)
+        if entry.name not in self._kept:
+            return
+
+        # a kept entry removed by hand, the next older one takes its place
+        self._kept.discard(entry.name)
+        self._kept_bytes -= entry.size
+        entrants = []
+        if entry.name in self._last_names:
+            self._last.remove(entry)
+            self._last_names.discard(entry.name)
+            if len(self._order) >= self.policy.last:
+                entrants.append(self._order[-self.policy.last])
+                self._last.appendleft(entrants[-1])
+                self._last_names.add(entrants[-1].name)
+        for rule in self._rules:
+            bucket = rule.bucket(entry)
+            if rule.newest.get(bucket) is not entry:
+                continue
+            if i and rule.bucket(self._order[i - 1]) == bucket:
+                rule.newest[bucket] = self._order[i - 1]
+                entrants.append(self._order[i - 1])
+                continue
+            del rule.newest[bucket]
+            if len(rule.newest) == rule.count - 1:
+                entrant = self._older_bucket(rule, i)
+                if entrant is not None:
+                    rule.newest[rule.bucket(entrant)] = entrant
+                    rule.newest.move_to_end(rule.bucket(entrant), last=False)
+                    entrants.append(entrant)
+        for entrant in entrants:
+            if entrant.name not in self._kept:
+                self._kept.add(entrant.name)
+                self._kept_bytes += entrant.size
+
+    def _older_bucket(self, rule: _Buckets, i: int) -> Optional[ManifestEntry]:
+        "Newest entry of the period before the oldest one `rule` keeps"
+        if rule.newest:
+            oldest = next(iter(rule.newest.values()))
+            i = bisect_left(self._keys, entry_order(oldest))
+            bucket = rule.bucket(oldest)
+            while i and rule.bucket(self._order[i - 1]) == bucket:
+                i -= 1
+        return self._order[i - 1] if i else None
+
+    def _keeps(self, entry: ManifestEntry) -> bool:
+        "Whether a rule keeps `entry`"
+        return (
+            self._everything
+            or entry.name in self._last_names
+            or any(rule.keeps(entry) for rule in self._rules)
+        )
+
+    def _evaluate(self, now: float) -> List[ManifestEntry]:
+        if not self._order:
+            return []
+        policy = self.policy
+        newest = self._order[-1]
+        total = self._kept_bytes
+        if newest.name not in self._kept:
+            total += newest.size
+
+        # the oldest kept entries max_age and max_bytes reach
+        dropped = set()
+        for entry in self._order:
+            if entry is newest:
+                break
+            aged = policy.max_age is not None and now - entry.timestamp > policy.max_age
+            over = policy.max_bytes is not None and total > policy.max_bytes
+            if not (aged or over):
+                break
+            if entry.name in self._kept:
+                total -= entry.size
+                dropped.add(entry.name)
+
+        expired = set()
+        # deltas on each base that are still kept after this evaluation
+        deps = {}
+        work = list(self._pending | dropped)
+        while work:
+            name = work.pop()
+            entry = self._entries.get(name)
+            if entry is None or name in expired:
+                continue
+            kept = entry is newest or (name in self._kept and name not in dropped)
+            if kept or deps.get(name, self._deps.get(name, 0)):
+                # looked at again once that changes
+                self._pending.discard(name)
+                continue
+            # pending until it is removed
+            expired.add(name)
+            self._pending.add(name)
+            base = self._bases[name]
+            if base is not None:
+                deps[base] = deps.get(base, self._deps.get(base, 0)) - 1
+                if not deps[base]:
+                    work.append(base)
+        return sorted((self._entries[name] for name in expired), key=entry_order)
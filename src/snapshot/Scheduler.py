@@ -0,0 +1,203 @@
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+import contextlib
+import random
+import threading
+import time
+from .TrackedDict import TrackedDict
+
+# Redis' default `save 3600 1 300 100 60 10000`
+DEFAULT_RULES = ((3600, 1), (300, 100), (60, 10000))
+
+
+class SnapshotScheduler:
+    """
+    Dumps a source from a background thread when a save rule is met.
+
+    Like Redis `save <seconds> <changes>`, a rule is met once `seconds` have
+    passed since the last dump and at least `changes` mutations were made;
+    any rule triggers a dump. A TrackedDict counts its own mutations, other
+    sources report theirs with `record()`. Every threshold is stretched by
+    up to `jitter` (a fraction, drawn again after each dump) so processes
+    started together don't dump together.
+
+    Dumps run one at a time on the scheduler thread: a slow dump delays the
+    next check instead of starting another, and the delay shows up as lag,
+    the time between a dump becoming due and it starting. `lock` is held
+    while dumping in-process so writers can exclude it; with `background`
+    the dump forks instead (see SnapshotManager.dump_background) and the
+    thread waits for the child. A failed dump is retried after `retry`
+    seconds.
+    """
+
+    def __init__(
+        self,
+        manager,
+        source: dict,
+        rules: List[Tuple[float, int]] = DEFAULT_RULES,
+        jitter: float = 0.1,
+        interval: float = 1.0,
+        lock=None,
+        background: bool = False,
+        retry: float = 5.0,
+        on_dump: Callable[["SnapshotScheduler"], None] = None,
+        **dump_kwargs,
+    ):
+        if not rules:
+            raise ValueError("At least one save rule is needed")
+        self._manager = manager
+        self._source = source
+        self._rules = [(float(seconds), int(changes)) for seconds, changes in rules]
+        self._jitter = jitter
+        self._interval = interval
+        self._lock = lock if lock is not None else contextlib.nullcontext()
+        self._background = background
+        self._retry = retry
+        self._on_dump = on_dump
+        self._dump_kwargs = dump_kwargs
+        self._random = random.Random()
+        self._recorded = 0
+        self._record_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._forced = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._last = time.monotonic()
+        self._failed_at: Optional[float] = None
+        self._stretch = self._draw()
+        # when each rule's change threshold was first seen met
+        self._met: List[Optional[float]] = [None] * len(self._rules)
+
+        self.dumps = 0
+        self.errors = 0
+        self.last_error: Optional[BaseException] = None
+        self.last_path: Optional[Path] = None
+        self.last_duration: Optional[float] = None
+        self.total_duration = 0.0
+        self.last_lag: Optional[float] = None
+        self.max_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def changes(self) -> int:
+        "Mutations not in a snapshot yet"
+        if isinstance(self._source, TrackedDict):
+            return self._source.changes
+        return self._recorded
+
+    def record(self, changes: int = 1):
+        "Count mutations of a source that doesn't track them itself"
+        with self._record_lock:
+            self._recorded += changes
+
+    def start(self) -> "SnapshotScheduler":
+        if self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, flush: bool = False):
+        "Stop the thread, after a last dump of the pending changes with `flush`"
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if flush and self.changes:
+            self._dump(time.monotonic())
+
+    def trigger(self):
+        "Dump at the next check whatever the rules say"
+        self._forced = True
+        self._wake.set()
+
+    def __enter__(self) -> "SnapshotScheduler":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop(flush=exc[0] is None)
+
+    def due(self, now: float = None) -> Optional[float]:
+        "When the pending dump became due, None when no rule is met"
+        now = time.monotonic() if now is None else now
+        if self._forced:
+            return now
+        if self._failed_at is not None and now - self._failed_at < self._retry:
+            return None
+        changes = self.changes
+        due = None
+        for index, (seconds, threshold) in enumerate(self._rules):
+            if changes < max(threshold, 1):
+                self._met[index] = None
+                continue
+            if self._met[index] is None:
+                self._met[index] = now
+            at = max(self._last + seconds * self._stretch, self._met[index])
+            if at <= now and (due is None or at < due):
+                due = at
+        return due
+
+    def check(self, now: float = None) -> Optional[Path]:
+        "Dump if a rule is met, returns the snapshot written"
+        now = time.monotonic() if now is None else now
+        due = self.due(now)
+        if due is None:
+            return None
+        self.last_lag = max(now - due, 0.0)
+        self.max_lag = max(self.max_lag, self.last_lag)
+        return self._dump(now)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception:
+                # recorded by _dump, keep scheduling
+                pass
+            self._wake.wait(self._interval)
+            self._wake.clear()
+
+    def _dump(self, now: float) -> Optional[Path]:
+        self._forced = False
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                # mutations made from here on belong to the next snapshot
+                with self._record_lock:
+                    self._recorded = 0
+                if self._background:
+                    if isinstance(self._source, TrackedDict):
+                        # the child writes it in full
+                        self._source.clear_dirty()
+                    handle = self._manager.dump_background(self._source)
+                else:
+                    path = self._manager.dump(self._source, **self._dump_kwargs)
+            if self._background:
+                handle.wait()
+                path = handle.path
+        except BaseException as e:
+            self.errors += 1
+            self.last_error = e
+            self._failed_at = time.monotonic()
+            raise
+        finally:
+            self.last_duration = time.perf_counter() - started
+            self.total_duration += self.last_duration
+        self._failed_at = None
+        self._last = now
+        self._stretch = self._draw()
+        self._met = [None] * len(self._rules)
+        self.dumps += 1
+        self.last_path = path
+        if self._on_dump is not None:
+            self._on_dump(self)
+        return path
+
+    def _draw(self) -> float:
+        return 1.0 + self._random.uniform(0, self._jitter) if self._jitter else 1.0
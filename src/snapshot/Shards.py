@@ -0,0 +1,297 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import BinaryIO, List, Optional
+import bisect
+import itertools
+import os
+import struct
+import zlib
+from .ChunkStore import open_snapshot
+from .Footer import Footer
+from .Header import Header
+from .Integrity import Verification, verify
+from .ParallelWriter import resolve_executor
+from .Reader import Reader, CorruptSnapshotError
+from .Throttle import throttled
+from .Writer import Writer, entry_digest
+
+# a shard map stands in the snapshot directory for a sharded snapshot and
+# names the shard files holding its entries
+SHARD_MAGIC = b"\x89PSS"
+SHARD_MAP_VERSION = 1
+
+# magic, version, shard count
+_MAP = struct.Struct("<4sHI")
+_LENGTH = struct.Struct("<I")
+_CRC = struct.Struct("<I")
+
+
+def shard_of(key, count: int) -> int:
+    "Shard holding `key`, stable across processes unlike hash()"
+    return zlib.crc32(str(key).encode("utf-8")) % count
+
+
+def shard_name(name: str, index: int) -> str:
+    # hidden so a manifest rebuild doesn't take shards for snapshots
+    return f".{name}.shard{index:04d}"
+
+
+def combined_checksum(checksums: List[bytes]) -> bytes:
+    "Checksum of a sharded snapshot, from the header checksums of its shards"
+    return entry_digest(b"".join(checksums)).digest()
+
+
+class ShardMap:
+    """
+    The shard files of a sharded snapshot, in shard order.
+
+    Paths inside the snapshot directory are stored relative to it so the
+    directory can be moved; shards placed on other disks keep their
+    absolute path.
+    """
+
+    __slots__ = ("paths",)
+
+    def __init__(self, paths: List[Path]):
+        self.paths = [Path(path) for path in paths]
+
+    def pack(self, directory: Path) -> bytes:
+        parts = [_MAP.pack(SHARD_MAGIC, SHARD_MAP_VERSION, len(self.paths))]
+        for path in self.paths:
+            if path.parent == directory:
+                path = Path(path.name)
+            encoded = str(path).encode("utf-8")
+            parts.append(_LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+        data = b"".join(parts)
+        return data + _CRC.pack(zlib.crc32(data))
+
+    @classmethod
+    def unpack(cls, data: bytes, directory: Path) -> "ShardMap":
+        if data[: len(SHARD_MAGIC)] != SHARD_MAGIC or len(data) < _MAP.size:
+            raise ValueError("Not a shard map")
+        (crc,) = _CRC.unpack_from(data, len(data) - _CRC.size)
+        if zlib.crc32(data[: -_CRC.size]) != crc:
+            raise ValueError("Shard map checksum mismatch")
+        _, version, count = _MAP.unpack_from(data)
+        if version > SHARD_MAP_VERSION:
+            raise ValueError(f"Unsupported shard map version {version}")
+        paths, position = [], _MAP.size
+        for _ in range(count):
+            (length,) = _LENGTH.unpack_from(data, position)
+            position += _LENGTH.size
+            path = Path(data[position : position + length].decode("utf-8"))
+            position += length
+            paths.append(path if path.is_absolute() else directory / path)
+        return cls(paths)
+
+    @classmethod
+    def read(cls, path: Path) -> Optional["ShardMap"]:
+        "None when `path` isn't a sharded snapshot"
+        path = Path(path)
+        with open(path, "rb") as f:
+            return cls.parse(f, path.parent)
+
+    @classmethod
+    def parse(cls, f: BinaryIO, directory: Path) -> Optional["ShardMap"]:
+        "Like read() from an open snapshot, leaves it at the start otherwise"
+        f.seek(0)
+        if f.read(len(SHARD_MAGIC)) != SHARD_MAGIC:
+            f.seek(0)
+            return None
+        f.seek(0)
+        return cls.unpack(f.read(), directory)
+
+    def headers(self) -> List[Optional[Header]]:
+        result = []
+        for path in self.paths:
+            with open_snapshot(path) as f:
+                result.append(Header.read(f))
+        return result
+
+    def header(self) -> Optional[Header]:
+        "Header standing for the whole snapshot, None when a shard has none"
+        headers = self.headers()
+        if not headers or any(header is None for header in headers):
+            return None
+        return Header(
+            size=sum(header.size for header in headers),
+            entries=sum(header.entries for header in headers),
+            created=min(header.created for header in headers),
+            checksum=combined_checksum([header.checksum for header in headers]),
+        )
+
+    def describe(self) -> tuple:
+        "Total size, entries and combined checksum, as a manifest entry has"
+        size, entries, checksums = 0, 0, []
+        for path, header in zip(self.paths, self.headers()):
+            size += path.stat().st_size
+            entries += header.entries if header else 0
+            checksums.append(header.checksum if header else bytes(8))
+        return size, entries, combined_checksum(checksums).hex()
+
+
+def write_shard(
+    path: str,
+    source: dict,
+    chunk_size: int,
+    sync: bool,
+    throttle=None,
+    log_sequence: int = None,
+) -> tuple:
+    """
+    Write one shard through `throttle`, returns its size, entry count,
+    header checksum, the seconds the throttle held it back and its entry
+    digests. Runs inside the worker so it must stay a module level
+    function.
+    """
+    with open(path, "wb") as f:
+        with throttled(f, throttle) as out:
+            writer = Writer(
+                source, out, chunk_size=chunk_size, hash_keys=True, header=True
+            )
+            writer.set_log_sequence(log_sequence)
+            writer.write()
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+        waited = out.throttled if throttle is not None else 0.0
+        return (
+            f.tell(),
+            writer.header.entries,
+            writer.header.checksum,
+            waited,
+            writer.key_hashes,
+        )
+
+
+def write_shards(
+    paths: List[Path],
+    source: dict,
+    chunk_size: int,
+    sync: bool,
+    throttle=None,
+    log_sequence: int = None,
+    workers: int = None,
+    executor="process",
+) -> List[tuple]:
+    "Hash the top level keys of `source` into shards written concurrently"
+    buckets = [{} for _ in paths]
+    for key, value in source.items():
+        buckets[shard_of(key, len(paths))][key] = value
+    pool, owned = resolve_executor(executor, workers or len(paths))
+    if throttle is not None and not isinstance(pool, ThreadPoolExecutor):
+        # worker processes can't share the buckets, each gets its part
+        throttle = throttle.split(min(workers or len(paths), len(paths)))
+    try:
+        futures = [
+            pool.submit(
+                write_shard, str(path), bucket, chunk_size, sync, throttle, log_sequence
+            )
+            for path, bucket in zip(paths, buckets)
+        ]
+        # let every shard finish before cleaning up after a failed one
+        wait(futures)
+        return [future.result() for future in futures]
+    finally:
+        if owned:
+            pool.shutdown()
+
+
+def read_shards(shards: ShardMap, workers: int = None, executor="process") -> dict:
+    "Decode the shards concurrently and merge them"
+    pool, owned = resolve_executor(executor, workers or len(shards.paths))
+    try:
+        data = {}
+        for part in pool.map(read_shard, [str(path) for path in shards.paths]):
+            data.update(part)
+        return data
+    finally:
+        if owned:
+            pool.shutdown()
+
+
+def verify_shards(shards: ShardMap) -> Verification:
+    "verify() every shard, their chunks numbered in shard order"
+    result = Verification()
+    for index, shard in enumerate(shards.paths):
+        try:
+            with open_snapshot(shard) as f:
+                checked = verify(f)
+        except OSError as e:
+            result.errors.append(f"shard {index}: {e}")
+            continue
+        result.bad_chunks.extend(result.chunks + bad for bad in checked.bad_chunks)
+        result.chunks += checked.chunks
+        result.errors.extend(f"shard {index}: {error}" for error in checked.errors)
+    if not result.errors:
+        result.header = shards.header()
+    return result
+
+
+def read_shard(path: str) -> dict:
+    # runs inside the worker so it must stay a module level function
+    with open_snapshot(path) as f:
+        return Reader(f).read()
+
+
+def chunk_spans(footer: Optional[Footer], count: int, wanted: set) -> Optional[list]:
+    """
+    (offset, entries, keys) of the chunks holding the `wanted` keys and the
+    ones each holds, None without a usable directory
+    """
+    chunks = footer.chunks() if footer is not None else []
+    key_hashes = footer.key_hashes() if chunks else None
+    if not key_hashes or len(key_hashes) != count:
+        return None
+    if sum(entries for _, _, entries in chunks) != count:
+        return None
+    # digests are recorded in entry order
+    ends = list(itertools.accumulate(entries for _, _, entries in chunks))
+    spans = {}
+    for index, key in enumerate(key_hashes):
+        if key in wanted:
+            spans.setdefault(bisect.bisect_right(ends, index), set()).add(key)
+    return [(chunks[i][0], chunks[i][2], spans[i]) for i in sorted(spans)]
+
+
+def find_keys(buffer: BinaryIO, keys, footer: Footer = None) -> dict:
+    """
+    Values of the entries named in `keys` in a snapshot, the others are
+    skipped undecoded. With the snapshot `footer` only the chunks holding
+    the keys are read.
+    """
+    wanted = {str(key) for key in keys}
+    found = {}
+    reader = Reader(buffer)
+    reader.read_header()
+    body = buffer.tell()
+    count = reader.read_length()
+    spans = chunk_spans(footer, count, wanted) if footer is not None else None
+    for offset, entries, expected in (
+        [(None, count, wanted)] if spans is None else spans
+    ):
+        if offset is not None:
+            buffer.seek(body + offset)
+        for index in range(entries):
+            if not expected:
+                break
+            handler, _ = reader.read_object_id()
+            if handler is None:
+                raise CorruptSnapshotError(
+                    f"Snapshot ended after {index} of {entries} entries"
+                )
+            key = reader.read_value()
+            if key in expected:
+                found[key] = handler.deserialise(reader)
+                expected.discard(key)
+            else:
+                handler.skip(reader)
+    return found
+
+
+def find_key(buffer: BinaryIO, key) -> tuple:
+    "(True, value) for the entry named `key` in a snapshot, (False, None)"
+    key = str(key)
+    found = find_keys(buffer, [key])
+    return (True, found[key]) if key in found else (False, None)
@@ -0,0 +1,203 @@
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import BinaryIO, Callable, ContextManager, Iterator
+import io
+import os
+import struct
+import threading
+import weakref
+from .Reader import Reader
+from .Shards import find_key
+from .Writer import Writer
+
+# reference count and snapshot length, in front of the snapshot
+_PREFIX = struct.Struct("<qQ")
+# size of the first segment a manager encodes into, segments double when outgrown
+MIN_SEGMENT = 1 << 20
+# the encoder writes to the segment in blocks of this size
+_BLOCK = 64 * 1024
+
+_MISSING = object()
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    # the reference count decides when the segment goes, not the exit of
+    # whichever process opened it first
+    if os.name == "posix":
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+
+def _destroy(shm: shared_memory.SharedMemory):
+    if os.name == "posix":
+        # balances the unregister unlink() sends
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        # views handed out keep the mapping alive until they are released
+        pass
+
+
+def _release(shm: shared_memory.SharedMemory, lock: Callable[[], ContextManager]):
+    with lock():
+        refs, length = _PREFIX.unpack_from(shm.buf)
+        refs -= 1
+        _PREFIX.pack_into(shm.buf, 0, refs, length)
+    if refs == 0:
+        _destroy(shm)
+        return
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+class _SegmentRaw(io.RawIOBase):
+    "Seekable output into a shared memory segment, moved to one twice the size when full"
+
+    def __init__(self, size: int):
+        self.shm = shared_memory.SharedMemory(create=True, size=_PREFIX.size + size)
+        _untrack(self.shm)
+        self.length = 0
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        size = len(data)
+        end = self._pos + size
+        if _PREFIX.size + end > self.shm.size:
+            self._grow(end)
+        start = _PREFIX.size + self._pos
+        self.shm.buf[start : start + size] = data
+        self._pos = end
+        self.length = max(self.length, end)
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def _grow(self, needed: int):
+        grown = shared_memory.SharedMemory(
+            create=True, size=max(self.shm.size * 2, _PREFIX.size + needed)
+        )
+        _untrack(grown)
+        used = _PREFIX.size + self.length
+        grown.buf[:used] = self.shm.buf[:used]
+        _destroy(self.shm)
+        self.shm = grown
+
+
+class SharedSnapshot:
+    """
+    A snapshot encoded into a shared memory segment, as attached by this
+    process.
+
+    Publishing and every attach count a reference in the segment, `close()`
+    (or the end of a `with` block, or the handle being collected) drops it
+    and the last one unlinks the segment. Counts change under `lock`, the
+    lock of the snapshot directory, so the processes sharing a segment use
+    managers on the same directory. `view` is the encoded snapshot in place,
+    `load()` decodes all of it straight from the mapping and `get()` and `in`
+    decode entries until they find the key. Views must be released before
+    the last close to free the mapping in this process.
+    """
+
+    def __init__(
+        self, shm: shared_memory.SharedMemory, lock: Callable[[], ContextManager]
+    ):
+        self._shm = shm
+        self.name = shm.name
+        self.size = _PREFIX.unpack_from(shm.buf)[1]
+        self._read_lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _release, shm, lock)
+
+    @classmethod
+    def publish(
+        cls,
+        build: Callable[[BinaryIO], Writer],
+        lock: Callable[[], ContextManager],
+        size_hint: int = MIN_SEGMENT,
+    ) -> "SharedSnapshot":
+        "Encode with the writer `build` makes into a new segment, holding its first reference"
+        raw = _SegmentRaw(max(size_hint, _PREFIX.size))
+        try:
+            with io.BufferedWriter(raw, _BLOCK) as f:
+                build(f).write()
+        except BaseException:
+            _destroy(raw.shm)
+            raise
+        _PREFIX.pack_into(raw.shm.buf, 0, 1, raw.length)
+        return cls(raw.shm, lock)
+
+    @classmethod
+    def attach(cls, name: str, lock: Callable[[], ContextManager]) -> "SharedSnapshot":
+        "Raises FileNotFoundError when no segment `name` is published"
+        shm = shared_memory.SharedMemory(name=name)
+        _untrack(shm)
+        with lock():
+            refs, length = _PREFIX.unpack_from(shm.buf)
+            if refs > 0:
+                _PREFIX.pack_into(shm.buf, 0, refs + 1, length)
+        if refs <= 0:
+            # released by its last holder while being opened
+            shm.close()
+            raise FileNotFoundError(f"Shared snapshot {name} was released")
+        return cls(shm, lock)
+
+    def __enter__(self) -> "SharedSnapshot":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    @property
+    def view(self) -> memoryview:
+        "The encoded snapshot, without copying"
+        return self._shm.buf[_PREFIX.size : _PREFIX.size + self.size]
+
+    @property
+    def references(self) -> int:
+        return _PREFIX.unpack_from(self._shm.buf)[0]
+
+    def load(self) -> dict:
+        with self._reading() as f:
+            return Reader(f).read() or {}
+
+    def get(self, key, default=None):
+        with self._reading() as f:
+            found, value = find_key(f, key)
+        return value if found else default
+
+    def close(self):
+        self._finalizer()
+
+    @contextmanager
+    def _reading(self) -> Iterator[BinaryIO]:
+        "The mapping at the snapshot start, read through its own file position"
+        if self.closed:
+            raise ValueError("Shared snapshot is closed")
+        with self._read_lock:
+            mapping = self._shm.buf.obj
+            mapping.seek(_PREFIX.size)
+            yield mapping
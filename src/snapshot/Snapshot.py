@@ -1,98 +1,554 @@
+from concurrent.futures import Executor
 from pathlib import Path
 from datetime import datetime
-from typing import BinaryIO
+from functools import partial
+from contextlib import ExitStack, contextmanager
+from typing import BinaryIO, Callable, Iterator, List, Optional, Union
+import asyncio
+import copy as copying
+import logging
 import os
+import threading
 from .Reader import Reader
-from .Writer import Writer
+from .Writer import Writer, fingerprint, fingerprint_entries
+from .ParallelWriter import ParallelWriter, write_stream
+from .ParallelReader import ParallelReader
+from .BackgroundDump import BackgroundDump
+from .DeltaWriter import DeltaWriter
+from .Footer import Footer
+from .TrackedDict import TrackedDict
+from .AppendOnlyLog import AppendOnlyLog
+from .Manifest import Manifest, ManifestEntry
+from .Header import Header
+from .Integrity import Verification, verify, salvage
+from .ChunkStore import ChunkStore, open_snapshot, is_recipe
+from .Shards import (
+    ShardMap,
+    shard_of,
+    shard_name,
+    combined_checksum,
+    write_shards,
+    read_shards,
+    verify_shards,
+    find_keys,
+)
+from .Durability import Durability, GroupCommit, fsync_directory
+from .Storage import StorageBackend, FileSystemBackend, temp_path
+from .SnapshotCache import SnapshotCache, freeze
+from .Retention import RetentionIndex, RetentionPolicy
+from .Scheduler import SnapshotScheduler, DEFAULT_RULES
+from .Throttle import IOThrottle, throttled
+from .Locking import FileLock, LOCK_NAME
+from .SharedSnapshot import SharedSnapshot, MIN_SEGMENT
+from .Replication import SnapshotSender
 from .TypeHandler import TypeHandler
+from .Merge import MergeWriter, assign, combine, merge_parts, last_wins
+from .Diff import SnapshotDiff, descend, diff_digests, state_digests
+
+logger = logging.getLogger(__name__)
 
 
 class SnapshotManager:
     _datetime_format = "%Y-%m-%d_%H-%M-%S-%f"
+    # entries per chunk recorded in the footer, lets load() decode in parallel
+    _chunk_size = 1024
 
-    def __init__(self, path="./snapshot"):
+    def __init__(
+        self,
+        path="./snapshot",
+        max_chain: int = 16,
+        aof_fsync: str = "everysec",
+        aof_rewrite_size: int = 64 * 1024 * 1024,
+        durability: str = "file",
+        group_commit_window: float = 0.0,
+        dedup: bool = False,
+        shards: int = 0,
+        shard_dirs: list = None,
+        storage: StorageBackend = None,
+        cache: SnapshotCache = None,
+        retention: RetentionPolicy = None,
+        throttle: IOThrottle = None,
+    ):
         from . import registry
 
         self._registry = registry
+        if isinstance(storage, FileSystemBackend):
+            path = storage.root
         self._path = Path(path)
+        # deltas stacked on a full snapshot before dump(delta=True) writes a full one
+        self._max_chain = max_chain
         self._init()
+        # where the snapshots are kept, the manifest and the log always stay
+        # in `path`; dedup, shards, forked dumps and mapped reads need files
+        self._storage = storage or FileSystemBackend(self._path)
+        self._files = isinstance(self._storage, FileSystemBackend)
+        if not self._files and (dedup or shards > 1):
+            raise ValueError("dedup and shards need filesystem storage")
+        # held by any process of the directory while it names, publishes or
+        # removes a snapshot; readers lease the files they read instead
+        self._lock = FileLock(self._path / LOCK_NAME)
+        # index of the published snapshots, saves listing the directory
+        self._manifest = Manifest(
+            self._path, self._datetime_format, self._storage, self._lock
+        )
+        self._aof = AppendOnlyLog(self._path, aof_fsync, floor=self._log_floor)
+        # active log segment size that triggers a background rewrite
+        self._aof_rewrite_size = aof_rewrite_size
+        self._aof_rewrite: Optional[threading.Thread] = None
+        self._aof_rewrite_lock = threading.Lock()
+        self._durability = Durability(durability)
+        # dumps finishing together share one directory fsync
+        self._commit = GroupCommit(self._sync_directory, group_commit_window)
+        # with `dedup` snapshots are stored as recipes of shared chunks, both
+        # kinds are read whatever the mode
+        self._dedup = dedup
+        self._chunks = ChunkStore(
+            self._path,
+            self._durability,
+            live=lambda: [entry.name for entry in self._manifest.entries()],
+        )
+        # with `shards` > 1 dump() spreads the top level keys over that many
+        # files, written round robin into `shard_dirs` (default the snapshot
+        # directory) so they can sit on separate disks
+        self._shards = shards
+        # decoded snapshots load() serves again while their files don't change
+        self._cache = cache
+        # applied after every dump when given
+        self._retention = retention
+        # kept up to date with the manifest, so a dump doesn't rescan it
+        self._expiry = None
+        if retention is not None:
+            self._expiry = RetentionIndex(retention, self._base)
+            self._manifest.observe(self._expiry.changed)
+        # limits the bytes and writes per second of dumps, adjustable while
+        # they run; `last_throttled` is how long the newest dump was held back
+        self._throttle = throttle
+        self.last_throttled = 0.0
+        # size of the last shared snapshot, the next one starts that big
+        self._shared_size = MIN_SEGMENT
+        # base of every snapshot looked at, None for full ones; files don't change
+        self._bases: dict[str, Optional[str]] = {}
+        self._shard_dirs = [Path(d) for d in shard_dirs] if shard_dirs else []
+        for directory in self._shard_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
 
     def register(self, handlers: list[TypeHandler]):
         self._registry.register(handlers)
 
-    def dump(self, source: dict):
-        now = datetime.now()
-        base_filename = now.strftime(self._datetime_format)
-        path = self._path / base_filename
+    def dump(
+        self,
+        source: dict,
+        workers: int = None,
+        executor="process",
+        delta: Optional[bool] = None,
+        skip_if_unchanged: bool = False,
+    ) -> Path:
+        """
+        Publish `source`, only its changes with `delta`, the newest snapshot
+        instead when it holds the same state with `skip_if_unchanged`. A
+        TrackedDict is dumped incrementally unless `delta` is False
+        """
+        if self._shards > 1:
+            if not skip_if_unchanged:
+                return self._dump_sharded(source, workers, executor)
+            with self.lease() as latest:
+                return self._dump_sharded(source, workers, executor, latest) or latest
+        if isinstance(source, TrackedDict):
+            return self._dump_tracked(
+                source, workers, executor, delta, skip_if_unchanged
+            )
 
-        counter = 0
-        while path.exists():
-            counter += 1
-            unique_filename = f"{base_filename}_{counter}"
-            path = self._path / unique_filename
+        full = lambda buffer: self._writer(buffer, source, workers, executor)
+        if not delta and not skip_if_unchanged:
+            return self._dump_file(full)
+
+        # leased until the dump is listed, so no process prunes its base or
+        # the snapshot it is found to match
+        with self.lease() as latest:
+            base = self._delta_base(latest) if delta else None
+            if base:
+                base_path, base_hashes = base
+                build = lambda buffer: DeltaWriter(
+                    source,
+                    buffer,
+                    base=base_path.name,
+                    base_hashes=base_hashes,
+                    chunk_size=self._chunk_size,
+                    header=True,
+                )
+                unchanged = lambda writer: not (writer.header.entries or writer.deleted)
+            else:
+                build = full
+                unchanged = lambda writer: self._matches(
+                    latest, writer.header.entries, lambda: writer.fingerprint
+                )
+            if not skip_if_unchanged or latest is None:
+                return self._dump_file(build)
+            return self._dump_file(build, skip=unchanged) or latest
+
+    def compact(self) -> Optional[Path]:
+        "Fold the newest delta chain and the closed log into a new full snapshot"
+        latest = self._latest()
+        if latest is None:
+            return None
+        seq = self._aof.rotate() or 0
+        if len(self._chain(latest)) == 1 and seq <= self._log_covered(latest):
+            return latest
+        # None when another snapshot was published meanwhile, it is newer
+        return self._fold(seq) or self._latest()
+
+    def dump_background(self, source: dict) -> BackgroundDump:
+        "Publish `source` from a forked child (a thread on a deep copy without fork)"
+        if not self._files:
+            raise ValueError("dump_background() needs filesystem storage")
+        with self._lock.exclusive():
+            # the temp file claims the name
+            path = self._next_snapshot_path()
+            sequence = self._aof.rotate()
+            write = partial(self._write, name=path.name, log=sequence)
+            published = partial(self._publish, log=sequence)
+            failed = lambda path: self._chunks.release(path.name)
+            if not hasattr(os, "fork"):
+                return BackgroundDump.thread(
+                    path,
+                    source,
+                    write,
+                    published,
+                    self._lock.exclusive,
+                    failed,
+                )
+            if self._dedup:
+                # the child's pins end with it, the chunks it writes stay
+                # pinned here until the snapshot is listed
+                self._chunks.pin(path.name)
+            try:
+                return BackgroundDump.fork(
+                    path,
+                    source,
+                    write,
+                    published,
+                    self._lock.exclusive,
+                    failed,
+                )
+            except BaseException:
+                failed(path)
+                raise
+
+    def schedule(
+        self,
+        source: dict,
+        rules: List[tuple] = DEFAULT_RULES,
+        jitter: float = 0.1,
+        interval: float = 1.0,
+        lock=None,
+        background: bool = False,
+        **kwargs,
+    ) -> SnapshotScheduler:
+        "Dump `source` in the background whenever a `(seconds, changes)` rule is met"
+        return SnapshotScheduler(
+            self,
+            source,
+            rules,
+            jitter=jitter,
+            interval=interval,
+            lock=lock,
+            background=background,
+            **kwargs,
+        ).start()
+
+    def load(
+        self,
+        target_timestamp: str = None,
+        workers: int = None,
+        executor="process",
+        copy: bool = False,
+    ):
+        "Newest state with the log replayed, a read-only view shared with the cache unless `copy`"
+        data = self._state(target_timestamp, workers, executor)
+        if self._cache is None:
+            return data
+        return copying.deepcopy(data) if copy else freeze(data)
+
+    def load_key(self, key, target_timestamp: str = None, default=None):
+        "Value of one top level key, without decoding the rest of the snapshot"
+
+        def read(snapshot: Optional[Path]) -> dict:
+            cached = self._cached(snapshot) if snapshot else None
+            if cached is not None:
+                return {key: freeze(cached[key])} if key in cached else {}
+            found, value = self._find_key(snapshot, key) if snapshot else (False, None)
+            return {key: value} if found else {}
+
+        if target_timestamp:
+            with self._leased(partial(self.find, target_timestamp)) as snapshot:
+                return read(snapshot).get(key, default)
+        return self._replayed(read).get(key, default)
+
+    def find(self, target_timestamp, how: str = "nearest") -> Optional[Path]:
+        "Snapshot closest to `target_timestamp`, `how` is nearest, floor or ceiling"
+        lookups = {
+            "nearest": self._manifest.nearest,
+            "floor": self._manifest.floor,
+            "ceiling": self._manifest.ceiling,
+        }
+        if how not in lookups:
+            raise ValueError(f"Unknown lookup {how!r}")
+        entry = lookups[how](self._target(target_timestamp))
+        return self._path / entry.name if entry else None
 
-        with open(path, "wb") as f:
-            Writer(source, f).write()
-            f.flush()
-            os.fsync(f.fileno())
+    def log_set(self, key, value) -> int:
+        "Append a set operation to the log replayed by load()"
+        written = self._aof.set(key, value)
+        self._maybe_rewrite_aof()
+        return written
 
-    def load(self, target_timestamp: str = None):
-        files = list(self._path.glob("*"))
-        if not files:
-            return {}
+    def log_delete(self, key) -> int:
+        "Append a delete operation to the log replayed by load()"
+        written = self._aof.delete(key)
+        self._maybe_rewrite_aof()
+        return written
 
+    def rewrite_aof(self, background: bool = True) -> Optional[threading.Thread]:
+        "Fold the closed log segments into a new snapshot, in a thread with `background`"
+        with self._aof_rewrite_lock:
+            if self._aof_rewrite is not None and self._aof_rewrite.is_alive():
+                return self._aof_rewrite
+            seq = self._aof.rotate()
+            if seq is None:
+                return None
+
+            def rewrite():
+                with self.lease() as latest:
+                    if self._log_covered(latest) >= seq:
+                        # a dump already includes them
+                        self._aof.remove(seq)
+                        return
+                self._fold(seq)
+
+            if not background:
+                rewrite()
+                return None
+            self._aof_rewrite = threading.Thread(target=rewrite, daemon=True)
+            self._aof_rewrite.start()
+            return self._aof_rewrite
+
+    def close(self):
+        "Wait for a running log rewrite and close the log"
+        if self._aof_rewrite is not None:
+            self._aof_rewrite.join()
+        self._aof.close()
+        self._lock.close()
+
+    def list(self, target_timestamp: str = None, since=None, until=None):
+        "Snapshots newest first, or closest first to `target_timestamp`"
+        since = self._target(since) if since is not None else None
+        until = self._target(until) if until is not None else None
         if not target_timestamp:
-            snapshot = max(files, key=lambda f: f.stat().st_mtime)
+            entries = self._manifest.between(since, until)
+            return [self._path / entry.name for entry in reversed(entries)]
+        target = self._target(target_timestamp)
+        return [
+            self._path / entry.name
+            for entry in self._manifest.around(target, since, until)
+        ]
+
+    def manifest(self) -> List[ManifestEntry]:
+        "Index entries of the published snapshots, oldest first"
+        return self._manifest.entries()
+
+    def exists(self, name: str) -> bool:
+        "Whether snapshot `name` is published"
+        return self._manifest.get(Path(name).name) is not None
+
+    @contextmanager
+    def lease(self, name: str = None) -> Iterator[Optional[Path]]:
+        "Snapshot `name` (default the newest), kept from being pruned in the block"
+        if name is None:
+            resolve = self._latest
         else:
-            # find the timestamp snapshot to target timestamp
-            target = datetime.strptime(target_timestamp, self._datetime_format)
+            path = self._path / Path(name).name
+            resolve = lambda: path if self._storage.exists(path.name) else None
+        with self._leased(resolve) as leased:
+            yield leased
 
-            snapshot = min(
-                files,
-                key=lambda f: abs(
-                    target - datetime.strptime(f.name, self._datetime_format)
-                ),
-            )
+    def chain(self, name) -> List[Path]:
+        "Files the state of snapshot `name` is read from, full snapshot first"
+        return [path for path, _ in self._chain(self._path / Path(name).name)]
 
-        with open(snapshot, "rb") as f:
-            reader = Reader(f)
-            data = reader.read()
-            return data if data else {}
+    def sharded(self, name) -> bool:
+        return self._shard_map(self._path / Path(name).name) is not None
+
+    def open(self, name) -> BinaryIO:
+        "Stored bytes of snapshot file `name`"
+        return self._storage.open(Path(name).name)
+
+    def stage(self, name: str):
+        "Staging writer publishing a received snapshot `name` through install()"
+        return self._storage.writer(name, self._durability != Durability.NONE)
+
+    def install(self, name: str, staged) -> Path:
+        "Publish snapshot `name` from its stage() writer, aborting it on failure"
+        path = self._path / name
+        try:
+            self._install(path, staged, ())
+        except BaseException:
+            staged.abort()
+            raise
+        self._publish(path)
+        return path
+
+    def stat(self, name) -> Optional[Header]:
+        "Header of a snapshot, None when written without one"
+        path = self._path / Path(name).name
+        shards = self._shard_map(path)
+        if shards is not None:
+            return shards.header()
+        with self.open(path) as f:
+            return Header.read(f)
+
+    def verify(self, name) -> Verification:
+        "Check the header, checksum and chunk CRCs of a snapshot without decoding it"
+        path = self._path / Path(name).name
+        shards = self._shard_map(path)
+        if shards is None:
+            with self.open(path) as f:
+                return verify(f)
+        return verify_shards(shards)
+
+    def salvage(self, target_timestamp: str = None) -> tuple[dict, int]:
+        "load() skipping damaged chunks, returns the data and the entries lost"
+        lost = 0
+
+        def read(path: Path) -> dict:
+            nonlocal lost
+            shards = self._shard_map(path)
+            data = {}
+            for shard in shards.paths if shards else [path]:
+                try:
+                    with open_snapshot(shard) if shards else self.open(path) as f:
+                        part, missing = salvage(f)
+                except FileNotFoundError:
+                    # the entry count of a lost shard is unknown
+                    continue
+                data.update(part)
+                lost += missing
+            return data
 
-    def list(self, target_timestamp: str = None):
-        files = list(self._path.glob("*"))
-        if not files:
-            return []
         if not target_timestamp:
-            # If no target timestamp, return all files sorted by mtime
-            return sorted(files, key=lambda f: f.stat().st_mtime, reverse=True)
-        target = datetime.strptime(target_timestamp, self._datetime_format)
-        return sorted(
-            files,
-            key=lambda f: abs(
-                target - datetime.strptime(f.name, self._datetime_format)
-            ),
-        )
+
+            def newest(snapshot: Optional[Path]) -> dict:
+                nonlocal lost
+                lost = 0
+                return self._load_snapshot(snapshot, read=read) if snapshot else {}
+
+            return self._replayed(newest), lost
+        with self._leased(partial(self.find, target_timestamp)) as snapshot:
+            if snapshot is None:
+                return {}, 0
+            return self._load_snapshot(snapshot, read=read), lost
 
     def prune(self, max_prune=1):
-        snapshots = list(self._path.glob("*"))
-        if len(snapshots) < max_prune:
+        "Remove the `max_prune` oldest snapshots no newer one needs as a base"
+        entries = self._manifest.entries()
+        if len(entries) < max_prune:
             return 0
-        snapshots.sort(key=lambda f: (f.stat().st_mtime, f.name), reverse=True)
-        pruned = 0
-        for old_snapshot in snapshots[:max_prune]:
-            try:
-                old_snapshot.unlink()
-                pruned += 1
-            except Exception as e:
-                print(f"Could not prune snapshot {old_snapshot}: {e}")
-        return pruned
+        needed = self._needed(entries[max_prune:])
+        oldest = [entry.name for entry in entries[:max_prune]]
+        return self._remove([name for name in oldest if name not in needed])
+
+    def apply_retention(self, policy: RetentionPolicy = None, now: float = None):
+        "Remove the snapshots `policy` doesn't keep, returns their names"
+        policy = policy or self._retention
+        if policy is None:
+            raise ValueError("No retention policy")
+        if policy is self._retention:
+            expired = self._expiry.expired(self._manifest, now)
+        else:
+            expired = policy.expired(self._manifest.entries(), self._base, now)
+        names = [entry.name for entry in expired]
+        self._remove(names)
+        # leased ones are kept for a later run
+        return [name for name in names if self._manifest.get(name) is None]
 
     def prune_snapshot(self, snapshot_name: str):
         path = Path(snapshot_name)
-        if not path.exists():
+        inside = self._inside(path)
+        if not (self._storage.exists(path.name) if inside else path.exists()):
             raise Exception(f"{snapshot_name} doesn't exists")
-        path.unlink()
+        if not inside:
+            self._unlink(path)
+            return
+        self._track_chunks()
+        with self._lock.exclusive():
+            claims = self._claim([path.name])
+            if path.name not in claims:
+                raise Exception(f"{snapshot_name} is being read")
+            try:
+                self._unlink(path)
+                self._manifest.remove([path.name])
+            finally:
+                self._storage.release_all(claims)
+        self._forget([path.name])
+        self._track_chunks()
+
+    def replicate(self, address, name: str = None, **kwargs) -> List[str]:
+        "Ship snapshot `name` (default the newest) and its bases to a SnapshotReceiver"
+        return SnapshotSender(self, address, **kwargs).send(name)
+
+    def diff(self, before: str, after: str, nested: bool = True) -> SnapshotDiff:
+        "Paths added, removed and changed from snapshot `before` to `after`"
+        with (
+            self.lease(before) as a,
+            self.lease(after) as b,
+        ):
+            for path, name in ((a, before), (b, after)):
+                if path is None:
+                    raise FileNotFoundError(name)
+            result = diff_digests(self._state_digests(a), self._state_digests(b))
+            if result.changed:
+                keys = [path[0] for path in result.changed]
+                descend(
+                    result, self._find_keys(a, keys), self._find_keys(b, keys), nested
+                )
+        return result
+
+    def merge(self, names: List[str], strategy: Callable = last_wins) -> Path:
+        """
+        Publish a full snapshot holding the entries of snapshots `names`,
+        `strategy(key, values)` deciding the value of keys held by several
+        """
+        if not names:
+            raise ValueError("No snapshots to merge")
+        with ExitStack() as stack:
+            paths = []
+            for name in names:
+                path = stack.enter_context(self.lease(name))
+                if path is None:
+                    raise FileNotFoundError(name)
+                paths.append(path)
+
+            owner, shared = assign(
+                [self._state_digests(path) for path in paths], strategy
+            )
+            finds = [partial(self._find_keys, path) for path in paths]
+            combined = combine(shared, strategy, finds, self._chunk_size)
+            parts = merge_parts([self._sources(path) for path in paths], owner)
+            return self._dump_file(
+                lambda buffer: MergeWriter(
+                    parts,
+                    buffer,
+                    combined,
+                    len(shared),
+                    chunk_size=self._chunk_size,
+                    header=True,
+                ),
+                # the log isn't merged, it stays replayed on top
+                log=self._log_floor,
+            )
+
+    def collect_chunks(self) -> int:
+        "Remove the stored chunks no snapshot references"
+        return self._chunks.collect(entry.name for entry in self._manifest.entries())
 
     def write_to_buffer(self, source: dict, buffer: BinaryIO) -> int:
         writer = Writer(source, buffer)
@@ -109,6 +565,713 @@ class SnapshotManager:
         data = reader.read()
         return data if data else {}
 
+    def publish_shared(self, source: dict, size_hint: int = None) -> SharedSnapshot:
+        "Encode `source` into a new shared memory segment for attach_shared()"
+        shared = SharedSnapshot.publish(
+            # encoded like write_to_buffer(), a handoff needs no header or footer
+            lambda f: Writer(source, f),
+            self._lock.exclusive,
+            size_hint or self._shared_size,
+        )
+        self._shared_size = max(shared.size, MIN_SEGMENT)
+        return shared
+
+    def attach_shared(self, name: str, lazy: bool = False):
+        "Decode the snapshot in shared memory segment `name`, read in place with `lazy`"
+        shared = SharedSnapshot.attach(name, self._lock.exclusive)
+        if lazy:
+            return shared
+        with shared:
+            return shared.load()
+
+    async def async_dump(
+        self, source: dict, executor: Executor = None, workers: int = None
+    ) -> Optional[Path]:
+        "dump() on `executor` (the loop default when None) so fsync doesn't block"
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(self.dump, source, workers))
+
+    async def async_load(
+        self,
+        target_timestamp: str = None,
+        executor: Executor = None,
+        workers: int = None,
+    ) -> dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, partial(self.load, target_timestamp, workers)
+        )
+
+    async def async_write_to_buffer(
+        self, source: dict, stream, executor: Executor = None, chunk_size: int = None
+    ) -> int:
+        """
+        Encode `source` chunk by chunk on `executor` into `stream`. The top level
+        items are copied on the loop, nested values must not be mutated until
+        this returns.
+        """
+        return await write_stream(
+            source, stream, executor, chunk_size or self._chunk_size
+        )
+
+    def _next_snapshot_path(self) -> Path:
+        base_filename = datetime.now().strftime(self._datetime_format)
+        path = self._path / base_filename
+
+        counter = 0
+        while self._storage.exists(path.name) or temp_path(path).exists():
+            counter += 1
+            unique_filename = f"{base_filename}_{counter}"
+            path = self._path / unique_filename
+        return path
+
+    def _writer(
+        self, f: BinaryIO, source: dict, workers=None, executor="process"
+    ) -> Writer:
+        if workers:
+            return ParallelWriter(
+                source,
+                f,
+                workers=workers,
+                executor=executor,
+                hash_keys=True,
+                header=True,
+            )
+        return Writer(
+            source, f, chunk_size=self._chunk_size, hash_keys=True, header=True
+        )
+
+    def _write(
+        self,
+        f: BinaryIO,
+        source: dict,
+        workers=None,
+        executor="process",
+        name: str = None,
+        log: int = None,
+    ):
+        "Write a full snapshot, returns what _publish() needs for the manifest"
+        return self._record(
+            f, lambda buffer: self._writer(buffer, source, workers, executor), name, log
+        )
+
+    def _record(
+        self,
+        f: BinaryIO,
+        build: Callable[[BinaryIO], Writer],
+        name: str,
+        log: int = None,
+    ) -> tuple:
+        "Run the writer `build` makes for `f`, returns what the manifest needs"
+        meter = self._throttle.meter() if self._throttle is not None else None
+        try:
+            if not self._dedup:
+                with throttled(f, meter) as out:
+                    writer = build(out)
+                    writer.set_log_sequence(log)
+                    writer.write()
+                header = writer.header
+                return f.tell(), header.entries, header.checksum.hex()
+
+            buffer = self._chunks.buffer(name, meter)
+            writer = build(buffer)
+            writer.set_log_sequence(log)
+            writer.write()
+            recipe = buffer.close()
+            with throttled(f, meter) as out:
+                out.write(recipe.pack())
+            header = writer.header
+            return recipe.size, header.entries, header.checksum.hex()
+        finally:
+            self.last_throttled = meter.throttled if meter is not None else 0.0
+
+    def _reserve(
+        self, log: Callable[[], Optional[int]] = None
+    ) -> tuple[Path, BinaryIO, Optional[int]]:
+        "Name and staging writer of a new snapshot, and the last log segment it includes"
+        sync = self._durability != Durability.NONE
+        # the name is checked and claimed under the lock renames happen under
+        with self._lock.exclusive():
+            # rotated under the lock, so newer names include more of the log
+            sequence = (log or self._aof.rotate)()
+            while True:
+                path = self._next_snapshot_path()
+                try:
+                    return path, self._storage.writer(path.name, sync), sequence
+                except FileExistsError:
+                    # taken by a concurrent dump
+                    continue
+
+    def _dump_file(
+        self,
+        build: Callable[[BinaryIO], Writer],
+        skip: Callable[[Writer], bool] = None,
+        log: Callable[[], Optional[int]] = None,
+    ) -> Optional[Path]:
+        "Write and publish a snapshot, None when `skip` says so of the writer"
+        path, f, sequence = self._reserve(log)
+        writers = []
+
+        def record(buffer: BinaryIO) -> Writer:
+            writers.append(build(buffer))
+            return writers[-1]
+
+        try:
+            info = self._record(f, record, path.name, sequence)
+            with self._lock.exclusive():
+                skipped = skip is not None and skip(writers[-1])
+                if not skipped:
+                    self._install(path, f, info)
+        except BaseException:
+            self._chunks.release(path.name)
+            f.abort()
+            raise
+        if skipped:
+            self._chunks.release(path.name)
+            f.abort()
+            return None
+        self._publish(path, log=sequence)
+        return path
+
+    def _dump_sharded(
+        self, source: dict, workers, executor, match: Optional[Path] = None
+    ) -> Optional[Path]:
+        """
+        Write the keys of `source` to shard files and publish their shard map,
+        None when they hold the state of snapshot `match`
+        """
+        if isinstance(source, TrackedDict):
+            # a sharded dump is a full one, nothing to track
+            source.clear_dirty()
+        path, f, sequence = self._reserve()
+        directories = self._shard_dirs or [self._path]
+        paths = [
+            directories[index % len(directories)] / shard_name(path.name, index)
+            for index in range(self._shards)
+        ]
+
+        def discard():
+            f.abort()
+            for shard in paths:
+                try:
+                    shard.unlink()
+                except OSError:
+                    pass
+
+        sync = self._durability != Durability.NONE
+        try:
+            results = write_shards(
+                paths,
+                source,
+                self._chunk_size,
+                sync and match is None,
+                self._throttle,
+                sequence,
+                workers,
+                executor,
+            )
+            skip = match is not None and self._matches(
+                match,
+                sum(result[1] for result in results),
+                lambda: fingerprint(
+                    {key: h for result in results for key, h in result[4].items()}
+                ),
+            )
+            if not skip:
+                if sync and match is not None:
+                    for shard in paths:
+                        with open(shard, "r+b") as written:
+                            os.fsync(written.fileno())
+                f.write(ShardMap(paths).pack(self._path))
+                if self._durability == Durability.FILE_AND_DIR:
+                    for directory in directories:
+                        if directory != self._path:
+                            fsync_directory(directory)
+                info = (
+                    sum(result[0] for result in results),
+                    sum(result[1] for result in results),
+                    combined_checksum([result[2] for result in results]).hex(),
+                )
+                self._install(path, f, info)
+        except BaseException:
+            discard()
+            raise
+
+        self.last_throttled = sum(result[3] for result in results)
+        if skip:
+            discard()
+            path = match
+        else:
+            self._publish(path, log=sequence)
+        if isinstance(source, TrackedDict):
+            source.mark_dumped(path.name, False)
+        return None if skip else path
+
+    def _install(self, path: Path, f: BinaryIO, info: tuple):
+        "Commit a staged snapshot and list it, under the directory lock"
+        with self._lock.exclusive():
+            f.commit()
+            self._manifest.add(self._manifest.describe(path, *info))
+
+    def _publish(self, path: Path, info: tuple = None, log: int = None):
+        "Finish publishing a snapshot and remove the log segments up to `log`"
+        if info is not None:
+            self._manifest.add(self._manifest.describe(path, *info))
+        self._chunks.release(path.name)
+        if log is not None:
+            self._aof.remove(log)
+        if self._durability == Durability.FILE_AND_DIR:
+            self._commit.sync()
+        if self._retention is not None:
+            self.apply_retention()
+
+    def _remove(self, names: List[str]) -> int:
+        "Delete published snapshots, returns the number of files removed"
+        if not names:
+            return 0
+        # count the chunk references before the recipes go away
+        self._track_chunks()
+        pruned, removed = 0, []
+        with self._lock.exclusive():
+            claims = self._claim(names)
+            try:
+                # one transaction where the storage has them
+                with self._storage.batch():
+                    for name in names:
+                        if name not in claims:
+                            continue
+                        old_snapshot = self._path / name
+                        try:
+                            self._unlink(old_snapshot)
+                            pruned += 1
+                            removed.append(name)
+                        except FileNotFoundError:
+                            removed.append(name)
+                        except OSError as e:
+                            # kept listed, a later prune retries it
+                            logger.warning(
+                                "Could not prune snapshot %s: %s", old_snapshot, e
+                            )
+                self._manifest.remove(removed)
+            finally:
+                self._storage.release_all(claims)
+        self._forget(removed)
+        self._track_chunks()
+        return pruned
+
+    def _claim(self, names: List[str]) -> dict:
+        "Claims on the snapshots no reader leases, held under the directory lock"
+        return self._storage.claim_unleased(names, self._base)
+
+    @contextmanager
+    def _leased(self, resolve: Callable[[], Optional[Path]]) -> Iterator[Path]:
+        "The snapshot `resolve` picks, read leased for the block"
+        while True:
+            snapshot = resolve()
+            if snapshot is None:
+                yield snapshot
+                return
+            with self._storage.lease(snapshot.name) as leased:
+                if leased:
+                    yield snapshot
+                    return
+            # pruned between being picked and leased, let the prune update the manifest
+            with self._lock.exclusive():
+                pass
+
+    def _base(self, name: str) -> Optional[str]:
+        "Snapshot `name` is a delta against, None for full snapshots"
+        if name not in self._bases:
+            path = self._path / name
+            footer = None
+            try:
+                if self._shard_map(path) is None:
+                    with self.open(path) as f:
+                        footer = Footer.read(f)
+            except FileNotFoundError:
+                pass
+            self._bases[name] = footer.base() if footer else None
+        return self._bases[name]
+
+    def _needed(self, entries: List[ManifestEntry]) -> set:
+        "Bases the snapshots of `entries` depend on, directly or not"
+        needed = set()
+        for entry in entries:
+            base = self._base(entry.name)
+            while base is not None and base not in needed:
+                needed.add(base)
+                base = self._base(base)
+        return needed
+
+    def _sync_directory(self):
+        fsync_directory(self._path)
+        self._manifest.sync()
+
+    def _target(self, target_timestamp: Union[str, datetime]) -> float:
+        if isinstance(target_timestamp, datetime):
+            return target_timestamp.timestamp()
+        target = datetime.strptime(target_timestamp, self._datetime_format)
+        return target.timestamp()
+
+    def _maybe_rewrite_aof(self):
+        if self._aof.size >= self._aof_rewrite_size:
+            self.rewrite_aof()
+
+    def _dump_tracked(
+        self,
+        source: TrackedDict,
+        workers,
+        executor,
+        delta: Optional[bool],
+        skip_if_unchanged: bool,
+    ) -> Path:
+        # leased until the delta is listed, so no process prunes its base
+        with self.lease() as latest:
+            incremental = (
+                delta is not False
+                and latest is not None
+                and latest.name == source.snapshot
+                and source.chain_length < self._max_chain
+            )
+            if incremental and not source.dirty:
+                return latest
+
+            # taken up front so mutations made while writing stay dirty
+            dirty = source.dirty
+            source.clear_dirty()
+            if incremental:
+                # the base digests drop keys set back to the value they had
+                base_hashes = self._state_digests(latest) if skip_if_unchanged else None
+                build = lambda buffer: DeltaWriter(
+                    source,
+                    buffer,
+                    base=latest.name,
+                    base_hashes=base_hashes,
+                    chunk_size=self._chunk_size,
+                    keys=dirty,
+                    header=True,
+                )
+                unchanged = lambda writer: not (writer.header.entries or writer.deleted)
+            else:
+                build = lambda buffer: self._writer(buffer, source, workers, executor)
+                unchanged = lambda writer: self._matches(
+                    latest, writer.header.entries, lambda: writer.fingerprint
+                )
+            try:
+                if skip_if_unchanged and latest is not None:
+                    path = self._dump_file(build, skip=unchanged)
+                else:
+                    path = self._dump_file(build)
+            except BaseException:
+                source.mark_dirty(dirty)
+                raise
+
+            if path is None:
+                return latest
+            source.mark_dumped(path.name, incremental)
+            return path
+
+    def _state(
+        self, target_timestamp: str = None, workers=None, executor="process"
+    ) -> dict:
+        "What load() returns, nested values may be shared with the cache"
+        if not target_timestamp:
+
+            def read(snapshot: Optional[Path]) -> dict:
+                if snapshot is None:
+                    return {}
+                data = self._load_cached(snapshot, workers, executor)
+                if self._cache is not None and self._aof.segments():
+                    # the log only sets and deletes top level keys
+                    data = dict(data)
+                return data
+
+            return self._replayed(read)
+
+        # find the timestamp snapshot to target timestamp
+        with self._leased(partial(self.find, target_timestamp)) as snapshot:
+            if snapshot is None:
+                return {}
+            return self._load_cached(snapshot, workers, executor)
+
+    def _cached(self, snapshot: Path) -> Optional[dict]:
+        "Cached state of `snapshot` when its files are still the decoded ones"
+        if self._cache is None:
+            return None
+        return self._cache.get(snapshot.name, self._stamps)
+
+    def _load_cached(self, snapshot: Path, workers=None, executor="process") -> dict:
+        "_load_snapshot() through the cache, the result must not be mutated"
+        cached = self._cached(snapshot)
+        if cached is not None:
+            return cached
+        if self._cache is None:
+            return self._load_snapshot(snapshot, workers, executor)
+        chain = self._chain(snapshot)
+        names = [path.name for path, _ in chain]
+        # taken before decoding, a file replaced meanwhile is a miss next time
+        stamps = self._stamps(names)
+        data = self._load_snapshot(snapshot, workers, executor, chain=chain)
+        weight = sum(stamp.size for stamp in stamps)
+        self._cache.put(snapshot.name, data, names, stamps, weight)
+        return data
+
+    def _stamps(self, names: List[str]) -> tuple:
+        return tuple(self._storage.stat(name) for name in names)
+
+    def _forget(self, names: List[str]):
+        for name in names:
+            self._bases.pop(name, None)
+        if self._cache is not None:
+            for name in names:
+                self._cache.invalidate(name)
+
+    def _load_snapshot(
+        self,
+        snapshot: Path,
+        workers=None,
+        executor="process",
+        read: Callable[[Path], dict] = None,
+        chain: List[tuple] = None,
+    ) -> dict:
+        read = read or partial(self._read, workers=workers, executor=executor)
+        chain = chain or self._chain(snapshot)
+        data = read(chain[0][0])
+        # replay the deltas oldest first
+        for path, footer in chain[1:]:
+            for key in footer.deleted():
+                data.pop(key, None)
+            data.update(read(path))
+        return data if data else {}
+
+    def _read(self, path: Path, workers=None, executor="process") -> dict:
+        shards = self._shard_map(path)
+        if shards is not None:
+            return read_shards(shards, workers, executor)
+        # workers map the file, recipes are read through the chunk store
+        if workers and self._files and not is_recipe(path):
+            return ParallelReader(path, workers=workers, executor=executor).read()
+        with self.open(path) as f:
+            return Reader(f).read()
+
+    def _find_key(self, snapshot: Path, key) -> tuple:
+        "(True, value) when `key` is in the state `snapshot` describes"
+        name = str(key)
+        found = self._find_keys(snapshot, [name])
+        return (True, found[name]) if name in found else (False, None)
+
+    def _find_keys(self, snapshot: Path, keys) -> dict:
+        "Values of the `keys` present in the state `snapshot` describes"
+        wanted = {str(key) for key in keys}
+        found = {}
+        for path, footer in reversed(self._chain(snapshot)):
+            if not wanted:
+                break
+            shards = self._shard_map(path)
+            if shards is not None:
+                by_shard = {}
+                for name in wanted:
+                    by_shard.setdefault(shard_of(name, len(shards.paths)), []).append(
+                        name
+                    )
+                for index, names in by_shard.items():
+                    with open_snapshot(shards.paths[index]) as f:
+                        found.update(find_keys(f, names, Footer.read(f)))
+                break
+            here = wanted
+            if footer is not None:
+                wanted = wanted - set(footer.deleted())
+                key_hashes = footer.key_hashes()
+                here = wanted if key_hashes is None else wanted & key_hashes.keys()
+            if here:
+                with self.open(path) as f:
+                    values = find_keys(f, here, footer)
+                found.update(values)
+                wanted = wanted - values.keys()
+        return found
+
+    def _replayed(self, read: Callable[[Optional[Path]], dict]) -> dict:
+        "What `read` returns for the newest snapshot, with the log replayed on top"
+        while True:
+            with self.lease() as snapshot:
+                data = read(snapshot)
+                after = self._log_covered(snapshot)
+            try:
+                return self._aof.replay(data, after=after)
+            except FileNotFoundError:
+                continue
+
+    def _fold(self, seq: int) -> Optional[Path]:
+        """
+        Dump the newest state with the log up to segment `seq` replayed,
+        None when another snapshot is published meanwhile
+        """
+        with self.lease() as latest:
+            after = self._log_covered(latest)
+            try:
+                data = self._load_snapshot(latest) if latest else {}
+                if seq > after:
+                    data = self._aof.replay(data, after=after, upto=seq)
+            except FileNotFoundError:
+                # folded into a newer snapshot meanwhile
+                return None
+            return self._dump_file(
+                lambda buffer: self._writer(buffer, data),
+                skip=lambda writer: self._latest() != latest,
+                log=lambda: max(seq, after) or None,
+            )
+
+    def _log_covered(self, snapshot: Optional[Path]) -> int:
+        "Last log segment the state of `snapshot` includes, 0 for none"
+        if snapshot is None:
+            return 0
+        shards = self._shard_map(snapshot)
+        if shards is None:
+            with self.open(snapshot) as f:
+                footer = Footer.read(f)
+        else:
+            # every shard records it, any one still readable will do
+            for shard in shards.paths:
+                try:
+                    with open_snapshot(shard) as f:
+                        footer = Footer.read(f)
+                    break
+                except FileNotFoundError:
+                    continue
+            else:
+                footer = None
+        sequence = footer.log_sequence() if footer is not None else None
+        return sequence or 0
+
+    def _log_floor(self) -> int:
+        "_log_covered() of the newest snapshot, without taking the directory lock"
+        for entry in reversed(self._manifest.entries()):
+            try:
+                return self._log_covered(self._path / entry.name)
+            except FileNotFoundError:
+                # pruned meanwhile
+                continue
+        return 0
+
+    def _state_digests(self, snapshot: Path) -> dict[str, bytes]:
+        "Entry digests of the state `snapshot` describes"
+        return state_digests(self._sources(snapshot))
+
+    def _sources(self, snapshot: Path) -> List[tuple]:
+        "(open, footer) of the files holding the state of `snapshot`, oldest first"
+        shards = self._shard_map(snapshot)
+        if shards is None:
+            return [
+                (partial(self.open, path), footer)
+                for path, footer in self._chain(snapshot)
+            ]
+        files = []
+        for shard in shards.paths:
+            with open_snapshot(shard) as f:
+                files.append((partial(open_snapshot, shard), Footer.read(f)))
+        return files
+
+    def _fingerprint(self, snapshot: Path) -> bytes:
+        "Fingerprint of the state `snapshot` describes, from its footer when recorded"
+        if self._shard_map(snapshot) is None:
+            with self.open(snapshot) as f:
+                footer = Footer.read(f)
+            recorded = footer.fingerprint() if footer is not None else None
+            if recorded is not None and fingerprint_entries(recorded) is not None:
+                return recorded
+        return fingerprint(self._state_digests(snapshot))
+
+    def _matches(
+        self, snapshot: Path, entries: int, state: Callable[[], bytes]
+    ) -> bool:
+        "Whether `snapshot` holds `entries` entries with the fingerprint `state` makes"
+        recorded = self._fingerprint(snapshot)
+        # the count is cheap to compare, hashing every digest isn't
+        return fingerprint_entries(recorded) == entries and recorded == state()
+
+    def _shard_map(self, path: Path) -> Optional[ShardMap]:
+        "Shard map of a sharded snapshot, None for other snapshots"
+        return ShardMap.read(path) if self._files else None
+
+    def _inside(self, path: Path) -> bool:
+        "Whether `path` names a snapshot of the storage, not some other file"
+        return not self._files or path.parent.resolve() == self._path.resolve()
+
+    def _unlink(self, path: Path):
+        "Remove a snapshot, and the shards of a sharded one"
+        shards = self._shard_map(path)
+        if not self._inside(path):
+            path.unlink()
+        elif not self._storage.delete(path.name):
+            raise FileNotFoundError(path.name)
+        for shard in shards.paths if shards else []:
+            try:
+                shard.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _latest(self) -> Optional[Path]:
+        while True:
+            entry = self._manifest.floor(float("inf"))
+            if entry is None:
+                return None
+            path = self._path / entry.name
+            if self._storage.exists(entry.name):
+                return path
+            # deleted without going through prune
+            self._manifest.remove([entry.name])
+
+    def _chain(self, path: Path) -> List[tuple[Path, Optional[Footer]]]:
+        "The snapshot and the bases it depends on, oldest (full snapshot) first"
+        chain = []
+        while True:
+            if self._shard_map(path) is not None:
+                # sharded snapshots are always full ones
+                chain.append((path, None))
+                break
+            with self.open(path) as f:
+                footer = Footer.read(f)
+            chain.append((path, footer))
+            base = footer.base() if footer else None
+            if not base:
+                break
+            path = self._path / base
+            if not self._storage.exists(base):
+                raise FileNotFoundError(
+                    f"Base snapshot {base} of {chain[-1][0].name} doesn't exists"
+                )
+        chain.reverse()
+        return chain
+
+    def _delta_base(
+        self, latest: Optional[Path]
+    ) -> Optional[tuple[Path, dict[str, bytes]]]:
+        "The newest snapshot `latest` and the entry digests of the state it describes"
+        if latest is None:
+            return None
+        chain = self._chain(latest)
+        if len(chain) > self._max_chain:
+            return None
+
+        _, footer = chain[0]
+        key_hashes = footer.key_hashes() if footer else None
+        if key_hashes is None:
+            # written before digests were recorded
+            return None
+        for _, footer in chain[1:]:
+            for key in footer.deleted():
+                key_hashes.pop(key, None)
+            key_hashes.update(footer.key_hashes() or {})
+        return latest, key_hashes
+
+    def _track_chunks(self) -> int:
+        "Bring the chunk references up to date, freeing unused chunks"
+        return self._chunks.track(entry.name for entry in self._manifest.entries())
+
+    def _snapshot_files(self) -> List[Path]:
+        "Published snapshots, oldest first"
+        return [self._path / entry.name for entry in self._manifest.entries()]
+
     def _init(self):
         path = self._path
         if not path.exists():
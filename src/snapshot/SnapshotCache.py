@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from typing import Callable, List, Optional
+import threading
+
+
+def freeze(value):
+    "Read-only view of decoded dicts and lists, other values as they are"
+    if isinstance(value, dict):
+        return FrozenDict(value)
+    if isinstance(value, list):
+        return FrozenList(value)
+    return value
+
+
+class FrozenDict(Mapping):
+    """
+    Read-only view of a decoded dict shared through the cache. Nested dicts
+    and lists are wrapped as they are looked up, so nothing reachable from
+    the view can change the cached snapshot. Compares equal to a dict with
+    the same content.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: dict):
+        self._data = data
+
+    def __getitem__(self, key):
+        return freeze(self._data[key])
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        return f"FrozenDict({self._data!r})"
+
+
+class FrozenList(Sequence):
+    "Read-only view of a decoded list, see FrozenDict"
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: list):
+        self._data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrozenList(self._data[index])
+        return freeze(self._data[index])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenList):
+            other = other._data
+        if not isinstance(other, (list, Sequence)) or isinstance(other, (str, bytes)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f"FrozenList({self._data!r})"
+
+
+class _Entry:
+    __slots__ = ("data", "names", "stamps", "weight")
+
+    def __init__(self, data: dict, names: List[str], stamps: tuple, weight: int):
+        self.data = data
+        self.names = names
+        self.stamps = stamps
+        self.weight = weight
+
+
+class SnapshotCache:
+    """
+    LRU cache of decoded snapshots for SnapshotManager.load().
+
+    Entries are keyed by snapshot name and remember the identity (size,
+    mtime and inode or generation) of every file they were decoded from, a
+    delta chain included; a lookup whose files changed since is a miss. At
+    most `max_entries` snapshots, and `max_bytes` of encoded snapshot size
+    (the stored bytes stand in for the decoded size), are kept.
+    """
+
+    def __init__(self, max_entries: Optional[int] = 8, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name: str):
+        return name in self._entries
+
+    def get(self, name: str, stamp: Callable[[List[str]], tuple]) -> Optional[dict]:
+        """
+        Cached state of snapshot `name`, None on a miss. `stamp` gives the
+        current identities of the files it was decoded from.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None:
+            try:
+                current = stamp(entry.names)
+            except FileNotFoundError:
+                current = None
+            with self._lock:
+                if current == entry.stamps:
+                    if name in self._entries:
+                        self._entries.move_to_end(name)
+                    self.hits += 1
+                    return entry.data
+                self._drop(name, entry)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, name: str, data: dict, names: List[str], stamps: tuple, weight: int):
+        if self.max_bytes is not None and weight > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self.bytes -= previous.weight
+            self._entries[name] = _Entry(data, names, stamps, weight)
+            self.bytes += weight
+            while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.weight
+                self.evictions += 1
+
+    def invalidate(self, name: str):
+        "Forget every entry decoded from snapshot `name`"
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if name in entry.names:
+                    self._drop(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _drop(self, name: str, entry: _Entry):
+        if self._entries.get(name) is entry:
+            del self._entries[name]
+            self.bytes -= entry.weight
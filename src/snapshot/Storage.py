@@ -0,0 +1,608 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional
+import io
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from .ChunkStore import open_snapshot
+from .Locking import claim as claim_file, create_locked, read_lease
+
+# `identity` changes whenever the object is replaced: the inode of a file,
+# a generation number elsewhere
+ObjectInfo = namedtuple("ObjectInfo", ["size", "mtime", "identity"])
+
+# copy size of streaming reads and writes
+_BLOCK_SIZE = 1024 * 1024
+
+
+def temp_path(path: Path) -> Path:
+    "Hidden sibling the snapshot is written to before being renamed in place"
+    return path.with_name(f".{path.name}.tmp")
+
+
+class StorageBackend(ABC):
+    """
+    Where the snapshot files of a SnapshotManager live.
+
+    Objects are named byte strings. `writer` streams a new object into a
+    seekable staging buffer that is published atomically by its `commit()`
+    and dropped by `abort()`, names being reserved from the moment a writer
+    is open. `open` streams an object back through a seekable reader, so
+    footers and chunks are read without fetching the whole object.
+
+    A read `lease` keeps an object from being claimed for deletion. Here the
+    leases only reach the threads of this process, FileSystemBackend extends
+    them to every process sharing the directory.
+    """
+
+    def __init__(self):
+        self._leases = _Leases()
+
+    @abstractmethod
+    def writer(self, name: str, sync: bool = True, replace: bool = False):
+        "Staging buffer for `name`, FileExistsError when taken and not `replace`"
+
+    @abstractmethod
+    def open(self, name: str) -> BinaryIO:
+        "Seekable reader, FileNotFoundError when `name` doesn't exist"
+
+    @abstractmethod
+    def list(self) -> List[str]:
+        "Names of the published objects, sorted"
+
+    @abstractmethod
+    def stat(self, name: str) -> ObjectInfo:
+        "FileNotFoundError when `name` doesn't exist"
+
+    @abstractmethod
+    def delete(self, name: str) -> bool:
+        "Remove `name`, False when it didn't exist"
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.stat(name)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, name: str, data: bytes, sync: bool = True):
+        "Store `data` under `name`, replacing what was there"
+        f = self.writer(name, sync, replace=True)
+        try:
+            f.write(data)
+            f.commit()
+        except BaseException:
+            f.abort()
+            raise
+
+    def get(self, name: str) -> bytes:
+        with self.open(name) as f:
+            return f.read()
+
+    def read_range(self, name: str, offset: int, length: int) -> bytes:
+        with self.open(name) as f:
+            f.seek(offset)
+            return f.read(length)
+
+    @contextmanager
+    def batch(self):
+        "Group the deletions made inside into one transaction where supported"
+        yield
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[bool]:
+        "Keeps `name` from being claimed in the block, False when it doesn't exist"
+        with self._leases.lease(name):
+            yield self.exists(name)
+
+    def claim(self, name: str):
+        """
+        Claim on `name` for deleting it until release(), None while a reader
+        leases it. FileNotFoundError when it doesn't exist.
+        """
+        if not self.exists(name):
+            raise FileNotFoundError(name)
+        return name if self._leases.claim(name) else None
+
+    def release(self, claim):
+        self._leases.release(claim)
+
+    def claim_unleased(
+        self, names: List[str], base: Callable[[str], Optional[str]]
+    ) -> dict:
+        """
+        Claims (name -> claim, None when already gone) on the objects no
+        reader leases, leaving out the bases `base` says the leased ones need.
+        """
+        claims, leased = {}, []
+        for name in names:
+            try:
+                claim = self.claim(name)
+            except FileNotFoundError:
+                claims[name] = None
+                continue
+            if claim is None:
+                leased.append(name)
+            else:
+                claims[name] = claim
+        for name in leased:
+            needed = base(name)
+            while needed is not None:
+                claim = claims.pop(needed, None)
+                if claim is not None:
+                    self.release(claim)
+                needed = base(needed)
+        return claims
+
+    def release_all(self, claims: dict):
+        for claim in claims.values():
+            if claim is not None:
+                self.release(claim)
+
+    def close(self):
+        pass
+
+
+class _Leases:
+    "Read leases and delete claims between the threads of one process"
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._readers: Dict[str, int] = {}
+        self._claimed = set()
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[None]:
+        with self._changed:
+            # a claimed object is gone or kept once the claim is let go
+            self._changed.wait_for(lambda: name not in self._claimed)
+            self._readers[name] = self._readers.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._readers[name] -= 1
+                if not self._readers[name]:
+                    del self._readers[name]
+
+    def claim(self, name: str) -> bool:
+        with self._changed:
+            if name in self._readers:
+                return False
+            self._claimed.add(name)
+            return True
+
+    def release(self, name: str):
+        with self._changed:
+            self._claimed.discard(name)
+            self._changed.notify_all()
+
+
+class _FileWrite(io.BufferedWriter):
+    """
+    Hidden temp file renamed in place by commit(). It stays locked while open,
+    so a temp left by a crashed writer is reclaimed by the next one.
+    """
+
+    def __init__(self, path: Path, sync: bool):
+        self._path = path
+        self._tmp = temp_path(path)
+        self._sync = sync
+        super().__init__(io.FileIO(create_locked(self._tmp), "wb"))
+
+    def commit(self):
+        try:
+            self.flush()
+            if self._sync:
+                os.fsync(self.fileno())
+            # renamed before the lock is let go, nobody reclaims it meanwhile
+            os.replace(self._tmp, self._path)
+        finally:
+            self.close()
+
+    def abort(self):
+        try:
+            self._tmp.unlink()
+        except OSError:
+            pass
+        self.close()
+
+
+class FileSystemBackend(StorageBackend):
+    """
+    One file per object in `root`, the layout SnapshotManager always had.
+    Hidden files (temp files, manifest, log, chunk store) aren't objects.
+    Recipes of deduplicated snapshots are opened through the chunk store.
+    """
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = Path(root)
+
+    def writer(self, name: str, sync: bool = True, replace: bool = False):
+        path = self.root / name
+        if not replace and path.exists():
+            raise FileExistsError(name)
+        return _FileWrite(path, sync)
+
+    def open(self, name: str) -> BinaryIO:
+        return open_snapshot(self.root / name)
+
+    def list(self) -> List[str]:
+        return sorted(
+            entry.name
+            for entry in os.scandir(self.root)
+            if not entry.name.startswith(".") and entry.is_file()
+        )
+
+    def stat(self, name: str) -> ObjectInfo:
+        st = os.stat(self.root / name)
+        return ObjectInfo(st.st_size, st.st_mtime, st.st_ino)
+
+    def exists(self, name: str) -> bool:
+        return (self.root / name).is_file()
+
+    def delete(self, name: str) -> bool:
+        try:
+            (self.root / name).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def lease(self, name: str) -> Iterator[bool]:
+        # a shared flock() on the file, seen by every process
+        with read_lease(self.root / name) as leased:
+            yield leased
+
+    def claim(self, name: str) -> Optional[int]:
+        return claim_file(self.root / name)
+
+    def release(self, claim: int):
+        os.close(claim)
+
+
+class _MemoryWrite(io.BytesIO):
+    def __init__(self, store: "MemoryBackend", name: str):
+        super().__init__()
+        self._store = store
+        self._name = name
+
+    def commit(self):
+        data = self.getvalue()
+        self.close()
+        self._store._publish(self._name, data)
+
+    def abort(self):
+        self.close()
+        self._store._release(self._name)
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Objects kept as bytes in a dict, for tests and hot caches. Readers get a
+    zero copy view of the bytes published when they were opened.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._objects: Dict[str, tuple] = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def writer(self, name: str, sync: bool = True, replace: bool = False):
+        with self._lock:
+            if name in self._pending or (not replace and name in self._objects):
+                raise FileExistsError(name)
+            self._pending.add(name)
+        return _MemoryWrite(self, name)
+
+    def open(self, name: str) -> BinaryIO:
+        with self._lock:
+            if name not in self._objects:
+                raise FileNotFoundError(name)
+            return io.BytesIO(self._objects[name][0])
+
+    def list(self) -> List[str]:
+        with self._lock:
+            return sorted(self._objects)
+
+    def stat(self, name: str) -> ObjectInfo:
+        with self._lock:
+            if name not in self._objects:
+                raise FileNotFoundError(name)
+            data, mtime, generation = self._objects[name]
+            return ObjectInfo(len(data), mtime, generation)
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            return self._objects.pop(name, None) is not None
+
+    def get(self, name: str) -> bytes:
+        with self._lock:
+            if name not in self._objects:
+                raise FileNotFoundError(name)
+            return self._objects[name][0]
+
+    def read_range(self, name: str, offset: int, length: int) -> bytes:
+        return self.get(name)[offset : offset + length]
+
+    def _publish(self, name: str, data: bytes):
+        with self._lock:
+            self._generation += 1
+            self._objects[name] = (data, time.time(), self._generation)
+            self._pending.discard(name)
+
+    def _release(self, name: str):
+        with self._lock:
+            self._pending.discard(name)
+
+
+class _ConnectionPool:
+    "Idle SQLite connections handed out to one thread at a time"
+
+    def __init__(self, path: str, size: int):
+        self._path = path
+        self._size = size
+        self._idle = queue.LifoQueue()
+        self.opened = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit, transactions are opened explicitly
+        connection = sqlite3.connect(
+            self._path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        self.opened += 1
+        return connection
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, connection: sqlite3.Connection):
+        if self._idle.qsize() < self._size:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class _BlobReader(io.RawIOBase):
+    """
+    Reads one row's BLOB inside a read transaction, so the object stays the
+    one opened even if it is replaced or deleted meanwhile. Uses incremental
+    blob I/O where sqlite3 has it (Python 3.11+), ranged substr() otherwise.
+    """
+
+    def __init__(self, pool: _ConnectionPool, name: str):
+        self._pool = pool
+        self._blob = None
+        self._connection = pool.acquire()
+        self._connection.execute("BEGIN")
+        row = self._connection.execute(
+            "SELECT rowid, size FROM snapshots WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            self._finish()
+            raise FileNotFoundError(name)
+        self._rowid, self._size = row
+        self._position = 0
+        if hasattr(self._connection, "blobopen"):
+            self._blob = self._connection.blobopen(
+                "snapshots", "data", self._rowid, readonly=True
+            )
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}
+        self._position = max(base[whence] + offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self._size - self._position)
+        if length <= 0:
+            return 0
+        if self._blob is not None:
+            self._blob.seek(self._position)
+            data = self._blob.read(length)
+        else:
+            (data,) = self._connection.execute(
+                "SELECT substr(data, ?, ?) FROM snapshots WHERE rowid = ?",
+                (self._position + 1, length, self._rowid),
+            ).fetchone()
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _finish(self):
+        if self._connection is None:
+            return
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+        connection, self._connection = self._connection, None
+        connection.execute("COMMIT")
+        self._pool.release(connection)
+
+
+class _SpooledWrite(tempfile.SpooledTemporaryFile):
+    "Staged in memory, spilled to a temp file past `max_size`, inserted by commit()"
+
+    def __init__(self, store: "SQLiteBackend", name: str, sync: bool):
+        super().__init__(max_size=store.spool_size)
+        self._store = store
+        self._name = name
+        self._sync = sync
+
+    def commit(self):
+        try:
+            self._store._insert(self._name, self, self._sync)
+        finally:
+            self.abort()
+
+    def abort(self):
+        self.close()
+        self._store._release(self._name)
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Objects stored as BLOB rows of one SQLite database (WAL mode), for many
+    small snapshots: listing is an index scan and `batch` prunes in a single
+    transaction. Connections are pooled, `pool_size` of them kept idle.
+    Writes are staged in a spooled temp file and copied into a zeroblob with
+    incremental blob I/O where available; `sync` maps to synchronous=FULL.
+    """
+
+    def __init__(self, path, pool_size: int = 4, spool_size: int = 8 * 1024 * 1024):
+        super().__init__()
+        self.path = str(path)
+        self.spool_size = spool_size
+        self._pool = _ConnectionPool(self.path, pool_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        # connection of the batch running in this thread
+        self._local = threading.local()
+        with self._pool.connection() as connection:
+            connection.execute(
+                # AUTOINCREMENT never reuses a rowid, it serves as identity
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, "
+                "data BLOB NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            yield connection
+            return
+        with self._pool.connection() as connection:
+            yield connection
+
+    def writer(self, name: str, sync: bool = True, replace: bool = False):
+        with self._lock:
+            if name in self._pending or (not replace and self.exists(name)):
+                raise FileExistsError(name)
+            self._pending.add(name)
+        return _SpooledWrite(self, name, sync)
+
+    def open(self, name: str) -> BinaryIO:
+        return io.BufferedReader(_BlobReader(self._pool, name), _BLOCK_SIZE)
+
+    def list(self) -> List[str]:
+        with self._connection() as connection:
+            rows = connection.execute("SELECT name FROM snapshots ORDER BY name")
+            return [name for (name,) in rows]
+
+    def stat(self, name: str) -> ObjectInfo:
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT size, mtime, rowid FROM snapshots WHERE name = ?", (name,)
+            ).fetchone()
+        if row is None:
+            raise FileNotFoundError(name)
+        return ObjectInfo(*row)
+
+    def delete(self, name: str) -> bool:
+        with self._connection() as connection:
+            cursor = connection.execute("DELETE FROM snapshots WHERE name = ?", (name,))
+            return cursor.rowcount > 0
+
+    def read_range(self, name: str, offset: int, length: int) -> bytes:
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT substr(data, ?, ?) FROM snapshots WHERE name = ?",
+                (offset + 1, length, name),
+            ).fetchone()
+        if row is None:
+            raise FileNotFoundError(name)
+        return row[0]
+
+    @contextmanager
+    def batch(self):
+        if getattr(self._local, "connection", None) is not None:
+            yield
+            return
+        with self._pool.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            self._local.connection = connection
+            try:
+                yield
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            else:
+                connection.execute("COMMIT")
+            finally:
+                self._local.connection = None
+
+    def close(self):
+        self._pool.close()
+
+    def _insert(self, name: str, f: BinaryIO, sync: bool):
+        size = f.seek(0, 2)
+        f.seek(0)
+        with self._connection() as connection:
+            connection.execute(f"PRAGMA synchronous={'FULL' if sync else 'OFF'}")
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                blobopen = getattr(connection, "blobopen", None)
+                data = f.read() if blobopen is None else b""
+                connection.execute("DELETE FROM snapshots WHERE name = ?", (name,))
+                cursor = connection.execute(
+                    "INSERT INTO snapshots (name, data, size, mtime) "
+                    "VALUES (?, CASE WHEN ? THEN zeroblob(?) ELSE ? END, ?, ?)",
+                    (name, blobopen is not None, size, data, size, time.time()),
+                )
+                if blobopen is not None:
+                    with blobopen("snapshots", "data", cursor.lastrowid) as blob:
+                        while True:
+                            block = f.read(_BLOCK_SIZE)
+                            if not block:
+                                break
+                            blob.write(block)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def _release(self, name: str):
+        with self._lock:
+            self._pending.discard(name)
@@ -0,0 +1,206 @@
+from contextlib import contextmanager
+from typing import BinaryIO, Optional
+import io
+import threading
+import time
+from .Locking import reset_after_fork
+
+# dump output reaches the storage in writes of this size, one IOPS token each
+BLOCK_SIZE = 64 * 1024
+
+
+class IOThrottle:
+    """
+    Token buckets limiting the bytes and write calls per second of dumps.
+
+    Each bucket holds `burst` seconds worth of its rate. A write takes its
+    tokens up front and, when that leaves a bucket in debt, sleeps until the
+    debt would be repaid, so concurrent writers queue behind each other and
+    a write larger than the bucket still goes through. `bytes_per_sec` and
+    `iops` can be changed (or set to None to lift the limit) while dumps are
+    running; `throttled` is the total time writers were made to wait.
+    """
+
+    def __init__(
+        self,
+        bytes_per_sec: Optional[float] = None,
+        iops: Optional[float] = None,
+        burst: float = 0.05,
+    ):
+        self._lock = threading.Lock()
+        self._burst = burst
+        self._bytes_per_sec = bytes_per_sec
+        self._iops = iops
+        self._byte_tokens = self._capacity(bytes_per_sec)
+        self._op_tokens = self._capacity(iops)
+        self._updated = time.monotonic()
+        self.throttled = 0.0
+        self.bytes = 0
+        self.ops = 0
+        reset_after_fork(self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        reset_after_fork(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_per_sec(self) -> Optional[float]:
+        return self._bytes_per_sec
+
+    @bytes_per_sec.setter
+    def bytes_per_sec(self, rate: Optional[float]):
+        with self._lock:
+            self._refill()
+            self._bytes_per_sec = rate
+            self._byte_tokens = min(self._byte_tokens, self._capacity(rate))
+
+    @property
+    def iops(self) -> Optional[float]:
+        return self._iops
+
+    @iops.setter
+    def iops(self, rate: Optional[float]):
+        with self._lock:
+            self._refill()
+            self._iops = rate
+            self._op_tokens = min(self._op_tokens, self._capacity(rate))
+
+    def acquire(self, nbytes: int, ops: int = 1) -> float:
+        "Wait until `nbytes` in `ops` writes are allowed, returns the seconds waited"
+        with self._lock:
+            self._refill()
+            wait = 0.0
+            if self._bytes_per_sec:
+                self._byte_tokens -= nbytes
+                if self._byte_tokens < 0:
+                    wait = -self._byte_tokens / self._bytes_per_sec
+            if self._iops:
+                self._op_tokens -= ops
+                if self._op_tokens < 0:
+                    wait = max(wait, -self._op_tokens / self._iops)
+            self.bytes += nbytes
+            self.ops += ops
+            self.throttled += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def meter(self) -> "ThrottleMeter":
+        return ThrottleMeter(self)
+
+    def split(self, parts: int) -> "IOThrottle":
+        "Independent throttle with a `parts`th of the rates, for another process"
+        return IOThrottle(
+            self._bytes_per_sec / parts if self._bytes_per_sec else None,
+            self._iops / parts if self._iops else None,
+            self._burst,
+        )
+
+    def _capacity(self, rate: Optional[float]) -> float:
+        return rate * self._burst if rate else 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self._bytes_per_sec:
+            self._byte_tokens = min(
+                self._byte_tokens + elapsed * self._bytes_per_sec,
+                self._capacity(self._bytes_per_sec),
+            )
+        else:
+            self._byte_tokens = 0.0
+        if self._iops:
+            self._op_tokens = min(
+                self._op_tokens + elapsed * self._iops, self._capacity(self._iops)
+            )
+        else:
+            self._op_tokens = 0.0
+
+
+class ThrottleMeter:
+    "Throttle as seen by one dump, summing the time everything it wrote waited"
+
+    def __init__(self, throttle: IOThrottle):
+        self._throttle = throttle
+        self._lock = threading.Lock()
+        self.throttled = 0.0
+
+    def acquire(self, nbytes: int, ops: int = 1) -> float:
+        waited = self._throttle.acquire(nbytes, ops)
+        self.add(waited)
+        return waited
+
+    def add(self, seconds: float):
+        "Count time waited on another copy of the throttle, by a worker process"
+        with self._lock:
+            self.throttled += seconds
+
+
+class _ThrottledRaw(io.RawIOBase):
+    def __init__(self, target: BinaryIO, throttle):
+        self._target = target
+        self._throttle = throttle
+        self.throttled = 0.0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self._target is None:
+            # discarded after a failure
+            return len(data)
+        self.throttled += self._throttle.acquire(len(data))
+        return self._target.write(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._target.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._target.tell()
+
+
+class ThrottledWriter(io.BufferedWriter):
+    """
+    Gathers writes into blocks of `block_size` and pays for each in the
+    throttle before passing it to `target`, which is never closed.
+    """
+
+    def __init__(self, target: BinaryIO, throttle, block_size: int = BLOCK_SIZE):
+        super().__init__(_ThrottledRaw(target, throttle), block_size)
+
+    @property
+    def throttled(self) -> float:
+        return self.raw.throttled
+
+    def discard(self):
+        "Drop what is buffered, nothing more reaches the target"
+        self.raw._target = None
+        self.close()
+
+
+@contextmanager
+def throttled(target: BinaryIO, throttle):
+    "`target` written through a ThrottledWriter, `target` itself without a throttle"
+    if throttle is None:
+        yield target
+        return
+    writer = ThrottledWriter(target, throttle)
+    try:
+        yield writer
+        writer.flush()
+    except BaseException:
+        writer.discard()
+        raise
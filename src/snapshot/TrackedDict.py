@@ -0,0 +1,216 @@
+from typing import Hashable, Iterable, Optional
+from . import registry
+
+
+class _Tracked:
+    "Routes mutations of nested containers to the top level key they live under"
+
+    _root: Optional["TrackedDict"] = None
+    _root_key: Hashable = None
+
+    def _mark(self, key: Hashable):
+        pass
+
+    def _attach(self, root: "TrackedDict", root_key: Hashable):
+        self._root = root
+        self._root_key = root_key
+
+    def _changed(self, key: Hashable = None):
+        if self._root is not None:
+            self._root._mark(self._root_key)
+        else:
+            self._mark(key)
+
+    def _wrap(self, value, key: Hashable = None):
+        "Copies plain dicts and lists into tracked containers"
+        root = self._root if self._root is not None else self
+        root_key = self._root_key if self._root is not None else key
+        if type(value) is dict:
+            tracked = _NestedDict()
+            tracked._attach(root, root_key)
+            dict.update(tracked, {k: tracked._wrap(v) for k, v in value.items()})
+            return tracked
+        if type(value) is list:
+            tracked = TrackedList()
+            tracked._attach(root, root_key)
+            list.extend(tracked, [tracked._wrap(v) for v in value])
+            return tracked
+        if isinstance(value, _Tracked):
+            value._attach(root, root_key)
+        return value
+
+
+class _TrackedMapping(_Tracked, dict):
+    def __reduce__(self):
+        # copies and pickles (e.g. for worker processes) are plain dicts
+        return dict, (dict(self),)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, self._wrap(value, key))
+        self._changed(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed(key)
+
+    def pop(self, key, *default):
+        had_key = key in self
+        value = super().pop(key, *default)
+        if had_key:
+            self._changed(key)
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._changed(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return super().__getitem__(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        keys = list(self)
+        super().clear()
+        for key in keys:
+            self._changed(key)
+
+
+class _NestedDict(_TrackedMapping):
+    pass
+
+
+class TrackedList(_Tracked, list):
+    "list that marks the top level key it is stored under as dirty on mutation"
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [self._wrap(v) for v in value]
+        else:
+            value = self._wrap(value)
+        super().__setitem__(index, value)
+        self._changed()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._changed()
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, count):
+        super().__imul__(count)
+        self._changed()
+        return self
+
+    def append(self, value):
+        super().append(self._wrap(value))
+        self._changed()
+
+    def extend(self, values):
+        super().extend([self._wrap(v) for v in values])
+        self._changed()
+
+    def insert(self, index, value):
+        super().insert(index, self._wrap(value))
+        self._changed()
+
+    def pop(self, *index):
+        value = super().pop(*index)
+        self._changed()
+        return value
+
+    def remove(self, value):
+        super().remove(value)
+        self._changed()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super().reverse()
+        self._changed()
+
+
+class TrackedDict(_TrackedMapping):
+    """
+    dict that records which top level keys were mutated since the last dump.
+
+    Plain dicts and lists stored in it are copied into tracked containers, so
+    changes made through nested values mark the top level key they live under.
+    Containers kept from before insertion are not tracked, mutate through the
+    TrackedDict. `SnapshotManager.dump` uses the dirty keys to write a delta of
+    only those keys, or skips writing when nothing changed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._dirty: set = set()
+        self._changes = 0
+        self._snapshot: Optional[str] = None
+        self._chain_length = 0
+        dict.update(
+            self, {k: self._wrap(v, k) for k, v in dict(*args, **kwargs).items()}
+        )
+
+    @property
+    def dirty(self) -> frozenset:
+        "Top level keys added, changed or deleted since the last clear_dirty()"
+        return frozenset(self._dirty)
+
+    @property
+    def changes(self) -> int:
+        "Number of mutations since the last clear_dirty()"
+        return self._changes
+
+    @property
+    def snapshot(self) -> Optional[str]:
+        "Name of the snapshot last dumped from this dict"
+        return self._snapshot
+
+    @property
+    def chain_length(self) -> int:
+        "Number of deltas stacked on the full snapshot of `snapshot`"
+        return self._chain_length
+
+    def clear_dirty(self):
+        self._dirty.clear()
+        self._changes = 0
+
+    def mark_dirty(self, keys: Iterable):
+        "Mark `keys` dirty again, e.g. after a dump of them failed"
+        for key in keys:
+            self._mark(key)
+
+    def mark_dumped(self, name: str, incremental: bool):
+        "Record that snapshot `name` holds this dict, a delta on the last one when `incremental`"
+        self._snapshot = name
+        self._chain_length = self._chain_length + 1 if incremental else 0
+
+    def _mark(self, key: Hashable):
+        self._dirty.add(key)
+        self._changes += 1
+
+
+# serialised like the builtins they wrap
+registry.alias(TrackedDict, dict)
+registry.alias(_NestedDict, dict)
+registry.alias(TrackedList, list)
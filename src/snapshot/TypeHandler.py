@@ -22,6 +22,10 @@ class TypeHandler(ABC, Generic[T]):
     def deserialise(self, reader) -> T:
         pass
 
+    def skip(self, reader) -> None:
+        "Move the reader past a value without building it"
+        self.deserialise(reader)
+
 
 ALL_SET_MARKER = 0xFF
 
@@ -27,6 +27,13 @@ class TypeRegistry:
             if handler.is_sequence_type:
                 self._sequence_types.add(_id)
 
+    def alias(self, datatype: type, target: type):
+        "Serialise `datatype` (usually a subclass) with the handler of `target`"
+        handler = self._by_types.get(target)
+        if not handler:
+            raise TypeNotFoundException(f"Type handler not found for {target}")
+        self._by_types[datatype] = handler
+
     def get_handler_by_id(self, id):
         return self._by_ids.get(id)
 
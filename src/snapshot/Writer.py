@@ -1,5 +1,7 @@
-from typing import BinaryIO
+from typing import BinaryIO, Optional
+import hashlib
 import struct
+import time
 import zlib
 from .TypeHandler import (
     TypeHandler,
@@ -8,16 +10,94 @@ from .TypeHandler import (
     ALL_SET_MARKER,
 )
 from .TypeRegistry import TypeNotFoundException
+from .Footer import Footer, KEY_DIGEST_SIZE
+from .Header import Header, HEADER_SIZE, FLAG_FOOTER
+
+FINGERPRINT_DIGEST_SIZE = 16
+_COUNT = struct.Struct("<Q")
+
+
+def entry_digest(data=b""):
+    "Hash object used for the per key digests stored in the footer"
+    return hashlib.blake2b(data, digest_size=KEY_DIGEST_SIZE)
+
+
+def fingerprint(key_hashes: dict) -> bytes:
+    """
+    Fingerprint of a state from the entry digests of its top level entries:
+    their count, then a blake2b of every key and digest in key order, so it
+    doesn't depend on the entry order, chunking, sharding or delta chain.
+    """
+    parts = []
+    for key in sorted(key_hashes):
+        encoded = key.encode("utf-8")
+        parts.append(_COUNT.pack(len(encoded)) + encoded + key_hashes[key])
+    digest = hashlib.blake2b(b"".join(parts), digest_size=FINGERPRINT_DIGEST_SIZE)
+    return _COUNT.pack(len(key_hashes)) + digest.digest()
+
+
+def fingerprint_entries(fingerprint: bytes) -> Optional[int]:
+    "Entry count of a fingerprint, None for one recorded in an older format"
+    if len(fingerprint) != _COUNT.size + FINGERPRINT_DIGEST_SIZE:
+        return None
+    return _COUNT.unpack_from(fingerprint)[0]
+
+
+class _CountingBuffer:
+    "Forwards to the wrapped buffer while counting (and optionally hashing) writes"
+
+    def __init__(self, buffer: BinaryIO):
+        self._buffer = buffer
+        self.written = 0
+        self.hasher = None
+        # running CRC32 of the current chunk, None when not tracked
+        self.crc = None
+
+    def write(self, data) -> int:
+        self._buffer.write(data)
+        self.written += len(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+        if self.crc is not None:
+            self.crc = zlib.crc32(data, self.crc)
+        return len(data)
+
+    def __getattr__(self, name):
+        return getattr(self._buffer, name)
 
 
 class Writer:
-    def __init__(self, source: dict = None, buffer: BinaryIO = None):
+    def __init__(
+        self,
+        source: dict = None,
+        buffer: BinaryIO = None,
+        chunk_size: int = None,
+        hash_keys: bool = False,
+        header: bool = False,
+    ):
         # to avoid partial imports
         from . import registry
 
         self._registry = registry
         self._buffer: BinaryIO = buffer
         self._source: dict = source
+        # when set, entries are grouped in chunks recorded in the footer
+        self._chunk_size = chunk_size
+        self._chunks: list[tuple[int, int, int]] = []
+        # CRC32 of every chunk, lets verify() check a file without decoding it
+        self._crcs: list[int] = []
+        # digest of every top level entry, lets deltas skip decoding the base
+        self._hash_keys = hash_keys
+        self._key_hashes: dict[str, bytes] = {}
+        # fixed header patched in front of the body once it is written, needs
+        # a seekable buffer
+        self._with_header = header
+        self._header: Optional[Header] = None
+        # top level entries and body size of the last write, for the header
+        self._entries = 0
+        self._body_size: Optional[int] = None
+        # last log segment the source includes, recorded in the footer
+        self._log_sequence: Optional[int] = None
 
     def set_buffer(self, buffer: BinaryIO):
         self._buffer = buffer
@@ -25,15 +105,121 @@ class Writer:
     def set_source(self, source: dict):
         self._source = source
 
+    def set_log_sequence(self, sequence: Optional[int]):
+        self._log_sequence = sequence
+
     @property
     def buffer(self):
         return self._buffer
 
+    @property
+    def chunks(self) -> list[tuple[int, int, int]]:
+        "(offset, length, entry count) of every chunk written by the last write"
+        return self._chunks
+
+    @property
+    def key_hashes(self) -> dict[str, bytes]:
+        return self._key_hashes
+
+    @property
+    def fingerprint(self) -> Optional[bytes]:
+        "Fingerprint of the state written by the last write, None without `hash_keys`"
+        if not self._hash_keys:
+            return None
+        return fingerprint(self._key_hashes)
+
+    @property
+    def header(self) -> Optional[Header]:
+        "Header written by the last write, None without `header`"
+        return self._header
+
     def write(self):
-        self.write_length(len(self._source))
-        for key, value in self._source.items():
-            self.write_key_value(key, value)
-        self.write_encoding(EncodingTypes.EOF)
+        if not self._with_header:
+            self.write_body()
+            return
+
+        buffer = self._buffer
+        start = buffer.tell()
+        buffer.write(bytes(HEADER_SIZE))
+        counter = self._buffer = _CountingBuffer(buffer)
+        counter.hasher = entry_digest()
+        created = time.time()
+        self._body_size = None
+        try:
+            self.write_body()
+        finally:
+            self._buffer = buffer
+
+        self._header = Header(
+            flags=self._header_flags(),
+            size=counter.written if self._body_size is None else self._body_size,
+            entries=self._entries,
+            created=created,
+            checksum=counter.hasher.digest(),
+        )
+        end = buffer.tell()
+        buffer.seek(start)
+        buffer.write(self._header.pack())
+        buffer.seek(end)
+
+    def write_body(self):
+        "Body and footer, offsets in the footer are relative to the body start"
+        self._entries = len(self._source)
+        if not self._chunk_size and not self._hash_keys:
+            self.write_length(len(self._source))
+            for key, value in self._source.items():
+                self.write_key_value(key, value)
+            self.write_encoding(EncodingTypes.EOF)
+            return
+
+        buffer = self._buffer
+        counter = self._buffer = _CountingBuffer(buffer)
+        try:
+            self.write_length(len(self._source))
+            self._chunks = []
+            self._crcs = []
+            self._key_hashes = {}
+            start, count = counter.written, 0
+            counter.crc = 0
+            for key, value in self._source.items():
+                if self._hash_keys:
+                    counter.hasher = entry_digest()
+                self.write_key_value(key, value)
+                if self._hash_keys:
+                    self._key_hashes[str(key)] = counter.hasher.digest()
+                    counter.hasher = None
+                count += 1
+                if count == self._chunk_size:
+                    self._chunks.append((start, counter.written - start, count))
+                    self._crcs.append(counter.crc)
+                    start, count = counter.written, 0
+                    counter.crc = 0
+            if count:
+                self._chunks.append((start, counter.written - start, count))
+                self._crcs.append(counter.crc)
+            counter.crc = None
+            self.write_encoding(EncodingTypes.EOF)
+        finally:
+            self._buffer = buffer
+
+        self.write_footer(counter.written)
+
+    def write_footer(self, offset: int, footer: Footer = None) -> int:
+        self._body_size = offset
+        footer = footer or Footer()
+        footer.set_chunks(self._chunks)
+        footer.set_crcs(self._crcs)
+        if self._hash_keys:
+            footer.set_key_hashes(self._key_hashes)
+        state = self.fingerprint
+        if state is not None:
+            footer.set_fingerprint(state)
+        if self._log_sequence is not None:
+            footer.set_log_sequence(self._log_sequence)
+        return footer.write(self._buffer, offset)
+
+    def _header_flags(self) -> int:
+        return FLAG_FOOTER if self._body_size is not None else 0
 
     def write_encoding(self, encoding: EncodingTypes):
         # write with a prefix of 11
@@ -3,3 +3,6 @@ from .handlers import IntHandler, DictHandler, StringHandler, ListHandler
 
 registry = TypeRegistry()
 registry.register([IntHandler(), DictHandler(), StringHandler(), ListHandler()])
+
+# imported after `registry` exists, the module aliases its containers in it
+from .TrackedDict import TrackedDict, TrackedList
@@ -1,6 +1,6 @@
 from ..TypeHandler import TypeHandler
 from ..Writer import Writer
-from ..Reader import Reader
+from ..Reader import Reader, CorruptSnapshotError
 
 
 class DictHandler(TypeHandler[dict]):
@@ -21,15 +21,24 @@ class DictHandler(TypeHandler[dict]):
 
     def deserialise(self, reader: Reader) -> dict:
         result = {}
-        for _ in range(reader.read_length()):
-            current_pos = reader.buffer.tell()
-            try:
-                key, value = reader.read_key_value()
-                if key == None or value == None:
-                    break
-                result[key] = value
-            except Exception:
-                reader.buffer.seek(current_pos)
-                break
+        length = reader.read_length()
+        for index in range(length):
+            key, value = reader.read_key_value()
+            if key is None:
+                raise CorruptSnapshotError(
+                    f"Dict ended after {index} of {length} entries"
+                )
+            result[key] = value
 
         return result
+
+    def skip(self, reader: Reader) -> None:
+        length = reader.read_length()
+        for index in range(length):
+            handler, _ = reader.read_object_id()
+            if handler is None:
+                raise CorruptSnapshotError(
+                    f"Dict ended after {index} of {length} entries"
+                )
+            reader.skip_value()
+            handler.skip(reader)
@@ -16,3 +16,6 @@ class FloatHandler(TypeHandler[float]):
 
     def deserialise(self, reader: Reader) -> float:
         return float(reader.read_value())
+
+    def skip(self, reader: Reader) -> None:
+        reader.skip_value()
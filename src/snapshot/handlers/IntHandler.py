@@ -3,6 +3,8 @@ from ..TypeHandler import TypeHandler, EncodingTypes
 from ..Writer import Writer
 from ..Reader import Reader
 
+_FIXED_SIZES = {EncodingTypes.INT8: 1, EncodingTypes.INT16: 2, EncodingTypes.INT32: 4}
+
 
 class IntHandler(TypeHandler[int]):
     type_identifier = 1
@@ -40,3 +42,11 @@ class IntHandler(TypeHandler[int]):
             return struct.unpack("<i", reader.buffer.read(4))[0]
 
         return reader.read_value(encoding)
+
+    def skip(self, reader: Reader) -> None:
+        encoding = reader.read_encoding()
+        size = _FIXED_SIZES.get(encoding)
+        if size is None:
+            reader.skip_value(encoding)
+        else:
+            reader.buffer.seek(size, 1)
@@ -1,6 +1,6 @@
 from ..TypeHandler import TypeHandler
 from ..Writer import Writer
-from ..Reader import Reader
+from ..Reader import Reader, CorruptSnapshotError
 
 
 class ListHandler(TypeHandler[list]):
@@ -22,16 +22,22 @@ class ListHandler(TypeHandler[list]):
     def deserialise(self, reader: Reader) -> list:
         results = []
         length = reader.read_length()
-        for _ in range(length):
-            current_pos = reader.buffer.tell()
-            try:
-                object_type_handler, _ = reader.read_object_id()
-                value = object_type_handler.deserialise(reader)
-                if not value:
-                    break
-                results.append(value)
-            except Exception:
-                reader.buffer.seek(current_pos)
-                break
+        for index in range(length):
+            object_type_handler, _ = reader.read_object_id()
+            if object_type_handler is None:
+                raise CorruptSnapshotError(
+                    f"List ended after {index} of {length} items"
+                )
+            results.append(object_type_handler.deserialise(reader))
 
         return results
+
+    def skip(self, reader: Reader) -> None:
+        length = reader.read_length()
+        for index in range(length):
+            object_type_handler, _ = reader.read_object_id()
+            if object_type_handler is None:
+                raise CorruptSnapshotError(
+                    f"List ended after {index} of {length} items"
+                )
+            object_type_handler.skip(reader)
@@ -16,3 +16,6 @@ class StringHandler(TypeHandler[str]):
 
     def deserialise(self, reader: Reader) -> str:
         return reader.read_value()
+
+    def skip(self, reader: Reader) -> None:
+        reader.skip_value()
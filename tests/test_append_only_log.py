@@ -0,0 +1,225 @@
+"""Tests for AppendOnlyLog class."""
+
+import pytest
+import tempfile
+import shutil
+from pathlib import Path
+from src.snapshot.AppendOnlyLog import AppendOnlyLog, FsyncPolicy
+from src.snapshot.Footer import Footer
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def snapshot_manager(temp_dir):
+    """Create a SnapshotManager instance with a temp directory."""
+    manager = SnapshotManager(path=temp_dir, aof_fsync="always")
+    yield manager
+    manager.close()
+
+
+class TestAppendOnlyLog:
+    """Test cases for AppendOnlyLog class."""
+
+    @pytest.mark.parametrize("policy", ["always", "everysec", "no"])
+    def test_replay(self, temp_dir, policy):
+        """Test set and delete operations replay in order for every policy."""
+        log = AppendOnlyLog(temp_dir, fsync=policy)
+        log.set("a", 1)
+        log.set("b", {"nested": [1, 2]})
+        log.set("a", "changed")
+        log.delete("b")
+        log.delete("missing")
+        log.close()
+
+        assert log.replay({}) == {"a": "changed"}
+        assert log.replay({"c": 3}) == {"a": "changed", "c": 3}
+
+    def test_invalid_policy(self, temp_dir):
+        """Test an unknown fsync policy raises."""
+        with pytest.raises(ValueError):
+            AppendOnlyLog(temp_dir, fsync="sometimes")
+
+    def test_everysec_syncs_in_background(self, temp_dir):
+        """Test the everysec policy starts and stops its sync thread."""
+        log = AppendOnlyLog(temp_dir, fsync=FsyncPolicy.EVERYSEC)
+        log.set("a", 1)
+        assert log._syncer.is_alive()
+        log.close()
+        assert log._syncer is None
+
+    def test_torn_tail_is_ignored(self, temp_dir):
+        """Test a record cut short by a crash is dropped on replay."""
+        log = AppendOnlyLog(temp_dir, fsync="always")
+        log.set("a", 1)
+        log.set("b", "a longer value that gets torn")
+        log.close()
+
+        segment = log.segments()[0]
+        data = segment.read_bytes()
+        segment.write_bytes(data[:-5])
+        assert log.replay({}) == {"a": 1}
+
+    def test_rotate_and_remove(self, temp_dir):
+        """Test rotate starts a new segment and remove drops the closed ones."""
+        log = AppendOnlyLog(temp_dir, fsync="no")
+        assert log.rotate() is None
+        log.set("a", 1)
+        seq = log.rotate()
+        log.set("b", 2)
+        assert len(log.segments()) == 2
+
+        assert log.replay({}, upto=seq) == {"a": 1}
+        assert log.replay({}, after=seq) == {"b": 2}
+        log.remove(seq)
+        assert log.replay({}) == {"b": 2}
+        log.close()
+
+    def test_size(self, temp_dir):
+        """Test size counts the bytes of the active segment."""
+        log = AppendOnlyLog(temp_dir, fsync="no")
+        written = log.set("a", 1) + log.delete("a")
+        assert log.size == written
+        log.rotate()
+        assert log.size == 0
+        log.close()
+
+
+class TestSnapshotManagerLog:
+    """Test cases for SnapshotManager append only log integration."""
+
+    def test_load_replays_log(self, snapshot_manager):
+        """Test load applies the log on top of the newest snapshot."""
+        snapshot_manager.dump({"a": 1, "b": 2})
+        snapshot_manager.log_set("b", "changed")
+        snapshot_manager.log_set("c", [3])
+        snapshot_manager.log_delete("a")
+        assert snapshot_manager.load() == {"b": "changed", "c": [3]}
+
+    def test_load_log_without_snapshot(self, snapshot_manager):
+        """Test load replays the log onto an empty state."""
+        snapshot_manager.log_set("a", 1)
+        assert snapshot_manager.load() == {"a": 1}
+
+    def test_log_survives_reopen(self, snapshot_manager, temp_dir):
+        """Test a new manager replays the log written by a previous one."""
+        snapshot_manager.log_set("a", 1)
+        snapshot_manager.close()
+        assert SnapshotManager(path=temp_dir).load() == {"a": 1}
+
+    def test_segments_are_not_snapshots(self, snapshot_manager):
+        """Test log segments don't show up as snapshots."""
+        snapshot_manager.log_set("a", 1)
+        assert snapshot_manager.list() == []
+        assert snapshot_manager.prune() == 0
+
+    def test_rewrite(self, snapshot_manager):
+        """Test rewrite folds the log into a snapshot and removes it."""
+        snapshot_manager.dump({"a": 1})
+        snapshot_manager.log_set("b", 2)
+        snapshot_manager.rewrite_aof(background=False)
+
+        assert snapshot_manager._aof.segments() == []
+        assert len(snapshot_manager.list()) == 2
+        assert snapshot_manager.load() == {"a": 1, "b": 2}
+
+    def test_background_rewrite(self, snapshot_manager):
+        """Test appends made during a background rewrite are kept."""
+        snapshot_manager.log_set("a", 1)
+        rewrite = snapshot_manager.rewrite_aof()
+        snapshot_manager.log_set("b", 2)
+        rewrite.join()
+
+        assert len(snapshot_manager._aof.segments()) == 1
+        assert snapshot_manager.load() == {"a": 1, "b": 2}
+
+    def test_rewrite_empty_log(self, snapshot_manager):
+        """Test rewrite without a log does nothing."""
+        assert snapshot_manager.rewrite_aof() is None
+        assert snapshot_manager.list() == []
+
+    def test_dump_supersedes_log(self, snapshot_manager, temp_dir):
+        """Test a dump taken after log records isn't overwritten by them."""
+        snapshot_manager.log_set("k", 1)
+        snapshot_manager.dump({"k": 2})
+        assert snapshot_manager.load() == {"k": 2}
+        assert snapshot_manager.load_key("k") == 2
+        assert snapshot_manager._aof.segments() == []
+
+        snapshot_manager.log_set("k", 3)
+        assert snapshot_manager.load() == {"k": 3}
+        snapshot_manager.close()
+        assert SnapshotManager(path=temp_dir).load() == {"k": 3}
+
+    def test_included_segments_are_skipped(self, snapshot_manager):
+        """Test segments left behind by a crash after a dump aren't replayed."""
+        snapshot_manager.log_set("k", 1)
+        snapshot_manager._aof.rotate()
+        (segment,) = snapshot_manager._aof.segments()
+        data = segment.read_bytes()
+        snapshot_manager.dump({"k": 2})
+        segment.write_bytes(data)
+
+        assert snapshot_manager.load() == {"k": 2}
+
+    def test_numbering_continues_after_reopen(self, snapshot_manager, temp_dir):
+        """Test a new manager doesn't reuse segment numbers a dump includes."""
+        snapshot_manager.log_set("a", 1)
+        snapshot_manager.dump({"a": 1})
+        snapshot_manager.close()
+
+        manager = SnapshotManager(path=temp_dir, aof_fsync="always")
+        manager.log_set("b", 2)
+        manager.close()
+        assert SnapshotManager(path=temp_dir).load() == {"a": 1, "b": 2}
+
+    def test_rewrite_yields_to_newer_dump(self, snapshot_manager, monkeypatch):
+        """Test a rewrite doesn't publish over a dump made while it ran."""
+        snapshot_manager.dump({"k": 0})
+        snapshot_manager.log_set("k", 1)
+        replay = snapshot_manager._aof.replay
+
+        def replay_then_dump(*args, **kwargs):
+            data = replay(*args, **kwargs)
+            snapshot_manager.dump({"k": 2})
+            return data
+
+        monkeypatch.setattr(snapshot_manager._aof, "replay", replay_then_dump)
+        snapshot_manager.rewrite_aof(background=False)
+        monkeypatch.undo()
+
+        assert len(snapshot_manager.manifest()) == 2
+        assert snapshot_manager.load() == {"k": 2}
+
+    def test_compact_folds_log(self, snapshot_manager):
+        """Test compact() includes the log and removes its segments."""
+        snapshot_manager.dump({"k": 0, "j": 0})
+        snapshot_manager.dump({"k": 1, "j": 0}, delta=True)
+        snapshot_manager.log_set("j", 1)
+
+        path = snapshot_manager.compact()
+        assert snapshot_manager._aof.segments() == []
+        with open(path, "rb") as f:
+            assert Footer.read(f).base() is None
+        assert snapshot_manager.load() == {"k": 1, "j": 1}
+
+        snapshot_manager.dump({"k": 2})
+        assert snapshot_manager.load() == {"k": 2}
+        assert snapshot_manager.compact().name == snapshot_manager.manifest()[-1].name
+
+    def test_automatic_rewrite(self, temp_dir):
+        """Test the log is rewritten once it grows past aof_rewrite_size."""
+        manager = SnapshotManager(path=temp_dir, aof_fsync="no", aof_rewrite_size=64)
+        for i in range(20):
+            manager.log_set(f"key{i}", "x" * 10)
+        manager.close()
+
+        assert manager.list()
+        assert manager.load() == {f"key{i}": "x" * 10 for i in range(20)}
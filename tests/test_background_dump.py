@@ -0,0 +1,176 @@
+"""Tests for BackgroundDump class."""
+
+import pytest
+import asyncio
+import os
+import tempfile
+import shutil
+import threading
+import time
+from pathlib import Path
+from src.snapshot.BackgroundDump import BackgroundDump
+from src.snapshot.Storage import temp_path
+from src.snapshot.Retention import RetentionPolicy
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Throttle import IOThrottle
+from src.snapshot.Writer import Writer
+
+requires_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+
+
+@pytest.fixture
+def snapshot_manager():
+    """Create a SnapshotManager instance with a temp directory."""
+    temp_dir = tempfile.mkdtemp()
+    yield SnapshotManager(path=temp_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def write(f, source):
+    Writer(source, f).write()
+
+
+def fail(f, source):
+    raise ValueError("boom")
+
+
+class TestBackgroundDump:
+    """Test cases for BackgroundDump class."""
+
+    @requires_fork
+    def test_dump_background_round_trip(self, snapshot_manager):
+        """Test forked dump publishes a loadable snapshot."""
+        source = {"key": "value", "nested": {"list": [1, 2, 3]}}
+        handle = snapshot_manager.dump_background(source)
+        path = handle.wait()
+
+        assert path.exists()
+        assert handle.poll() is True
+        assert handle.size == path.stat().st_size
+        assert snapshot_manager.load() == source
+
+    @requires_fork
+    def test_source_mutation_after_fork(self, snapshot_manager):
+        """Test the child serialises the state at the time of the call."""
+        source = {f"key{i}": i for i in range(1000)}
+        expected = dict(source)
+        handle = snapshot_manager.dump_background(source)
+        source.clear()
+        source["other"] = "data"
+        handle.wait()
+        assert snapshot_manager.load() == expected
+
+    @requires_fork
+    def test_reports_cow_bytes(self, snapshot_manager):
+        """Test copy-on-write memory is reported where /proc is available."""
+        handle = snapshot_manager.dump_background({"key": "value" * 100})
+        handle.wait()
+        if Path("/proc/self/smaps_rollup").exists():
+            assert isinstance(handle.cow_bytes, int)
+        else:
+            assert handle.cow_bytes is None
+
+    @requires_fork
+    def test_await_handle(self, snapshot_manager):
+        """Test the handle can be awaited."""
+        source = {"key": "value"}
+
+        async def run():
+            return await snapshot_manager.dump_background(source)
+
+        path = asyncio.run(run())
+        assert path.exists()
+        assert snapshot_manager.load() == source
+
+    @requires_fork
+    def test_fork_failure_cleans_up(self, snapshot_manager):
+        """Test a failing child raises on wait and leaves no temp file."""
+        path = snapshot_manager._path / "snap"
+        handle = BackgroundDump.fork(path, {}, fail)
+        with pytest.raises(RuntimeError, match="boom"):
+            handle.wait()
+        assert not path.exists()
+        assert not temp_path(path).exists()
+
+    @requires_fork
+    def test_wait_with_timeout(self, snapshot_manager):
+        """Test wait with a timeout returns once done."""
+        handle = snapshot_manager.dump_background({"key": "value"})
+        assert handle.wait(timeout=10).exists()
+
+    @requires_fork
+    def test_retention_applies(self, snapshot_manager):
+        """Test forked dumps are pruned like dump() by the retention policy."""
+        manager = SnapshotManager(
+            path=snapshot_manager._path, retention=RetentionPolicy(last=2)
+        )
+        for i in range(4):
+            manager.dump_background({"i": i}).wait()
+
+        assert len(manager.manifest()) == 2
+        assert len(manager.list()) == 2
+        assert manager.load() == {"i": 3}
+
+    @requires_fork
+    def test_locks_held_by_other_threads(self, snapshot_manager):
+        """Test the child doesn't wait on locks another parent thread held at fork."""
+        throttle = IOThrottle(bytes_per_sec=1 << 30)
+        manager = SnapshotManager(
+            path=snapshot_manager._path, dedup=True, throttle=throttle
+        )
+        held, done = threading.Event(), threading.Event()
+
+        def hold():
+            with throttle._lock:
+                held.set()
+                done.wait(10)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        held.wait()
+        try:
+            handle = manager.dump_background({"key": "value" * 1000})
+            assert handle.wait(timeout=10).exists()
+        finally:
+            done.set()
+            thread.join()
+        assert manager.load() == {"key": "value" * 1000}
+
+    @requires_fork
+    def test_dropped_handle_is_reaped(self, snapshot_manager):
+        """Test the child is reaped and published without anyone polling."""
+        pid = snapshot_manager.dump_background({"key": "value"}).pid
+        deadline = time.monotonic() + 10
+        while not snapshot_manager.manifest() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert snapshot_manager.load() == {"key": "value"}
+        with pytest.raises(ChildProcessError):
+            os.waitpid(pid, os.WNOHANG)
+
+    def test_thread_fallback(self, snapshot_manager):
+        """Test the thread fallback writes a deep copy."""
+        source = {"nested": {"key": "value"}}
+        path = snapshot_manager._path / "snap"
+        handle = BackgroundDump.thread(path, source, write)
+        source["nested"]["key"] = "changed"
+
+        assert handle.wait() == path
+        assert handle.cow_bytes is None
+        assert snapshot_manager.load() == {"nested": {"key": "value"}}
+
+    def test_thread_failure_cleans_up(self, snapshot_manager):
+        """Test a failing thread raises on wait and leaves no temp file."""
+        path = snapshot_manager._path / "snap"
+        handle = BackgroundDump.thread(path, {}, fail)
+        with pytest.raises(RuntimeError, match="boom"):
+            handle.wait()
+        assert not temp_path(path).exists()
+
+    def test_temp_files_are_not_snapshots(self, snapshot_manager):
+        """Test in-flight temporaries are ignored by list and load."""
+        snapshot_manager.dump({"key": "value"})
+        temp_path(snapshot_manager._path / "in-flight").write_bytes(b"partial")
+
+        assert len(snapshot_manager.list()) == 1
+        assert snapshot_manager.load() == {"key": "value"}
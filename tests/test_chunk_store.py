@@ -0,0 +1,295 @@
+"""Tests for ChunkStore and deduplicated snapshots."""
+
+import pytest
+import os
+import random
+import shutil
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from src.snapshot.ChunkStore import (
+    ChunkStore,
+    ChunkedReader,
+    Recipe,
+    AVERAGE_CHUNK_SIZE,
+    CHUNK_DIR,
+    MIN_CHUNK_SIZE,
+    MAX_CHUNK_SIZE,
+    chunk_digest,
+    chunk_path,
+    cut,
+)
+from src.snapshot.Reader import CorruptSnapshotError
+from src.snapshot.Snapshot import SnapshotManager
+
+requires_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict large enough to span many chunks."""
+    rng = random.Random(0)
+    return {
+        f"user:{i}": {"name": f"name {i}", "score": rng.randint(0, 10**6)}
+        for i in range(5000)
+    }
+
+
+def stored_chunks(path: Path) -> int:
+    return sum(1 for f in (path / CHUNK_DIR).rglob("*") if f.is_file())
+
+
+def pieces(data: bytes, final: bool = True) -> list:
+    start, result = 0, []
+    for end in cut(data, final):
+        result.append(data[start:end])
+        start = end
+    return result
+
+
+class TestCut:
+    """Test cases for content-defined cut points."""
+
+    def test_sizes_bounded(self):
+        """Test every chunk but the last is within the size bounds."""
+        data = random.Random(1).randbytes(1 << 20)
+        sizes = [len(piece) for piece in pieces(data)]
+        assert sum(sizes) == len(data)
+        assert all(MIN_CHUNK_SIZE <= size <= MAX_CHUNK_SIZE for size in sizes[:-1])
+
+    def test_insertion_only_moves_nearby_cuts(self):
+        """Test bytes inserted up front leave the later chunks unchanged."""
+        data = random.Random(2).randbytes(1 << 20)
+        before = set(pieces(data))
+        after = pieces(b"inserted" * 100 + data)
+        # the cuts resynchronise within a few chunks of the edit
+        assert sum(piece in before for piece in after) >= len(after) * 0.95
+        assert after[-50:] == pieces(data)[-50:]
+
+    def test_insertion_keeps_offsets(self):
+        """Test the cuts after a prefix insert are the old ones, shifted."""
+        data = random.Random(5).randbytes(1 << 20)
+        inserted = b"prefix" * 50
+        cuts = cut(data, final=True)
+        shifted = [end - len(inserted) for end in cut(inserted + data, final=True)]
+        assert set(cuts[3:]) <= set(shifted)
+
+    def test_average_size(self):
+        """Test chunks are near the average size, not the minimum."""
+        data = random.Random(6).randbytes(1 << 20)
+        sizes = [len(piece) for piece in pieces(data)][:-1]
+        assert 0.8 <= sum(sizes) / len(sizes) / AVERAGE_CHUNK_SIZE <= 1.25
+
+    def test_not_final_keeps_tail(self):
+        """Test the bytes after the last cut wait for more data."""
+        data = random.Random(3).randbytes(MAX_CHUNK_SIZE - 1)
+        cuts = cut(data)
+        assert not cuts or cuts[-1] < len(data)
+        assert cut(data, final=True)[-1] == len(data)
+
+
+class TestRecipe:
+    """Test cases for Recipe class."""
+
+    def test_round_trip(self):
+        """Test pack and unpack keep the prefix and the chunk list."""
+        recipe = Recipe(b"head", [(bytes(16), 10), (b"\x01" * 16, 20)])
+        unpacked = Recipe.unpack(recipe.pack())
+        assert unpacked.prefix == b"head"
+        assert unpacked.chunks == recipe.chunks
+        assert unpacked.size == 34
+
+    def test_damaged(self):
+        """Test a damaged recipe is refused."""
+        data = bytearray(Recipe(b"head", [(bytes(16), 10)]).pack())
+        data[6] ^= 0xFF
+        with pytest.raises(CorruptSnapshotError):
+            Recipe.unpack(bytes(data))
+
+
+class TestChunkStore:
+    """Test cases for ChunkStore class."""
+
+    def test_buffer_round_trip(self, temp_dir):
+        """Test what a buffer stores reads back through the recipe."""
+        store = ChunkStore(temp_dir)
+        data = random.Random(4).randbytes(300_000)
+        buffer = store.buffer("snap")
+        buffer.write(data[:1000])
+        buffer.write(data[1000:])
+        recipe = buffer.close()
+
+        reader = ChunkedReader(store.root, recipe)
+        assert reader.read() == data
+        reader.seek(123_456)
+        assert reader.read(10) == data[123_456:123_466]
+
+    def test_prefix_patch(self, temp_dir):
+        """Test the prefix can be rewritten after the rest is written."""
+        store = ChunkStore(temp_dir)
+        buffer = store.buffer("snap")
+        buffer.write(bytes(44) + b"body")
+        buffer.seek(0)
+        buffer.write(b"h" * 44)
+        buffer.seek(48)
+        recipe = buffer.close()
+        assert recipe.prefix == b"h" * 44
+        assert ChunkedReader(store.root, recipe).read() == b"h" * 44 + b"body"
+
+    def test_identical_chunks_stored_once(self, temp_dir):
+        """Test writing the same data twice stores nothing new."""
+        store = ChunkStore(temp_dir)
+        data = random.Random(5).randbytes(200_000)
+        first = store.buffer("a")
+        first.write(data)
+        first.close()
+        written = store.bytes_written
+        second = store.buffer("b")
+        second.write(data)
+        second.close()
+        assert store.bytes_written == written
+
+    def test_damaged_chunk(self, temp_dir):
+        """Test a damaged chunk is detected on read."""
+        store = ChunkStore(temp_dir)
+        buffer = store.buffer("snap")
+        buffer.write(random.Random(6).randbytes(100_000))
+        recipe = buffer.close()
+        path = chunk_path(store.root, recipe.chunks[1][0])
+        path.write_bytes(b"x" + path.read_bytes()[1:])
+
+        with pytest.raises(CorruptSnapshotError):
+            ChunkedReader(store.root, recipe).read()
+
+    def test_pinned_chunks_survive_collect(self, temp_dir):
+        """Test chunks of an unpublished write aren't collected."""
+        store = ChunkStore(temp_dir)
+        buffer = store.buffer("pending")
+        buffer.write(random.Random(7).randbytes(100_000))
+        recipe = buffer.close()
+        assert store.collect([]) == 0
+
+        store.release("pending")
+        assert store.collect([]) == len(recipe.chunks)
+        assert chunk_digest(b"") not in store._refs
+
+
+class TestSnapshotManagerDedup:
+    """Test cases for SnapshotManager with dedup."""
+
+    def test_round_trip(self, temp_dir, source):
+        """Test a deduplicated snapshot loads, stats and verifies."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        path = manager.dump(source)
+        assert manager.load() == source
+        assert manager.load(workers=2, executor="thread") == source
+        assert manager.stat(path.name).entries == len(source)
+        assert manager.verify(path.name).ok
+        (entry,) = manager.manifest()
+        assert entry.size > path.stat().st_size
+
+    def test_manifest_rebuild(self, temp_dir, source):
+        """Test a rebuilt manifest describes recipes like the dump did."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        manager.dump(source)
+        expected = manager.manifest()
+        (temp_dir / ".manifest").unlink()
+        assert SnapshotManager(path=temp_dir).manifest() == expected
+
+    def test_overlap_is_stored_once(self, temp_dir, source):
+        """Test a mostly unchanged snapshot writes only its new chunks."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        manager.dump(source)
+        first = manager._chunks.bytes_written
+        for i in range(0, 5000, 1000):
+            source[f"user:{i}"]["score"] += 1
+        time.sleep(0.01)
+        manager.dump(source)
+
+        assert manager._chunks.bytes_written - first < first / 4
+        assert manager.load() == source
+
+    def test_delta(self, temp_dir, source):
+        """Test deltas are stored as recipes too."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        manager.dump(source)
+        source["new"] = 1
+        del source["user:7"]
+        time.sleep(0.01)
+        manager.dump(source, delta=True)
+        assert manager.load() == source
+
+    def test_prune_frees_chunks(self, temp_dir, source):
+        """Test prune removes the chunks only the pruned snapshot used."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        paths = [manager.dump(source)]
+        time.sleep(0.01)
+        paths.append(manager.dump({"other": list(range(20_000))}))
+        before = stored_chunks(temp_dir)
+
+        manager.prune_snapshot(str(paths[1]))
+        assert stored_chunks(temp_dir) < before
+        assert manager.load() == source
+        manager.prune_snapshot(str(paths[0]))
+        assert stored_chunks(temp_dir) == 0
+
+    def test_shared_chunks_kept(self, temp_dir, source):
+        """Test chunks still referenced by another snapshot survive a prune."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        first = manager.dump(source)
+        time.sleep(0.01)
+        manager.dump(source)
+        manager.prune_snapshot(str(first))
+        assert manager.load() == source
+        assert manager.verify(manager.list()[0].name).ok
+
+    def test_collect_orphans(self, temp_dir):
+        """Test chunks left by a failed dump are collected."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        # large enough for chunks to be stored before the failure
+        rng = random.Random(8)
+        source = {f"key{i}": rng.randbytes(40).hex() for i in range(40_000)}
+        with pytest.raises(Exception):
+            manager.dump({**source, "bad": {1, 2}})
+        assert stored_chunks(temp_dir) > 0
+        assert manager.collect_chunks() > 0
+        assert stored_chunks(temp_dir) == 0
+
+    def test_salvage_missing_chunk(self, temp_dir, source):
+        """Test salvage skips the entries of a missing chunk."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        path = manager.dump(source)
+        recipe = Recipe.read(path)
+        chunk_path(temp_dir / CHUNK_DIR, recipe.chunks[2][0]).unlink()
+
+        assert not manager.verify(path.name).ok
+        data, lost = manager.salvage()
+        assert lost > 0
+        assert len(data) == len(source) - lost
+
+    @requires_fork
+    def test_background_dump(self, temp_dir, source):
+        """Test a forked dump writes a recipe the parent can read."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        path = manager.dump_background(source).wait()
+        assert Recipe.read(path) is not None
+        assert manager.load() == source
+
+    def test_mixed_directory(self, temp_dir, source):
+        """Test plain snapshots stay readable next to recipes."""
+        SnapshotManager(path=temp_dir).dump({"plain": 1})
+        time.sleep(0.01)
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        manager.dump(source)
+        oldest = manager.list()[-1]
+        assert manager.load(oldest.name) == {"plain": 1}
+        assert manager.load() == source
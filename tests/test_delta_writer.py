@@ -0,0 +1,186 @@
+"""Tests for DeltaWriter class and delta snapshots."""
+
+import pytest
+import tempfile
+import shutil
+import time
+from io import BytesIO
+from src.snapshot.DeltaWriter import DeltaWriter
+from src.snapshot.ParallelWriter import ParallelWriter
+from src.snapshot.Writer import Writer
+from src.snapshot.Reader import Reader
+from src.snapshot.Footer import Footer
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def snapshot_manager():
+    """Create a SnapshotManager instance with a temp directory."""
+    temp_dir = tempfile.mkdtemp()
+    yield SnapshotManager(path=temp_dir, max_chain=3)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def hashes_of(source):
+    buffer = BytesIO()
+    writer = Writer(source, buffer, hash_keys=True)
+    writer.write()
+    return writer.key_hashes
+
+
+def files_of(manager):
+    return sorted(manager._snapshot_files(), key=lambda f: f.stat().st_mtime)
+
+
+class TestKeyHashes:
+    """Test cases for per key digests recorded in the footer."""
+
+    def test_writer_records_key_hashes(self):
+        """Test Writer records one digest per top level key."""
+        source = {"a": 1, "b": {"nested": "value"}, 3: "int key"}
+        buffer = BytesIO()
+        writer = Writer(source, buffer, hash_keys=True)
+        writer.write()
+
+        assert set(writer.key_hashes) == {"a", "b", "3"}
+        assert Footer.read(buffer).key_hashes() == writer.key_hashes
+        buffer.seek(0)
+        assert Reader(buffer).read() == {
+            "a": 1,
+            "b": {"nested": "value"},
+            "3": "int key",
+        }
+
+    def test_digest_depends_on_value(self):
+        """Test digests only change for changed entries."""
+        first = hashes_of({"a": 1, "b": "two"})
+        second = hashes_of({"a": 1, "b": "three"})
+        assert first["a"] == second["a"]
+        assert first["b"] != second["b"]
+
+    def test_parallel_writer_matches(self):
+        """Test ParallelWriter records the same digests."""
+        source = {f"key{i}": i for i in range(50)}
+        buffer = BytesIO()
+        writer = ParallelWriter(
+            source, buffer, workers=2, chunk_size=8, executor="thread", hash_keys=True
+        )
+        writer.write()
+        assert writer.key_hashes == hashes_of(source)
+
+
+class TestDeltaWriter:
+    """Test cases for DeltaWriter class."""
+
+    def test_writes_only_changes(self):
+        """Test only added and changed entries end up in the body."""
+        base = {"same": 1, "changed": "old", "deleted": [1, 2]}
+        source = {"same": 1, "changed": "new", "added": {"k": "v"}}
+        buffer = BytesIO()
+        writer = DeltaWriter(source, buffer, base="base", base_hashes=hashes_of(base))
+        writer.write()
+
+        buffer.seek(0)
+        assert Reader(buffer).read() == {"changed": "new", "added": {"k": "v"}}
+        footer = Footer.read(buffer)
+        assert footer.base() == "base"
+        assert footer.deleted() == ["deleted"]
+        assert set(footer.key_hashes()) == {"changed", "added"}
+
+    def test_no_changes(self):
+        """Test an unchanged source gives an empty delta."""
+        source = {"a": 1, "b": "two"}
+        buffer = BytesIO()
+        DeltaWriter(source, buffer, base="base", base_hashes=hashes_of(source)).write()
+        buffer.seek(0)
+        assert Reader(buffer).read() == {}
+        assert Footer.read(buffer).deleted() == []
+
+
+class TestDeltaSnapshots:
+    """Test cases for SnapshotManager delta dumps."""
+
+    def test_delta_round_trip(self, snapshot_manager):
+        """Test load replays a delta on top of its base."""
+        snapshot_manager.dump({"a": 1, "b": "two", "c": [3]})
+        time.sleep(0.01)
+        snapshot_manager.dump({"a": 1, "b": "changed", "d": 4}, delta=True)
+
+        assert snapshot_manager.load() == {"a": 1, "b": "changed", "d": 4}
+        first, second = files_of(snapshot_manager)
+        with open(second, "rb") as f:
+            assert Footer.read(f).base() == first.name
+            f.seek(0)
+            assert Reader(f).read() == {"b": "changed", "d": 4}
+
+    def test_chain_replay(self, snapshot_manager):
+        """Test several stacked deltas replay in order."""
+        state = {f"key{i}": i for i in range(20)}
+        snapshot_manager.dump(state)
+        for i in range(3):
+            time.sleep(0.01)
+            state[f"key{i}"] = f"v{i}"
+            state.pop(f"key{10 + i}")
+            snapshot_manager.dump(state, delta=True)
+            assert snapshot_manager.load() == state
+
+        assert snapshot_manager.load(workers=2, executor="thread") == state
+
+    def test_delta_without_base_is_full(self, snapshot_manager):
+        """Test first delta dump writes a full snapshot."""
+        path = snapshot_manager.dump({"a": 1}, delta=True)
+        with open(path, "rb") as f:
+            assert Footer.read(f).base() is None
+        assert snapshot_manager.load() == {"a": 1}
+
+    def test_delta_on_legacy_base_is_full(self, snapshot_manager):
+        """Test a base without digests can't be used for deltas."""
+        with open(snapshot_manager._path / "legacy", "wb") as f:
+            Writer({"a": 1}, f).write()
+        path = snapshot_manager.dump({"a": 2}, delta=True)
+        with open(path, "rb") as f:
+            assert Footer.read(f).base() is None
+
+    def test_max_chain_writes_full(self, snapshot_manager):
+        """Test a full snapshot is written once the chain is long enough."""
+        state = {"counter": 0}
+        snapshot_manager.dump(state)
+        paths = []
+        for i in range(4):
+            time.sleep(0.01)
+            state["counter"] = i + 1
+            paths.append(snapshot_manager.dump(state, delta=True))
+
+        bases = []
+        for path in paths:
+            with open(path, "rb") as f:
+                bases.append(Footer.read(f).base())
+        assert all(bases[:3])
+        assert bases[3] is None
+        assert snapshot_manager.load() == {"counter": 4}
+
+    def test_compact(self, snapshot_manager):
+        """Test compact folds the chain into a full snapshot."""
+        snapshot_manager.dump({"a": 1, "b": 2})
+        time.sleep(0.01)
+        snapshot_manager.dump({"a": 1, "b": 3}, delta=True)
+        time.sleep(0.01)
+
+        path = snapshot_manager.compact()
+        with open(path, "rb") as f:
+            assert Footer.read(f).base() is None
+        assert snapshot_manager.load() == {"a": 1, "b": 3}
+        assert snapshot_manager.compact() == path
+
+    def test_compact_empty(self, snapshot_manager):
+        """Test compact with no snapshots."""
+        assert snapshot_manager.compact() is None
+
+    def test_missing_base(self, snapshot_manager):
+        """Test loading a delta whose base was removed raises."""
+        first = snapshot_manager.dump({"a": 1})
+        time.sleep(0.01)
+        snapshot_manager.dump({"a": 2}, delta=True)
+        first.unlink()
+        with pytest.raises(FileNotFoundError):
+            snapshot_manager.load()
@@ -0,0 +1,195 @@
+"""Tests for comparing snapshots."""
+
+import pytest
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from src.snapshot.Diff import diff_snapshots, diff_values, entry_digests
+from src.snapshot.Footer import Footer
+from src.snapshot.Reader import CorruptSnapshotError
+from src.snapshot.Shards import find_keys
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Writer import Writer
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict with nested values."""
+    return {
+        "users": {"alice": {"age": 30, "tags": ["a", "b"]}, "bob": {"age": 25}},
+        "count": 2,
+        "name": "x" * 500,
+        **{f"k{i}": i for i in range(200)},
+    }
+
+
+def changed_source(source: dict) -> dict:
+    changed = dict(source, count=3, extra=[1])
+    changed["users"] = {
+        "alice": {"age": 31, "tags": ["a", "b", "c"]},
+        "carol": {"age": 40},
+    }
+    del changed["k7"]
+    return changed
+
+
+EXPECTED = {
+    "added": [("extra",), ("users", "alice", "tags", 2), ("users", "carol")],
+    "removed": [("k7",), ("users", "bob")],
+    "changed": [("count",), ("users", "alice", "age")],
+}
+
+
+def encode(source: dict, **kwargs) -> io.BytesIO:
+    buffer = io.BytesIO()
+    Writer(source, buffer, **kwargs).write()
+    buffer.seek(0)
+    return buffer
+
+
+def as_dict(result) -> dict:
+    return {
+        "added": result.added,
+        "removed": result.removed,
+        "changed": result.changed,
+    }
+
+
+class TestDiffValues:
+    """Test cases for comparing decoded values."""
+
+    def test_nested_paths(self):
+        """Test dicts and lists are descended into."""
+        result = diff_values(
+            {"a": {"b": 1, "c": [1, 2]}, "d": 1}, {"a": {"b": 2, "c": [1]}, "e": 1}
+        )
+        assert result.added == [("e",)]
+        assert result.removed == [("a", "c", 1), ("d",)]
+        assert result.changed == [("a", "b")]
+
+    def test_type_change(self):
+        """Test a value that changed type is changed as a whole."""
+        result = diff_values({"a": {"b": 1}}, {"a": [1]})
+        assert result.changed == [("a",)]
+        assert not diff_values({"a": [1, {"b": "c"}]}, {"a": [1, {"b": "c"}]})
+
+
+class TestDiffSnapshots:
+    """Test cases for diffing encoded snapshots."""
+
+    def test_without_footers(self, source):
+        """Test bodies are walked side by side when no digests are stored."""
+        result = diff_snapshots(encode(source), encode(changed_source(source)))
+        assert as_dict(result) == EXPECTED
+
+    def test_with_stored_digests(self, source):
+        """Test the footer digests are compared without a walk."""
+        before = encode(source, hash_keys=True, header=True)
+        after = encode(changed_source(source), hash_keys=True, header=True)
+        assert as_dict(diff_snapshots(before, after)) == EXPECTED
+
+    def test_top_level_only(self, source):
+        """Test nested=False reports the changed top level keys."""
+        result = diff_snapshots(
+            encode(source), encode(changed_source(source)), nested=False
+        )
+        assert result.changed == [("count",), ("users",)]
+
+    def test_identical(self, source):
+        """Test equal snapshots have no differences."""
+        assert not diff_snapshots(encode(source), encode(dict(source)))
+
+    def test_reordered(self, source):
+        """Test entries written in another order still match."""
+        reordered = dict(reversed(list(source.items())))
+        assert not diff_snapshots(encode(source), encode(reordered))
+
+    def test_equal_after_decoding(self):
+        """Test entries whose bytes differ but decode equal are dropped."""
+        value = "abc" * 200
+        compressed = encode({"a": value})
+        plain = io.BytesIO()
+        writer = Writer(buffer=plain)
+        writer.write_length(1)
+        plain.write(bytes([3]))  # string
+        writer.write_value("a")
+        # the value stored uncompressed
+        writer.write_length(len(value))
+        plain.write(value.encode())
+        plain.write(bytes([3 << 6]))  # EOF
+        plain.seek(0)
+        assert plain.getvalue() != compressed.getvalue()
+        assert not diff_snapshots(compressed, plain)
+
+    def test_digests_match_footer(self, source):
+        """Test the digests of a walk are the ones the writer stores."""
+        buffer = encode(source, hash_keys=True)
+        assert dict(entry_digests(buffer)) == Footer.read(buffer).key_hashes()
+
+    def test_find_keys_reads_one_chunk(self, source):
+        """Test keys are looked up in their chunk only when there is a footer."""
+        data = bytearray(encode(source, chunk_size=10, hash_keys=True).getvalue())
+        footer = Footer.read(io.BytesIO(data))
+        offset, length, _ = footer.chunks()[0]
+        data[offset : offset + length] = b"\xff" * length
+
+        found = find_keys(io.BytesIO(data), ["k150", "missing"], footer)
+        assert found == {"k150": 150}
+        with pytest.raises(Exception):
+            find_keys(io.BytesIO(data), ["k150"])
+
+    def test_truncated(self, source):
+        """Test a body cut short raises CorruptSnapshotError."""
+        data = encode(source).getvalue()
+        with pytest.raises(CorruptSnapshotError):
+            list(entry_digests(io.BytesIO(data[: len(data) // 2])))
+
+
+class TestManagerDiff:
+    """Test cases for SnapshotManager.diff()."""
+
+    def test_full_snapshots(self, temp_dir, source):
+        """Test two full snapshots are diffed by name."""
+        manager = SnapshotManager(path=temp_dir)
+        before = manager.dump(source)
+        after = manager.dump(changed_source(source))
+        assert as_dict(manager.diff(before.name, after.name)) == EXPECTED
+        assert not manager.diff(after.name, after.name)
+
+    def test_delta_chain(self, temp_dir, source):
+        """Test deltas are compared as the state their chain describes."""
+        manager = SnapshotManager(path=temp_dir)
+        before = manager.dump(source)
+        middle = dict(source, k1="changed")
+        manager.dump(middle, delta=True)
+        after = manager.dump(changed_source(middle), delta=True)
+
+        result = manager.diff(before.name, after.name)
+        assert ("k1",) in result.changed and ("k7",) in result.removed
+        assert as_dict(manager.diff(after.name, before.name))["added"] == [
+            ("k7",),
+            ("users", "bob"),
+        ]
+
+    def test_sharded(self, temp_dir, source):
+        """Test sharded snapshots are diffed from their shards."""
+        manager = SnapshotManager(path=temp_dir, shards=3)
+        before = manager.dump(source)
+        after = manager.dump(changed_source(source))
+        assert as_dict(manager.diff(before.name, after.name)) == EXPECTED
+
+    def test_missing(self, temp_dir, source):
+        """Test an unknown name raises FileNotFoundError."""
+        manager = SnapshotManager(path=temp_dir)
+        path = manager.dump(source)
+        with pytest.raises(FileNotFoundError):
+            manager.diff(path.name, "missing")
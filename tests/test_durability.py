@@ -0,0 +1,163 @@
+"""Tests for atomic publishing, durability modes and GroupCommit."""
+
+import pytest
+import os
+import tempfile
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from src.snapshot.Durability import Durability, GroupCommit
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """Count fsync calls on files and directories."""
+    calls = []
+    fsync = os.fsync
+
+    def counting(fd):
+        calls.append("dir" if os.path.isdir(f"/proc/self/fd/{fd}") else "file")
+        return fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", counting)
+    return calls
+
+
+class TestAtomicDump:
+    """Test cases for temp file publishing."""
+
+    def test_no_temporaries_left(self, temp_dir):
+        """Test a dump leaves only the snapshot, the manifest and the lock."""
+        manager = SnapshotManager(path=temp_dir)
+        path = manager.dump({"a": 1})
+        assert sorted(f.name for f in temp_dir.iterdir()) == sorted(
+            [path.name, ".manifest", ".lock"]
+        )
+
+    def test_failed_dump_leaves_nothing(self, temp_dir):
+        """Test a dump that fails while writing publishes nothing."""
+        manager = SnapshotManager(path=temp_dir)
+        with pytest.raises(Exception):
+            manager.dump({"ok": 1, "bad": {1, 2}})
+        assert [
+            f for f in temp_dir.iterdir() if f.name not in (".manifest", ".lock")
+        ] == []
+        assert manager.list() == []
+        assert manager.load() == {}
+
+    def test_concurrent_dumps_get_unique_names(self, temp_dir):
+        """Test dumps racing for the same name all get published."""
+        manager = SnapshotManager(path=temp_dir, durability="file+dir")
+        with ThreadPoolExecutor(8) as pool:
+            paths = list(pool.map(lambda i: manager.dump({"i": i}), range(16)))
+        assert len(set(paths)) == 16
+        assert sorted(manager.list()) == sorted(paths)
+
+
+class TestDurability:
+    """Test cases for durability modes."""
+
+    @pytest.mark.skipif(
+        not os.path.isdir("/proc/self/fd"), reason="needs /proc to tell fds apart"
+    )
+    @pytest.mark.parametrize(
+        "durability, expected",
+        [
+            ("none", []),
+            ("file", ["file"]),
+            ("file+dir", ["file", "dir", "file"]),
+        ],
+    )
+    def test_fsyncs(self, temp_dir, fsyncs, durability, expected):
+        """Test each mode syncs the file, directory and manifest it promises."""
+        manager = SnapshotManager(path=temp_dir, durability=durability)
+        # the manifest is created (and synced) on first use
+        manager.list()
+        fsyncs.clear()
+        manager.dump({"a": 1})
+        assert fsyncs == expected
+        assert manager.load() == {"a": 1}
+
+    def test_invalid_mode(self, temp_dir):
+        """Test an unknown durability mode raises."""
+        with pytest.raises(ValueError):
+            SnapshotManager(path=temp_dir, durability="paranoid")
+
+    def test_modes(self):
+        """Test the mode names."""
+        assert [d.value for d in Durability] == ["none", "file", "file+dir"]
+
+
+class TestGroupCommit:
+    """Test cases for GroupCommit class."""
+
+    def test_single_caller(self):
+        """Test a lone caller syncs once."""
+        calls = []
+        commit = GroupCommit(lambda: calls.append(1))
+        commit.sync()
+        commit.sync()
+        assert calls == [1, 1]
+        assert commit.syncs == 2
+
+    def test_batches_concurrent_callers(self):
+        """Test callers arriving during a sync share the next one."""
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def sync():
+            calls.append(1)
+            if len(calls) == 1:
+                started.set()
+                release.wait()
+
+        commit = GroupCommit(sync)
+        first = threading.Thread(target=commit.sync)
+        first.start()
+        started.wait()
+        others = [threading.Thread(target=commit.sync) for _ in range(5)]
+        for thread in others:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [first, *others]:
+            thread.join()
+
+        assert commit.requests == 6
+        assert commit.syncs == 2
+
+    def test_window_gathers_callers(self):
+        """Test a window lets callers arriving shortly after join the sync."""
+        commit = GroupCommit(lambda: None, window=0.05)
+        threads = [threading.Thread(target=commit.sync) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert commit.syncs == 1
+
+    def test_failure_reaches_the_batch(self):
+        """Test a failed sync raises for the callers it covered only."""
+        calls = []
+
+        def sync():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OSError("disk gone")
+
+        commit = GroupCommit(sync)
+        with pytest.raises(OSError, match="disk gone"):
+            commit.sync()
+        commit.sync()
+        assert commit._failures == {}
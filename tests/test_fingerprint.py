@@ -0,0 +1,146 @@
+"""Tests for state fingerprints and dumps skipped when nothing changed."""
+
+import pytest
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from src.snapshot.Footer import Footer
+from src.snapshot.ParallelWriter import ParallelWriter
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.TrackedDict import TrackedDict
+from src.snapshot.Writer import Writer, fingerprint, fingerprint_entries
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict with nested values."""
+    return {f"k{i}": {"value": i, "tags": ["a", str(i)]} for i in range(300)}
+
+
+def footer_of(writer_class, source: dict, **kwargs) -> Footer:
+    buffer = io.BytesIO()
+    writer_class(source, buffer, hash_keys=True, **kwargs).write()
+    return Footer.read(buffer)
+
+
+def files(directory: Path) -> set:
+    return {path.name for path in directory.iterdir()}
+
+
+class TestFingerprint:
+    """Test cases for the fingerprint recorded by writers."""
+
+    def test_order_and_writer_independent(self, source):
+        """Test the same state has one fingerprint whatever wrote it."""
+        reordered = dict(reversed(list(source.items())))
+        expected = footer_of(Writer, source).fingerprint()
+        assert footer_of(Writer, reordered, chunk_size=7).fingerprint() == expected
+        parallel = footer_of(ParallelWriter, source, workers=2, executor="thread")
+        assert parallel.fingerprint() == expected
+        assert footer_of(Writer, dict(source, k1=1)).fingerprint() != expected
+
+    def test_parts_combine(self, source):
+        """Test the digests of disjoint parts give the fingerprint of the whole."""
+        keys = list(source)
+        parts = [{key: source[key] for key in keys[i::3]} for i in range(3)]
+        digests = {}
+        for part in parts:
+            digests.update(footer_of(Writer, part).key_hashes())
+        assert fingerprint(digests) == footer_of(Writer, source).fingerprint()
+
+    def test_swapped_digests(self):
+        """Test digests moved between keys or entries added change it."""
+        a, b = bytes(8), b"\x01" * 8
+        assert fingerprint({"x": a, "y": b}) != fingerprint({"x": b, "y": a})
+        assert fingerprint({"x": a}) != fingerprint({"x": a, "y": bytes(8)})
+        assert fingerprint_entries(fingerprint({"x": a, "y": b})) == 2
+        assert fingerprint_entries(bytes(8)) is None
+
+    def test_without_hash_keys(self, source):
+        """Test nothing is recorded without entry digests."""
+        writer = Writer(source, io.BytesIO(), chunk_size=10)
+        writer.write()
+        assert writer.fingerprint is None
+
+
+class TestSkipIfUnchanged:
+    """Test cases for dump(skip_if_unchanged=True)."""
+
+    def test_unchanged_returns_latest(self, temp_dir, source):
+        """Test an identical dump publishes nothing and leaves no file."""
+        manager = SnapshotManager(path=temp_dir)
+        path = manager.dump(source)
+        before = files(temp_dir)
+
+        assert manager.dump(dict(source), skip_if_unchanged=True) == path
+        assert files(temp_dir) == before
+        assert [entry.name for entry in manager.manifest()] == [path.name]
+
+    def test_changed_is_published(self, temp_dir, source):
+        """Test a changed source is dumped as usual."""
+        manager = SnapshotManager(path=temp_dir)
+        path = manager.dump(source)
+        changed = dict(source, k1="changed")
+        newer = manager.dump(changed, skip_if_unchanged=True)
+        assert newer != path
+        assert manager.load() == changed
+
+    def test_first_dump(self, temp_dir, source):
+        """Test the first snapshot is always written."""
+        manager = SnapshotManager(path=temp_dir)
+        path = manager.dump(source, skip_if_unchanged=True)
+        assert manager.manifest()[0].name == path.name
+
+    def test_delta(self, temp_dir, source):
+        """Test a delta without changes is skipped, and its state recognised."""
+        manager = SnapshotManager(path=temp_dir)
+        manager.dump(source)
+        changed = dict(source, k1="changed")
+        delta = manager.dump(changed, delta=True)
+
+        assert manager.dump(changed, delta=True, skip_if_unchanged=True) == delta
+        assert manager.dump(changed, skip_if_unchanged=True) == delta
+        assert len(manager.manifest()) == 2
+
+    def test_tracked_delta_fallback(self, temp_dir, source):
+        """Test a latest snapshot without a recorded fingerprint is hashed."""
+        manager = SnapshotManager(path=temp_dir)
+        tracked = TrackedDict(source)
+        manager.dump(tracked)
+        tracked["k1"] = "changed"
+        delta = manager.dump(tracked)
+        with manager.open(delta) as f:
+            assert Footer.read(f).fingerprint() is None
+
+        assert manager.dump(dict(tracked), skip_if_unchanged=True) == delta
+
+    def test_dedup(self, temp_dir, source):
+        """Test a skipped deduplicated dump leaves no recipe behind."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        path = manager.dump(source)
+        assert manager.dump(source, skip_if_unchanged=True) == path
+        assert manager.collect_chunks() == 0
+        assert len(manager.manifest()) == 1
+
+    def test_sharded(self, temp_dir, source):
+        """Test identical shards are removed and the latest map returned."""
+        manager = SnapshotManager(path=temp_dir, shards=3)
+        path = manager.dump(source, executor="thread")
+        before = files(temp_dir)
+
+        assert manager.dump(source, executor="thread", skip_if_unchanged=True) == path
+        assert files(temp_dir) == before
+        newer = manager.dump(
+            dict(source, k1="changed"), executor="thread", skip_if_unchanged=True
+        )
+        assert newer != path
+        assert manager.load()["k1"] == "changed"
@@ -3,7 +3,7 @@
 import pytest
 from io import BytesIO
 from src.snapshot.Writer import Writer
-from src.snapshot.Reader import Reader
+from src.snapshot.Reader import Reader, CorruptSnapshotError
 from src.snapshot.handlers.IntHandler import IntHandler
 from src.snapshot.handlers.StringHandler import StringHandler
 from src.snapshot.handlers.DictHandler import DictHandler
@@ -319,6 +319,15 @@ class TestDictHandler:
         read_value = handler.deserialise(reader)
         assert read_value == original_value
 
+    def test_truncated_dict_raises(self, buffer):
+        """Test a dict cut short raises instead of returning fewer keys."""
+        handler = DictHandler()
+        handler.serialise(Writer(buffer=buffer), {"a": 1, "b": 2})
+        data = buffer.getvalue()
+
+        with pytest.raises(CorruptSnapshotError):
+            handler.deserialise(Reader(buffer=BytesIO(data[:-3])))
+
     def test_serialise_invalid_type(self, buffer):
         """Test serializing invalid type raises exception."""
         handler = DictHandler()
@@ -394,6 +403,24 @@ class TestListHandler:
         read_value = handler.deserialise(reader)
         assert read_value == original_value
 
+    def test_round_trip_falsy_items(self, buffer):
+        """Test falsy items don't cut the list short."""
+        handler = ListHandler()
+        original_value = [1, 0, "", [], {}, "after"]
+        handler.serialise(Writer(buffer=buffer), original_value)
+        buffer.seek(0)
+
+        assert handler.deserialise(Reader(buffer=buffer)) == original_value
+
+    def test_truncated_list_raises(self, buffer):
+        """Test a list cut short raises instead of returning a prefix."""
+        handler = ListHandler()
+        handler.serialise(Writer(buffer=buffer), ["a", "b", "c"])
+        data = buffer.getvalue()
+
+        with pytest.raises(CorruptSnapshotError):
+            handler.deserialise(Reader(buffer=BytesIO(data[:-2])))
+
     def test_serialise_invalid_type(self, buffer):
         """Test serializing invalid type raises exception."""
         handler = ListHandler()
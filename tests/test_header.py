@@ -0,0 +1,161 @@
+"""Tests for Header class and headered snapshots."""
+
+import pytest
+import tempfile
+import shutil
+import time
+from io import BytesIO
+from src.snapshot.Header import (
+    Header,
+    HEADER_MAGIC,
+    HEADER_SIZE,
+    HEADER_VERSION,
+    FLAG_FOOTER,
+    FLAG_DELTA,
+)
+from src.snapshot.Writer import Writer, entry_digest
+from src.snapshot.ParallelWriter import ParallelWriter
+from src.snapshot.ParallelReader import ParallelReader
+from src.snapshot.DeltaWriter import DeltaWriter
+from src.snapshot.Reader import Reader
+from src.snapshot.Footer import Footer
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def snapshot_manager():
+    """Create a SnapshotManager instance with a temp directory."""
+    temp_dir = tempfile.mkdtemp()
+    yield SnapshotManager(path=temp_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class TestHeader:
+    """Test cases for Header class."""
+
+    def test_pack_unpack(self):
+        """Test a header survives a round trip."""
+        header = Header(flags=FLAG_FOOTER, size=10, entries=2, created=1.5)
+        data = header.pack()
+        assert len(data) == HEADER_SIZE
+        assert data.startswith(HEADER_MAGIC)
+        restored = Header.unpack(data)
+        assert (restored.flags, restored.size, restored.entries) == (1, 10, 2)
+        assert restored.created == 1.5
+        assert restored.has_footer and not restored.delta
+
+    def test_damaged_header(self):
+        """Test a flipped byte fails the header CRC."""
+        data = bytearray(Header(entries=3).pack())
+        data[12] ^= 0xFF
+        with pytest.raises(ValueError, match="checksum"):
+            Header.unpack(bytes(data))
+
+    def test_newer_version(self):
+        """Test headers from a newer format version are refused."""
+        with pytest.raises(ValueError, match="version"):
+            Header.unpack(Header(version=HEADER_VERSION + 1).pack())
+
+    def test_read_without_header(self):
+        """Test read leaves buffers without a header alone."""
+        buffer = BytesIO(b"\x01abc")
+        assert Header.read(buffer) is None
+        assert buffer.tell() == 0
+
+
+class TestHeaderedWriter:
+    """Test cases for writers with header=True."""
+
+    def test_default_has_no_header(self):
+        """Test writers don't write a header unless asked."""
+        buffer = BytesIO()
+        writer = Writer({"a": 1}, buffer)
+        writer.write()
+        assert buffer.getvalue()[0] == 1
+        assert writer.header is None
+
+    def test_plain_body(self):
+        """Test a header in front of a body without footer."""
+        source = {"a": 1, "b": "two"}
+        buffer = BytesIO()
+        before = time.time()
+        writer = Writer(source, buffer, header=True)
+        writer.write()
+        data = buffer.getvalue()
+
+        header = Header.unpack(data)
+        assert header.flags == 0
+        assert header.entries == 2
+        assert header.size == len(data) - HEADER_SIZE
+        assert before <= header.created <= time.time()
+        assert header.checksum == entry_digest(data[HEADER_SIZE:]).digest()
+        assert writer.header.checksum == header.checksum
+
+        buffer.seek(0)
+        assert Reader(buffer).read() == source
+
+    def test_footer_offsets(self):
+        """Test footer offsets stay relative to the body."""
+        source = {f"key{i}": i for i in range(10)}
+        buffer = BytesIO()
+        Writer(source, buffer, chunk_size=4, hash_keys=True, header=True).write()
+
+        header = Header.unpack(buffer.getvalue())
+        assert header.has_footer
+        footer = Footer.read(buffer)
+        assert [count for _, _, count in footer.chunks()] == [4, 4, 2]
+        offset, _, count = footer.chunks()[1]
+        buffer.seek(HEADER_SIZE + offset)
+        assert Reader(buffer).read_entries(count) == {f"key{i}": i for i in range(4, 8)}
+        assert header.size < len(buffer.getvalue()) - HEADER_SIZE
+
+    def test_parallel_round_trip(self, tmp_path):
+        """Test ParallelWriter headers and ParallelReader reading them."""
+        source = {f"key{i}": {"n": i} for i in range(100)}
+        path = tmp_path / "snapshot"
+        with open(path, "wb") as f:
+            writer = ParallelWriter(
+                source, f, workers=2, chunk_size=16, executor="thread", header=True
+            )
+            writer.write()
+        assert writer.header.entries == 100
+        reader = ParallelReader(path, workers=2, executor="thread")
+        assert reader.read() == source
+
+    def test_delta_flag(self):
+        """Test DeltaWriter marks its header as a delta."""
+        buffer = BytesIO()
+        writer = DeltaWriter({"a": 1, "b": 2}, buffer, base="base", header=True)
+        writer.write()
+        header = Header.unpack(buffer.getvalue())
+        assert header.delta and header.has_footer
+        assert header.entries == 2
+        assert Footer.read(buffer).base() == "base"
+
+
+class TestSnapshotManagerStat:
+    """Test cases for SnapshotManager.stat."""
+
+    def test_stat(self, snapshot_manager):
+        """Test stat reports the header of a dumped snapshot."""
+        path = snapshot_manager.dump({f"key{i}": "v" * i for i in range(50)})
+        header = snapshot_manager.stat(path.name)
+        assert header.entries == 50
+        assert header.has_footer and not header.delta
+        assert header.checksum.hex() == snapshot_manager.manifest()[0].checksum
+        assert snapshot_manager.stat(path).checksum == header.checksum
+
+    def test_stat_delta(self, snapshot_manager):
+        """Test stat reports delta snapshots."""
+        snapshot_manager.dump({"a": 1, "b": 2})
+        time.sleep(0.01)
+        path = snapshot_manager.dump({"a": 1, "b": 3}, delta=True)
+        header = snapshot_manager.stat(path)
+        assert header.delta
+        assert header.entries == 1
+
+    def test_stat_without_header(self, snapshot_manager):
+        """Test stat of a snapshot written without header."""
+        with open(snapshot_manager._path / "legacy", "wb") as f:
+            Writer({"a": 1}, f).write()
+        assert snapshot_manager.stat("legacy") is None
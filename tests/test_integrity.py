@@ -0,0 +1,189 @@
+"""Tests for verify() and salvage()."""
+
+import pytest
+import shutil
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from src.snapshot.Integrity import verify, salvage
+from src.snapshot.Reader import Reader, CorruptSnapshotError
+from src.snapshot.Writer import Writer
+from src.snapshot.ParallelWriter import ParallelWriter
+from src.snapshot.DeltaWriter import DeltaWriter
+from src.snapshot.Footer import Footer
+from src.snapshot.Header import HEADER_SIZE
+from src.snapshot.Snapshot import SnapshotManager
+
+SOURCE = {f"key{i}": f"value {i}" * 3 for i in range(40)}
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def written(writer_class=Writer, **kwargs) -> bytes:
+    buffer = BytesIO()
+    writer_class(SOURCE, buffer, chunk_size=10, hash_keys=True, **kwargs).write()
+    return buffer.getvalue()
+
+
+def flip(data: bytes, position: int) -> bytes:
+    return data[:position] + bytes([data[position] ^ 0xFF]) + data[position + 1 :]
+
+
+def chunk_position(data: bytes, index: int) -> int:
+    "Absolute position of the middle of chunk `index`"
+    offset, length, _ = Footer.read(BytesIO(data)).chunks()[index]
+    body = HEADER_SIZE if data.startswith(b"\x89PSN") else 0
+    return body + offset + length // 2
+
+
+class TestVerify:
+    """Test cases for verify()."""
+
+    @pytest.mark.parametrize("header", [True, False])
+    def test_intact(self, header):
+        """Test an untouched snapshot verifies with every chunk checked."""
+        result = verify(BytesIO(written(header=header)))
+        assert result.ok
+        assert result.chunks == 4
+        assert result.bad_chunks == []
+
+    def test_parallel_writer_crcs(self):
+        """Test chunks encoded concurrently carry matching CRCs."""
+        data = written(ParallelWriter, executor="thread", header=True)
+        assert verify(BytesIO(data)).ok
+        assert verify(BytesIO(flip(data, chunk_position(data, 1)))).bad_chunks == [1]
+
+    def test_delta_writer_crcs(self):
+        """Test delta chunks carry matching CRCs."""
+        buffer = BytesIO()
+        DeltaWriter(SOURCE, buffer, base="base", chunk_size=10, header=True).write()
+        assert verify(BytesIO(buffer.getvalue())).chunks == 4
+        assert verify(BytesIO(buffer.getvalue())).ok
+
+    @pytest.mark.parametrize("header", [True, False])
+    def test_locates_bad_chunk(self, header):
+        """Test a flipped byte is reported against the chunk holding it."""
+        data = written(header=header)
+        result = verify(BytesIO(flip(data, chunk_position(data, 2))))
+        assert not result.ok
+        assert result.bad_chunks == [2]
+
+    def test_small_blocks(self):
+        """Test chunks spanning several read blocks are checked correctly."""
+        data = written(header=True)
+        assert verify(BytesIO(data), block_size=7).ok
+        damaged = flip(data, chunk_position(data, 3))
+        assert verify(BytesIO(damaged), block_size=7).bad_chunks == [3]
+
+    def test_damage_outside_chunks(self):
+        """Test the checksum catches damage to bytes no chunk covers."""
+        data = written(header=True)
+        # the EOF marker right after the last chunk
+        offset, length, _ = Footer.read(BytesIO(data)).chunks()[-1]
+        result = verify(BytesIO(flip(data, HEADER_SIZE + offset + length)))
+        assert result.bad_chunks == []
+        assert result.errors == ["checksum mismatch"]
+
+    def test_damaged_header(self):
+        """Test a damaged header is reported and chunks still checked."""
+        result = verify(BytesIO(flip(written(header=True), 10)))
+        assert result.header is None
+        assert result.chunks == 4
+        assert "header" in result.errors[0]
+
+    def test_truncated(self):
+        """Test a truncated file fails without decoding."""
+        data = written(header=True)
+        assert not verify(BytesIO(data[: len(data) // 2])).ok
+
+    def test_without_chunks_decodes(self):
+        """Test snapshots without header or chunks fall back to decoding."""
+        buffer = BytesIO()
+        Writer(SOURCE, buffer).write()
+        data = buffer.getvalue()
+        assert verify(BytesIO(data)).ok
+        assert not verify(BytesIO(data[:-20])).ok
+
+
+class TestSalvage:
+    """Test cases for salvage()."""
+
+    @pytest.mark.parametrize("header", [True, False])
+    def test_skips_bad_chunk(self, header):
+        """Test decoding resumes at the chunk after the damaged one."""
+        data = written(header=header)
+        data = flip(data, chunk_position(data, 1))
+
+        result, lost = salvage(BytesIO(data))
+        assert lost == 10
+        expected = {k: v for i, (k, v) in enumerate(SOURCE.items()) if i // 10 != 1}
+        assert result == expected
+
+    def test_intact(self):
+        """Test an undamaged snapshot salvages completely."""
+        assert salvage(BytesIO(written(header=True))) == (SOURCE, 0)
+
+    def test_without_chunks_keeps_prefix(self):
+        """Test the entries before the damage are kept without a directory."""
+        buffer = BytesIO()
+        Writer(SOURCE, buffer).write()
+        data = buffer.getvalue()
+        result, lost = salvage(BytesIO(data[: len(data) // 2]))
+        assert 0 < len(result) < len(SOURCE)
+        assert lost == len(SOURCE) - len(result)
+        assert all(SOURCE[key] == value for key, value in result.items())
+
+
+class TestStrictReads:
+    """Test cases for corruption signalled by Reader."""
+
+    def test_truncated_raises(self):
+        """Test a truncated snapshot raises instead of loading fewer keys."""
+        data = written(header=True)
+        with pytest.raises(CorruptSnapshotError):
+            Reader(BytesIO(data[: len(data) // 2])).read()
+
+    def test_missing_eof_raises(self):
+        """Test the EOF marker after the entries is required."""
+        buffer = BytesIO()
+        Writer({"a": 1}, buffer).write()
+        with pytest.raises(CorruptSnapshotError, match="EOF"):
+            Reader(BytesIO(buffer.getvalue()[:-1] + b"\x00")).read()
+
+
+class TestSnapshotManagerIntegrity:
+    """Test cases for SnapshotManager verify and salvage."""
+
+    def test_verify(self, temp_dir):
+        """Test verify by name, before and after damaging the file."""
+        manager = SnapshotManager(path=temp_dir)
+        path = manager.dump(SOURCE)
+        assert manager.verify(path.name).ok
+
+        data = path.read_bytes()
+        path.write_bytes(flip(data, HEADER_SIZE + 20))
+        assert not manager.verify(path.name).ok
+        with pytest.raises(CorruptSnapshotError):
+            manager.load()
+
+    def test_salvage_chain(self, temp_dir):
+        """Test salvage walks the delta chain and counts lost entries."""
+        manager = SnapshotManager(path=temp_dir)
+        base = manager.dump({"a": 1, "b": 2})
+        time.sleep(0.01)
+        manager.dump({"a": 1, "b": 3, "c": 4}, delta=True)
+        # damage the only chunk of the base
+        data = base.read_bytes()
+        base.write_bytes(flip(data, HEADER_SIZE + 3))
+
+        data, lost = manager.salvage()
+        assert data == {"b": 3, "c": 4}
+        assert lost == 2
+        assert manager.salvage(base.name) == ({}, 2)
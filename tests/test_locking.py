@@ -0,0 +1,220 @@
+"""Tests for directory locks and read leases between processes."""
+
+import pytest
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from src.snapshot.ChunkStore import CHUNK_DIR
+from src.snapshot.Locking import (
+    FileLock,
+    LOCK_NAME,
+    claim,
+    create_locked,
+    read_lease,
+)
+from src.snapshot.Retention import RetentionPolicy
+from src.snapshot.Snapshot import SnapshotManager
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork and flock")
+
+context = multiprocessing.get_context("fork")
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def try_lock(path: Path, results):
+    results.put(FileLock(path).acquire(blocking=False))
+
+
+def dump_many(path: Path, writer: int, count: int):
+    manager = SnapshotManager(path=path)
+    for i in range(count):
+        manager.dump({"writer": writer, "seq": i})
+
+
+def load_many(path: Path, seconds: float, errors):
+    manager = SnapshotManager(path=path)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            data = manager.load()
+            if data and data["check"] != data["writer"] * 1000 + data["seq"]:
+                errors.put("torn snapshot")
+        except Exception as e:
+            errors.put(repr(e))
+
+
+def write_for(path: Path, writer: int, seconds: float):
+    manager = SnapshotManager(path=path, retention=RetentionPolicy(last=3))
+    deadline = time.monotonic() + seconds
+    seq = 0
+    while time.monotonic() < deadline:
+        manager.dump({"writer": writer, "seq": seq, "check": writer * 1000 + seq})
+        seq += 1
+
+
+def run(*processes):
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+
+class TestFileLock:
+    """Test cases for the lock file itself."""
+
+    def test_excludes_other_processes(self, temp_dir):
+        """Test another process can't take the lock while it is held."""
+        lock = FileLock(temp_dir / LOCK_NAME)
+        results = context.Queue()
+        with lock.exclusive():
+            run(context.Process(target=try_lock, args=(temp_dir / LOCK_NAME, results)))
+        assert results.get() is False
+
+        run(context.Process(target=try_lock, args=(temp_dir / LOCK_NAME, results)))
+        assert results.get() is True
+
+    def test_reentrant(self, temp_dir):
+        """Test the holder can take the lock again."""
+        lock = FileLock(temp_dir / LOCK_NAME)
+        with lock.exclusive():
+            with lock.exclusive():
+                pass
+            assert not FileLock(temp_dir / LOCK_NAME).acquire(blocking=False)
+        assert FileLock(temp_dir / LOCK_NAME).acquire(blocking=False)
+
+    def test_lease_blocks_claim(self, temp_dir):
+        """Test a file can't be claimed while leased."""
+        path = temp_dir / "file"
+        path.write_bytes(b"data")
+        with read_lease(path) as leased:
+            assert leased
+            assert claim(path) is None
+        fd = claim(path)
+        assert fd is not None
+        os.close(fd)
+
+    def test_lease_of_missing_file(self, temp_dir):
+        """Test leasing a removed file reports it gone."""
+        with read_lease(temp_dir / "missing") as leased:
+            assert not leased
+
+    def test_create_locked_reclaims_stale_file(self, temp_dir):
+        """Test a file nobody holds, left by a crashed writer, is replaced."""
+        path = temp_dir / ".snap.tmp"
+        path.write_bytes(b"partial")
+        fd = create_locked(path)
+        try:
+            assert path.read_bytes() == b""
+            assert sorted(os.listdir(temp_dir)) == [".snap.tmp"]
+        finally:
+            os.close(fd)
+
+    def test_create_locked_refuses_held_file(self, temp_dir):
+        """Test a file still held by its writer isn't taken."""
+        path = temp_dir / ".snap.tmp"
+        fd = create_locked(path)
+        try:
+            with pytest.raises(FileExistsError):
+                create_locked(path)
+        finally:
+            os.close(fd)
+
+
+class TestSharedDirectory:
+    """Test cases for managers in several processes on one directory."""
+
+    def test_concurrent_dumps(self, temp_dir):
+        """Test dumps from several processes never take the same name."""
+        run(
+            *[
+                context.Process(target=dump_many, args=(temp_dir, writer, 10))
+                for writer in range(4)
+            ]
+        )
+        manager = SnapshotManager(path=temp_dir)
+        names = [entry.name for entry in manager.manifest()]
+        assert len(names) == len(set(names)) == 40
+        assert sorted(names) == sorted(p.name for p in manager.list())
+
+    def test_prune_skips_leased(self, temp_dir):
+        """Test prune leaves a snapshot being read and removes it later."""
+        manager = SnapshotManager(path=temp_dir)
+        oldest = manager.dump({"a": 1})
+        manager.dump({"a": 2})
+        with read_lease(oldest):
+            assert manager.prune() == 0
+            assert oldest.exists()
+            with pytest.raises(Exception, match="being read"):
+                manager.prune_snapshot(str(oldest))
+        assert manager.prune() == 1
+        assert not oldest.exists()
+
+    def test_retention_keeps_leased_base(self, temp_dir):
+        """Test a leased delta keeps the base it needs."""
+        manager = SnapshotManager(path=temp_dir)
+        base = manager.dump({"a": 1, "b": 2})
+        delta = manager.dump({"a": 1, "b": 3}, delta=True)
+        manager.dump({"a": 4})
+        with read_lease(delta):
+            assert manager.apply_retention(RetentionPolicy(last=1)) == []
+            assert base.exists() and delta.exists()
+        removed = manager.apply_retention(RetentionPolicy(last=1))
+        assert sorted(removed) == sorted([base.name, delta.name])
+
+    def test_load_picks_again_after_prune(self, temp_dir):
+        """Test a snapshot pruned before its lease is swapped for a newer one."""
+        manager = SnapshotManager(path=temp_dir)
+        gone = manager.dump({"a": 1})
+        latest = manager.dump({"a": 2})
+        gone.unlink()
+        picks = iter([gone, latest])
+        with manager._leased(lambda: next(picks)) as snapshot:
+            assert snapshot == latest
+
+    def test_chunks_pinned_in_another_process(self, temp_dir):
+        """Test chunks aren't freed while another store may be using them."""
+        manager = SnapshotManager(path=temp_dir, dedup=True)
+        other = SnapshotManager(path=temp_dir, dedup=True)
+        source = {f"k{i}": os.urandom(64).hex() for i in range(2000)}
+        first = manager.dump(source)
+        chunks = temp_dir / CHUNK_DIR
+        stored = {p for p in chunks.rglob("*") if p.is_file()}
+        manager.dump({"a": 1})
+
+        other._chunks.buffer("pending")
+        manager.prune_snapshot(str(first))
+        assert all(p.exists() for p in stored)
+
+        other._chunks.release("pending")
+        manager._track_chunks()
+        assert not any(p.exists() for p in stored)
+
+    def test_writers_and_readers(self, temp_dir):
+        """Test readers never fail or see a torn snapshot while writers prune."""
+        errors = context.Queue()
+        run(
+            *[
+                context.Process(target=write_for, args=(temp_dir, w, 1.0))
+                for w in range(2)
+            ],
+            *[
+                context.Process(target=load_many, args=(temp_dir, 1.0, errors))
+                for _ in range(2)
+            ],
+        )
+        assert errors.empty()
+        manager = SnapshotManager(path=temp_dir)
+        assert sorted(e.name for e in manager.manifest()) == sorted(
+            p.name for p in manager.list()
+        )
@@ -0,0 +1,260 @@
+"""Tests for Manifest class."""
+
+import pytest
+import os
+import tempfile
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from src.snapshot.Manifest import Manifest, ManifestEntry, MANIFEST_NAME, checksum
+from src.snapshot.Header import HEADER_SIZE
+from src.snapshot.Snapshot import SnapshotManager
+
+requires_fork = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def snapshot_manager(temp_dir):
+    """Create a SnapshotManager instance with a temp directory."""
+    return SnapshotManager(path=temp_dir)
+
+
+def entry(name, timestamp=0.0):
+    return ManifestEntry(name, timestamp, 10, 1, "00" * 8)
+
+
+class TestManifest:
+    """Test cases for Manifest class."""
+
+    def test_add_and_remove(self, temp_dir):
+        """Test entries are listed oldest first and removals drop them."""
+        manifest = Manifest(temp_dir, SnapshotManager._datetime_format)
+        manifest.add(entry("b", 2.0))
+        manifest.add(entry("a", 1.0))
+        manifest.add(entry("c", 3.0))
+        manifest.remove(["b"])
+
+        assert [e.name for e in manifest.entries()] == ["a", "c"]
+        assert manifest.get("b") is None
+        assert manifest.get("c") == entry("c", 3.0)
+
+    def test_duplicate_names_order(self, temp_dir):
+        """Test name_10 sorts after name_9 at the same timestamp."""
+        manifest = Manifest(temp_dir, SnapshotManager._datetime_format)
+        for name in ["s_10", "s_9", "s"]:
+            manifest.add(entry(name, 1.0))
+        assert [e.name for e in manifest.entries()] == ["s", "s_9", "s_10"]
+
+    def test_sees_appends_from_other_instances(self, temp_dir):
+        """Test an instance picks up lines appended by another one."""
+        first = Manifest(temp_dir, SnapshotManager._datetime_format)
+        second = Manifest(temp_dir, SnapshotManager._datetime_format)
+        first.add(entry("a"))
+        assert [e.name for e in second.entries()] == ["a"]
+        second.add(entry("b", 1.0))
+        first.remove(["a"])
+        assert [e.name for e in second.entries()] == ["b"]
+        assert [e.name for e in first.entries()] == ["b"]
+
+    def test_torn_line_is_skipped(self, temp_dir):
+        """Test a line cut short by a crash doesn't break later appends."""
+        manifest = Manifest(temp_dir, SnapshotManager._datetime_format)
+        manifest.add(entry("a"))
+        with open(temp_dir / MANIFEST_NAME, "ab") as f:
+            f.write(b"+\tb\t1.0\t1")
+
+        reopened = Manifest(temp_dir, SnapshotManager._datetime_format)
+        reopened.add(entry("c", 2.0))
+        assert [e.name for e in reopened.entries()] == ["a", "c"]
+
+    def test_compact(self, temp_dir):
+        """Test compact rewrites the file with the live entries only."""
+        manifest = Manifest(temp_dir, SnapshotManager._datetime_format)
+        for i in range(10):
+            manifest.add(entry(f"s{i}", float(i)))
+        manifest.remove([f"s{i}" for i in range(9)])
+        size = (temp_dir / MANIFEST_NAME).stat().st_size
+
+        manifest.compact()
+        assert (temp_dir / MANIFEST_NAME).stat().st_size < size
+        assert [e.name for e in manifest.entries()] == ["s9"]
+        other = Manifest(temp_dir, SnapshotManager._datetime_format)
+        assert [e.name for e in other.entries()] == ["s9"]
+
+    def test_timestamp_from_name(self, temp_dir):
+        """Test timestamps come from snapshot names, mtime otherwise."""
+        manifest = Manifest(temp_dir, SnapshotManager._datetime_format)
+        name = "2024-01-02_03-04-05-000006"
+        expected = manifest.timestamp(temp_dir / name)
+        assert manifest.timestamp(temp_dir / f"{name}_3") == expected
+
+        foreign = temp_dir / "foreign"
+        foreign.write_bytes(b"")
+        assert manifest.timestamp(foreign) == foreign.stat().st_mtime
+
+
+class TestSnapshotManagerManifest:
+    """Test cases for SnapshotManager manifest integration."""
+
+    def test_dump_records_entry(self, snapshot_manager):
+        """Test dump records the size, entry count and checksum."""
+        path = snapshot_manager.dump({"a": 1, "b": "two", "c": [3]})
+        (recorded,) = snapshot_manager.manifest()
+
+        data = path.read_bytes()
+        # the header checksum covers everything after the header
+        digest = checksum(data[HEADER_SIZE:])
+        assert recorded.name == path.name
+        assert recorded.size == len(data)
+        assert recorded.entries == 3
+        assert recorded.checksum == digest.hexdigest()
+
+    def test_delta_entry_count(self, snapshot_manager):
+        """Test a delta records the number of entries it holds."""
+        snapshot_manager.dump({"a": 1, "b": 2, "c": 3})
+        time.sleep(0.01)
+        snapshot_manager.dump({"a": 1, "b": 5, "c": 3}, delta=True)
+        assert [e.entries for e in snapshot_manager.manifest()] == [3, 1]
+
+    def test_prune_updates_manifest(self, snapshot_manager):
+        """Test prune and prune_snapshot remove their entries."""
+        paths = []
+        for i in range(3):
+            paths.append(snapshot_manager.dump({"i": i}))
+            time.sleep(0.01)
+        snapshot_manager.prune(max_prune=1)
+        assert not paths[0].exists()
+        snapshot_manager.prune_snapshot(str(paths[2]))
+        assert [e.name for e in snapshot_manager.manifest()] == [paths[1].name]
+
+    def test_rebuild_when_missing(self, snapshot_manager, temp_dir):
+        """Test a missing manifest is rebuilt by rescanning the directory."""
+        for i in range(3):
+            snapshot_manager.dump({"i": i})
+            time.sleep(0.01)
+        expected = snapshot_manager.manifest()
+        (temp_dir / MANIFEST_NAME).unlink()
+
+        assert SnapshotManager(path=temp_dir).manifest() == expected
+        assert SnapshotManager(path=temp_dir).load() == {"i": 2}
+
+    def test_deleted_snapshot_is_skipped(self, snapshot_manager):
+        """Test a snapshot removed behind the manifest is dropped from it."""
+        snapshot_manager.dump({"i": 1})
+        time.sleep(0.01)
+        snapshot_manager.dump({"i": 2}).unlink()
+        assert snapshot_manager.load() == {"i": 1}
+        assert len(snapshot_manager.manifest()) == 1
+
+    @requires_fork
+    def test_background_dump_is_recorded(self, snapshot_manager):
+        """Test a forked dump appends its entry to the parent's manifest."""
+        path = snapshot_manager.dump_background({"a": 1}).wait()
+        (recorded,) = snapshot_manager.manifest()
+        assert recorded.name == path.name
+        assert recorded.size == path.stat().st_size
+        assert snapshot_manager.list() == [path]
+
+
+@pytest.fixture
+def populated(temp_dir):
+    """Create a Manifest with entries at timestamps 10, 20, 30 and 40."""
+    manifest = Manifest(temp_dir, SnapshotManager._datetime_format)
+    for timestamp in (30.0, 10.0, 40.0, 20.0):
+        manifest.add(entry(f"s{int(timestamp)}", timestamp))
+    return manifest
+
+
+class TestManifestLookups:
+    """Test cases for Manifest timestamp lookups."""
+
+    def test_floor_and_ceiling(self, populated):
+        """Test floor and ceiling find the closest entry on either side."""
+        assert populated.floor(25.0).name == "s20"
+        assert populated.floor(20.0).name == "s20"
+        assert populated.floor(5.0) is None
+        assert populated.ceiling(25.0).name == "s30"
+        assert populated.ceiling(30.0).name == "s30"
+        assert populated.ceiling(45.0) is None
+
+    def test_nearest(self, populated):
+        """Test nearest picks the closest entry, the older one on a tie."""
+        assert populated.nearest(27.0).name == "s30"
+        assert populated.nearest(25.0).name == "s20"
+        assert populated.nearest(0.0).name == "s10"
+        assert populated.nearest(100.0).name == "s40"
+
+    def test_between(self, populated):
+        """Test range queries are inclusive and open ended."""
+        assert [e.name for e in populated.between(20.0, 30.0)] == ["s20", "s30"]
+        assert [e.name for e in populated.between(since=25.0)] == ["s30", "s40"]
+        assert [e.name for e in populated.between(until=15.0)] == ["s10"]
+        assert populated.between(31.0, 39.0) == []
+        assert populated.between(30.0, 20.0) == []
+
+    def test_around(self, populated):
+        """Test around yields entries by increasing distance."""
+        names = [e.name for e in populated.around(26.0)]
+        assert names == ["s30", "s20", "s40", "s10"]
+        assert [e.name for e in populated.around(26.0, since=25.0)] == ["s30", "s40"]
+
+    def test_order_kept_across_changes(self, populated):
+        """Test the sorted index stays valid through appends and removals."""
+        populated.remove(["s20"])
+        populated.add(entry("s50", 50.0))
+        populated.add(entry("s15", 15.0))
+        assert [e.timestamp for e in populated.entries()] == [
+            10.0,
+            15.0,
+            30.0,
+            40.0,
+            50.0,
+        ]
+        assert populated.floor(29.0).name == "s15"
+
+
+class TestSnapshotManagerLookups:
+    """Test cases for SnapshotManager timestamp lookups."""
+
+    def test_find_and_range(self, snapshot_manager):
+        """Test find and list(since, until) against real snapshots."""
+        paths = []
+        for i in range(3):
+            paths.append(snapshot_manager.dump({"i": i}))
+            time.sleep(0.01)
+        first, middle, last = snapshot_manager.manifest()
+        at = datetime.fromtimestamp(middle.timestamp)
+
+        assert snapshot_manager.find(at) == paths[1]
+        assert snapshot_manager.find(at - timedelta(microseconds=1)) == paths[1]
+        assert snapshot_manager.find(at, how="floor") == paths[1]
+        assert (
+            snapshot_manager.find(at - timedelta(microseconds=1), how="floor")
+            == paths[0]
+        )
+        assert (
+            snapshot_manager.find(at + timedelta(microseconds=1), how="ceiling")
+            == paths[2]
+        )
+        with pytest.raises(ValueError):
+            snapshot_manager.find(at, how="closest")
+
+        assert snapshot_manager.list(since=at) == [paths[2], paths[1]]
+        assert snapshot_manager.list(until=paths[1].name) == [paths[1], paths[0]]
+        assert snapshot_manager.list(paths[0].name, since=at) == [paths[1], paths[2]]
+        assert snapshot_manager.load(paths[2].name) == {"i": 2}
+
+    def test_find_empty(self, snapshot_manager):
+        """Test lookups in an empty directory."""
+        assert snapshot_manager.find(datetime.now()) is None
+        assert snapshot_manager.list(since=datetime.now()) == []
+        assert snapshot_manager.load(datetime.now()) == {}
@@ -0,0 +1,144 @@
+"""Tests for merging snapshots."""
+
+import pytest
+import shutil
+import tempfile
+from pathlib import Path
+from src.snapshot.Footer import Footer
+from src.snapshot.Integrity import verify
+from src.snapshot.Merge import first_wins
+from src.snapshot.Reader import CorruptSnapshotError
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def days():
+    """Create three overlapping dicts, like daily partitions."""
+    return [
+        {f"d{day}:{i}": {"day": day, "i": i} for i in range(1500)}
+        | {"shared": {"day": day}, f"only{day}": [day]}
+        for day in range(3)
+    ]
+
+
+def merged(parts: list) -> dict:
+    result = {}
+    for part in parts:
+        result.update(part)
+    return result
+
+
+def by_day(parts: list) -> dict:
+    result = {}
+    for part in parts:
+        for key, value in part.items():
+            result.setdefault(key, []).append(value)
+    return result
+
+
+class TestMerge:
+    """Test cases for SnapshotManager.merge()."""
+
+    def test_last_wins(self, temp_dir, days):
+        """Test the union of the snapshots is published, later ones winning."""
+        manager = SnapshotManager(path=temp_dir)
+        names = [manager.dump(day).name for day in days]
+        path = manager.merge(names)
+
+        assert manager.manifest()[-1].name == path.name
+        assert manager.load() == merged(days)
+        assert manager.load()["shared"] == {"day": 2}
+        assert manager.manifest()[-1].entries == len(merged(days))
+
+    def test_first_wins(self, temp_dir, days):
+        """Test first_wins keeps the value of the earliest snapshot."""
+        manager = SnapshotManager(path=temp_dir)
+        names = [manager.dump(day).name for day in days]
+        manager.merge(names, strategy=first_wins)
+        assert manager.load() == merged(reversed(days))
+
+    def test_custom_strategy(self, temp_dir, days):
+        """Test a custom strategy gets the values of shared keys in order."""
+        manager = SnapshotManager(path=temp_dir)
+        names = [manager.dump(day).name for day in days]
+        calls = []
+
+        def collect(key, values):
+            calls.append(key)
+            return values
+
+        manager.merge(names, strategy=collect)
+        assert calls == ["shared"]
+        assert manager.load()["shared"] == by_day(days)["shared"]
+        assert manager.load()["only1"] == [1]
+
+    def test_output_is_complete(self, temp_dir, days):
+        """Test the merged file has a checked header, chunks and digests."""
+        manager = SnapshotManager(path=temp_dir)
+        names = [manager.dump(day).name for day in days]
+        path = manager.merge(names)
+
+        with open(path, "rb") as f:
+            assert verify(f).ok
+            footer = Footer.read(f)
+        assert len(footer.chunks()) > 1
+        expected = SnapshotManager(path=temp_dir / "other").dump(merged(days))
+        with open(expected, "rb") as f:
+            assert footer.fingerprint() == Footer.read(f).fingerprint()
+        assert not manager.diff(names[-1], path.name).changed
+        assert manager.load_key("d0:7") == {"day": 0, "i": 7}
+
+    def test_delta_chains(self, temp_dir, days):
+        """Test deltas are merged as the state their chain describes."""
+        manager = SnapshotManager(path=temp_dir)
+        base = manager.dump(days[0])
+        changed = dict(days[0], **{"d0:3": "changed"})
+        del changed["d0:4"]
+        delta = manager.dump(changed, delta=True)
+        other = manager.dump(days[1])
+
+        manager.merge([delta.name, other.name])
+        assert manager.load() == merged([changed, days[1]])
+        manager.merge([other.name, base.name])
+        assert manager.load() == merged([days[1], days[0]])
+
+    def test_sharded_and_dedup(self, temp_dir, days):
+        """Test sharded inputs are merged into a deduplicated store."""
+        sharded = SnapshotManager(path=temp_dir, shards=3, dedup=True)
+        names = [sharded.dump(day, executor="thread").name for day in days[:2]]
+        path = sharded.merge(names)
+        assert sharded._shard_map(path) is None
+        assert sharded.load() == merged(days[:2])
+
+    def test_corrupt_chunk(self, temp_dir, days):
+        """Test a chunk failing its CRC isn't copied."""
+        manager = SnapshotManager(path=temp_dir)
+        names = [manager.dump(day).name for day in days[:2]]
+        path = temp_dir / names[0]
+        with open(path, "rb") as f:
+            footer = Footer.read(f)
+        offset, length, _ = footer.chunks()[0]
+        data = bytearray(path.read_bytes())
+        data[offset + length // 2 + 64] ^= 0xFF
+        path.write_bytes(bytes(data))
+
+        with pytest.raises(CorruptSnapshotError):
+            manager.merge(names)
+        assert [entry.name for entry in manager.manifest()] == names
+
+    def test_missing(self, temp_dir):
+        """Test unknown names and an empty list are refused."""
+        manager = SnapshotManager(path=temp_dir)
+        path = manager.dump({"a": 1})
+        with pytest.raises(FileNotFoundError):
+            manager.merge([path.name, "missing"])
+        with pytest.raises(ValueError):
+            manager.merge([])
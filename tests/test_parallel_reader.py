@@ -0,0 +1,114 @@
+"""Tests for ParallelReader class."""
+
+import pytest
+import tempfile
+import shutil
+from io import BytesIO
+from pathlib import Path
+from src.snapshot.ParallelReader import ParallelReader
+from src.snapshot.ParallelWriter import ParallelWriter
+from src.snapshot.Writer import Writer
+from src.snapshot.Reader import Reader
+from src.snapshot.Footer import Footer
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    temp_dir = tempfile.mkdtemp()
+    yield Path(temp_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a source dict with enough entries for several chunks."""
+    data = {f"key{i}": f"value{i}" for i in range(200)}
+    data["nested"] = {"level1": {"level2": "deep"}}
+    data["list"] = [1, "mixed", {"key": "value"}]
+    data["long"] = "compressible " * 50
+    return data
+
+
+def write_file(path, source, chunk_size=16):
+    with open(path, "wb") as f:
+        Writer(source, f, chunk_size=chunk_size).write()
+    return path
+
+
+class TestChunkedWriter:
+    """Test cases for chunked sequential writes."""
+
+    def test_records_chunks(self, source):
+        """Test Writer records chunk boundaries when chunk_size is set."""
+        buffer = BytesIO()
+        writer = Writer(source, buffer, chunk_size=50)
+        writer.write()
+
+        chunks = Footer.read(buffer).chunks()
+        assert chunks == writer.chunks
+        assert [count for _, _, count in chunks] == [50, 50, 50, 50, 3]
+
+    def test_matches_parallel_writer(self, source):
+        """Test sequential and parallel chunked writes are identical."""
+        sequential = BytesIO()
+        Writer(source, sequential, chunk_size=20).write()
+        parallel = BytesIO()
+        ParallelWriter(
+            source, parallel, workers=2, chunk_size=20, executor="thread"
+        ).write()
+        assert sequential.getvalue() == parallel.getvalue()
+
+    def test_chunked_output_readable(self, source):
+        """Test the plain Reader ignores the footer."""
+        buffer = BytesIO()
+        Writer(source, buffer, chunk_size=7).write()
+        buffer.seek(0)
+        assert Reader(buffer).read() == source
+
+
+class TestParallelReader:
+    """Test cases for ParallelReader class."""
+
+    def test_read_thread_executor(self, temp_dir, source):
+        """Test chunked file decoded on threads."""
+        path = write_file(temp_dir / "snap", source)
+        assert ParallelReader(path, workers=4, executor="thread").read() == source
+
+    def test_read_process_executor(self, temp_dir, source):
+        """Test chunked file decoded on worker processes."""
+        path = write_file(temp_dir / "snap", source, chunk_size=64)
+        assert ParallelReader(path, workers=2).read() == source
+
+    def test_preserves_key_order(self, temp_dir, source):
+        """Test merged dict keeps the written order."""
+        path = write_file(temp_dir / "snap", source)
+        loaded = ParallelReader(path, workers=3, executor="thread").read()
+        assert list(loaded) == list(source)
+
+    def test_read_without_footer(self, temp_dir, source):
+        """Test snapshots without a chunk directory are read sequentially."""
+        path = temp_dir / "snap"
+        with open(path, "wb") as f:
+            Writer(source, f).write()
+        assert ParallelReader(path, workers=2, executor="thread").read() == source
+
+    def test_read_empty_dict(self, temp_dir):
+        """Test reading an empty chunked snapshot."""
+        path = write_file(temp_dir / "snap", {})
+        assert ParallelReader(path, workers=2, executor="thread").read() == {}
+
+    def test_unknown_executor(self, temp_dir, source):
+        """Test an unknown executor name raises."""
+        path = write_file(temp_dir / "snap", source)
+        with pytest.raises(ValueError):
+            ParallelReader(path, workers=2, executor="fiber").read()
+
+    def test_snapshot_manager_parallel_load(self, temp_dir, source):
+        """Test SnapshotManager.load with workers."""
+        manager = SnapshotManager(path=temp_dir)
+        manager._chunk_size = 32
+        manager.dump(source)
+        assert manager.load(workers=2, executor="thread") == source
+        assert manager.load() == source
@@ -0,0 +1,126 @@
+"""Tests for ParallelWriter class."""
+
+import pytest
+import tempfile
+import shutil
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from src.snapshot.ParallelWriter import ParallelWriter
+from src.snapshot.Writer import Writer
+from src.snapshot.Reader import Reader
+from src.snapshot.Footer import Footer
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def source():
+    """Create a source dict with enough entries for several chunks."""
+    data = {f"key{i}": i for i in range(100)}
+    data["nested"] = {"level1": {"level2": "deep"}}
+    data["list"] = [1, "mixed", {"key": "value"}]
+    return data
+
+
+class TestParallelWriter:
+    """Test cases for ParallelWriter class."""
+
+    def test_round_trip_thread_executor(self, source):
+        """Test output of a threaded write is readable by Reader."""
+        buffer = BytesIO()
+        ParallelWriter(source, buffer, workers=4, executor="thread").write()
+        buffer.seek(0)
+        assert Reader(buffer).read() == source
+
+    def test_round_trip_process_executor(self, source):
+        """Test output of a multi-process write is readable by Reader."""
+        buffer = BytesIO()
+        ParallelWriter(source, buffer, workers=2, chunk_size=40).write()
+        buffer.seek(0)
+        assert Reader(buffer).read() == source
+
+    def test_preserves_key_order(self, source):
+        """Test chunks are concatenated in source order."""
+        buffer = BytesIO()
+        ParallelWriter(
+            source, buffer, workers=4, chunk_size=7, executor="thread"
+        ).write()
+        buffer.seek(0)
+        assert list(Reader(buffer).read()) == list(source)
+
+    def test_body_matches_sequential_writer(self, source):
+        """Test the body is byte-identical to a sequential write."""
+        sequential = BytesIO()
+        Writer(source, sequential).write()
+
+        parallel = BytesIO()
+        ParallelWriter(source, parallel, workers=3, executor="thread").write()
+
+        body = sequential.getvalue()
+        assert parallel.getvalue()[: len(body)] == body
+
+    def test_records_chunk_boundaries(self, source):
+        """Test chunk directory is recorded in the footer."""
+        buffer = BytesIO()
+        writer = ParallelWriter(
+            source, buffer, workers=2, chunk_size=10, executor="thread"
+        )
+        writer.write()
+
+        chunks = Footer.read(buffer).chunks()
+        assert chunks == writer.chunks
+        assert len(chunks) == 11
+        assert sum(count for _, _, count in chunks) == len(source)
+
+        # every chunk starts right where the previous one ended
+        for (offset, length, _), (next_offset, _, _) in zip(chunks, chunks[1:]):
+            assert offset + length == next_offset
+
+    def test_chunk_can_be_decoded_alone(self, source):
+        """Test each chunk decodes independently from its offset."""
+        buffer = BytesIO()
+        writer = ParallelWriter(
+            source, buffer, workers=2, chunk_size=25, executor="thread"
+        )
+        writer.write()
+
+        merged = {}
+        reader = Reader(buffer)
+        for offset, _, count in writer.chunks:
+            buffer.seek(offset)
+            for _ in range(count):
+                key, value = reader.read_key_value()
+                merged[key] = value
+        assert merged == source
+
+    def test_empty_source(self):
+        """Test writing an empty dict."""
+        buffer = BytesIO()
+        writer = ParallelWriter({}, buffer, workers=2, executor="thread")
+        writer.write()
+        buffer.seek(0)
+        assert Reader(buffer).read() == {}
+        assert writer.chunks == []
+
+    def test_external_executor(self, source):
+        """Test an executor instance is used and left running."""
+        buffer = BytesIO()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            ParallelWriter(source, buffer, workers=2, executor=executor).write()
+            assert executor.submit(lambda: 1).result() == 1
+        buffer.seek(0)
+        assert Reader(buffer).read() == source
+
+    def test_unknown_executor(self, source):
+        """Test an unknown executor name raises."""
+        with pytest.raises(ValueError):
+            ParallelWriter(source, BytesIO(), executor="fiber").write()
+
+    def test_snapshot_manager_parallel_dump(self, source):
+        """Test SnapshotManager.dump with workers."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            manager = SnapshotManager(path=temp_dir)
+            manager.dump(source, workers=2, executor="thread")
+            assert manager.load() == source
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
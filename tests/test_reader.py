@@ -286,3 +286,15 @@ class TestReader:
 
         read_dict = reader.read()
         assert read_dict == original_source
+
+    def test_round_trip_compressed_string(self, writer_reader_pair):
+        """Test round-trip of a string long enough to be compressed."""
+        writer, reader, buffer = writer_reader_pair
+        original_value = "compressible " * 20
+
+        writer.write_key_value("text", original_value)
+        buffer.seek(0)
+
+        read_key, read_value = reader.read_key_value()
+        assert read_key == "text"
+        assert read_value == original_value
@@ -0,0 +1,260 @@
+"""Tests for shipping snapshots over sockets."""
+
+import pytest
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from src.snapshot.Replication import (
+    DATA,
+    ERROR,
+    OFFER,
+    SnapshotReceiver,
+    SnapshotSender,
+    connect,
+    read_frame,
+    send_frame,
+)
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Storage import MemoryBackend, temp_path
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict that encodes to a few hundred KiB."""
+    return {f"k{i}": os.urandom(64).hex() for i in range(3000)}
+
+
+@pytest.fixture
+def replica(temp_dir):
+    """Serve a receiver on a localhost socket."""
+    manager = SnapshotManager(path=temp_dir / "replica")
+    receiver = SnapshotReceiver(manager, timeout=5)
+    listener = socket.create_server(("127.0.0.1", 0))
+    thread = threading.Thread(target=receiver.serve, args=(listener,), daemon=True)
+    thread.start()
+    yield manager, receiver, listener.getsockname()
+    listener.shutdown(socket.SHUT_RDWR)
+    listener.close()
+    thread.join(5)
+    receiver.close()
+
+
+class Flaky:
+    "Socket that drops the connection, or corrupts a byte, once `limit` bytes went out"
+
+    def __init__(self, sock: socket.socket, limit: int, corrupt: bool = False):
+        self._sock = sock
+        self._limit = limit
+        self._corrupt = corrupt
+        self._sent = 0
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._sock.close()
+
+    def sendall(self, data):
+        data = bytearray(data)
+        if self._sent + len(data) > self._limit:
+            if not self._corrupt:
+                self._sock.shutdown(socket.SHUT_RDWR)
+                raise ConnectionResetError("dropped")
+            data[-1] ^= 0xFF
+            self._limit = float("inf")
+        self._sent += len(data)
+        self._sock.sendall(data)
+
+
+def flaky_once(address, limit: int, corrupt: bool = False):
+    connections = []
+
+    def open_connection():
+        sock = connect(address, timeout=5)
+        connections.append(sock)
+        return Flaky(sock, limit, corrupt) if len(connections) == 1 else sock
+
+    return open_connection
+
+
+class TestReplication:
+    """Test cases for a sender and a receiver on a local socket."""
+
+    def test_ship_latest(self, temp_dir, source, replica):
+        """Test the replica gets the same bytes and lists the snapshot."""
+        manager, receiver, address = replica
+        primary = SnapshotManager(path=temp_dir / "primary")
+        path = primary.dump(source)
+
+        assert primary.replicate(address, chunk_size=16 * 1024) == [path.name]
+        assert (manager._path / path.name).read_bytes() == path.read_bytes()
+        assert manager.manifest()[0] == primary.manifest()[0]
+        assert manager.load() == source
+        assert receiver.received == [path.name]
+
+    def test_already_replicated(self, temp_dir, source, replica):
+        """Test a snapshot the replica has isn't sent again."""
+        _, _, address = replica
+        primary = SnapshotManager(path=temp_dir / "primary")
+        primary.dump(source)
+        primary.replicate(address)
+        sender = SnapshotSender(primary, address)
+
+        assert sender.send() == []
+        assert sender.bytes_sent == 0
+
+    def test_delta_ships_missing_bases(self, temp_dir, source, replica):
+        """Test a delta goes after the bases the replica lacks."""
+        manager, _, address = replica
+        primary = SnapshotManager(path=temp_dir / "primary")
+        base = primary.dump(source)
+        primary.replicate(address)
+        changed = dict(source, k1="changed")
+        delta = primary.dump(changed, delta=True)
+
+        assert primary.replicate(address) == [delta.name]
+        assert manager.load() == changed
+        assert [e.name for e in manager.manifest()] == [base.name, delta.name]
+
+    def test_named_snapshot(self, temp_dir, replica):
+        """Test an older snapshot is shipped by name."""
+        manager, _, address = replica
+        primary = SnapshotManager(path=temp_dir / "primary")
+        old = primary.dump({"a": 1})
+        primary.dump({"a": 2})
+        assert primary.replicate(address, old.name) == [old.name]
+        assert manager.load() == {"a": 1}
+        with pytest.raises(FileNotFoundError):
+            primary.replicate(address, "missing")
+
+    def test_resume_after_disconnect(self, temp_dir, source, replica):
+        """Test a dropped connection carries on from the acknowledged chunks."""
+        manager, _, address = replica
+        primary = SnapshotManager(path=temp_dir / "primary")
+        path = primary.dump(source)
+        size = path.stat().st_size
+        sender = SnapshotSender(
+            primary,
+            flaky_once(address, size // 2),
+            chunk_size=8 * 1024,
+            window=2,
+            backoff=0,
+        )
+
+        assert sender.send() == [path.name]
+        assert sender.reconnects == 1
+        assert sender.bytes_resumed > 0
+        assert sender.bytes_sent < size + size // 2
+        assert manager.load() == source
+
+    def test_stale_temp_is_reclaimed(self, temp_dir, source, replica):
+        """Test a temp left by a crashed receiver doesn't block the snapshot."""
+        manager, _, address = replica
+        primary = SnapshotManager(path=temp_dir / "primary")
+        path = primary.dump(source)
+        temp_path(manager._path / path.name).write_bytes(b"partial")
+
+        assert primary.replicate(address) == [path.name]
+        assert manager.load() == source
+
+    def test_corrupt_chunk_is_refused(self, temp_dir, source, replica):
+        """Test a chunk failing its CRC is sent again, not written."""
+        manager, _, address = replica
+        primary = SnapshotManager(path=temp_dir / "primary")
+        path = primary.dump(source)
+        sender = SnapshotSender(
+            primary,
+            flaky_once(address, path.stat().st_size // 3, corrupt=True),
+            chunk_size=8 * 1024,
+            backoff=0,
+        )
+
+        sender.send()
+        assert sender.reconnects == 1
+        assert (manager._path / path.name).read_bytes() == path.read_bytes()
+
+    def test_gives_up(self, temp_dir, source):
+        """Test the error surfaces once the retries are used up."""
+        primary = SnapshotManager(path=temp_dir / "primary")
+        primary.dump(source)
+
+        def refuse():
+            raise ConnectionRefusedError
+
+        with pytest.raises(ConnectionRefusedError):
+            SnapshotSender(primary, refuse, retries=2, backoff=0).send()
+
+    def test_dedup_and_memory_storage(self, temp_dir, source):
+        """Test recipes are shipped resolved into any storage."""
+        primary = SnapshotManager(path=temp_dir / "primary", dedup=True)
+        primary.dump(source)
+        manager = SnapshotManager(path=temp_dir / "replica", storage=MemoryBackend())
+        left, right = socket.socketpair()
+        thread = threading.Thread(
+            target=SnapshotReceiver(manager).handle, args=(right,)
+        )
+        thread.start()
+        with left:
+            SnapshotSender(primary, lambda: left).send()
+        thread.join(5)
+        assert manager.load() == source
+
+    def test_sharded_refused(self, temp_dir, replica):
+        """Test sharded snapshots aren't shipped as their shard map."""
+        primary = SnapshotManager(path=temp_dir / "primary", shards=2)
+        primary.dump({"a": 1})
+        with pytest.raises(ValueError):
+            primary.replicate(replica[2])
+
+    @pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+    def test_unix_socket(self, temp_dir, source):
+        """Test a path is connected to as a Unix socket."""
+        manager = SnapshotManager(path=temp_dir / "replica")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(temp_dir / "replica.sock"))
+        listener.listen()
+        thread = threading.Thread(
+            target=lambda: SnapshotReceiver(manager).handle(listener.accept()[0])
+        )
+        thread.start()
+        primary = SnapshotManager(path=temp_dir / "primary")
+        primary.dump(source)
+        primary.replicate(str(temp_dir / "replica.sock"))
+        thread.join(5)
+        listener.close()
+        assert manager.load() == source
+
+
+class TestReceiver:
+    """Test cases for what the receiver refuses."""
+
+    def test_invalid_name(self, replica):
+        """Test names that would leave the directory are refused."""
+        _, _, address = replica
+        with connect(address, 5) as sock, sock.makefile("rb") as stream:
+            send_frame(sock, OFFER, struct.pack("<Q", 10) + b"../escape")
+            kind, message = read_frame(stream)
+        assert kind == ERROR and b"Invalid" in message
+
+    def test_unexpected_message(self, replica):
+        """Test data without an offer ends the connection with an error."""
+        _, _, address = replica
+        with connect(address, 5) as sock, sock.makefile("rb") as stream:
+            send_frame(sock, DATA, b"\0" * 12)
+            assert read_frame(stream)[0] == ERROR
+            assert read_frame(stream) is None
@@ -0,0 +1,299 @@
+"""Tests for retention policies and pruning."""
+
+import pytest
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from src.snapshot.Manifest import ManifestEntry
+from src.snapshot.Retention import RetentionIndex, RetentionPolicy
+from src.snapshot.Snapshot import SnapshotManager
+
+NOW = datetime(2024, 6, 15, 12, 30).timestamp()
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def entries(ages: list, size: int = 100) -> list:
+    "Manifest entries `ages` seconds old, oldest first"
+    return [
+        ManifestEntry(f"s{i}", NOW - age, size, 1, "")
+        for i, age in enumerate(sorted(ages, reverse=True))
+    ]
+
+
+def names(expired: list) -> list:
+    return [entry.name for entry in expired]
+
+
+class TestRetentionPolicy:
+    """Test cases for what a policy keeps."""
+
+    def test_no_rules_keeps_everything(self):
+        """Test an empty policy drops nothing."""
+        assert RetentionPolicy().expired(entries([30, 20, 10]), now=NOW) == []
+
+    def test_last(self):
+        """Test last=N drops all but the newest N."""
+        expired = RetentionPolicy(last=2).expired(entries([40, 30, 20, 10]), now=NOW)
+        assert names(expired) == ["s0", "s1"]
+
+    def test_hourly(self):
+        """Test hourly keeps the newest snapshot of each recent hour."""
+        ages = [m * 60 for m in (5, 20, 70, 80, 130, 200)]
+        expired = RetentionPolicy(hourly=2).expired(entries(ages), now=NOW)
+        # newest first: 5m and 20m share 12h, 70m and 80m share 11h
+        assert names(expired) == ["s0", "s1", "s2", "s4"]
+
+    def test_daily_and_last_combine(self):
+        """Test a snapshot is kept when any rule keeps it."""
+        day = 24 * 3600
+        ages = [3 * day, 2 * day, day + 60, day, 120, 60]
+        policy = RetentionPolicy(last=1, daily=3)
+        kept = {e.name for e in entries(ages)} - set(
+            names(policy.expired(entries(ages), now=NOW))
+        )
+        assert kept == {"s5", "s3", "s1"}
+
+    def test_max_age(self):
+        """Test max_age drops old snapshots but never the newest."""
+        expired = RetentionPolicy(max_age=25).expired(
+            entries([40, 30, 20, 10]), now=NOW
+        )
+        assert names(expired) == ["s0", "s1"]
+        expired = RetentionPolicy(max_age=1).expired(entries([40, 30]), now=NOW)
+        assert names(expired) == ["s0"]
+
+    def test_max_bytes(self):
+        """Test max_bytes drops the oldest until the rest fit."""
+        expired = RetentionPolicy(max_bytes=250).expired(
+            entries([40, 30, 20, 10], size=100), now=NOW
+        )
+        assert names(expired) == ["s0", "s1"]
+
+    def test_bases_of_kept_deltas_are_kept(self):
+        """Test a kept delta keeps its whole chain."""
+        bases = {"s3": "s2", "s2": "s1"}
+        expired = RetentionPolicy(last=1).expired(
+            entries([40, 30, 20, 10]), base=bases.get, now=NOW
+        )
+        assert names(expired) == ["s0"]
+
+
+class FakeManifest:
+    "Entries and change events the way Manifest reports them"
+
+    def __init__(self):
+        self.live = []
+        self.version = 0
+        self.observers = []
+
+    def observe(self, observer):
+        self.observers.append(observer)
+
+    def add(self, entry):
+        self.live.append(entry)
+        self.changed("+", entry)
+
+    def remove(self, entry):
+        self.live.remove(entry)
+        self.changed("-", entry)
+
+    def changed(self, kind, entry=None):
+        self.version += 1
+        for observer in self.observers:
+            observer(self.version, kind, entry)
+
+    def refresh(self):
+        pass
+
+    def snapshot(self):
+        return self.version, list(self.live)
+
+
+class TestRetentionIndex:
+    """Test cases for retention kept up to date as snapshots come and go."""
+
+    POLICIES = [
+        RetentionPolicy(last=3),
+        RetentionPolicy(hourly=4),
+        RetentionPolicy(last=2, hourly=3, daily=2),
+        RetentionPolicy(daily=2, max_age=30 * 3600),
+        RetentionPolicy(last=5, max_bytes=1200),
+        RetentionPolicy(max_age=5 * 3600),
+        RetentionPolicy(max_bytes=900),
+        RetentionPolicy(last=0, daily=1),
+    ]
+
+    @pytest.mark.parametrize("policy", POLICIES, ids=repr)
+    def test_matches_full_evaluation(self, policy):
+        """Test each evaluation drops what the policy drops from the whole list."""
+        rng = random.Random(repr(policy))
+        manifest, bases = FakeManifest(), {}
+        index = RetentionIndex(policy, bases.get)
+        manifest.observe(index.changed)
+        now = NOW
+        for i in range(300):
+            now += rng.choice([60, 600, 1800, 3600, 5 * 3600])
+            name = f"s{i}"
+            if manifest.live and rng.random() < 0.3:
+                bases[name] = manifest.live[-1].name
+            manifest.add(ManifestEntry(name, now, rng.randint(50, 300), 1, ""))
+            needed = {bases.get(entry.name) for entry in manifest.live}
+            spare = [e for e in manifest.live[:-1] if e.name not in needed]
+            if spare and rng.random() < 0.05:
+                # removed by hand, not by the policy
+                manifest.remove(rng.choice(spare))
+
+            expected = policy.expired(manifest.live, bases.get, now)
+            assert names(index.expired(manifest, now)) == names(expected)
+            for entry in expected:
+                manifest.remove(entry)
+
+    def test_only_looks_at_changed_entries(self):
+        """Test an evaluation doesn't look up the bases of every entry again."""
+        manifest, lookups = FakeManifest(), []
+        index = RetentionIndex(
+            RetentionPolicy(last=1000), lambda name: lookups.append(name)
+        )
+        manifest.observe(index.changed)
+        for i in range(2000):
+            manifest.add(ManifestEntry(f"s{i}", NOW + i, 100, 1, ""))
+            for entry in index.expired(manifest, NOW + i):
+                manifest.remove(entry)
+        assert len(manifest.live) == 1000
+        assert len(lookups) == 2000
+
+    def test_unremoved_entries_expire_again(self):
+        """Test an expired entry that couldn't be removed is reported again."""
+        manifest = FakeManifest()
+        index = RetentionIndex(RetentionPolicy(last=1), lambda name: None)
+        manifest.observe(index.changed)
+        manifest.add(ManifestEntry("s0", NOW, 100, 1, ""))
+        manifest.add(ManifestEntry("s1", NOW + 1, 100, 1, ""))
+        assert names(index.expired(manifest, NOW + 1)) == ["s0"]
+        assert names(index.expired(manifest, NOW + 2)) == ["s0"]
+
+    def test_reload_starts_over(self):
+        """Test a reloaded manifest is read again as a whole."""
+        manifest = FakeManifest()
+        index = RetentionIndex(RetentionPolicy(last=1), lambda name: None)
+        manifest.observe(index.changed)
+        manifest.add(ManifestEntry("s1", NOW + 1, 100, 1, ""))
+        assert index.expired(manifest, NOW) == []
+        manifest.live.insert(0, ManifestEntry("s0", NOW, 100, 1, ""))
+        manifest.changed(None)
+        assert names(index.expired(manifest, NOW)) == ["s0"]
+
+
+class TestSnapshotManagerRetention:
+    """Test cases for retention through the manager."""
+
+    def dump(self, manager: SnapshotManager, count: int, **kwargs) -> list:
+        paths = []
+        for i in range(count):
+            paths.append(manager.dump({"i": i}, **kwargs))
+            time.sleep(0.002)
+        return paths
+
+    def test_prune_removes_oldest(self, temp_dir):
+        """Test prune() removes the oldest snapshots, not the newest."""
+        manager = SnapshotManager(path=temp_dir)
+        paths = self.dump(manager, 4)
+
+        assert manager.prune(max_prune=2) == 2
+        assert [p.exists() for p in paths] == [False, False, True, True]
+        assert manager.load() == {"i": 3}
+
+    def test_prune_keeps_needed_bases(self, temp_dir):
+        """Test prune() doesn't break a delta chain."""
+        manager = SnapshotManager(path=temp_dir)
+        base = manager.dump({"a": 1})
+        time.sleep(0.002)
+        manager.dump({"a": 2}, delta=True)
+
+        assert manager.prune(max_prune=1) == 0
+        assert base.exists()
+        assert manager.load() == {"a": 2}
+
+    def test_prune_failure_is_logged(self, temp_dir, monkeypatch, caplog):
+        """Test a snapshot that can't be removed is logged and stays listed."""
+        manager = SnapshotManager(path=temp_dir)
+        paths = self.dump(manager, 2)
+
+        def delete(name):
+            raise PermissionError(name)
+
+        monkeypatch.setattr(manager._storage, "delete", delete)
+        assert manager.prune(max_prune=1) == 0
+        assert "Could not prune snapshot" in caplog.text
+        assert [entry.name for entry in manager.manifest()] == [
+            path.name for path in paths
+        ]
+
+    def test_apply_retention(self, temp_dir):
+        """Test apply_retention() removes what the policy drops."""
+        manager = SnapshotManager(path=temp_dir)
+        paths = self.dump(manager, 5)
+
+        removed = manager.apply_retention(RetentionPolicy(last=2))
+        assert removed == [p.name for p in paths[:3]]
+        assert [e.name for e in manager.manifest()] == [p.name for p in paths[3:]]
+        assert manager.apply_retention(RetentionPolicy(last=2)) == []
+
+    def test_applied_after_every_dump(self, temp_dir):
+        """Test a policy given at creation bounds the snapshot count."""
+        manager = SnapshotManager(path=temp_dir, retention=RetentionPolicy(last=3))
+        paths = self.dump(manager, 6)
+
+        assert [e.name for e in manager.manifest()] == [p.name for p in paths[3:]]
+        assert sorted(f.name for f in temp_dir.iterdir() if f.name[0] != ".") == [
+            p.name for p in paths[3:]
+        ]
+
+    def test_max_bytes_bounds_disk_use(self, temp_dir):
+        """Test max_bytes keeps the stored total under the cap."""
+        manager = SnapshotManager(path=temp_dir)
+        self.dump(manager, 6)
+        size = manager.manifest()[-1].size
+
+        manager.apply_retention(RetentionPolicy(max_bytes=size * 2))
+        assert sum(e.size for e in manager.manifest()) <= size * 2
+
+    def test_retention_with_delta_chain(self, temp_dir):
+        """Test deltas keep the snapshots they are built on."""
+        manager = SnapshotManager(path=temp_dir, retention=RetentionPolicy(last=1))
+        manager.dump({"a": 1, "b": 1})
+        for i in range(3):
+            time.sleep(0.002)
+            manager.dump({"a": 1, "b": i + 2}, delta=True)
+
+        assert len(manager.manifest()) == 4
+        assert manager.load() == {"a": 1, "b": 4}
+
+    def test_no_policy(self, temp_dir):
+        """Test apply_retention() needs a policy."""
+        with pytest.raises(ValueError):
+            SnapshotManager(path=temp_dir).apply_retention()
+
+    def test_does_not_stat_snapshots(self, temp_dir, monkeypatch):
+        """Test retention decides from the manifest alone."""
+        manager = SnapshotManager(path=temp_dir)
+        self.dump(manager, 5)
+        for entry in manager.manifest():
+            manager._base(entry.name)
+
+        def stat(*args, **kwargs):
+            raise AssertionError("stat called")
+
+        monkeypatch.setattr(manager._storage, "stat", stat)
+        monkeypatch.setattr(manager._storage, "list", stat)
+        assert len(manager.apply_retention(RetentionPolicy(last=1))) == 4
@@ -0,0 +1,214 @@
+"""Tests for the threshold-driven dump scheduler."""
+
+import pytest
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from src.snapshot.Scheduler import SnapshotScheduler
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.TrackedDict import TrackedDict
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class TestRules:
+    """Test cases for when a dump is due, driven by check()."""
+
+    def scheduler(self, temp_dir, source, **kwargs) -> SnapshotScheduler:
+        kwargs.setdefault("jitter", 0)
+        return SnapshotScheduler(SnapshotManager(path=temp_dir), source, **kwargs)
+
+    def test_needs_time_and_changes(self, temp_dir):
+        """Test a rule fires only once both thresholds are met."""
+        source = TrackedDict()
+        scheduler = self.scheduler(temp_dir, source, rules=[(10, 2)])
+        start = scheduler._last
+
+        source["a"] = 1
+        assert scheduler.check(start + 20) is None
+        source["b"] = 2
+        assert scheduler.check(start + 5) is None
+        assert scheduler.check(start + 20) is not None
+        assert scheduler.dumps == 1 and scheduler.changes == 0
+
+    def test_any_rule_triggers(self, temp_dir):
+        """Test the first rule met triggers the dump."""
+        source = TrackedDict()
+        scheduler = self.scheduler(temp_dir, source, rules=[(100, 1), (1, 3)])
+        start = scheduler._last
+        for i in range(3):
+            source[i] = i
+
+        assert scheduler.check(start + 2) is not None
+
+    def test_no_changes_no_dump(self, temp_dir):
+        """Test time alone never triggers a dump."""
+        scheduler = self.scheduler(temp_dir, TrackedDict(), rules=[(1, 1)])
+        assert scheduler.check(scheduler._last + 100) is None
+
+    def test_recorded_changes(self, temp_dir):
+        """Test plain dicts count what record() reports."""
+        source = {"a": 1}
+        scheduler = self.scheduler(temp_dir, source, rules=[(1, 5)])
+        scheduler.record(4)
+        assert scheduler.check(scheduler._last + 2) is None
+        scheduler.record()
+        path = scheduler.check(scheduler._last + 2)
+
+        assert path is not None and scheduler.changes == 0
+        assert SnapshotManager(path=temp_dir).load() == source
+
+    def test_lag(self, temp_dir):
+        """Test lag measures how late the dump started."""
+        source = TrackedDict()
+        scheduler = self.scheduler(temp_dir, source, rules=[(10, 1)])
+        start = scheduler._last
+        source["a"] = 1
+        scheduler.due(start + 1)
+
+        scheduler.check(start + 13)
+        assert scheduler.last_lag == pytest.approx(3)
+        assert scheduler.max_lag == pytest.approx(3)
+        assert scheduler.last_duration > 0
+
+    def test_jitter_stretches_thresholds(self, temp_dir):
+        """Test jitter delays the time threshold by at most its fraction."""
+        source = TrackedDict()
+        scheduler = self.scheduler(temp_dir, source, rules=[(10, 1)], jitter=0.5)
+        start = scheduler._last
+        source["a"] = 1
+
+        assert 1.0 <= scheduler._stretch <= 1.5
+        assert scheduler.due(start + 10 * scheduler._stretch - 0.01) is None
+        assert scheduler.due(start + 15) is not None
+
+    def test_trigger(self, temp_dir):
+        """Test trigger() forces the next check to dump."""
+        scheduler = self.scheduler(temp_dir, {"a": 1}, rules=[(100, 100)])
+        scheduler.trigger()
+        assert scheduler.check() is not None
+
+    def test_failed_dump_is_retried_later(self, temp_dir):
+        """Test a failing dump is recorded and retried after `retry`."""
+        source = TrackedDict()
+        scheduler = self.scheduler(temp_dir, source, rules=[(0, 1)], retry=10)
+        source["a"] = object()
+        now = scheduler._last
+        with pytest.raises(Exception):
+            scheduler.check(now)
+
+        assert scheduler.errors == 1 and scheduler.last_error is not None
+        assert scheduler.due(scheduler._failed_at + 1) is None
+        source["a"] = 1
+        assert scheduler.check(scheduler._failed_at + 11) is not None
+
+    def test_needs_a_rule(self, temp_dir):
+        """Test an empty rule list is refused."""
+        with pytest.raises(ValueError):
+            self.scheduler(temp_dir, {}, rules=[])
+
+
+class TestScheduledDumps:
+    """Test cases for the scheduler thread."""
+
+    def test_dumps_in_background(self, temp_dir):
+        """Test the thread dumps once the rule is met."""
+        manager = SnapshotManager(path=temp_dir)
+        source = TrackedDict()
+        scheduler = manager.schedule(source, rules=[(0.05, 2)], interval=0.01)
+        try:
+            source["a"] = 1
+            source["b"] = 2
+            assert wait_for(lambda: scheduler.dumps == 1)
+            assert manager.load() == {"a": 1, "b": 2}
+        finally:
+            scheduler.stop()
+        assert not scheduler.running
+
+    def test_dumps_never_overlap(self, temp_dir):
+        """Test a slow dump delays the next one instead of running beside it."""
+        manager = SnapshotManager(path=temp_dir)
+        running = []
+        overlapped = []
+        dump = manager.dump
+
+        def slow(source, **kwargs):
+            overlapped.append(bool(running))
+            running.append(1)
+            time.sleep(0.05)
+            running.pop()
+            return dump(source, **kwargs)
+
+        manager.dump = slow
+        # overwriting values doesn't upset a dump iterating the dict
+        source = {i: 0 for i in range(5)}
+        scheduler = manager.schedule(source, rules=[(0, 1)], interval=0.001)
+        try:
+            for i in range(50):
+                source[i % 5] = i
+                scheduler.record()
+                time.sleep(0.002)
+            assert wait_for(lambda: scheduler.dumps >= 2)
+        finally:
+            scheduler.stop()
+        assert not any(overlapped)
+        assert scheduler.dumps < 50
+
+    def test_lock_excludes_writers(self, temp_dir):
+        """Test the lock is held while dumping."""
+        manager = SnapshotManager(path=temp_dir)
+        lock = threading.Lock()
+        held = []
+        dump = manager.dump
+
+        def check(source, **kwargs):
+            held.append(lock.locked())
+            return dump(source, **kwargs)
+
+        manager.dump = check
+        scheduler = manager.schedule({"a": 1}, rules=[(0, 1)], interval=0.01, lock=lock)
+        with lock:
+            scheduler.record()
+        assert wait_for(lambda: scheduler.dumps == 1)
+        scheduler.stop()
+        assert held == [True]
+
+    def test_stop_flushes(self, temp_dir):
+        """Test stop(flush=True) dumps the pending changes."""
+        manager = SnapshotManager(path=temp_dir)
+        source = TrackedDict()
+        with manager.schedule(source, rules=[(3600, 1)], interval=0.01):
+            source["a"] = 1
+        assert manager.load() == {"a": 1}
+
+    def test_background_fork(self, temp_dir):
+        """Test background=True dumps through dump_background()."""
+        manager = SnapshotManager(path=temp_dir)
+        source = TrackedDict()
+        scheduler = manager.schedule(
+            source, rules=[(0, 1)], interval=0.01, background=True
+        )
+        try:
+            source["a"] = 1
+            assert wait_for(lambda: scheduler.dumps == 1)
+        finally:
+            scheduler.stop()
+        assert scheduler.changes == 0
+        assert SnapshotManager(path=temp_dir).load() == {"a": 1}
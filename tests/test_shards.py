@@ -0,0 +1,203 @@
+"""Tests for sharded snapshots."""
+
+import pytest
+import shutil
+import tempfile
+from pathlib import Path
+from src.snapshot.Shards import ShardMap, shard_of, shard_name
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.TrackedDict import TrackedDict
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict spread over every shard."""
+    return {f"key:{i}": {"n": i, "tags": [i, str(i)]} for i in range(500)}
+
+
+def sharded(path: Path, **kwargs) -> SnapshotManager:
+    return SnapshotManager(path=path, shards=4, durability="none", **kwargs)
+
+
+class TestShardMap:
+    """Test cases for the shard map format."""
+
+    def test_pack_unpack_roundtrip(self, temp_dir):
+        """Test shards inside the directory are stored relative to it."""
+        other = temp_dir.parent / "elsewhere" / "shard"
+        shard_map = ShardMap([temp_dir / ".a.shard0000", other])
+
+        data = shard_map.pack(temp_dir)
+        assert str(temp_dir).encode() not in data
+        assert ShardMap.unpack(data, temp_dir).paths == shard_map.paths
+
+    def test_damaged_map_raises(self, temp_dir):
+        """Test a flipped byte fails the map CRC."""
+        data = bytearray(ShardMap([temp_dir / "a"]).pack(temp_dir))
+        data[-5] ^= 0xFF
+        with pytest.raises(ValueError, match="checksum"):
+            ShardMap.unpack(bytes(data), temp_dir)
+
+    def test_read_plain_snapshot(self, temp_dir):
+        """Test read() tells regular snapshots apart."""
+        path = SnapshotManager(path=temp_dir).dump({"a": 1})
+        assert ShardMap.read(path) is None
+
+    def test_shard_of_is_stable(self):
+        """Test keys land on the same shard every time."""
+        assert shard_of("key", 8) == shard_of("key", 8)
+        assert {shard_of(f"k{i}", 8) for i in range(100)} == set(range(8))
+
+
+class TestSnapshotManagerShards:
+    """Test cases for sharded dumps and loads."""
+
+    def test_dump_and_load(self, temp_dir, source):
+        """Test a sharded snapshot loads back whole."""
+        manager = sharded(temp_dir)
+        path = manager.dump(source, executor="thread")
+
+        shards = ShardMap.read(path)
+        assert [p.name for p in shards.paths] == [
+            shard_name(path.name, i) for i in range(4)
+        ]
+        assert all(p.exists() for p in shards.paths)
+        assert manager.load(executor="thread") == source
+        assert manager.load(workers=2, executor="thread") == source
+
+    def test_process_executor(self, temp_dir, source):
+        """Test shards are written and read by worker processes by default."""
+        manager = sharded(temp_dir)
+        manager.dump(source)
+        assert manager.load() == source
+
+    def test_manifest_entry(self, temp_dir, source):
+        """Test the manifest sums the shards, and a rebuild agrees."""
+        manager = sharded(temp_dir)
+        path = manager.dump(source, executor="thread")
+        entry = manager.manifest()[-1]
+        assert entry.entries == len(source)
+        assert entry.size == sum(p.stat().st_size for p in ShardMap.read(path).paths)
+
+        (temp_dir / ".manifest").unlink()
+        assert SnapshotManager(path=temp_dir).manifest() == [entry]
+
+    def test_unsharded_manager_reads_shards(self, temp_dir, source):
+        """Test any manager loads a sharded snapshot."""
+        sharded(temp_dir).dump(source, executor="thread")
+        assert SnapshotManager(path=temp_dir).load() == source
+
+    def test_shard_dirs(self, temp_dir, source):
+        """Test shards are spread round robin over the given directories."""
+        disks = [temp_dir / "disk0", temp_dir / "disk1"]
+        manager = sharded(temp_dir / "snapshots", shard_dirs=disks)
+        path = manager.dump(source, executor="thread")
+
+        parents = [p.parent for p in ShardMap.read(path).paths]
+        assert parents == [disks[0], disks[1], disks[0], disks[1]]
+        assert manager.load(executor="thread") == source
+
+    def test_load_key_reads_one_shard(self, temp_dir, source):
+        """Test load_key() only needs the shard holding the key."""
+        manager = sharded(temp_dir)
+        path = manager.dump(source, executor="thread")
+        shards = ShardMap.read(path).paths
+        for index, shard in enumerate(shards):
+            if index != shard_of("key:7", len(shards)):
+                shard.unlink()
+
+        assert manager.load_key("key:7") == source["key:7"]
+
+    def test_load_key_missing(self, temp_dir, source):
+        """Test missing keys return the default."""
+        manager = sharded(temp_dir)
+        manager.dump(source, executor="thread")
+        assert manager.load_key("absent") is None
+        assert manager.load_key("absent", default=0) == 0
+
+    def test_load_key_replays_log(self, temp_dir, source):
+        """Test the log applies on top of the latest snapshot."""
+        manager = sharded(temp_dir)
+        manager.dump(source, executor="thread")
+        manager.log_set("key:1", "changed")
+        manager.log_delete("key:2")
+
+        assert manager.load_key("key:1") == "changed"
+        assert manager.load_key("key:2", default="gone") == "gone"
+        manager.close()
+
+    def test_load_key_delta_chain(self, temp_dir):
+        """Test load_key() follows deltas of unsharded snapshots."""
+        manager = SnapshotManager(path=temp_dir)
+        first = manager.dump({"a": 1, "b": 2, "c": 3})
+        manager.dump({"a": 10, "c": 3}, delta=True)
+
+        assert manager.load_key("a") == 10
+        assert manager.load_key("b") is None
+        assert manager.load_key("c") == 3
+        assert manager.load_key("b", first.name) == 2
+
+    def test_prune_removes_shards(self, temp_dir, source):
+        """Test pruning a sharded snapshot removes its shard files."""
+        manager = sharded(temp_dir)
+        path = manager.dump(source, executor="thread")
+        shards = ShardMap.read(path).paths
+
+        assert manager.prune() == 1
+        assert not path.exists()
+        assert not any(p.exists() for p in shards)
+
+    def test_failed_dump_leaves_nothing(self, temp_dir):
+        """Test a shard failing to encode removes the other shards."""
+        manager = sharded(temp_dir)
+        with pytest.raises(Exception):
+            manager.dump({f"k{i}": object() for i in range(20)}, executor="thread")
+        assert list(temp_dir.glob(".*shard*")) == []
+        assert manager.manifest() == []
+
+    def test_stat_and_verify(self, temp_dir, source):
+        """Test stat() and verify() cover every shard."""
+        manager = sharded(temp_dir)
+        path = manager.dump(source, executor="thread")
+
+        header = manager.stat(path.name)
+        assert header.entries == len(source)
+        assert header.checksum.hex() == manager.manifest()[-1].checksum
+        assert manager.verify(path.name).ok
+
+        shard = ShardMap.read(path).paths[2]
+        data = bytearray(shard.read_bytes())
+        data[len(data) // 2] ^= 0xFF
+        shard.write_bytes(bytes(data))
+        result = manager.verify(path.name)
+        assert not result.ok
+        assert all(error.startswith("shard 2") for error in result.errors)
+
+    def test_salvage_lost_shard(self, temp_dir, source):
+        """Test salvage() keeps the shards that survive."""
+        manager = sharded(temp_dir)
+        path = manager.dump(source, executor="thread")
+        lost = ShardMap.read(path).paths[0]
+        lost.unlink()
+
+        data, _ = manager.salvage()
+        expected = {k: v for k, v in source.items() if shard_of(k, 4) != 0}
+        assert data == expected
+
+    def test_tracked_dict(self, temp_dir):
+        """Test tracked dicts are dumped in full and their dirty keys cleared."""
+        manager = sharded(temp_dir)
+        tracked = TrackedDict({"a": 1, "b": 2})
+        path = manager.dump(tracked, executor="thread")
+
+        assert not tracked.dirty
+        assert tracked._snapshot == path.name
+        assert manager.load(executor="thread") == {"a": 1, "b": 2}
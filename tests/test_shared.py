@@ -0,0 +1,129 @@
+"""Tests for snapshots handed over in shared memory."""
+
+import pytest
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+from multiprocessing import shared_memory
+from pathlib import Path
+from src.snapshot.Snapshot import SnapshotManager
+
+context = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict of a few hundred KiB."""
+    return {f"k{i}": {"value": i, "data": os.urandom(32).hex()} for i in range(5000)}
+
+
+def attach_and_check(path: Path, name: str, expected: dict, results):
+    manager = SnapshotManager(path=path)
+    results.put(manager.attach_shared(name) == expected)
+
+
+class TestSharedSnapshot:
+    """Test cases for publishing and attaching segments."""
+
+    def test_round_trip(self, temp_dir, source):
+        """Test a published snapshot decodes to the source."""
+        manager = SnapshotManager(path=temp_dir)
+        with manager.publish_shared(source) as shared:
+            assert shared.references == 1
+            assert manager.attach_shared(shared.name) == source
+            assert shared.load() == source
+
+    def test_other_process(self, temp_dir, source):
+        """Test a worker process attaches by name."""
+        manager = SnapshotManager(path=temp_dir)
+        results = context.Queue()
+        with manager.publish_shared(source) as shared:
+            worker = context.Process(
+                target=attach_and_check, args=(temp_dir, shared.name, source, results)
+            )
+            worker.start()
+            worker.join(30)
+            assert results.get() is True
+            assert shared.references == 1
+
+    def test_last_reference_unlinks(self, temp_dir, source):
+        """Test the segment outlives its publisher while attached."""
+        manager = SnapshotManager(path=temp_dir)
+        shared = manager.publish_shared(source)
+        attached = manager.attach_shared(shared.name, lazy=True)
+        assert attached.references == 2
+
+        shared.close()
+        assert attached.references == 1
+        assert attached.load() == source
+        attached.close()
+        with pytest.raises(FileNotFoundError):
+            manager.attach_shared(shared.name)
+
+    def test_close_is_idempotent(self, temp_dir):
+        """Test closing twice drops one reference."""
+        manager = SnapshotManager(path=temp_dir)
+        shared = manager.publish_shared({"a": 1})
+        attached = manager.attach_shared(shared.name, lazy=True)
+        attached.close()
+        attached.close()
+        assert shared.references == 1
+        assert attached.closed
+        with pytest.raises(ValueError):
+            attached.load()
+        shared.close()
+
+    def test_grows_past_hint(self, temp_dir, source):
+        """Test a snapshot larger than the hinted size still fits."""
+        manager = SnapshotManager(path=temp_dir)
+        with manager.publish_shared(source, size_hint=1024) as shared:
+            assert shared.size > 1024
+            assert shared.load() == source
+
+    def test_lazy_lookups(self, temp_dir, source):
+        """Test keys are found without decoding the whole snapshot."""
+        manager = SnapshotManager(path=temp_dir)
+        with manager.publish_shared(source) as shared:
+            with manager.attach_shared(shared.name, lazy=True) as view:
+                assert view.get("k42") == source["k42"]
+                assert view.get("missing", 0) == 0
+                assert "k4999" in view and "missing" not in view
+
+    def test_view_in_place(self, temp_dir):
+        """Test the view holds the encoded snapshot."""
+        manager = SnapshotManager(path=temp_dir)
+        source = {"a": 1, "b": [1, 2]}
+        with manager.publish_shared(source) as shared:
+            view = shared.view
+            assert manager.read_from_buffer(io.BytesIO(view)) == source
+            view.release()
+
+    def test_failed_encode_frees_segment(self, temp_dir, monkeypatch):
+        """Test a source that can't be encoded leaves no segment behind."""
+        created = []
+        create = shared_memory.SharedMemory
+
+        def record(*args, **kwargs):
+            shm = create(*args, **kwargs)
+            created.append(shm.name)
+            return shm
+
+        monkeypatch.setattr(shared_memory, "SharedMemory", record)
+        manager = SnapshotManager(path=temp_dir)
+        with pytest.raises(Exception):
+            manager.publish_shared({"a": object()})
+        monkeypatch.undo()
+
+        assert created
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=created[0])
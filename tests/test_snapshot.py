@@ -1,9 +1,11 @@
 """Tests for SnapshotManager class."""
 
 import pytest
+import asyncio
 import tempfile
 import shutil
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from src.snapshot.Snapshot import SnapshotManager
@@ -11,6 +13,11 @@ from src.snapshot.handlers.IntHandler import IntHandler
 from src.snapshot.handlers.StringHandler import StringHandler
 
 
+def snapshot_files(manager):
+    # hidden files (manifest, log segments, temporaries) aren't snapshots
+    return [f for f in manager._path.glob("*") if not f.name.startswith(".")]
+
+
 @pytest.fixture
 def temp_snapshot_dir():
     """Create a temporary directory for snapshots."""
@@ -71,7 +78,7 @@ class TestSnapshotManager:
         snapshot_manager.dump(source)
 
         # Check that a file was created
-        files = list(snapshot_manager._path.glob("*"))
+        files = snapshot_files(snapshot_manager)
         assert len(files) == 1
         assert files[0].exists()
         assert files[0].is_file()
@@ -81,7 +88,7 @@ class TestSnapshotManager:
         source = {"test": "data"}
         snapshot_manager.dump(source)
 
-        files = list(snapshot_manager._path.glob("*"))
+        files = snapshot_files(snapshot_manager)
         assert len(files) == 1
 
         # Try to parse the filename as datetime
@@ -105,7 +112,7 @@ class TestSnapshotManager:
         snapshot_manager.dump(source)
         snapshot_manager.dump(source)
 
-        files = list(snapshot_manager._path.glob("*"))
+        files = snapshot_files(snapshot_manager)
         assert len(files) >= 1
         # All files should exist
         for file in files:
@@ -237,18 +244,18 @@ class TestSnapshotManager:
         time.sleep(0.01)
         snapshot_manager.dump({"test3": "data3"})
 
-        initial_count = len(list(snapshot_manager._path.glob("*")))
+        initial_count = len(snapshot_files(snapshot_manager))
         pruned = snapshot_manager.prune(max_prune=1)
 
         assert pruned == 1
-        final_count = len(list(snapshot_manager._path.glob("*")))
+        final_count = len(snapshot_files(snapshot_manager))
         assert final_count == initial_count - 1
 
     def test_prune_snapshot_by_name(self, snapshot_manager):
         """Test pruning a specific snapshot by name."""
         snapshot_manager.dump({"test": "data"})
 
-        files = list(snapshot_manager._path.glob("*"))
+        files = snapshot_files(snapshot_manager)
         assert len(files) == 1
 
         snapshot_name = str(files[0])
@@ -309,7 +316,7 @@ class TestSnapshotManager:
         source = {"test": "data"}
         snapshot_manager.dump(source)
 
-        files = list(snapshot_manager._path.glob("*"))
+        files = snapshot_files(snapshot_manager)
         filename = files[0].name
 
         # Check if it matches the format (may have counter suffix)
@@ -454,3 +461,106 @@ class TestSnapshotManager:
         assert buffer_data == source
         assert file_data == source
         assert buffer_data == file_data
+
+    def test_lease_and_chain(self, snapshot_manager):
+        """Test the published snapshots are leased, listed and chained by name."""
+        base = snapshot_manager.dump({"a": 1})
+        delta = snapshot_manager.dump({"a": 2}, delta=True)
+
+        assert snapshot_manager.exists(base.name)
+        assert not snapshot_manager.exists("missing")
+        assert snapshot_manager.chain(delta.name) == [base, delta]
+        with snapshot_manager.lease() as latest:
+            assert latest == delta
+        with snapshot_manager.lease("missing") as missing:
+            assert missing is None
+
+    def test_stage_and_install(self, snapshot_manager, tmp_path):
+        """Test a staged snapshot copied from elsewhere is published by install()."""
+        other = SnapshotManager(path=tmp_path / "other").dump({"a": 1})
+        staged = snapshot_manager.stage(other.name)
+        staged.write(other.read_bytes())
+        path = snapshot_manager.install(other.name, staged)
+
+        assert snapshot_manager.manifest()[-1].name == path.name
+        assert snapshot_manager.load() == {"a": 1}
+
+
+class TestSnapshotManagerAsync:
+    """Test cases for the asyncio SnapshotManager APIs."""
+
+    def test_async_dump_and_load(self, snapshot_manager):
+        """Test round-trip through async_dump and async_load."""
+        source = {"key": "value", "nested": {"list": [1, 2, 3]}}
+
+        async def run():
+            await snapshot_manager.async_dump(source)
+            return await snapshot_manager.async_load()
+
+        assert asyncio.run(run()) == source
+
+    def test_async_dump_custom_executor(self, snapshot_manager):
+        """Test async APIs run on a provided executor."""
+        source = {"key": "value"}
+
+        async def run():
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                await snapshot_manager.async_dump(source, executor=executor)
+                return await snapshot_manager.async_load(executor=executor)
+
+        assert asyncio.run(run()) == source
+
+    def test_async_dump_returns_path(self, snapshot_manager):
+        """Test async_dump returns the published snapshot like dump()."""
+        path = asyncio.run(snapshot_manager.async_dump({"key": "value"}))
+        assert path.exists()
+        assert snapshot_manager.list()[0] == path
+
+    def test_async_write_to_buffer(self, snapshot_manager):
+        """Test chunked async write matches write_to_buffer."""
+        source = {f"key{i}": f"value{i}" for i in range(50)}
+        buffer = BytesIO()
+
+        written = asyncio.run(
+            snapshot_manager.async_write_to_buffer(source, buffer, chunk_size=8)
+        )
+
+        expected = BytesIO()
+        snapshot_manager.write_to_buffer(source, expected)
+        assert written == len(buffer.getvalue())
+        assert buffer.getvalue() == expected.getvalue()
+        assert snapshot_manager.read_from_buffer(buffer) == source
+
+    def test_async_write_to_stream(self, snapshot_manager):
+        """Test async_write_to_buffer writes to an asyncio stream."""
+        source = {f"key{i}": i for i in range(100)}
+
+        async def run():
+            received = BytesIO()
+            done = asyncio.Event()
+
+            async def handle(reader, writer):
+                received.write(await reader.read())
+                writer.close()
+                done.set()
+
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                await snapshot_manager.async_write_to_buffer(
+                    source, writer, chunk_size=10
+                )
+                writer.close()
+                await writer.wait_closed()
+                await asyncio.wait_for(done.wait(), timeout=5)
+            return received
+
+        received = asyncio.run(run())
+        assert snapshot_manager.read_from_buffer(received) == source
+
+    def test_async_write_to_buffer_empty(self, snapshot_manager):
+        """Test async write of an empty dict."""
+        buffer = BytesIO()
+        asyncio.run(snapshot_manager.async_write_to_buffer({}, buffer))
+        assert snapshot_manager.read_from_buffer(buffer) == {}
@@ -0,0 +1,233 @@
+"""Tests for SnapshotCache and cached loads."""
+
+import pytest
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from src.snapshot.SnapshotCache import SnapshotCache, FrozenDict, FrozenList, freeze
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Storage import MemoryBackend
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict with nested values."""
+    return {f"k{i}": {"n": i, "tags": ["a", {"deep": i}]} for i in range(100)}
+
+
+def counting(manager: SnapshotManager) -> list:
+    "Record the files the manager decodes"
+    reads = []
+    read = manager._read
+
+    def spy(path, *args, **kwargs):
+        reads.append(Path(path).name)
+        return read(path, *args, **kwargs)
+
+    manager._read = spy
+    return reads
+
+
+class TestFrozen:
+    """Test cases for the read-only views."""
+
+    def test_equal_to_plain_values(self, source):
+        """Test views compare equal to what they wrap."""
+        assert freeze(source) == source
+        assert source == freeze(source)
+        assert freeze([1, [2]]) == [1, [2]]
+
+    def test_nested_values_are_frozen(self, source):
+        """Test nothing reachable from the view can be mutated."""
+        view = freeze(source)
+        assert isinstance(view["k1"], FrozenDict)
+        assert isinstance(view["k1"]["tags"], FrozenList)
+        with pytest.raises(TypeError):
+            view["k1"] = 1
+        with pytest.raises(TypeError):
+            view["k1"]["tags"][0] = "b"
+        assert not hasattr(view["k1"]["tags"], "append")
+
+    def test_scalars_pass_through(self):
+        """Test other values are returned as they are."""
+        assert freeze(5) == 5
+        assert freeze("a") == "a"
+
+
+class TestSnapshotCache:
+    """Test cases for the LRU cache itself."""
+
+    def stamp(self, stamps: dict):
+        return lambda names: tuple(stamps[name] for name in names)
+
+    def test_hit_and_miss(self):
+        """Test matching stamps hit and changed ones miss."""
+        cache = SnapshotCache()
+        stamps = {"a": 1}
+        cache.put("a", {"x": 1}, ["a"], (1,), 10)
+
+        assert cache.get("a", self.stamp(stamps)) == {"x": 1}
+        stamps["a"] = 2
+        assert cache.get("a", self.stamp(stamps)) is None
+        assert "a" not in cache
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_missing_file_is_a_miss(self):
+        """Test entries whose file is gone are dropped."""
+        cache = SnapshotCache()
+        cache.put("a", {}, ["a"], (1,), 10)
+
+        def gone(names):
+            raise FileNotFoundError(names[0])
+
+        assert cache.get("a", gone) is None
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        """Test max_entries evicts the coldest entry."""
+        cache = SnapshotCache(max_entries=2)
+        stamp = self.stamp({"a": 1, "b": 1, "c": 1})
+        cache.put("a", {}, ["a"], (1,), 1)
+        cache.put("b", {}, ["b"], (1,), 1)
+        cache.get("a", stamp)
+        cache.put("c", {}, ["c"], (1,), 1)
+
+        assert "a" in cache and "c" in cache and "b" not in cache
+        assert cache.evictions == 1
+
+    def test_byte_bound(self):
+        """Test max_bytes bounds the total weight, oversized entries skipped."""
+        cache = SnapshotCache(max_entries=None, max_bytes=100)
+        cache.put("a", {}, ["a"], (1,), 60)
+        cache.put("b", {}, ["b"], (1,), 60)
+        assert "a" not in cache and cache.bytes == 60
+        cache.put("huge", {}, ["huge"], (1,), 101)
+        assert "huge" not in cache
+
+    def test_invalidate_chain_member(self):
+        """Test invalidating a base drops the deltas decoded from it."""
+        cache = SnapshotCache()
+        cache.put("delta", {}, ["base", "delta"], (1, 1), 2)
+        cache.invalidate("base")
+        assert len(cache) == 0 and cache.bytes == 0
+
+
+class TestSnapshotManagerCache:
+    """Test cases for load() through the cache."""
+
+    def test_repeated_load_decodes_once(self, temp_dir, source):
+        """Test the newest snapshot is decoded only once."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        manager.dump(source)
+        reads = counting(manager)
+
+        assert manager.load() == source
+        assert manager.load() == source
+        assert len(reads) == 1
+        assert isinstance(manager.load(), FrozenDict)
+
+    def test_copy(self, temp_dir, source):
+        """Test copy=True returns an independent dict."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        manager.dump(source)
+        data = manager.load(copy=True)
+        data["k1"]["tags"].append("mutated")
+
+        assert type(data) is dict
+        assert manager.load() == source
+
+    def test_new_dump_is_loaded(self, temp_dir, source):
+        """Test a dump makes load() return the new snapshot."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        manager.dump(source)
+        manager.load()
+        manager.dump({"a": 1})
+        assert manager.load() == {"a": 1}
+
+    def test_delta_chain(self, temp_dir, source):
+        """Test deltas are cached with the files they depend on."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        manager.dump(source)
+        changed = dict(source, extra=1)
+        manager.dump(changed, delta=True)
+        reads = counting(manager)
+
+        assert manager.load() == changed
+        assert manager.load() == changed
+        assert len(reads) == 2
+
+    def test_replaced_file_is_reloaded(self, temp_dir):
+        """Test a snapshot rewritten in place isn't served from the cache."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        path = manager.dump({"a": 1})
+        manager.load()
+
+        other = SnapshotManager(path=temp_dir / "other").dump({"a": 2})
+        os.replace(other, path)
+        assert manager.load() == {"a": 2}
+
+    def test_prune_invalidates(self, temp_dir):
+        """Test pruned snapshots leave the cache."""
+        cache = SnapshotCache()
+        manager = SnapshotManager(path=temp_dir, cache=cache)
+        first = manager.dump({"a": 1})
+        manager.load()
+        assert first.name in cache
+
+        manager.prune_snapshot(str(first))
+        assert first.name not in cache
+        assert manager.load() == {}
+
+    def test_log_is_applied_without_touching_the_cache(self, temp_dir, source):
+        """Test the log replays onto a copy of the cached state."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        manager.dump(source)
+        manager.load()
+        manager.log_set("k1", "changed")
+
+        assert manager.load()["k1"] == "changed"
+        assert manager.load(manager.list()[0].name)["k1"] == source["k1"]
+        manager.close()
+
+    def test_load_key_uses_cache(self, temp_dir, source):
+        """Test load_key() answers from a cached snapshot."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        manager.dump(source)
+        manager.load()
+
+        def scan(snapshot, key):
+            raise AssertionError("scanned the snapshot")
+
+        manager._find_key = scan
+        assert manager.load_key("k3") == source["k3"]
+        assert manager.load_key("absent", default=0) == 0
+
+    def test_memory_backend(self, temp_dir, source):
+        """Test storage generations identify replaced objects."""
+        storage = MemoryBackend()
+        manager = SnapshotManager(path=temp_dir, storage=storage, cache=SnapshotCache())
+        path = manager.dump(source)
+        manager.load()
+
+        replacement = MemoryBackend()
+        SnapshotManager(path=temp_dir / "other", storage=replacement).dump({"a": 2})
+        storage.put(path.name, replacement.get(replacement.list()[0]))
+        assert manager.load() == {"a": 2}
+
+    def test_compact_with_cache(self, temp_dir):
+        """Test compact() can dump the cached state."""
+        manager = SnapshotManager(path=temp_dir, cache=SnapshotCache())
+        manager.dump({"a": [1, 2], "b": {"c": 1}})
+        manager.dump({"a": [1, 2, 3], "b": {"c": 1}}, delta=True)
+        manager.load()
+        manager.compact()
+        assert manager.load() == {"a": [1, 2, 3], "b": {"c": 1}}
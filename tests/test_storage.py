@@ -0,0 +1,291 @@
+"""Tests for the storage backends."""
+
+import pytest
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from src.snapshot.Storage import (
+    FileSystemBackend,
+    MemoryBackend,
+    SQLiteBackend,
+    StorageBackend,
+)
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture(params=["file", "memory", "sqlite"])
+def backend(request, temp_dir):
+    """Create each backend."""
+    if request.param == "file":
+        backend = FileSystemBackend(temp_dir)
+    elif request.param == "memory":
+        backend = MemoryBackend()
+    else:
+        backend = SQLiteBackend(temp_dir / "snapshots.db", spool_size=1024)
+    yield backend
+    backend.close()
+
+
+class TestStorageBackend:
+    """Test cases shared by every backend."""
+
+    def test_put_get(self, backend):
+        """Test stored bytes come back unchanged."""
+        backend.put("a", b"hello")
+        assert backend.get("a") == b"hello"
+        assert backend.exists("a")
+        assert backend.stat("a").size == 5
+
+    def test_put_replaces(self, backend):
+        """Test put() overwrites and changes the identity."""
+        backend.put("a", b"one")
+        before = backend.stat("a").identity
+        backend.put("a", b"other")
+        assert backend.get("a") == b"other"
+        assert backend.stat("a").identity != before
+
+    def test_list_sorted(self, backend):
+        """Test list() returns the names sorted."""
+        for name in ("b", "c", "a"):
+            backend.put(name, name.encode())
+        assert backend.list() == ["a", "b", "c"]
+
+    def test_abstract(self):
+        """Test a backend missing the storage methods can't be created."""
+
+        class Partial(StorageBackend):
+            def list(self):
+                return []
+
+        with pytest.raises(TypeError):
+            Partial()
+
+    def test_delete(self, backend):
+        """Test delete() reports whether something was removed."""
+        backend.put("a", b"x")
+        assert backend.delete("a")
+        assert not backend.delete("a")
+        assert not backend.exists("a")
+        with pytest.raises(FileNotFoundError):
+            backend.open("a")
+        with pytest.raises(FileNotFoundError):
+            backend.stat("a")
+
+    def test_streaming_read(self, backend):
+        """Test readers seek and read in pieces."""
+        data = bytes(range(256)) * 1000
+        backend.put("big", data)
+        with backend.open("big") as f:
+            assert f.read(10) == data[:10]
+            f.seek(-100, 2)
+            assert f.read() == data[-100:]
+            f.seek(5000)
+            assert f.read(300) == data[5000:5300]
+
+    def test_read_range(self, backend):
+        """Test ranged reads return just the range."""
+        backend.put("a", b"0123456789")
+        assert backend.read_range("a", 3, 4) == b"3456"
+        assert backend.read_range("a", 8, 10) == b"89"
+
+    def test_writer_commit(self, backend):
+        """Test written bytes only appear once committed, seeks included."""
+        f = backend.writer("a")
+        f.write(b"xxxx-body")
+        f.seek(0)
+        f.write(b"HEAD")
+        assert not backend.exists("a")
+        f.commit()
+        assert backend.get("a") == b"HEAD-body"
+
+    def test_writer_abort(self, backend):
+        """Test aborted writes leave nothing and free the name."""
+        f = backend.writer("a")
+        f.write(b"partial")
+        f.abort()
+        assert backend.list() == []
+        backend.writer("a").abort()
+
+    def test_writer_claims_name(self, backend):
+        """Test a name can't be written twice at once or over an object."""
+        f = backend.writer("a")
+        with pytest.raises(FileExistsError):
+            backend.writer("a")
+        f.write(b"x")
+        f.commit()
+        with pytest.raises(FileExistsError):
+            backend.writer("a")
+
+    def test_batch(self, backend):
+        """Test deletes inside a batch apply."""
+        for name in ("a", "b", "c"):
+            backend.put(name, b"x")
+        with backend.batch():
+            backend.delete("a")
+            backend.delete("b")
+        assert backend.list() == ["c"]
+
+    def test_lease_blocks_claim(self, backend):
+        """Test a leased object can't be claimed and a missing one isn't leased."""
+        backend.put("a", b"x")
+        with backend.lease("a") as leased:
+            assert leased
+            assert backend.claim("a") is None
+        claim = backend.claim("a")
+        assert claim is not None
+        backend.release(claim)
+        with backend.lease("missing") as leased:
+            assert not leased
+        with pytest.raises(FileNotFoundError):
+            backend.claim("missing")
+
+
+class TestSQLiteBackend:
+    """Test cases specific to the SQLite backend."""
+
+    def test_pool_reuses_connections(self, temp_dir):
+        """Test sequential operations share one connection."""
+        backend = SQLiteBackend(temp_dir / "db")
+        for i in range(20):
+            backend.put(f"s{i}", b"data")
+            backend.get(f"s{i}")
+        assert backend._pool.opened == 1
+        backend.close()
+
+    def test_reader_sees_opened_version(self, temp_dir):
+        """Test an open reader keeps reading what it opened."""
+        backend = SQLiteBackend(temp_dir / "db")
+        backend.put("a", b"old" * 1000)
+        with backend.open("a") as f:
+            backend.put("a", b"new" * 1000)
+            assert f.read() == b"old" * 1000
+        assert backend.get("a") == b"new" * 1000
+        backend.close()
+
+    def test_batch_rolls_back(self, temp_dir):
+        """Test a failing batch deletes nothing."""
+        backend = SQLiteBackend(temp_dir / "db")
+        backend.put("a", b"x")
+        with pytest.raises(RuntimeError):
+            with backend.batch():
+                backend.delete("a")
+                raise RuntimeError
+        assert backend.exists("a")
+        backend.close()
+
+    def test_concurrent_writers(self, temp_dir):
+        """Test threads writing at once all get stored."""
+        backend = SQLiteBackend(temp_dir / "db")
+
+        def work(i):
+            for j in range(10):
+                backend.put(f"t{i}-{j}", bytes([i]) * 5000)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(backend.list()) == 40
+        assert backend.get("t3-9") == bytes([3]) * 5000
+        backend.close()
+
+
+class TestSnapshotManagerStorage:
+    """Test cases for SnapshotManager on other backends."""
+
+    @pytest.fixture(params=["memory", "sqlite"])
+    def storage(self, request, temp_dir):
+        """Create a backend that isn't the file system."""
+        if request.param == "memory":
+            backend = MemoryBackend()
+        else:
+            backend = SQLiteBackend(temp_dir / "snapshots.db")
+        yield backend
+        backend.close()
+
+    def test_dump_and_load(self, temp_dir, storage):
+        """Test snapshots round trip through the backend."""
+        manager = SnapshotManager(path=temp_dir / "local", storage=storage)
+        source = {f"k{i}": {"n": i} for i in range(3000)}
+        path = manager.dump(source)
+
+        assert storage.list() == [path.name]
+        assert not (temp_dir / "local" / path.name).exists()
+        assert manager.load() == source
+        assert manager.load(workers=2, executor="thread") == source
+        assert manager.stat(path.name).entries == len(source)
+        assert manager.verify(path.name).ok
+
+    def test_delta_and_load_key(self, temp_dir, storage):
+        """Test delta chains and single key reads use the backend."""
+        manager = SnapshotManager(path=temp_dir, storage=storage)
+        manager.dump({"a": 1, "b": 2})
+        manager.dump({"a": 5}, delta=True)
+
+        assert manager.load() == {"a": 5}
+        assert manager.load_key("a") == 5
+        assert manager.load_key("b") is None
+
+    def test_prune(self, temp_dir, storage):
+        """Test pruning deletes from the backend and the manifest."""
+        manager = SnapshotManager(path=temp_dir, storage=storage)
+        for i in range(3):
+            manager.dump({"i": i})
+        assert manager.prune(max_prune=2) == 2
+        assert len(storage.list()) == 1
+        assert len(manager.manifest()) == 1
+
+        manager.prune_snapshot(storage.list()[0])
+        assert storage.list() == []
+        assert manager.manifest() == []
+
+    def test_prune_skips_leased(self, temp_dir, storage):
+        """Test pruning keeps the snapshots a reader of this process leases."""
+        manager = SnapshotManager(path=temp_dir, storage=storage)
+        first = manager.dump({"i": 0})
+        manager.dump({"i": 1})
+        with manager.lease(first.name):
+            assert manager.prune() == 0
+            with pytest.raises(Exception, match="being read"):
+                manager.prune_snapshot(first.name)
+        assert manager.prune() == 1
+        assert not storage.exists(first.name)
+
+    def test_manifest_rebuild_lists_backend(self, temp_dir, storage):
+        """Test a lost manifest is rebuilt from the backend listing."""
+        manager = SnapshotManager(path=temp_dir, storage=storage)
+        manager.dump({"a": 1})
+        manager.dump({"b": 2})
+        entries = manager.manifest()
+
+        (temp_dir / ".manifest").unlink()
+        rebuilt = SnapshotManager(path=temp_dir, storage=storage)
+        assert rebuilt.manifest() == entries
+        assert rebuilt.load() == {"b": 2}
+
+    def test_file_features_need_files(self, temp_dir, storage):
+        """Test dedup, shards and background dumps are refused."""
+        with pytest.raises(ValueError):
+            SnapshotManager(path=temp_dir, storage=storage, dedup=True)
+        with pytest.raises(ValueError):
+            SnapshotManager(path=temp_dir, storage=storage, shards=4)
+        manager = SnapshotManager(path=temp_dir, storage=storage)
+        with pytest.raises(ValueError):
+            manager.dump_background({"a": 1})
+
+    def test_filesystem_backend_root(self, temp_dir):
+        """Test a FileSystemBackend keeps the snapshots in its root."""
+        manager = SnapshotManager(storage=FileSystemBackend(temp_dir))
+        path = manager.dump({"a": 1})
+        assert path.parent == temp_dir
+        assert manager.load() == {"a": 1}
@@ -0,0 +1,230 @@
+"""Tests for I/O throttling of dumps."""
+
+import pytest
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from src.snapshot.Throttle import IOThrottle, ThrottledWriter, throttled
+from src.snapshot.Snapshot import SnapshotManager
+from src.snapshot.Storage import MemoryBackend
+
+RATE = 1024 * 1024
+
+
+@pytest.fixture
+def temp_dir():
+    """Create a temporary directory."""
+    path = tempfile.mkdtemp()
+    yield Path(path)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def source():
+    """Create a dict that encodes to a few hundred KiB."""
+    return {f"k{i}": os.urandom(64).hex() for i in range(3000)}
+
+
+def expected_wait(size: int, rate: float = RATE, burst: float = 0.05) -> float:
+    "Least time writing `size` bytes must wait on a full bucket"
+    return max(size - rate * burst, 0) / rate
+
+
+class TestIOThrottle:
+    """Test cases for the token buckets."""
+
+    def test_unlimited(self):
+        """Test a throttle without rates never waits."""
+        throttle = IOThrottle()
+        assert throttle.acquire(10 << 20) == 0
+        assert throttle.bytes == 10 << 20 and throttle.ops == 1
+
+    def test_bytes_per_sec(self):
+        """Test writes beyond the burst wait for the byte rate."""
+        throttle = IOThrottle(bytes_per_sec=RATE)
+        started = time.monotonic()
+        for _ in range(4):
+            throttle.acquire(64 * 1024)
+        elapsed = time.monotonic() - started
+
+        assert elapsed >= expected_wait(256 * 1024) * 0.9
+        assert throttle.throttled == pytest.approx(expected_wait(256 * 1024), abs=0.02)
+
+    def test_iops(self):
+        """Test the number of writes is limited on its own."""
+        throttle = IOThrottle(iops=200)
+        started = time.monotonic()
+        for _ in range(30):
+            throttle.acquire(1)
+        # 10 tokens in the bucket, 20 more at 200 a second
+        assert time.monotonic() - started >= 0.09
+
+    def test_large_write_goes_through(self):
+        """Test a write bigger than the bucket waits instead of failing."""
+        throttle = IOThrottle(bytes_per_sec=RATE, burst=0.01)
+        waited = throttle.acquire(RATE // 10)
+        assert waited == pytest.approx(0.09, abs=0.01)
+
+    def test_concurrent_writers_share_the_rate(self):
+        """Test writers in several threads queue behind each other."""
+        throttle = IOThrottle(bytes_per_sec=RATE)
+
+        def write():
+            for _ in range(2):
+                throttle.acquire(32 * 1024)
+
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.monotonic() - started >= expected_wait(256 * 1024) * 0.9
+
+    def test_adjust_at_runtime(self):
+        """Test rates can be raised, lowered and lifted."""
+        throttle = IOThrottle(bytes_per_sec=RATE)
+        throttle.bytes_per_sec = RATE * 100
+        assert throttle.acquire(RATE // 4) < 0.01
+        throttle.bytes_per_sec = None
+        assert throttle.acquire(RATE * 100) == 0
+        throttle.bytes_per_sec = RATE
+        assert throttle.acquire(RATE // 10) == pytest.approx(0.1, abs=0.02)
+
+    def test_split_and_pickle(self):
+        """Test copies for worker processes get a share of the rate."""
+        throttle = IOThrottle(bytes_per_sec=RATE, iops=100)
+        part = pickle.loads(pickle.dumps(throttle.split(4)))
+        assert part.bytes_per_sec == RATE / 4 and part.iops == 25
+        assert part.acquire(1) == 0
+
+    def test_meter(self):
+        """Test a meter sums what its writes waited."""
+        throttle = IOThrottle(bytes_per_sec=RATE)
+        meter = throttle.meter()
+        meter.acquire(RATE // 10)
+        meter.add(1.0)
+        assert meter.throttled == pytest.approx(1.05, abs=0.02)
+
+
+class TestThrottledWriter:
+    """Test cases for the block writer in front of a dump's output."""
+
+    def test_writes_in_blocks(self):
+        """Test small writes reach the target in blocks, one token each."""
+        throttle = IOThrottle()
+        target = io.BytesIO()
+        writer = ThrottledWriter(target, throttle, block_size=1024)
+        for _ in range(100):
+            writer.write(b"x" * 100)
+        writer.flush()
+
+        assert target.getvalue() == b"x" * 10000
+        assert throttle.ops <= 11
+
+    def test_seek_back(self):
+        """Test the header can be patched after the body."""
+        target = io.BytesIO()
+        with throttled(target, IOThrottle()) as out:
+            out.write(b"\0" * 4 + b"body")
+            out.seek(0)
+            out.write(b"head")
+            out.seek(0, io.SEEK_END)
+            assert out.tell() == 8
+        assert target.getvalue() == b"headbody"
+
+    def test_failure_discards(self):
+        """Test nothing buffered reaches the target after a failure."""
+        target = io.BytesIO()
+        with pytest.raises(RuntimeError):
+            with throttled(target, IOThrottle()) as out:
+                out.write(b"partial")
+                raise RuntimeError
+        assert target.getvalue() == b""
+        assert not target.closed
+
+    def test_no_throttle(self):
+        """Test the target is used as is without a throttle."""
+        target = io.BytesIO()
+        with throttled(target, None) as out:
+            assert out is target
+
+
+class TestThrottledDumps:
+    """Test cases for dumps through a throttle."""
+
+    def test_dump_is_throttled(self, temp_dir, source):
+        """Test dump() keeps to the byte rate and reports the wait."""
+        manager = SnapshotManager(
+            path=temp_dir, throttle=IOThrottle(bytes_per_sec=RATE)
+        )
+        started = time.monotonic()
+        path = manager.dump(source)
+
+        # encoding refills the bucket, the wait itself is shorter
+        assert time.monotonic() - started >= expected_wait(path.stat().st_size)
+        assert manager.last_throttled > 0
+        assert manager.load() == source
+
+    def test_unthrottled(self, temp_dir, source):
+        """Test managers without a throttle report no wait."""
+        manager = SnapshotManager(path=temp_dir)
+        manager.dump(source)
+        assert manager.last_throttled == 0
+
+    def test_raised_while_dumping(self, temp_dir, source):
+        """Test lifting the limit lets a running dump finish at full speed."""
+        throttle = IOThrottle(bytes_per_sec=64 * 1024)
+        manager = SnapshotManager(path=temp_dir, throttle=throttle)
+        timer = threading.Timer(0.2, setattr, (throttle, "bytes_per_sec", None))
+        timer.start()
+        started = time.monotonic()
+        manager.dump(source)
+        timer.join()
+        # about 5s at the initial rate
+        assert time.monotonic() - started < 2
+
+    def test_parallel_and_delta(self, temp_dir, source):
+        """Test chunked and delta writers go through the throttle."""
+        throttle = IOThrottle(bytes_per_sec=RATE)
+        manager = SnapshotManager(path=temp_dir, throttle=throttle)
+        manager.dump(source, workers=2, executor="thread")
+        assert manager.last_throttled > 0
+        changed = dict(source, k1="changed")
+        manager.dump(changed, delta=True)
+        assert manager.load() == changed
+
+    def test_dedup_chunks_are_throttled(self, temp_dir, source):
+        """Test chunk store writes are paid for, unchanged chunks aren't."""
+        throttle = IOThrottle(bytes_per_sec=RATE)
+        manager = SnapshotManager(path=temp_dir, dedup=True, throttle=throttle)
+        manager.dump(source)
+        assert manager.last_throttled > 0
+        written = throttle.bytes
+
+        manager.dump(source)
+        assert throttle.bytes - written < 50 * 1024
+        assert manager.load() == source
+
+    @pytest.mark.parametrize("executor", ["thread", "process"])
+    def test_shards(self, temp_dir, source, executor):
+        """Test shard writers are throttled in threads and processes."""
+        manager = SnapshotManager(
+            path=temp_dir, shards=2, throttle=IOThrottle(bytes_per_sec=RATE)
+        )
+        manager.dump(source, executor=executor)
+        assert manager.last_throttled > 0
+        assert manager.load() == source
+
+    def test_memory_backend(self, temp_dir):
+        """Test the throttle applies whatever the storage."""
+        manager = SnapshotManager(
+            path=temp_dir, storage=MemoryBackend(), throttle=IOThrottle(iops=20)
+        )
+        manager.dump({f"k{i}": os.urandom(512).hex() for i in range(1024)})
+        assert manager.last_throttled > 0
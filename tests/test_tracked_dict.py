@@ -0,0 +1,231 @@
+"""Tests for TrackedDict class."""
+
+import pytest
+import copy
+import pickle
+import tempfile
+import shutil
+import time
+from io import BytesIO
+from src.snapshot.TrackedDict import TrackedDict, TrackedList
+from src.snapshot.Writer import Writer
+from src.snapshot.Reader import Reader
+from src.snapshot.Footer import Footer
+from src.snapshot.Snapshot import SnapshotManager
+
+
+@pytest.fixture
+def snapshot_manager():
+    """Create a SnapshotManager instance with a temp directory."""
+    temp_dir = tempfile.mkdtemp()
+    yield SnapshotManager(path=temp_dir, max_chain=3)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def tracked():
+    """Create a TrackedDict with nested containers."""
+    return TrackedDict(
+        {"user": {"name": "alice", "tags": ["a", "b"]}, "count": 1, "items": [1, 2]}
+    )
+
+
+class TestTrackedDict:
+    """Test cases for TrackedDict class."""
+
+    def test_starts_clean(self, tracked):
+        """Test a new TrackedDict has no dirty keys."""
+        assert tracked.dirty == frozenset()
+        assert tracked.changes == 0
+        assert tracked == {
+            "user": {"name": "alice", "tags": ["a", "b"]},
+            "count": 1,
+            "items": [1, 2],
+        }
+
+    def test_top_level_mutations(self, tracked):
+        """Test top level mutations mark their keys."""
+        tracked["count"] = 2
+        tracked["new"] = "value"
+        del tracked["items"]
+        assert tracked.dirty == {"count", "new", "items"}
+        assert tracked.changes == 3
+
+    def test_dict_methods(self, tracked):
+        """Test mutating dict methods mark their keys."""
+        tracked.pop("count")
+        tracked.pop("missing", None)
+        tracked.setdefault("count", 5)
+        tracked.setdefault("count", 6)
+        tracked.update({"a": 1}, b=2)
+        tracked |= {"c": 3}
+        assert tracked.dirty == {"count", "a", "b", "c"}
+        assert tracked["count"] == 5
+
+    def test_clear_marks_all_keys(self, tracked):
+        """Test clear marks every removed key."""
+        tracked.clear()
+        assert tracked.dirty == {"user", "count", "items"}
+
+    def test_nested_dict_marks_root_key(self, tracked):
+        """Test nested dict mutations mark the top level key."""
+        tracked["user"]["name"] = "bob"
+        assert tracked.dirty == {"user"}
+
+    def test_nested_list_marks_root_key(self, tracked):
+        """Test nested list mutations mark the top level key."""
+        tracked["user"]["tags"].append("c")
+        tracked["items"].extend([3])
+        tracked["items"][0] = 0
+        tracked["items"].sort()
+        assert tracked.dirty == {"user", "items"}
+
+    def test_inserted_containers_are_tracked(self, tracked):
+        """Test containers inserted later are tracked too."""
+        tracked["fresh"] = {"inner": [1]}
+        tracked.clear_dirty()
+        tracked["fresh"]["inner"].append(2)
+        assert tracked.dirty == {"fresh"}
+        tracked["items"].append({"deep": []})
+        tracked.clear_dirty()
+        tracked["items"][-1]["deep"].append(1)
+        assert tracked.dirty == {"items"}
+
+    def test_clear_dirty(self, tracked):
+        """Test clear_dirty resets the dirty set and change counter."""
+        tracked["count"] = 5
+        tracked.clear_dirty()
+        assert tracked.dirty == frozenset()
+        assert tracked.changes == 0
+
+    def test_copies_are_plain(self, tracked):
+        """Test pickles and deep copies produce plain containers."""
+        for clone in (pickle.loads(pickle.dumps(tracked)), copy.deepcopy(tracked)):
+            assert type(clone) is dict
+            assert type(clone["user"]) is dict
+            assert type(clone["items"]) is list
+            assert clone == tracked
+
+    def test_standalone_list(self):
+        """Test a TrackedList outside a TrackedDict works as a list."""
+        items = TrackedList()
+        items.append(1)
+        items += [2]
+        assert items == [1, 2]
+
+    def test_serialises_like_dict(self, tracked):
+        """Test Writer handles tracked containers like plain ones."""
+        buffer = BytesIO()
+        Writer(tracked, buffer).write()
+        plain = BytesIO()
+        Writer(copy.deepcopy(tracked), plain).write()
+        assert buffer.getvalue() == plain.getvalue()
+        buffer.seek(0)
+        assert Reader(buffer).read() == tracked
+
+
+class TestTrackedDumps:
+    """Test cases for SnapshotManager dumps of a TrackedDict."""
+
+    def test_first_dump_is_full(self, snapshot_manager, tracked):
+        """Test the first dump writes a full snapshot and clears dirty keys."""
+        tracked["count"] = 2
+        path = snapshot_manager.dump(tracked)
+        with open(path, "rb") as f:
+            assert Footer.read(f).base() is None
+        assert tracked.dirty == frozenset()
+        assert snapshot_manager.load() == tracked
+
+    def test_unchanged_dump_is_skipped(self, snapshot_manager, tracked):
+        """Test nothing is written when nothing changed."""
+        first = snapshot_manager.dump(tracked)
+        assert snapshot_manager.dump(tracked) == first
+        assert len(snapshot_manager.list()) == 1
+
+    def test_dump_writes_dirty_keys_only(self, snapshot_manager, tracked):
+        """Test incremental dumps contain only the dirty keys."""
+        first = snapshot_manager.dump(tracked)
+        time.sleep(0.01)
+        tracked["user"]["name"] = "bob"
+        del tracked["items"]
+        path = snapshot_manager.dump(tracked)
+
+        with open(path, "rb") as f:
+            footer = Footer.read(f)
+            assert footer.base() == first.name
+            assert footer.deleted() == ["items"]
+            f.seek(0)
+            assert Reader(f).read() == {"user": {"name": "bob", "tags": ["a", "b"]}}
+        assert snapshot_manager.load() == tracked
+
+    def test_other_snapshot_forces_full(self, snapshot_manager, tracked):
+        """Test a snapshot written by someone else invalidates the dirty set."""
+        snapshot_manager.dump(tracked)
+        time.sleep(0.01)
+        snapshot_manager.dump({"other": "state"})
+        time.sleep(0.01)
+        tracked["count"] = 3
+        path = snapshot_manager.dump(tracked)
+        with open(path, "rb") as f:
+            assert Footer.read(f).base() is None
+        assert snapshot_manager.load() == tracked
+
+    def test_max_chain_forces_full(self, snapshot_manager, tracked):
+        """Test the chain is folded after max_chain incremental dumps."""
+        snapshot_manager.dump(tracked)
+        bases = []
+        for i in range(4):
+            time.sleep(0.01)
+            tracked["count"] = i + 10
+            with open(snapshot_manager.dump(tracked), "rb") as f:
+                bases.append(Footer.read(f).base())
+            assert snapshot_manager.load() == tracked
+        assert all(bases[:3])
+        assert bases[3] is None
+
+    def test_failed_dump_keeps_dirty_keys(self, snapshot_manager, tracked):
+        """Test dirty keys survive a failed dump."""
+        snapshot_manager.dump(tracked)
+        time.sleep(0.01)
+        tracked["bad"] = {1, 2}
+        with pytest.raises(Exception):
+            snapshot_manager.dump(tracked)
+        assert "bad" in tracked.dirty
+
+    def test_delta_false_forces_full(self, snapshot_manager, tracked):
+        """Test delta=False writes a full snapshot and restarts the chain."""
+        snapshot_manager.dump(tracked)
+        time.sleep(0.01)
+        tracked["count"] = 2
+        path = snapshot_manager.dump(tracked, delta=False)
+        with open(path, "rb") as f:
+            assert Footer.read(f).base() is None
+        assert tracked.snapshot == path.name
+        assert tracked.chain_length == 0
+        assert snapshot_manager.load() == tracked
+
+    def test_skip_if_unchanged_reverted_keys(self, snapshot_manager, tracked):
+        """Test keys set back to their dumped value are skipped."""
+        first = snapshot_manager.dump(tracked)
+        tracked["count"] = 2
+        tracked["count"] = 1
+        tracked["extra"] = 1
+        del tracked["extra"]
+        assert snapshot_manager.dump(tracked, skip_if_unchanged=True) == first
+        assert len(snapshot_manager.list()) == 1
+        assert tracked.dirty == frozenset()
+
+    def test_skip_if_unchanged_full(self, snapshot_manager, tracked):
+        """Test a full dump of the newest state is skipped."""
+        first = snapshot_manager.dump(dict(tracked))
+        assert snapshot_manager.dump(tracked, skip_if_unchanged=True) == first
+        assert len(snapshot_manager.list()) == 1
+
+    def test_mark_dumped(self, tracked):
+        """Test mark_dumped counts the deltas stacked on a full snapshot."""
+        tracked.mark_dumped("a", False)
+        tracked.mark_dumped("b", True)
+        tracked.mark_dumped("c", True)
+        assert (tracked.snapshot, tracked.chain_length) == ("c", 2)
+        tracked.mark_dumped("d", False)
+        assert (tracked.snapshot, tracked.chain_length) == ("d", 0)
@@ -111,3 +111,23 @@ class TestTypeRegistry:
         registry.register(handler2)
         # New handler should replace old one
         assert registry.get_handler_by_type(int) == handler2
+
+    def test_alias(self):
+        """Test aliasing a subclass to a registered type's handler."""
+
+        class MyDict(dict):
+            pass
+
+        registry = TypeRegistry()
+        handler = DictHandler()
+        registry.register(handler)
+        registry.alias(MyDict, dict)
+
+        assert registry.get_handler_by_type(MyDict) == handler
+        assert registry.get_handler_by_id(handler.type_identifier) == handler
+
+    def test_alias_unknown_target(self):
+        """Test aliasing to an unregistered type raises."""
+        registry = TypeRegistry()
+        with pytest.raises(TypeNotFoundException):
+            registry.alias(bool, int)